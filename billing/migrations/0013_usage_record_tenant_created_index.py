@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-18 23:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0012_remove_processing_status'),
+        ('messaging', '0015_retention_policies'),
+        ('tenants', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usagerecord',
+            index=models.Index(fields=['tenant', 'created_at'], name='sms_usage_r_tenant__49b625_idx'),
+        ),
+    ]
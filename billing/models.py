@@ -112,17 +112,10 @@ class SMSPackage(models.Model):
             list: List of available sender IDs
         """
         if self.sender_id_restriction == 'none':
-            # Return all registered sender IDs from Beem
-            from messaging.services.sms_service import SMSService
-            try:
-                sms_service = SMSService(tenant_id=None)  # Get from any tenant
-                result = sms_service.get_sender_ids()
-                if result.get('success'):
-                    return [sender.get('senderid') for sender in result.get('sender_ids', []) 
-                           if sender.get('status') == 'active']
-            except:
-                pass
-            return []
+            # Return all registered sender IDs from Beem (background-refreshed)
+            from messaging.services.provider_metadata import provider_metadata
+            entry = provider_metadata.read('sender_ids:platform')
+            return [sender.get('senderid') for sender in entry['data'] or []]
             
         elif self.sender_id_restriction == 'default_only':
             return [self.default_sender_id] if self.default_sender_id else []
@@ -413,6 +406,9 @@ class UsageRecord(models.Model):
     class Meta:
         db_table = 'sms_usage_records'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['tenant', 'created_at']),
+        ]
 
     def __str__(self):
         return f"Usage {self.tenant.name} - {self.credits_used} credits"
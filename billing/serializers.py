@@ -2,6 +2,8 @@
 Serializers for billing functionality.
 """
 from rest_framework import serializers
+
+from core.phone import PhoneNumberError, to_national
 from .models import (
     SMSPackage, SMSBalance, Purchase, UsageRecord, 
     BillingPlan, Subscription, PaymentTransaction, CustomSMSPurchase
@@ -155,15 +157,9 @@ class PaymentInitiateSerializer(serializers.Serializer):
     
     def validate_buyer_phone(self, value):
         """Validate Tanzanian phone number format."""
-        # Remove any non-digit characters
-        phone = ''.join(filter(str.isdigit, value))
-        
-        # Check if it's a valid Tanzanian mobile number
-        if phone.startswith('07') and len(phone) == 10:
-            return value
-        elif phone.startswith('2557') and len(phone) == 13:
-            return value
-        else:
+        try:
+            return to_national(value, 'TZ')
+        except PhoneNumberError:
             raise serializers.ValidationError(
                 "Please provide a valid Tanzanian mobile number (e.g., 0744963858)"
             )
@@ -203,7 +199,7 @@ class CustomSMSPurchaseCreateSerializer(serializers.Serializer):
     buyer_phone = serializers.CharField(max_length=20)
     mobile_money_provider = serializers.ChoiceField(
         choices=['vodacom', 'tigo', 'airtel', 'halotel'],
-        default='vodacom'
+        required=False
     )
     
     def validate_credits(self, value):
@@ -216,17 +212,9 @@ class CustomSMSPurchaseCreateSerializer(serializers.Serializer):
     
     def validate_buyer_phone(self, value):
         """Validate phone number format."""
-        # Remove any non-digit characters
-        phone = ''.join(filter(str.isdigit, value))
-        
-        # Check if it's a valid Tanzanian mobile number
-        if phone.startswith(('07', '06')) and len(phone) == 10:
-            return phone
-        elif phone.startswith('255') and len(phone) == 12:
-            # Convert from international format
-            if phone[3:5] in ['07', '06']:
-                return '0' + phone[3:]
-        
-        raise serializers.ValidationError(
-            "Please provide a valid Tanzanian mobile number (e.g., 0744963858)"
-        )
\ No newline at end of file
+        try:
+            return to_national(value, 'TZ')
+        except PhoneNumberError:
+            raise serializers.ValidationError(
+                "Please provide a valid Tanzanian mobile number (e.g., 0744963858)"
+            )
\ No newline at end of file
@@ -0,0 +1,246 @@
+"""
+Unified transaction timeline (purchases, standalone payments, custom purchases).
+"""
+from django.db.models import CharField, F, IntegerField, Sum, Value
+from django.db.models.functions import Coalesce, NullIf
+
+from billing.models import CustomSMSPurchase, PaymentTransaction, Purchase
+
+TRANSACTION_TYPES = ('purchase', 'payment', 'custom')
+
+
+class TransactionTimeline:
+    """
+    Serves a tenant's transactions as one ``UNION ALL`` query.
+
+    Each branch projects the same narrow (id, created_at, type) columns, so
+    ordering, OFFSET/LIMIT and the count run in the database, and totals
+    are aggregated per branch. Only the rows on the requested page are
+    loaded in full.
+    """
+
+    def __init__(self, tenant, status=None, transaction_type=None, start=None, end=None):
+        self.tenant = tenant
+        self.status = status
+        self.transaction_type = transaction_type
+        # created_at range; ``end`` is exclusive
+        self.start = start
+        self.end = end
+
+    def _branches(self):
+        text = CharField()
+        branches = {
+            'purchase': Purchase.objects.filter(tenant=self.tenant).annotate(
+                kind=Value('purchase', output_field=text),
+                row_status=F('status'),
+                row_amount=F('amount'),
+                row_credits=F('credits'),
+            ),
+            # Payments that belong to a purchase are shown through that purchase
+            'payment': PaymentTransaction.objects.filter(
+                tenant=self.tenant, purchase__isnull=True, custom_sms_purchase__isnull=True
+            ).annotate(
+                kind=Value('payment', output_field=text),
+                row_status=F('status'),
+                row_amount=F('amount'),
+                row_credits=Value(None, output_field=IntegerField()),
+            ),
+            # Custom purchases report their payment's status when they have one
+            'custom': CustomSMSPurchase.objects.filter(tenant=self.tenant).annotate(
+                kind=Value('custom', output_field=text),
+                row_status=Coalesce(NullIf(F('payment_transaction__status'), Value('')), F('status'), output_field=text),
+                row_amount=F('total_price'),
+                row_credits=F('credits'),
+            ),
+        }
+
+        selected = {}
+        for kind, queryset in branches.items():
+            if self.transaction_type and kind != self.transaction_type:
+                continue
+            if self.status:
+                queryset = queryset.filter(status=self.status)
+            if self.start:
+                queryset = queryset.filter(created_at__gte=self.start)
+            if self.end:
+                queryset = queryset.filter(created_at__lt=self.end)
+            selected[kind] = queryset
+        return selected
+
+    def queryset(self):
+        """
+        The merged timeline, newest first, as (kind, id, created_at) rows.
+        """
+        branches = [
+            queryset.order_by().values('id', 'created_at', 'kind')
+            for queryset in self._branches().values()
+        ]
+        if not branches:
+            return Purchase.objects.none().values('id', 'created_at')
+        timeline = branches[0].union(*branches[1:], all=True) if len(branches) > 1 else branches[0]
+        return timeline.order_by('-created_at', '-id')
+
+    def count(self):
+        return self.queryset().count()
+
+    def totals(self):
+        """
+        Completed amount and credits across the filtered timeline.
+        """
+        total_amount = 0
+        total_credits = 0
+        for queryset in self._branches().values():
+            sums = queryset.filter(row_status='completed').aggregate(
+                amount=Sum('row_amount'), credits=Sum('row_credits')
+            )
+            total_amount += sums['amount'] or 0
+            total_credits += sums['credits'] or 0
+        return float(total_amount), total_credits
+
+    def page(self, start, end):
+        """
+        Load and format the rows between ``start`` and ``end``.
+        """
+        return self.hydrate(list(self.queryset()[start:end]))
+
+    def iter_rows(self, chunk_size=2000):
+        """
+        Yield every formatted row, loading ``chunk_size`` at a time.
+        """
+        chunk = []
+        for key in self.queryset().iterator(chunk_size=chunk_size):
+            chunk.append(key)
+            if len(chunk) >= chunk_size:
+                yield from self.hydrate(chunk)
+                chunk = []
+        if chunk:
+            yield from self.hydrate(chunk)
+
+    def hydrate(self, keys):
+        """
+        Format (id, created_at, kind) rows from ``queryset()`` in order.
+        """
+        ids = {kind: [row['id'] for row in keys if row['kind'] == kind] for kind in TRANSACTION_TYPES}
+
+        objects = {
+            'purchase': Purchase.objects.select_related('package').in_bulk(ids['purchase']) if ids['purchase'] else {},
+            'payment': PaymentTransaction.objects.in_bulk(ids['payment']) if ids['payment'] else {},
+            'custom': CustomSMSPurchase.objects.select_related('payment_transaction').in_bulk(ids['custom']) if ids['custom'] else {},
+        }
+        formatters = {'purchase': purchase_row, 'payment': payment_row, 'custom': custom_row}
+
+        rows = []
+        for key in keys:
+            obj = objects[key['kind']].get(key['id'])
+            if obj is None:
+                continue
+            row = formatters[key['kind']](obj)
+            # Map any "processing" status to "pending" for consistency
+            if row['status'] == 'processing':
+                row['status'] = 'pending'
+                row['status_display'] = 'Pending'
+            rows.append(row)
+        return rows
+
+
+def purchase_row(purchase):
+    package_name = purchase.package.name if purchase.package else 'Unknown Package'
+    return {
+        'id': str(purchase.id),
+        'type': 'purchase',
+        'type_display': 'SMS Package Purchase',
+        'invoice_number': purchase.invoice_number,
+        'amount': float(purchase.amount),
+        'currency': 'TZS',
+        'status': purchase.status,
+        'status_display': purchase.get_status_display(),
+        'payment_method': purchase.payment_method,
+        'payment_method_display': purchase.get_payment_method_display(),
+        'credits': purchase.credits,
+        'package_name': package_name,
+        'unit_price': float(purchase.unit_price),
+        'created_at': purchase.created_at,
+        'completed_at': purchase.completed_at,
+        'description': f"Purchased {purchase.credits} SMS credits from {package_name}",
+        'icon': '📦',
+        'color': 'blue'
+    }
+
+
+def payment_row(pt):
+    return {
+        'id': str(pt.id),
+        'type': 'payment',
+        'type_display': 'Payment Transaction',
+        'invoice_number': pt.invoice_number,
+        'amount': float(pt.amount),
+        'currency': pt.currency,
+        'status': pt.status,
+        'status_display': pt.get_status_display(),
+        'payment_method': pt.payment_method,
+        'payment_method_display': pt.get_payment_method_display(),
+        'credits': None,
+        'package_name': None,
+        'unit_price': None,
+        'created_at': pt.created_at,
+        'completed_at': pt.completed_at,
+        'description': f"Payment of {pt.amount} {pt.currency} via {pt.get_payment_method_display()}",
+        'buyer_name': pt.buyer_name,
+        'buyer_email': pt.buyer_email,
+        'buyer_phone': pt.buyer_phone,
+        'icon': '💳',
+        'color': 'green'
+    }
+
+
+def custom_row(csp):
+    # Prefer payment status if available (so the row reflects real payment progress)
+    combined_status = csp.status
+    payment_method_display = 'Custom Purchase'
+    payment_method = 'custom'
+    invoice_number = f"CSP-{str(csp.id)[:8].upper()}"
+    buyer_name = None
+    buyer_email = None
+    buyer_phone = None
+    order_id = None
+
+    if getattr(csp, 'payment_transaction', None):
+        pt = csp.payment_transaction
+        invoice_number = pt.invoice_number or invoice_number
+        combined_status = pt.status or combined_status
+        payment_method = pt.payment_method
+        payment_method_display = pt.get_payment_method_display()
+        buyer_name = pt.buyer_name
+        buyer_email = pt.buyer_email
+        buyer_phone = pt.buyer_phone
+        order_id = pt.order_id
+
+    return {
+        'id': str(csp.id),
+        'type': 'custom',
+        'type_display': 'Custom SMS Purchase',
+        'invoice_number': invoice_number,
+        'amount': float(csp.total_price),
+        'currency': 'TZS',
+        'status': combined_status,
+        'status_display': combined_status.title() if isinstance(combined_status, str) else str(combined_status),
+        'payment_method': payment_method,
+        'payment_method_display': payment_method_display,
+        'credits': csp.credits,
+        'package_name': f"Custom ({csp.active_tier})",
+        'unit_price': float(csp.unit_price),
+        'created_at': csp.created_at,
+        'completed_at': csp.completed_at,
+        'description': f"Custom purchase of {csp.credits} SMS credits at {csp.unit_price} TZS each",
+        'tier_info': {
+            'active_tier': csp.active_tier,
+            'min_credits': csp.tier_min_credits,
+            'max_credits': csp.tier_max_credits
+        },
+        'buyer_name': buyer_name,
+        'buyer_email': buyer_email,
+        'buyer_phone': buyer_phone,
+        'order_id': order_id,
+        'icon': '⚙️',
+        'color': 'purple'
+    }
@@ -1,11 +1,13 @@
 """
 Signals for billing app.
 """
-from django.db.models.signals import post_migrate
+from django.db.models.signals import post_delete, post_migrate, post_save
 from django.dispatch import receiver
 from django.core.management import call_command
 from django.conf import settings
 
+from core.cache import invalidate_tags
+
 
 @receiver(post_migrate)
 def setup_sms_packages(sender, **kwargs):
@@ -37,3 +39,10 @@ def setup_sms_packages(sender, **kwargs):
                 except Exception as e:
                     # Log error but don't fail the migration
                     print(f"Warning: Could not update SMS packages: {e}")
+
+
+@receiver(post_save, sender='billing.SMSPackage')
+@receiver(post_delete, sender='billing.SMSPackage')
+def invalidate_sms_packages(sender, **kwargs):
+    """Drop cached package listings after a package changes."""
+    invalidate_tags('sms_packages')
@@ -481,6 +481,29 @@ class PaymentAPITests(BillingAPITestCase):
         self.assertEqual(response.data['data']['mobile_money_provider'], 'vodacom')
         self.assertEqual(response.data['data']['provider_name'], 'Vodacom M-Pesa')
     
+    @patch('billing.zenopay_service.zenopay_service.create_payment')
+    def test_initiate_payment_detects_provider(self, mock_create_payment):
+        """Test the provider defaults to the buyer phone's network."""
+        mock_create_payment.return_value = {
+            'success': True,
+            'order_id': 'ZENO-123456',
+            'message': 'Payment request sent successfully'
+        }
+        
+        url = reverse('payment-initiate')
+        data = {
+            'package_id': str(self.standard_package.id),
+            'buyer_email': 'test@example.com',
+            'buyer_name': 'John Doe',
+            'buyer_phone': '+255 784 963 858'
+        }
+        
+        response = self.client.post(url, data, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['data']['mobile_money_provider'], 'airtel')
+        self.assertEqual(mock_create_payment.call_args.kwargs['buyer_phone'], '0784963858')
+    
     def test_initiate_payment_validation(self):
         """Test payment initiation validation."""
         url = reverse('payment-initiate')
@@ -982,6 +1005,101 @@ class DataValidationTests(BillingAPITestCase):
         self.assertEqual(total_costs, 7500.00)  # 2500.00 + 5000.00
 
 
+
+class HistoryCursorPaginationTests(BillingAPITestCase):
+    """Test keyset pagination on the history endpoints."""
+    
+    def test_usage_history_cursor_pages_without_gaps(self):
+        """Cursor pages cover every row once, even with tied timestamps."""
+        now = timezone.now()
+        for i in range(25):
+            record = UsageRecord.objects.create(tenant=self.tenant, credits_used=1, cost=Decimal('25.00'))
+            UsageRecord.objects.filter(id=record.id).update(created_at=now - timedelta(minutes=i // 4))
+        
+        url = reverse('usage-history-detailed')
+        params = {'pagination': 'cursor', 'page_size': 10}
+        seen = []
+        pages = 0
+        while True:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = response.data['data']
+            self.assertNotIn('count', data['pagination'])
+            seen += [row['id'] for row in data['usage_records']]
+            pages += 1
+            if not data['pagination']['next_cursor']:
+                break
+            params['cursor'] = data['pagination']['next_cursor']
+            # Rows inserted while paging do not shift later pages
+            UsageRecord.objects.create(tenant=self.tenant, credits_used=1, cost=Decimal('25.00'))
+        
+        self.assertEqual(pages, 3)
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+    
+    def test_invalid_cursor_is_rejected(self):
+        """A malformed cursor returns 400."""
+        response = self.client.get(reverse('usage-history-detailed'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+
+class ComprehensiveHistoryTests(BillingAPITestCase):
+    """Test the merged transaction timeline."""
+    
+    def setUp(self):
+        super().setUp()
+        tenant = self.user.tenant
+        linked_payment = PaymentTransaction.objects.create(
+            tenant=tenant, order_id='MIFUMO-LINKED', invoice_number='INV-PT-LINKED', zenopay_order_id='ZP-LINKED', amount=Decimal('100000.00'), status='completed'
+        )
+        Purchase.objects.create(
+            tenant=tenant, user=self.user, package=self.standard_package, invoice_number='INV-TL-1',
+            amount=Decimal('100000.00'), credits=5000, unit_price=Decimal('20.00'),
+            payment_method='zenopay_mobile_money', status='completed', payment_transaction=linked_payment
+        )
+        for i in range(3):
+            PaymentTransaction.objects.create(
+                tenant=tenant, order_id=f'MIFUMO-STANDALONE-{i}', invoice_number=f'INV-PT-{i}', zenopay_order_id=f'ZP-{i}', amount=Decimal('1000.00'), status='processing'
+            )
+        custom_payment = PaymentTransaction.objects.create(
+            tenant=tenant, order_id='MIFUMO-CUSTOM', invoice_number='INV-PT-CUSTOM', zenopay_order_id='ZP-CUSTOM', amount=Decimal('6000.00'), status='completed'
+        )
+        CustomSMSPurchase.objects.create(
+            tenant=tenant, credits=200, unit_price=Decimal('30.00'), total_price=Decimal('6000.00'),
+            active_tier='Lite', tier_min_credits=1, tier_max_credits=49999, status='pending',
+            payment_transaction=custom_payment
+        )
+    
+    def test_timeline_pages_and_totals(self):
+        """Rows from all sources are merged, paginated and totalled in the database."""
+        url = reverse('comprehensive-transaction-history')
+        response = self.client.get(url, {'page_size': 3})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data['data']
+        self.assertEqual(data['summary']['total_transactions'], 5)
+        self.assertEqual(data['summary']['total_amount'], 106000.0)
+        self.assertEqual(data['summary']['total_credits'], 5200)
+        self.assertEqual(len(data['transactions']), 3)
+        self.assertEqual(data['pagination']['total_pages'], 2)
+        
+        second = self.client.get(url, {'page_size': 3, 'page': 2}).data['data']['transactions']
+        rows = data['transactions'] + second
+        self.assertEqual(len({row['id'] for row in rows}), 5)
+        self.assertEqual([row['created_at'] for row in rows], sorted((row['created_at'] for row in rows), reverse=True))
+        self.assertTrue(all(row['status'] == 'pending' for row in rows if row['type'] == 'payment'))
+        custom = next(row for row in rows if row['type'] == 'custom')
+        self.assertEqual(custom['status'], 'completed')
+    
+    def test_type_filter(self):
+        """Filtering by type only queries that source."""
+        url = reverse('comprehensive-transaction-history')
+        data = self.client.get(url, {'transaction_type': 'payment'}).data['data']
+        self.assertEqual(data['summary']['total_transactions'], 3)
+        self.assertEqual(data['summary']['total_amount'], 0)
+
+
 if __name__ == '__main__':
     import django
     from django.conf import settings
@@ -20,6 +20,36 @@ from .serializers import (
     PurchaseSerializer, PaymentTransactionSerializer, UsageRecordSerializer,
     CustomSMSPurchaseSerializer
 )
+from .services.timeline import TransactionTimeline
+from core.pagination import keyset_page, page_size_from, wants_cursor
+
+
+def _keyset_response(request, queryset, serializer_class, key):
+    """
+    Cursor-mode response for the history endpoints: no COUNT, no OFFSET.
+    """
+    page_size = page_size_from(request, 20)
+    try:
+        rows, next_cursor = keyset_page(queryset, page_size, request.query_params.get('cursor'))
+    except ValueError:
+        return Response(
+            {
+                'success': False,
+                'message': 'Invalid cursor.',
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    return Response({
+        'success': True,
+        'data': {
+            key: serializer_class(rows, many=True).data,
+            'pagination': {
+                'next_cursor': next_cursor,
+                'page_size': page_size,
+            }
+        }
+    })
 
 
 class BillingHistoryView(generics.ListAPIView):
@@ -367,6 +397,12 @@ def billing_history_summary(request):
             type=openapi.TYPE_INTEGER,
             default=20
         ),
+        openapi.Parameter(
+            'cursor',
+            openapi.IN_QUERY,
+            description="Keyset cursor from a previous response; use pagination=cursor to start",
+            type=openapi.TYPE_STRING
+        ),
     ],
     responses={
         200: openapi.Response(
@@ -449,6 +485,9 @@ def purchase_history_detailed(request):
         # Order by creation date
         queryset = queryset.order_by('-created_at')
         
+        if wants_cursor(request):
+            return _keyset_response(request, queryset, PurchaseSerializer, 'purchases')
+        
         # Pagination
         total_count = queryset.count()
         start_index = (page - 1) * page_size
@@ -533,6 +572,12 @@ def purchase_history_detailed(request):
             type=openapi.TYPE_INTEGER,
             default=20
         ),
+        openapi.Parameter(
+            'cursor',
+            openapi.IN_QUERY,
+            description="Keyset cursor from a previous response; use pagination=cursor to start",
+            type=openapi.TYPE_STRING
+        ),
     ],
     responses={
         200: openapi.Response(
@@ -619,6 +664,9 @@ def payment_history_detailed(request):
         # Order by creation date
         queryset = queryset.order_by('-created_at')
         
+        if wants_cursor(request):
+            return _keyset_response(request, queryset, PaymentTransactionSerializer, 'transactions')
+        
         # Pagination
         total_count = queryset.count()
         start_index = (page - 1) * page_size
@@ -689,6 +737,12 @@ def payment_history_detailed(request):
             type=openapi.TYPE_INTEGER,
             default=20
         ),
+        openapi.Parameter(
+            'cursor',
+            openapi.IN_QUERY,
+            description="Keyset cursor from a previous response; use pagination=cursor to start",
+            type=openapi.TYPE_STRING
+        ),
     ],
     responses={
         200: openapi.Response(
@@ -764,6 +818,9 @@ def usage_history_detailed(request):
         # Order by creation date
         queryset = queryset.order_by('-created_at')
         
+        if wants_cursor(request):
+            return _keyset_response(request, queryset, UsageRecordSerializer, 'usage_records')
+        
         # Pagination
         total_count = queryset.count()
         start_index = (page - 1) * page_size
@@ -863,156 +920,21 @@ def comprehensive_transaction_history(request):
         page = int(request.query_params.get('page', 1))
         page_size = int(request.query_params.get('page_size', 20))
         
-        # Collect all transaction types
-        transactions = []
-        
-        # 1. Regular Purchases
-        purchases = Purchase.objects.filter(tenant=tenant).select_related('package')
-        if status_filter:
-            purchases = purchases.filter(status=status_filter)
-        
-        for purchase in purchases:
-            transactions.append({
-                'id': str(purchase.id),
-                'type': 'purchase',
-                'type_display': 'SMS Package Purchase',
-                'invoice_number': purchase.invoice_number,
-                'amount': float(purchase.amount),
-                'currency': 'TZS',
-                'status': purchase.status,
-                'status_display': purchase.get_status_display(),
-                'payment_method': purchase.payment_method,
-                'payment_method_display': purchase.get_payment_method_display(),
-                'credits': purchase.credits,
-                'package_name': purchase.package.name if purchase.package else 'Unknown Package',
-                'unit_price': float(purchase.unit_price),
-                'created_at': purchase.created_at,
-                'completed_at': purchase.completed_at,
-                'description': f"Purchased {purchase.credits} SMS credits from {purchase.package.name if purchase.package else 'Unknown Package'}",
-                'icon': '📦',
-                'color': 'blue'
-            })
-        
-        # 2. Payment Transactions (standalone only - exclude ones that belong to a purchase or custom purchase)
-        from billing.models import PaymentTransaction
-        payment_transactions = (
-            PaymentTransaction.objects
-            .filter(tenant=tenant, purchase__isnull=True, custom_sms_purchase__isnull=True)
-        )
-        if status_filter:
-            payment_transactions = payment_transactions.filter(status=status_filter)
-        
-        for pt in payment_transactions:
-            transactions.append({
-                'id': str(pt.id),
-                'type': 'payment',
-                'type_display': 'Payment Transaction',
-                'invoice_number': pt.invoice_number,
-                'amount': float(pt.amount),
-                'currency': pt.currency,
-                'status': pt.status,
-                'status_display': pt.get_status_display(),
-                'payment_method': pt.payment_method,
-                'payment_method_display': pt.get_payment_method_display(),
-                'credits': None,
-                'package_name': None,
-                'unit_price': None,
-                'created_at': pt.created_at,
-                'completed_at': pt.completed_at,
-                'description': f"Payment of {pt.amount} {pt.currency} via {pt.get_payment_method_display()}",
-                'buyer_name': pt.buyer_name,
-                'buyer_email': pt.buyer_email,
-                'buyer_phone': pt.buyer_phone,
-                'icon': '💳',
-                'color': 'green'
-            })
-        
-        # 3. Custom SMS Purchases (combine with their payment data into a single entry)
-        from billing.models import CustomSMSPurchase
-        custom_purchases = CustomSMSPurchase.objects.filter(tenant=tenant)
-        if status_filter:
-            custom_purchases = custom_purchases.filter(status=status_filter)
-        
-        for csp in custom_purchases:
-            # Prefer payment status if available (so the row reflects real payment progress)
-            combined_status = csp.status
-            payment_method_display = 'Custom Purchase'
-            payment_method = 'custom'
-            invoice_number = f"CSP-{str(csp.id)[:8].upper()}"
-            buyer_name = None
-            buyer_email = None
-            buyer_phone = None
-            order_id = None
-
-            if getattr(csp, 'payment_transaction', None):
-                pt = csp.payment_transaction
-                invoice_number = pt.invoice_number or invoice_number
-                combined_status = pt.status or combined_status
-                payment_method = pt.payment_method
-                payment_method_display = pt.get_payment_method_display()
-                buyer_name = pt.buyer_name
-                buyer_email = pt.buyer_email
-                buyer_phone = pt.buyer_phone
-                order_id = pt.order_id
-            
-            transactions.append({
-                'id': str(csp.id),
-                'type': 'custom',
-                'type_display': 'Custom SMS Purchase',
-                'invoice_number': invoice_number,
-                'amount': float(csp.total_price),
-                'currency': 'TZS',
-                'status': combined_status,
-                'status_display': combined_status.title() if isinstance(combined_status, str) else str(combined_status),
-                'payment_method': payment_method,
-                'payment_method_display': payment_method_display,
-                'credits': csp.credits,
-                'package_name': f"Custom ({csp.active_tier})",
-                'unit_price': float(csp.unit_price),
-                'created_at': csp.created_at,
-                'completed_at': csp.completed_at,
-                'description': f"Custom purchase of {csp.credits} SMS credits at {csp.unit_price} TZS each",
-                'tier_info': {
-                    'active_tier': csp.active_tier,
-                    'min_credits': csp.tier_min_credits,
-                    'max_credits': csp.tier_max_credits
-                },
-                'buyer_name': buyer_name,
-                'buyer_email': buyer_email,
-                'buyer_phone': buyer_phone,
-                'order_id': order_id,
-                'icon': '⚙️',
-                'color': 'purple'
-            })
-        
-        # Filter by transaction type if specified
-        if transaction_type:
-            transactions = [t for t in transactions if t['type'] == transaction_type]
-        
-        # Sort by creation date (newest first)
-        transactions.sort(key=lambda x: x['created_at'], reverse=True)
-        
-        # Ensure all transactions have consistent status mapping
-        for transaction in transactions:
-            # Map any "processing" status to "pending" for consistency
-            if transaction['status'] == 'processing':
-                transaction['status'] = 'pending'
-                transaction['status_display'] = 'Pending'
+        timeline = TransactionTimeline(tenant, status=status_filter, transaction_type=transaction_type)
         
         # Pagination
-        total_count = len(transactions)
+        total_count = timeline.count()
         start_index = (page - 1) * page_size
         end_index = start_index + page_size
         
-        paginated_transactions = transactions[start_index:end_index]
+        paginated_transactions = timeline.page(start_index, end_index)
         
         # Calculate pagination info
         has_next = end_index < total_count
         has_previous = page > 1
         
         # Calculate summary statistics
-        total_amount = sum(t['amount'] for t in transactions if t['status'] == 'completed')
-        total_credits = sum(t['credits'] for t in transactions if t['credits'] and t['status'] == 'completed')
+        total_amount, total_credits = timeline.totals()
         
         return Response({
             'success': True,
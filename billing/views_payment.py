@@ -29,6 +29,9 @@ from .serializers import (
     CustomSMSPurchaseSerializer, CustomSMSPurchaseCreateSerializer
 )
 from .zenopay_service import zenopay_service
+from core.operators import operator_directory
+from core.phone import PhoneNumberError, to_national
+from messaging.services.inbox import inbound_inbox
 
 logger = logging.getLogger(__name__)
 
@@ -99,7 +102,7 @@ class PaymentTransactionDetailView(generics.RetrieveAPIView):
             "mobile_money_provider": openapi.Schema(
                 type=openapi.TYPE_STRING,
                 enum=["vodacom", "tigo", "airtel", "halotel"],
-                description="Mobile money provider code (default: vodacom)"
+                description="Mobile money provider code (default: the buyer phone's network, else vodacom)"
             )
         },
     ),
@@ -150,7 +153,7 @@ def initiate_payment(request):
         buyer_email = request.data.get('buyer_email')
         buyer_name = request.data.get('buyer_name')
         buyer_phone = request.data.get('buyer_phone')
-        mobile_money_provider = request.data.get('mobile_money_provider', 'vodacom')
+        mobile_money_provider = request.data.get('mobile_money_provider')
 
         if not all([package_id, buyer_email, buyer_name, buyer_phone]):
             return Response({
@@ -158,19 +161,25 @@ def initiate_payment(request):
                 'message': 'Missing required fields: package_id, buyer_email, buyer_name, buyer_phone'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Validate mobile money provider
-        valid_providers = [p['code'] for p in get_mobile_money_providers_data()]
-        if mobile_money_provider not in valid_providers:
+        # Validate phone number format (07 or 06)
+        try:
+            buyer_phone = to_national(buyer_phone, 'TZ')
+        except PhoneNumberError:
             return Response({
                 'success': False,
-                'message': f'Invalid mobile money provider. Choose from: {", ".join(valid_providers)}'
+                'message': 'Invalid phone number. Must be a Tanzanian mobile number starting with 07 or 06 (e.g., 0744963858)'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Validate phone number format (07 or 06)
-        if not buyer_phone.startswith(('07', '06')):
+        # Default to the mobile money service of the buyer's own network
+        if not mobile_money_provider:
+            mobile_money_provider = detect_mobile_money_provider(buyer_phone)
+
+        # Validate mobile money provider
+        valid_providers = [p['code'] for p in get_mobile_money_providers_data()]
+        if mobile_money_provider not in valid_providers:
             return Response({
                 'success': False,
-                'message': 'Invalid phone number. Must be a Tanzanian mobile number starting with 07 or 06 (e.g., 0744963858)'
+                'message': f'Invalid mobile money provider. Choose from: {", ".join(valid_providers)}'
             }, status=status.HTTP_400_BAD_REQUEST)
 
         # Validate package_id format
@@ -626,6 +635,7 @@ def payment_webhook(request):
     Handle ZenoPay webhook notifications.
     POST /api/billing/payments/webhook/
     """
+    event_key = None
     try:
         # Validate webhook authentication using ZenoPay API key
         # According to ZenoPay docs, they send x-api-key in the header
@@ -651,6 +661,11 @@ def payment_webhook(request):
             order_id = webhook_response.get('order_id')
             payment_status = webhook_response.get('payment_status')
 
+            # ZenoPay repeats notifications until acknowledged; each status is handled once
+            event_key = f"{order_id}:{payment_status}"
+            if not inbound_inbox.claim('zenopay', event_key):
+                return Response({'success': True, 'message': 'Webhook already processed'})
+
             try:
                 payment_transaction = PaymentTransaction.objects.get(zenopay_order_id=order_id)
                 
@@ -684,6 +699,7 @@ def payment_webhook(request):
                             logger.warning(f"Webhook status unclear for order {order_id}, keeping as pending")
                     else:
                         logger.warning(f"Failed to verify webhook with ZenoPay API for order {order_id}")
+                        inbound_inbox.release('zenopay', event_key)
                         payment_transaction.webhook_data = webhook_data
                         payment_transaction.save()
                         
@@ -700,6 +716,7 @@ def payment_webhook(request):
                 return Response({'success': True, 'message': 'Webhook processed successfully'})
             except PaymentTransaction.DoesNotExist:
                 logger.error(f"Payment transaction not found for zenopay_order_id: {order_id}")
+                inbound_inbox.release('zenopay', event_key)
                 return Response({'success': False, 'message': 'Transaction not found'}, status=status.HTTP_404_NOT_FOUND)
         else:
             return Response({'success': False, 'message': 'Webhook processing failed', 'error': webhook_response.get('error')},
@@ -707,6 +724,8 @@ def payment_webhook(request):
 
     except Exception as e:
         logger.exception("Webhook processing error")
+        if event_key:
+            inbound_inbox.release('zenopay', event_key)
         return Response({'success': False, 'message': 'Webhook processing failed', 'error': str(e)},
                         status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -1065,11 +1084,16 @@ def get_mobile_money_providers(request):
     try:
         providers = get_mobile_money_providers_data()
         
-        return Response({
+        data = {
             'success': True,
             'providers': providers,
             'message': f'Found {len(providers)} mobile money providers'
-        })
+        }
+        # With ?phone=, also say which provider that number's network uses
+        phone = request.query_params.get('phone')
+        if phone:
+            data['detected_provider'] = operator_directory.mobile_money_provider(phone, 'TZ')
+        return Response(data)
         
     except Exception as e:
         logger.error(f"Error getting mobile money providers: {str(e)}")
@@ -1129,6 +1153,11 @@ def get_mobile_money_providers_data():
     ]
 
 
+def detect_mobile_money_provider(phone, default='vodacom'):
+    """Mobile money provider of the phone number's network (``default`` if unknown)."""
+    return operator_directory.mobile_money_provider(phone, 'TZ') or default
+
+
 def get_provider_name(code):
     """Get provider name by code."""
     providers = get_mobile_money_providers_data()
@@ -1302,7 +1331,7 @@ def initiate_custom_sms_purchase(request):
         buyer_email = validated_data['buyer_email']
         buyer_name = validated_data['buyer_name']
         buyer_phone = validated_data['buyer_phone']
-        mobile_money_provider = validated_data.get('mobile_money_provider', 'vodacom')
+        mobile_money_provider = validated_data.get('mobile_money_provider') or detect_mobile_money_provider(buyer_phone)
 
         with transaction.atomic():
             # Create custom SMS purchase
@@ -13,6 +13,7 @@ from datetime import datetime, timedelta
 import logging
 import uuid
 
+from core.cache import TieredCache
 from .models import (
     SMSPackage,
     SMSBalance,
@@ -33,6 +34,9 @@ from .serializers import (
 
 logger = logging.getLogger(__name__)
 
+# Active packages are the same for every tenant; invalidated by billing.signals
+package_cache = TieredCache('sms_packages', ttl=3600)
+
 
 # ---------------------------------------------------------------------------
 # Helpers so schema generation (drf_yasg) / anonymous requests don't crash
@@ -60,6 +64,17 @@ class SMSPackageListView(generics.ListAPIView):
         # Safe for schema gen too – no user access here
         return SMSPackage.objects.filter(is_active=True).order_by("price")
 
+    def list(self, request, *args, **kwargs):
+        packages = package_cache.get_or_set(
+            "active",
+            lambda: list(self.get_serializer(self.get_queryset(), many=True).data),
+            tags=["sms_packages"],
+        )
+        page = self.paginate_queryset(packages)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(packages)
+
 
 class SMSBalanceView(generics.RetrieveAPIView):
     """
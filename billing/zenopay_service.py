@@ -9,6 +9,8 @@ from django.utils import timezone
 from decimal import Decimal
 import uuid
 
+from core.phone import to_national
+
 logger = logging.getLogger(__name__)
 
 
@@ -39,28 +41,7 @@ class ZenoPayService:
         Validate and format Tanzanian phone number.
         Expected format: 07XXXXXXXX (as per ZenoPay docs)
         """
-        # Remove any non-digit characters
-        phone = ''.join(filter(str.isdigit, phone))
-        
-        # Handle different input formats
-        if phone.startswith('07'):
-            # Already in correct format
-            return phone
-        elif phone.startswith('06'):
-            # Halotel numbers (06 prefix) - keep as is
-            return phone
-        elif phone.startswith('255'):
-            # Convert from international format to local
-            if phone[3:5] in ['07', '06']:
-                return '0' + phone[3:]
-            else:
-                return '0' + phone[3:]
-        else:
-            # Assume it's missing the prefix
-            if len(phone) == 9:
-                return '0' + phone
-            else:
-                return '07' + phone
+        return to_national(phone, 'TZ')
     
     def create_payment(self, order_id, buyer_email, buyer_name, buyer_phone, amount, webhook_url=None, mobile_money_provider='vodacom'):
         """
@@ -0,0 +1,334 @@
+"""
+Caching helpers shared across apps.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache, caches
+
+logger = logging.getLogger(__name__)
+
+
+class LocalObjectCache:
+    """
+    Per-process cache for objects that are expensive to build and cannot be
+    pickled into a shared cache (compiled regexes, flow graphs).
+
+    Each key carries a version number in the shared Django cache;
+    ``invalidate`` bumps it so every process rebuilds on its next lookup.
+    Versions are re-read at most every ``check_interval`` seconds and local
+    entries expire after ``ttl`` seconds, which bounds staleness when the
+    configured cache is process-local.
+    """
+
+    def __init__(self, namespace, ttl=300, check_interval=2):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _version_key(self, key):
+        return f'{self.namespace}:version:{key}'
+
+    def _shared_version(self, key):
+        return cache.get(self._version_key(key), 0)
+
+    def get(self, key, builder):
+        """
+        Return the object for ``key``, calling ``builder()`` to (re)build it.
+        """
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, version, built_at, checked_at = entry
+            if now - built_at < self.ttl:
+                if now - checked_at < self.check_interval:
+                    return value
+                if self._shared_version(key) == version:
+                    self._entries[key] = (value, version, built_at, now)
+                    return value
+
+        with self._lock:
+            version = self._shared_version(key)
+            value = builder()
+            self._entries[key] = (value, version, now, now)
+            return value
+
+    def invalidate(self, key):
+        """Drop the local entry and tell other processes to rebuild."""
+        self._entries.pop(key, None)
+        version_key = self._version_key(key)
+        cache.add(version_key, 0, None)
+        try:
+            cache.incr(version_key)
+        except ValueError:
+            cache.set(version_key, 1, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+_tiered_caches = {}
+
+STAT_NAMES = ('l1_hits', 'l2_hits', 'misses', 'refreshes', 'waits', 'errors')
+
+STATS_NAMESPACES_KEY = 'cache-stats:namespaces'
+
+
+class TieredCache:
+    """
+    Two-tier cache for values that are cheap to pickle but costly to compute.
+
+    L1 is a small per-process LRU whose entries live ``l1_ttl`` seconds; L2
+    is the shared Django cache, so every gunicorn and Celery process sees
+    the same entries. Keys carry the namespace's ``version`` (bump it when
+    the cached shape changes) and every entry records the versions of its
+    tags at build time, so ``invalidate_tags`` expires all of them with one
+    write.
+
+    Stampedes are avoided by letting one caller per key rebuild: threads
+    of a process wait on a lock and other processes on a short-lived lock
+    key in L2. After a miss (an expired or invalidated entry) the other
+    callers block until that rebuild lands, up to ``lock_timeout``. Entries
+    are refreshed by a single caller once ``early_refresh`` of their TTL is
+    left, and only then do the rest keep getting the current value while
+    it rebuilds, so popular keys rarely expire outright.
+
+    Cached values are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, namespace, ttl=300, version=1, l1_ttl=None, l1_size=None,
+                 early_refresh=0.2, lock_timeout=10, alias='default'):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.version = version
+        self.l1_ttl = l1_ttl if l1_ttl is not None else getattr(settings, 'TIERED_CACHE_L1_TTL', 5)
+        self.l1_size = l1_size or getattr(settings, 'TIERED_CACHE_L1_SIZE', 512)
+        self.early_refresh = early_refresh
+        self.lock_timeout = lock_timeout
+        self.alias = alias
+        self.stats = dict.fromkeys(STAT_NAMES, 0)
+        self._flushed = dict.fromkeys(STAT_NAMES, 0)
+        self._flushed_at = time.monotonic()
+        self._l1 = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(64)]
+        _tiered_caches[namespace] = self
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def _key(self, key):
+        return f'{self.namespace}:v{self.version}:{key}'
+
+    def _tag_keys(self, tags):
+        return [tag_key(tag) for tag in (f'namespace:{self.namespace}',) + tuple(tags)]
+
+    def _count(self, name):
+        self.stats[name] += 1
+        if time.monotonic() - self._flushed_at >= getattr(settings, 'TIERED_CACHE_STATS_FLUSH_INTERVAL', 30):
+            self.flush_stats()
+
+    # L1 ------------------------------------------------------------------
+
+    def _l1_get(self, key):
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._l1[key]
+                return None
+            self._l1.move_to_end(key)
+            return entry
+
+    def _l1_set(self, key, value, tags):
+        with self._lock:
+            self._l1[key] = (value, time.monotonic() + self.l1_ttl, frozenset(tags))
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_size:
+                self._l1.popitem(last=False)
+
+    def _l1_discard_tags(self, tags):
+        with self._lock:
+            for key in [key for key, entry in self._l1.items() if entry[2] & tags]:
+                del self._l1[key]
+
+    # L2 ------------------------------------------------------------------
+
+    def _lock_key(self, key):
+        return f'{key}:lock'
+
+    def _acquire(self, key):
+        try:
+            return self.backend.add(self._lock_key(key), 1, self.lock_timeout)
+        except Exception:
+            return True
+
+    def _release(self, key):
+        try:
+            self.backend.delete(self._lock_key(key))
+        except Exception:
+            pass
+
+    def _build(self, key, builder, ttl, tags, stamps):
+        value = builder()
+        entry = {
+            'value': value,
+            'stamps': stamps,
+            'refresh_at': time.time() + ttl * (1 - self.early_refresh),
+        }
+        try:
+            self.backend.set(key, entry, ttl)
+        except Exception as e:
+            self._count('errors')
+            logger.warning(f"Cache write failed for {key}: {e}")
+        self._l1_set(key, value, tags)
+        return value
+
+    def _key_lock(self, key):
+        # Striped so the number of locks stays fixed however many keys exist
+        return self._key_locks[hash(key) % len(self._key_locks)]
+
+    def get_or_set(self, key, builder, ttl=None, tags=()):
+        """
+        Return the cached value for ``key``, calling ``builder()`` on a miss.
+
+        Args:
+            key: Key within this cache's namespace
+            builder: Zero-argument callable producing the value
+            ttl: L2 lifetime in seconds (defaults to the cache's ttl)
+            tags: Tags that ``invalidate_tags`` can expire this entry by
+        """
+        ttl = ttl or self.ttl
+        full_key = self._key(key)
+        tag_keys = self._tag_keys(tags)
+
+        entry = self._l1_get(full_key)
+        if entry is not None:
+            self._count('l1_hits')
+            return entry[0]
+
+        try:
+            found = self.backend.get_many([full_key] + tag_keys)
+        except Exception as e:
+            self._count('errors')
+            logger.warning(f"Cache read failed for {full_key}: {e}")
+            return builder()
+
+        stamps = {tag: found.get(tag, 0) for tag in tag_keys}
+        stored = found.get(full_key)
+        if stored is not None and stored['stamps'] == stamps:
+            if time.time() >= stored['refresh_at'] and self._acquire(full_key):
+                # Refresh ahead of expiry; everyone else keeps the old value
+                self._count('refreshes')
+                try:
+                    return self._build(full_key, builder, ttl, tag_keys, stamps)
+                finally:
+                    self._release(full_key)
+            self._count('l2_hits')
+            self._l1_set(full_key, stored['value'], tag_keys)
+            return stored['value']
+
+        self._count('misses')
+        with self._key_lock(full_key):
+            entry = self._l1_get(full_key)
+            if entry is not None:
+                return entry[0]
+
+            if self._acquire(full_key):
+                try:
+                    return self._build(full_key, builder, ttl, tag_keys, stamps)
+                finally:
+                    self._release(full_key)
+
+            # Another process is building this key; wait for its result
+            self._count('waits')
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                stored = self.backend.get(full_key)
+                if stored is not None and stored['stamps'] == stamps:
+                    self._l1_set(full_key, stored['value'], tag_keys)
+                    return stored['value']
+            return self._build(full_key, builder, ttl, tag_keys, stamps)
+
+    def delete(self, key):
+        full_key = self._key(key)
+        with self._lock:
+            self._l1.pop(full_key, None)
+        self.backend.delete(full_key)
+
+    def clear(self):
+        """Expire every entry in this namespace."""
+        invalidate_tags(f'namespace:{self.namespace}')
+
+    def flush_stats(self):
+        """Add counts since the last flush to the shared totals in L2."""
+        self._flushed_at = time.monotonic()
+        try:
+            namespaces = self.backend.get(STATS_NAMESPACES_KEY) or []
+            if self.namespace not in namespaces:
+                self.backend.set(STATS_NAMESPACES_KEY, sorted(namespaces + [self.namespace]), None)
+        except Exception:
+            return
+        for name in STAT_NAMES:
+            delta = self.stats[name] - self._flushed[name]
+            if not delta:
+                continue
+            stat_key = f'cache-stats:{self.namespace}:{name}'
+            try:
+                self.backend.add(stat_key, 0, None)
+                self.backend.incr(stat_key, delta)
+                self._flushed[name] = self.stats[name]
+            except Exception:
+                pass
+
+
+def tag_key(tag):
+    return f'cache-tag:{tag}'
+
+
+def invalidate_tags(*tags, alias='default'):
+    """
+    Expire every tiered-cache entry carrying any of ``tags``.
+
+    Other processes drop their L1 copies within ``TIERED_CACHE_L1_TTL``.
+    """
+    backend = caches[alias]
+    keys = [tag_key(tag) for tag in tags]
+    for key in keys:
+        backend.add(key, 0, None)
+        try:
+            backend.incr(key)
+        except ValueError:
+            backend.set(key, 1, None)
+    for tiered in list(_tiered_caches.values()):
+        tiered._l1_discard_tags(frozenset(keys))
+
+
+def cache_stats(alias='default'):
+    """
+    Hit/miss counters per tiered cache.
+
+    Returns:
+        dict: {namespace: {'process': {...}, 'shared': {...}}}; ``shared``
+        totals every process that has flushed its counts and ``process``
+        is only present for caches used by the calling process
+    """
+    backend = caches[alias]
+    for tiered in list(_tiered_caches.values()):
+        tiered.flush_stats()
+
+    report = {}
+    for namespace in backend.get(STATS_NAMESPACES_KEY) or sorted(_tiered_caches):
+        keys = [f'cache-stats:{namespace}:{name}' for name in STAT_NAMES]
+        shared = backend.get_many(keys)
+        report[namespace] = {'shared': {name: shared.get(key, 0) for name, key in zip(STAT_NAMES, keys)}}
+        if namespace in _tiered_caches:
+            report[namespace]['process'] = dict(_tiered_caches[namespace].stats)
+    return report
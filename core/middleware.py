@@ -6,9 +6,14 @@ import time
 from django.http import Http404
 from django.utils.deprecation import MiddlewareMixin
 from tenants.models import Tenant, Domain
+from .cache import TieredCache
 
 logger = logging.getLogger(__name__)
 
+# Host -> tenant id resolutions; invalidated by tenants.signals. Only the id
+# is cached, so every request works on a freshly loaded Tenant.
+tenant_cache = TieredCache('tenant_hosts', ttl=600, version=2)
+
 
 class TenantMiddleware(MiddlewareMixin):
     """
@@ -24,12 +29,13 @@ class TenantMiddleware(MiddlewareMixin):
         # Allow ngrok domains and localhost for development
         if host.endswith('.ngrok-free.dev') or host in ['localhost', '127.0.0.1']:
             # For ngrok and localhost, use the first available tenant for development
-            try:
-                request.tenant = Tenant.objects.filter(is_active=True).first()
-                return
-            except Tenant.DoesNotExist:
-                request.tenant = None
-                return
+            tenant_id = tenant_cache.get_or_set(
+                'development',
+                lambda: Tenant.objects.filter(is_active=True).values_list('id', flat=True).first(),
+                tags=['tenants']
+            )
+            request.tenant = self.load_tenant(tenant_id)
+            return
         
         # Skip tenant resolution for certain paths
         skip_paths = ['/admin/', '/swagger/', '/redoc/', '/webhooks/']
@@ -37,20 +43,24 @@ class TenantMiddleware(MiddlewareMixin):
             request.tenant = None
             return
         
+        tenant_id = tenant_cache.get_or_set(f'host:{host}', lambda: self.resolve_tenant_id(host), tags=['tenants'])
+        request.tenant = self.load_tenant(tenant_id)
+    
+    def load_tenant(self, tenant_id):
+        if tenant_id is None:
+            return None
+        return Tenant.objects.filter(pk=tenant_id).first()
+    
+    def resolve_tenant_id(self, host):
         # Try to find tenant by domain
-        try:
-            domain = Domain.objects.select_related('tenant').get(domain=host)
-            request.tenant = domain.tenant
-        except Domain.DoesNotExist:
-            # Try subdomain matching
-            subdomain = host.split('.')[0] if '.' in host else None
-            if subdomain and subdomain not in ['www', 'api', 'app']:
-                try:
-                    request.tenant = Tenant.objects.get(subdomain=subdomain)
-                except Tenant.DoesNotExist:
-                    request.tenant = None
-            else:
-                request.tenant = None
+        tenant_id = Domain.objects.filter(domain=host).values_list('tenant_id', flat=True).first()
+        if tenant_id is not None:
+            return tenant_id
+        # Try subdomain matching
+        subdomain = host.split('.')[0] if '.' in host else None
+        if subdomain and subdomain not in ['www', 'api', 'app']:
+            return Tenant.objects.filter(subdomain=subdomain).values_list('id', flat=True).first()
+        return None
 
 
 class RequestLoggingMiddleware(MiddlewareMixin):
@@ -0,0 +1,147 @@
+"""
+Operator detection by longest-prefix match on phone numbers.
+
+Prefix allocations (country, operator, network type and the operator's
+mobile-money service, where we can take payments through it) are read
+from ``MSISDN_PREFIX_FILE`` (``core/data/msisdn_prefixes.csv``) into a
+digit trie once per process. A lookup walks at most one node per digit
+of the number, however many prefixes are loaded, and the most specific
+prefix wins, so a ported block such as 254757 can sit under 25475.
+
+Numbers are normalized with core.phone first; invalid numbers have no
+operator.
+"""
+import csv
+import logging
+from collections import namedtuple
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .phone import PhoneNumberError, normalize, normalize_many
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREFIX_FILE = Path(__file__).resolve().parent / 'data' / 'msisdn_prefixes.csv'
+
+Operator = namedtuple('Operator', ['prefix', 'country', 'operator', 'network_type', 'mobile_money'])
+
+# Trie nodes are dicts keyed by digit; this key (never a digit) holds a node's value
+_VALUE = ''
+
+
+class PrefixTrie:
+    """
+    Digit trie mapping prefixes to values, matched on the longest prefix.
+    """
+
+    def __init__(self):
+        self.root = {}
+        self.size = 0
+
+    def insert(self, prefix, value):
+        node = self.root
+        for digit in prefix:
+            node = node.setdefault(digit, {})
+        if _VALUE not in node:
+            self.size += 1
+        node[_VALUE] = value
+
+    def longest_match(self, digits):
+        """The value of the longest prefix of ``digits``, or None."""
+        node = self.root
+        match = node.get(_VALUE)
+        for digit in digits:
+            node = node.get(digit)
+            if node is None:
+                break
+            match = node.get(_VALUE, match)
+        return match
+
+    def __len__(self):
+        return self.size
+
+
+def load_prefixes(path):
+    """
+    Read a prefix file (CSV with prefix, country, operator, network_type
+    and mobile_money columns) into a PrefixTrie.
+
+    Raises:
+        ImproperlyConfigured: if the file is missing or malformed
+    """
+    trie = PrefixTrie()
+    try:
+        with open(path, newline='', encoding='utf-8') as handle:
+            for line, row in enumerate(csv.DictReader(handle), start=2):
+                prefix = (row.get('prefix') or '').strip()
+                if not prefix.isdigit():
+                    raise ImproperlyConfigured(f"{path}:{line}: invalid prefix '{prefix}'")
+                trie.insert(prefix, Operator(
+                    prefix=prefix,
+                    country=row['country'].strip(),
+                    operator=row['operator'].strip(),
+                    network_type=(row.get('network_type') or 'mobile').strip(),
+                    mobile_money=(row.get('mobile_money') or '').strip() or None,
+                ))
+    except (OSError, KeyError) as e:
+        raise ImproperlyConfigured(f"Cannot load phone number prefixes from {path}: {str(e)}")
+    return trie
+
+
+class OperatorDirectory:
+    """
+    Finds the operator of phone numbers, one at a time or in batches.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or getattr(settings, 'MSISDN_PREFIX_FILE', None) or DEFAULT_PREFIX_FILE
+        self._trie = None
+
+    @property
+    def trie(self):
+        if self._trie is None:
+            self._trie = load_prefixes(self.path)
+            logger.info(f"Loaded {len(self._trie)} phone number prefixes from {self.path}")
+        return self._trie
+
+    def lookup(self, number, region=None):
+        """
+        Returns:
+            Operator: for the number, or None if it is invalid or unallocated
+        """
+        try:
+            e164 = normalize(number, region)
+        except PhoneNumberError:
+            return None
+        return self.trie.longest_match(e164[1:])
+
+    def lookup_many(self, numbers, region=None):
+        """
+        Operators for a batch of numbers (a campaign's audience, a sheet
+        column, ...), each distinct number matched once.
+
+        Returns:
+            list: Operator or None per number
+        """
+        match = self.trie.longest_match
+        seen = {}
+        operators = []
+        append = operators.append
+        for e164 in normalize_many(numbers, region):
+            if e164 is None:
+                append(None)
+                continue
+            operator = seen.get(e164, seen)
+            if operator is seen:
+                operator = seen[e164] = match(e164[1:])
+            append(operator)
+        return operators
+
+    def mobile_money_provider(self, number, region=None):
+        """The mobile-money provider code for the number's network, or None."""
+        operator = self.lookup(number, region)
+        return operator.mobile_money if operator else None
+
+
+operator_directory = OperatorDirectory()
@@ -0,0 +1,127 @@
+"""
+Keyset (cursor) pagination on (timestamp, id).
+
+Page-number pagination costs a COUNT(*) plus an OFFSET scan that grows with
+the page number. Keyset pagination instead remembers the last row returned
+and asks for rows strictly after it, which is an index range scan of one
+page regardless of depth, and does not skip or repeat rows when new ones
+are inserted while a client is paging.
+"""
+import base64
+import json
+from datetime import datetime
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def encode_cursor(timestamp, pk):
+    payload = json.dumps({'t': timestamp.isoformat(), 'id': str(pk)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Returns:
+        tuple: (timestamp, pk)
+
+    Raises:
+        ValueError: If the token is malformed
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(payload['t']), payload['id']
+    except (TypeError, KeyError, ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+def keyset_page(queryset, page_size, cursor=None, field='created_at'):
+    """
+    Return one page of ``queryset``, newest first, after ``cursor``.
+
+    Returns:
+        tuple: (rows, next_cursor) where next_cursor is None on the last page
+    """
+    queryset = queryset.order_by(f'-{field}', '-pk')
+    if cursor:
+        timestamp, pk = decode_cursor(cursor)
+        # The redundant lte bound lets the planner use a plain index range
+        queryset = queryset.filter(
+            Q(**{f'{field}__lte': timestamp}),
+            Q(**{f'{field}__lt': timestamp}) | Q(pk__lt=pk)
+        )
+
+    rows = list(queryset[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, field), last.pk)
+
+
+def wants_cursor(request):
+    """Clients opt in with ``?pagination=cursor`` or by sending a cursor."""
+    params = request.query_params
+    return params.get('pagination') == 'cursor' or 'cursor' in params
+
+
+def page_size_from(request, default=None):
+    try:
+        size = int(request.query_params.get('page_size', default or settings.REST_FRAMEWORK['PAGE_SIZE']))
+    except (TypeError, ValueError):
+        size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    return max(1, min(size, getattr(settings, 'API_MAX_PAGE_SIZE', 100)))
+
+
+class KeysetOrPageNumberPagination(PageNumberPagination):
+    """
+    Page-number pagination by default; keyset pagination on request.
+
+    Views can set ``keyset_field`` when their timestamp is not
+    ``created_at``. In cursor mode the response holds ``next``,
+    ``previous`` (always null) and ``results``; a ``count`` is only added
+    with ``?include_count=true``. ``page_size`` is only honoured in cursor
+    mode; page-number pages keep the configured PAGE_SIZE.
+    """
+
+    def get_page_size(self, request):
+        if not getattr(self, 'cursor_mode', False):
+            return super().get_page_size(request)
+        return page_size_from(request)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = wants_cursor(request)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        field = getattr(view, 'keyset_field', 'created_at')
+        try:
+            rows, self.next_cursor = keyset_page(
+                queryset, self.get_page_size(request), request.query_params.get('cursor'), field
+            )
+        except ValueError:
+            raise ValidationError({'cursor': 'Invalid cursor.'})
+
+        self.count = queryset.count() if request.query_params.get('include_count') == 'true' else None
+        return rows
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, 'cursor', self.next_cursor)
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        body = {'next': self.get_next_link(), 'previous': None, 'results': data}
+        if self.count is not None:
+            body = {'count': self.count, **body}
+        return Response(body)
@@ -0,0 +1,234 @@
+"""
+Monthly range partitioning for the high-volume message tables (PostgreSQL).
+
+Partitioning is opt-in via ``DB_PARTITIONING_ENABLED``. Converted tables are
+partitioned by their timestamp column into ``<table>_pYYYYMM`` children plus
+a ``<table>_default`` catch-all, so date-filtered queries only touch the
+months they ask for and retention can drop whole months at once.
+
+PostgreSQL requires unique constraints on a partitioned table to include the
+partition column, so after conversion:
+
+- the primary key becomes ``(id, <column>)``;
+- unique indexes that do not include the column (for example the
+  ``sms_messages.base_message_id`` one-to-one) are not recreated;
+- foreign keys pointing at a converted table are dropped and the relation
+  is enforced by the application only.
+
+On other databases (SQLite in development) every function here is a no-op
+and the tables stay plain, indexed on (tenant, timestamp).
+"""
+import logging
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import connection as default_connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Table name -> partition column
+PARTITIONED_TABLES = {
+    'messages': 'created_at',
+    'sms_messages': 'created_at',
+    'sms_delivery_reports': 'received_at',
+    'sms_usage_records': 'created_at',
+}
+
+
+def enabled(connection=None):
+    """Whether partitioning is switched on and supported by the database."""
+    connection = connection or default_connection
+    return getattr(settings, 'DB_PARTITIONING_ENABLED', False) and connection.vendor == 'postgresql'
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1, day=1)
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y%m}'
+
+
+def is_partitioned(table, connection=None):
+    connection = connection or default_connection
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [table]
+        )
+        return cursor.fetchone() is not None
+
+
+def _create_partition(cursor, table, month):
+    cursor.execute(
+        f'CREATE TABLE IF NOT EXISTS "{partition_name(table, month)}" PARTITION OF "{table}" '
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+def convert_table(table, column, months_ahead=None, connection=None):
+    """
+    Rebuild ``table`` as a table partitioned by month on ``column``.
+
+    Existing rows are copied inside one transaction, so run this in a
+    maintenance window on large tables.
+    """
+    connection = connection or default_connection
+    months_ahead = months_ahead if months_ahead is not None else getattr(settings, 'DB_PARTITION_MONTHS_AHEAD', 3)
+    if is_partitioned(table, connection):
+        return False
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        # Foreign keys into this table cannot survive the new composite key
+        cursor.execute(
+            "SELECT conname, conrelid::regclass::text FROM pg_constraint "
+            "WHERE contype = 'f' AND confrelid = to_regclass(%s)", [table]
+        )
+        for name, referencing in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {referencing} DROP CONSTRAINT "{name}"')
+
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid), confrelid::regclass::text FROM pg_constraint "
+            "WHERE contype = 'f' AND conrelid = to_regclass(%s)", [table]
+        )
+        foreign_keys = [
+            (name, definition) for name, definition, target in cursor.fetchall()
+            if target.strip('"') not in PARTITIONED_TABLES
+        ]
+
+        cursor.execute(
+            "SELECT i.relname, pg_get_indexdef(x.indexrelid), x.indisunique, x.indisprimary "
+            "FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid "
+            "WHERE x.indrelid = to_regclass(%s)", [table]
+        )
+        indexes = []
+        for name, definition, unique, primary in cursor.fetchall():
+            if primary:
+                continue
+            if unique and column not in definition:
+                logger.warning(f"Not recreating unique index {name} on partitioned table {table}")
+                continue
+            indexes.append(definition)
+
+        cursor.execute(f'SELECT MIN("{column}") FROM "{table}"')
+        oldest = cursor.fetchone()[0] or timezone.now()
+
+        cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{table}_legacy"')
+        cursor.execute(
+            f'CREATE TABLE "{table}" (LIKE "{table}_legacy" INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+            f'PARTITION BY RANGE ("{column}")'
+        )
+        cursor.execute(f'ALTER TABLE "{table}" ADD PRIMARY KEY ("id", "{column}")')
+        cursor.execute(f'CREATE TABLE "{table}_default" PARTITION OF "{table}" DEFAULT')
+
+        month = month_start(oldest)
+        last = add_months(month_start(timezone.now()), months_ahead)
+        while month <= last:
+            _create_partition(cursor, table, month)
+            month = add_months(month, 1)
+
+        cursor.execute(f'INSERT INTO "{table}" SELECT * FROM "{table}_legacy"')
+        cursor.execute(f'DROP TABLE "{table}_legacy"')
+
+        for definition in indexes:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}')
+
+    logger.info(f"Converted {table} to monthly partitions on {column}")
+    return True
+
+
+def convert_all(months_ahead=None, connection=None):
+    """
+    Convert every table in PARTITIONED_TABLES that is not partitioned yet.
+
+    Returns:
+        list: Names of the tables converted
+    """
+    if not enabled(connection):
+        return []
+    return [
+        table for table, column in PARTITIONED_TABLES.items()
+        if convert_table(table, column, months_ahead, connection)
+    ]
+
+
+def ensure_partitions(months_ahead=None, connection=None):
+    """
+    Create the partitions for the current month and ``months_ahead`` after.
+
+    Returns:
+        int: Number of partitions checked
+    """
+    connection = connection or default_connection
+    if not enabled(connection):
+        return 0
+    months_ahead = months_ahead if months_ahead is not None else getattr(settings, 'DB_PARTITION_MONTHS_AHEAD', 3)
+    current = month_start(timezone.now())
+
+    checked = 0
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(table, connection):
+            continue
+        for offset in range(months_ahead + 1):
+            try:
+                with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                    _create_partition(cursor, table, add_months(current, offset))
+                checked += 1
+            except Exception as e:
+                # Usually rows for that month already sit in the default partition
+                logger.error(f"Could not create partition for {table}: {str(e)}")
+    return checked
+
+
+def partitions(table, connection=None):
+    """
+    Return (name, month) for each monthly partition of ``table``, oldest first.
+    """
+    connection = connection or default_connection
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s)", [table]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    result = []
+    prefix = f'{table}_p'
+    for name in names:
+        suffix = name[len(prefix):]
+        if name.startswith(prefix) and len(suffix) == 6 and suffix.isdigit():
+            result.append((name, datetime(int(suffix[:4]), int(suffix[4:]), 1, tzinfo=dt_timezone.utc)))
+    return sorted(result, key=lambda item: item[1])
+
+
+def drop_partitions_before(table, cutoff, connection=None):
+    """
+    Drop monthly partitions whose whole range is older than ``cutoff``.
+
+    Returns:
+        list: Names of the partitions dropped
+    """
+    connection = connection or default_connection
+    if not enabled(connection) or not is_partitioned(table, connection):
+        return []
+
+    dropped = []
+    for name, month in partitions(table, connection):
+        if add_months(month, 1) > cutoff:
+            break
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"')
+            cursor.execute(f'DROP TABLE "{name}"')
+        dropped.append(name)
+
+    if dropped:
+        logger.info(f"Dropped {len(dropped)} expired partitions of {table}")
+    return dropped
@@ -0,0 +1,164 @@
+"""
+Phone number normalization for the East African mobile numbering plans.
+
+Every number we store, send to or charge is reduced to one form, E.164
+(``+255712345678``). A number is stripped to its digits, its country is
+found from the country code (or ``PHONE_DEFAULT_REGION`` for national
+numbers such as ``0712 345 678``), the trunk ``0`` is dropped and the
+national number is checked against the country's length and mobile
+prefixes. Numbers outside the plans below are accepted when written
+internationally and 8-15 digits long.
+
+Results are memoized, so a number seen before costs one dict lookup, and
+``normalize_many`` normalizes each distinct number of a batch once.
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+from django.conf import settings
+
+NumberingPlan = namedtuple(
+    'NumberingPlan', ['region', 'country_code', 'national_length', 'mobile_prefixes', 'trunk_prefix']
+)
+
+NUMBERING_PLANS = (
+    NumberingPlan('TZ', '255', 9, ('6', '7'), '0'),
+    NumberingPlan('KE', '254', 9, ('1', '7'), '0'),
+    NumberingPlan('UG', '256', 9, ('7',), '0'),
+    NumberingPlan('RW', '250', 9, ('7',), '0'),
+    NumberingPlan('BI', '257', 8, ('6', '7'), ''),
+    NumberingPlan('SS', '211', 9, ('9',), '0'),
+    NumberingPlan('CD', '243', 9, ('8', '9'), '0'),
+)
+PLANS_BY_REGION = {plan.region: plan for plan in NUMBERING_PLANS}
+PLANS_BY_CODE = {plan.country_code: plan for plan in NUMBERING_PLANS}
+
+# Separators people type; anything else that is not a digit goes through the regex
+_SEPARATORS = str.maketrans('', '', ' -+().\t/')
+_NON_DIGITS = re.compile(r'\D')
+
+
+class PhoneNumberError(ValueError):
+    """Raised for a number that is not a valid mobile number."""
+    code = 'INVALID_PHONE'
+
+
+def default_region():
+    return getattr(settings, 'PHONE_DEFAULT_REGION', 'TZ')
+
+
+@lru_cache(maxsize=262144)
+def _e164(text, region):
+    """
+    Returns:
+        str: the E.164 form of ``text``, or None if it is not valid
+    """
+    # Fast paths for numbers already written as digits, with or without '+'
+    if text.isdigit():
+        digits, international = text, False
+    elif text[:1] == '+' and text[1:].isdigit():
+        digits, international = text[1:], True
+    else:
+        text = text.strip()
+        international = text.startswith('+')
+        digits = text.translate(_SEPARATORS)
+        if not digits.isdigit():
+            digits = _NON_DIGITS.sub('', digits)
+            if not digits:
+                return None
+    if digits[:2] == '00':
+        # International call prefix
+        digits = digits[2:]
+        international = True
+
+    plan = PLANS_BY_CODE.get(digits[:3])
+    if plan and (international or len(digits) > plan.national_length + len(plan.trunk_prefix)):
+        national = digits[3:]
+    elif international:
+        return '+' + digits if 8 <= len(digits) <= 15 else None
+    else:
+        plan = PLANS_BY_REGION.get(region)
+        if plan is None:
+            return None
+        national = digits
+
+    # Also covers "+255 0712..." written with the trunk prefix
+    if plan.trunk_prefix and len(national) == plan.national_length + 1 and national.startswith(plan.trunk_prefix):
+        national = national[1:]
+    if len(national) != plan.national_length or national[0] not in plan.mobile_prefixes:
+        return None
+    return '+' + plan.country_code + national
+
+
+def _text(number):
+    if number.__class__ is str:
+        return number
+    if isinstance(number, float) and number.is_integer():
+        # Spreadsheet cells read as floats (255712345678.0)
+        return str(int(number))
+    return '' if number is None else str(number)
+
+
+def normalize(number, region=None):
+    """
+    The E.164 form of ``number`` (``+255712345678``). National numbers are
+    read in ``region`` (default PHONE_DEFAULT_REGION).
+
+    Raises:
+        PhoneNumberError: if it is not a valid mobile number
+    """
+    formatted = _e164(_text(number), region or default_region())
+    if formatted is None:
+        raise PhoneNumberError(f"Invalid phone number: {number}")
+    return formatted
+
+
+def is_valid(number, region=None):
+    return _e164(_text(number), region or default_region()) is not None
+
+
+def to_msisdn(number, region=None):
+    """International digits without the '+' (``255712345678``), as Beem takes them."""
+    return normalize(number, region)[1:]
+
+
+def to_national(number, region=None):
+    """
+    The national form with its trunk prefix (``0712345678``), for
+    providers that only take local numbers.
+
+    Raises:
+        PhoneNumberError: if it is not a valid mobile number of ``region``
+    """
+    region = region or default_region()
+    plan = PLANS_BY_REGION[region]
+    formatted = normalize(number, region)
+    if not formatted.startswith('+' + plan.country_code):
+        raise PhoneNumberError(f"Not a {region} phone number: {number}")
+    return plan.trunk_prefix + formatted[1 + len(plan.country_code):]
+
+
+def region_of(number, region=None):
+    """The region of a valid number, or None outside the known plans."""
+    plan = PLANS_BY_CODE.get(normalize(number, region)[1:4])
+    return plan.region if plan else None
+
+
+def normalize_many(numbers, region=None):
+    """
+    Normalize a batch of numbers (a list, a column of a sheet, ...).
+
+    Returns:
+        list: the E.164 form of each number, None where it is invalid
+    """
+    region = region or default_region()
+    seen = {}
+    normalized = []
+    append = normalized.append
+    for number in numbers:
+        text = number if number.__class__ is str else _text(number)
+        formatted = seen.get(text, seen)
+        if formatted is seen:
+            formatted = seen[text] = _e164(text, region)
+        append(formatted)
+    return normalized
@@ -10,11 +10,12 @@ from django.shortcuts import redirect
 from django.contrib import messages
 from .models import (
     Contact, Segment, Template, Conversation, Message, Attachment,
-    Campaign, Flow
+    Campaign, Flow, KeywordRule, RetentionPolicy, ExportJob, TenantUsageCounter,
+    ProviderMetadata, OutboxMessage, CampaignStage
 )
 from .models_sms import (
     SMSProvider, SMSSenderID, SMSMessage,
-    SMSTemplate, SMSDeliveryReport, SMSBulkUpload, SMSSchedule
+    SMSTemplate, SMSDeliveryReport, SMSBulkUpload, SMSSchedule, SMSBulkSendJob
 )
 from .models_sender_requests import SenderIDRequest
 from . import admin_sender_requests
@@ -195,6 +196,58 @@ class FlowAdmin(admin.ModelAdmin):
         super().save_model(request, obj, form, change)
 
 
+@admin.register(KeywordRule)
+class KeywordRuleAdmin(admin.ModelAdmin):
+    """Manage tenant keywords for language routing and auto-replies."""
+    list_display = ['label', 'kind', 'tenant', 'priority', 'is_active', 'updated_at']
+    list_filter = ['kind', 'is_active', 'tenant']
+    search_fields = ['label', 'tenant__name']
+    readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(RetentionPolicy)
+class RetentionPolicyAdmin(admin.ModelAdmin):
+    """Override how long each tenant's message data is kept."""
+    list_display = ['tenant', 'message_retention_days', 'sms_data_retention_days', 'archive_before_delete', 'updated_at']
+    search_fields = ['tenant__name']
+    readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(TenantUsageCounter)
+class TenantUsageCounterAdmin(admin.ModelAdmin):
+    """Inspect each tenant's running monthly usage."""
+    list_display = ['tenant', 'period', 'messages_count', 'cost_micro', 'updated_at']
+    list_filter = ['period']
+    search_fields = ['tenant__name']
+    readonly_fields = ['updated_at']
+
+
+@admin.register(ProviderMetadata)
+class ProviderMetadataAdmin(admin.ModelAdmin):
+    """See when provider data was last refreshed."""
+    list_display = ['key', 'refreshed_at', 'last_attempt_at', 'last_error']
+    search_fields = ['key']
+    readonly_fields = ['data', 'refreshed_at', 'last_attempt_at', 'last_error', 'created_at', 'updated_at']
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    """Find tasks the outbox relay has not been able to publish."""
+    list_display = ['task_name', 'tenant', 'attempts', 'created_at', 'available_at', 'published_at']
+    list_filter = ['task_name']
+    search_fields = ['task_name', 'last_error']
+    readonly_fields = ['args', 'kwargs', 'attempts', 'last_error', 'created_at', 'published_at']
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    """Track background data exports."""
+    list_display = ['dataset', 'file_format', 'tenant', 'status', 'row_count', 'created_at', 'completed_at']
+    list_filter = ['dataset', 'file_format', 'status']
+    search_fields = ['tenant__name', 'file_path']
+    readonly_fields = ['created_at', 'started_at', 'completed_at', 'file_path', 'row_count', 'error_message']
+
+
 # =============================================================================
 # SMS MANAGEMENT MODELS
 # =============================================================================
@@ -378,17 +431,17 @@ class SMSScheduleAdmin(admin.ModelAdmin):
         'name', 'tenant__name'
     ]
     readonly_fields = [
-        'id', 'created_at', 'updated_at', 'next_run', 'last_run'
+        'id', 'created_at', 'updated_at', 'next_run', 'last_run', 'run_count', 'locked_until'
     ]
     list_per_page = 25
 
     fieldsets = (
         ('Schedule Information', {
-            'fields': ('name', 'tenant', 'frequency', 'is_active'),
+            'fields': ('name', 'tenant', 'frequency', 'recurrence', 'is_active'),
             'classes': ('wide',)
         }),
         ('Timing', {
-            'fields': ('next_run', 'last_run'),
+            'fields': ('next_run', 'last_run', 'run_count', 'locked_until'),
             'classes': ('wide',)
         }),
         ('Timestamps', {
@@ -398,6 +451,24 @@ class SMSScheduleAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(SMSBulkSendJob)
+class SMSBulkSendJobAdmin(admin.ModelAdmin):
+    """Track background bulk SMS sends."""
+    list_display = ['id', 'tenant', 'status', 'total_messages', 'sent_messages', 'failed_messages', 'created_at', 'completed_at']
+    list_filter = ['status']
+    search_fields = ['tenant__name']
+    readonly_fields = ['payload', 'errors', 'created_at', 'started_at', 'completed_at']
+
+
+@admin.register(CampaignStage)
+class CampaignStageAdmin(admin.ModelAdmin):
+    """Campaign runs staged ahead of their fire time."""
+    list_display = ['campaign', 'tenant', 'run_at', 'status', 'total_recipients', 'total_segments', 'dispatched_count', 'suppressed_count']
+    list_filter = ['status']
+    search_fields = ['campaign__name', 'tenant__name']
+    readonly_fields = ['content_key', 'created_at', 'staged_at', 'dispatched_at']
+
+
 # =============================================================================
 # ADMIN CUSTOMIZATION
 # =============================================================================
@@ -0,0 +1,13 @@
+"""
+Messaging app configuration.
+"""
+from django.apps import AppConfig
+
+
+class MessagingConfig(AppConfig):
+    name = 'messaging'
+    verbose_name = 'Messaging'
+
+    def ready(self):
+        """Import signals when app is ready."""
+        import messaging.signals
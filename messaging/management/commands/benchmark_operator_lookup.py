@@ -0,0 +1,77 @@
+"""
+Management command to benchmark operator detection with the prefix trie
+against a scan of the prefix list, and campaign-scale cost estimates.
+"""
+import random
+import time
+from django.core.management.base import BaseCommand
+
+from core.operators import operator_directory
+from core.phone import normalize_many
+from messaging.services.beem_sms import BeemSMSService
+
+
+class Command(BaseCommand):
+    help = 'Benchmark prefix-trie operator lookup and per-operator cost estimates on synthetic numbers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--numbers', type=int, default=1000000, help='Numbers to look up per run')
+        parser.add_argument('--distinct', type=int, default=250000, help='Distinct subscribers among them')
+
+    def numbers(self, count, distinct, prefixes):
+        rng = random.Random(42)
+        subscribers = []
+        for _ in range(distinct):
+            prefix = rng.choice(prefixes)
+            # National numbers are 9 digits after the 3-digit country code (8 in Burundi)
+            length = 11 if prefix.startswith('257') else 12
+            subscribers.append('+' + prefix + ''.join(rng.choice('0123456789') for _ in range(length - len(prefix))))
+        return [rng.choice(subscribers) for _ in range(count)]
+
+    def handle(self, *args, **options):
+        trie = operator_directory.trie
+        operators = []
+        stack = [trie.root]
+        while stack:
+            node = stack.pop()
+            for key, child in node.items():
+                if key == '':
+                    operators.append(child)
+                else:
+                    stack.append(child)
+        # What a lookup without the trie does: try every prefix, longest first
+        by_length = sorted(operators, key=lambda operator: -len(operator.prefix))
+        numbers = self.numbers(options['numbers'], options['distinct'], [operator.prefix for operator in operators])
+        self.stdout.write(f'{len(numbers)} numbers, {len(trie)} prefixes, one core')
+        self.stdout.write(f"{'lookup':<16} {'seconds':>9} {'numbers/s':>14}")
+
+        def scan():
+            found = []
+            for e164 in normalize_many(numbers):
+                digits = e164[1:]
+                found.append(next((operator for operator in by_length if digits.startswith(operator.prefix)), None))
+            return found
+
+        def per_number():
+            return [operator_directory.lookup(number) for number in numbers]
+
+        def batch():
+            return operator_directory.lookup_many(numbers)
+
+        results = {}
+        for name, run in [('prefix scan', scan), ('trie', per_number), ('trie batch', batch)]:
+            started = time.perf_counter()
+            results[name] = run()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{name:<16} {elapsed:>9.2f} {len(numbers) / elapsed:>14,.0f}')
+
+        mismatches = sum(
+            1 for name in ('trie', 'trie batch')
+            for a, b in zip(results['prefix scan'], results[name]) if a != b
+        )
+        self.stdout.write(f'Mismatches: {mismatches}')
+
+        started = time.perf_counter()
+        cost = BeemSMSService()._calculate_cost(len(numbers), 200, numbers)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'Cost estimate for {len(numbers)} recipients: ${cost:,.2f} in {elapsed:.2f}s')
@@ -0,0 +1,82 @@
+"""
+Management command to compare OFFSET and keyset pagination on messages.
+"""
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.pagination import encode_cursor, keyset_page
+from messaging.models import Message
+from tenants.models import Tenant
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark page-number vs keyset pagination over a synthetic message table (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000, help='Synthetic messages to insert (e.g. 5000000)')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows per bulk insert')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per depth (best is reported)')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback()
+        except Rollback:
+            self.stdout.write('Synthetic rows rolled back')
+
+    def _best(self, repeat, fn):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best * 1000
+
+    def run(self, options):
+        rows, page_size, repeat = options['rows'], options['page_size'], options['repeat']
+        tenant = Tenant.objects.create(name='Pagination Benchmark', subdomain=f'bench-{uuid.uuid4().hex[:8]}')
+
+        self.stdout.write(f'Inserting {rows} messages...')
+        started = time.perf_counter()
+        for offset in range(0, rows, options['batch_size']):
+            count = min(options['batch_size'], rows - offset)
+            Message.objects.bulk_create(
+                [Message(tenant=tenant, direction='out', provider='sms', text='benchmark') for _ in range(count)],
+                batch_size=options['batch_size']
+            )
+        self.stdout.write(f'Inserted in {time.perf_counter() - started:.1f}s')
+
+        queryset = Message.objects.filter(tenant=tenant)
+        ordered = queryset.order_by('-created_at', '-pk')
+        last_page = max(1, rows // page_size)
+        depths = sorted({1, 10, 100, 1000, 10000, 100000, last_page} & set(range(1, last_page + 1)))
+
+        self.stdout.write(f"{'page':>10} {'offset ms':>12} {'keyset ms':>12}")
+        for page in depths:
+            offset = (page - 1) * page_size
+
+            def offset_page():
+                queryset.count()
+                list(ordered[offset:offset + page_size])
+
+            cursor = None
+            if offset:
+                # Cursor for the row just before this page (not timed)
+                anchor = ordered.values('created_at', 'pk')[offset - 1]
+                cursor = encode_cursor(anchor['created_at'], anchor['pk'])
+
+            def cursor_page():
+                keyset_page(queryset, page_size, cursor)
+
+            self.stdout.write(
+                f'{page:>10} {self._best(repeat, offset_page):>12.2f} {self._best(repeat, cursor_page):>12.2f}'
+            )
@@ -0,0 +1,83 @@
+"""
+Management command to benchmark phone number normalization, uncached per
+number against the memoized single and batch APIs.
+"""
+import random
+import time
+from django.core.management.base import BaseCommand
+
+from core.phone import NUMBERING_PLANS, _e164, default_region, normalize_many
+
+FORMATS = [
+    lambda plan, national: f'+{plan.country_code}{national}',
+    lambda plan, national: f'{plan.country_code}{national}',
+    lambda plan, national: f'{plan.trunk_prefix}{national}',
+    lambda plan, national: f'+{plan.country_code} {national[:3]} {national[3:6]} {national[6:]}',
+    lambda plan, national: f'00{plan.country_code}-{national}',
+    lambda plan, national: f'({plan.trunk_prefix}{national[:3]}) {national[3:]}',
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark phone number normalization on synthetic East African numbers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--numbers', type=int, default=1000000, help='Numbers to normalize per run')
+        parser.add_argument('--distinct', type=int, default=250000, help='Distinct subscribers among them')
+        parser.add_argument('--invalid-share', type=float, default=0.02, help='Share of malformed numbers')
+
+    def numbers(self, count, distinct, invalid_share):
+        rng = random.Random(42)
+        # Most audiences are Tanzanian; national numbers are written in the default region
+        tanzania = NUMBERING_PLANS[0]
+        subscribers = []
+        for _ in range(distinct):
+            plan = tanzania if rng.random() < 0.7 else rng.choice(NUMBERING_PLANS)
+            national = rng.choice(plan.mobile_prefixes) + ''.join(
+                rng.choice('0123456789') for _ in range(plan.national_length - 1)
+            )
+            # A subscriber's number is spelled the same way wherever it recurs
+            formats = FORMATS if plan is tanzania else FORMATS[:2] + FORMATS[3:5]
+            subscribers.append(rng.choice(formats)(plan, national))
+
+        numbers = []
+        for _ in range(count):
+            if rng.random() < invalid_share:
+                numbers.append(str(rng.randint(1000, 99999999)))
+                continue
+            numbers.append(rng.choice(subscribers))
+        return numbers
+
+    def handle(self, *args, **options):
+        numbers = self.numbers(options['numbers'], options['distinct'], options['invalid_share'])
+        region = default_region()
+        uncached = _e164.__wrapped__
+        self.stdout.write(f'{len(numbers)} numbers, {len(set(numbers))} distinct strings, one core')
+        self.stdout.write(f"{'api':<16} {'seconds':>9} {'numbers/s':>14}")
+
+        def per_number():
+            return [uncached(number, region) for number in numbers]
+
+        def memoized():
+            return [_e164(number, region) for number in numbers]
+
+        def batch():
+            return normalize_many(numbers, region)
+
+        results = {}
+        for name, run in [('uncached', per_number), ('memoized cold', memoized),
+                          ('memoized warm', memoized), ('batch', batch)]:
+            if name in ('memoized cold', 'batch'):
+                _e164.cache_clear()
+            started = time.perf_counter()
+            results[name] = run()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{name:<16} {elapsed:>9.2f} {len(numbers) / elapsed:>14,.0f}')
+
+        expected = results['uncached']
+        mismatches = sum(
+            1 for name in ('memoized warm', 'batch')
+            for a, b in zip(expected, results[name]) if a != b
+        )
+        invalid = sum(1 for number in expected if number is None)
+        self.stdout.write(f'Invalid: {invalid}; mismatches: {mismatches}')
@@ -0,0 +1,84 @@
+"""
+Management command to benchmark compiled template rendering against
+per-message string replacement.
+"""
+import random
+import time
+from django.core.management.base import BaseCommand
+
+from messaging.services.templating import GSM7, GSM7_ALL, UCS2, compile_template, segment_count
+
+TEMPLATE = (
+    'Habari {{ first_name|Mteja }}, your {{ plan }} balance is TZS {{ balance }}. '
+    'Top up before {{ due_date }} to keep enjoying {{ plan }} in {{ city }}. Reply STOP to opt out.'
+)
+FIRST_NAMES = ['Amina', 'Baraka', 'Neema', 'Juma', 'Zawadi', 'Halima', 'Émile', 'Josée', 'Saïd', 'Ñaño']
+CITIES = ['Dar es Salaam', 'Arusha', 'Mwanza', 'Dodoma', 'Mombasa', 'Kampala', 'Kigali', 'Zanzibar']
+PLANS = ['Starter', 'Business', 'Pro']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark compiled template rendering (with encoding and segments) on synthetic recipients'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--renders', type=int, default=1000000, help='Messages to render per run')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Contexts per render_many call')
+        parser.add_argument('--unicode-share', type=float, default=0.05, help='Share of names with emoji')
+
+    def contexts(self, count, unicode_share):
+        rng = random.Random(42)
+        contexts = []
+        for _ in range(count):
+            name = rng.choice(FIRST_NAMES)
+            if rng.random() < unicode_share:
+                name += ' 🎉'
+            contexts.append({
+                'first_name': name,
+                'plan': rng.choice(PLANS),
+                'balance': f'{rng.randint(0, 500000):,}',
+                'due_date': f'2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+                'city': rng.choice(CITIES),
+            })
+        return contexts
+
+    def naive(self, contexts):
+        """What sending did per message: replace each variable, then scan every character."""
+        rendered = []
+        for context in contexts:
+            text = TEMPLATE
+            for name in ('first_name', 'plan', 'balance', 'due_date', 'city'):
+                text = text.replace('{{ %s }}' % name, str(context.get(name, '')))
+            text = text.replace('{{ first_name|Mteja }}', str(context.get('first_name') or 'Mteja'))
+            gsm = all(char in GSM7_ALL for char in text)
+            encoding = GSM7 if gsm else UCS2
+            length = len(text) if gsm else len(text.encode('utf-16-le')) // 2
+            rendered.append((text, encoding, segment_count(encoding, length)))
+        return rendered
+
+    def compiled(self, contexts, batch_size):
+        template = compile_template(TEMPLATE)
+        rendered = []
+        for offset in range(0, len(contexts), batch_size):
+            rendered.extend(template.render_many(contexts[offset:offset + batch_size]))
+        return rendered
+
+    def handle(self, *args, **options):
+        contexts = self.contexts(options['renders'], options['unicode_share'])
+        self.stdout.write(f"{len(contexts)} renders of a {len(TEMPLATE)}-character template, one core")
+        self.stdout.write(f"{'renderer':<12} {'seconds':>9} {'renders/min':>14}")
+
+        results = {}
+        for name, run in [
+            ('naive', lambda: self.naive(contexts)),
+            ('compiled', lambda: self.compiled(contexts, options['batch_size'])),
+        ]:
+            started = time.perf_counter()
+            results[name] = run()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{name:<12} {elapsed:>9.2f} {len(contexts) / elapsed * 60:>14,.0f}')
+
+        # Both renderers must agree on every message
+        mismatches = sum(
+            1 for expected, actual in zip(results['naive'], results['compiled']) if tuple(actual) != expected
+        )
+        self.stdout.write(f'Mismatches: {mismatches}')
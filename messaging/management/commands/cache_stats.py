@@ -0,0 +1,33 @@
+"""
+Management command to print tiered cache hit/miss counters.
+"""
+import json
+from django.core.management.base import BaseCommand
+
+from core.cache import STAT_NAMES, cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counters for the tiered caches, totalled across processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print the raw counters as JSON')
+
+    def handle(self, *args, **options):
+        report = cache_stats()
+        if options.get('json'):
+            self.stdout.write(json.dumps({name: data['shared'] for name, data in report.items()}, indent=2))
+            return
+
+        if not report:
+            self.stdout.write(self.style.WARNING('No tiered cache counters recorded yet'))
+            return
+
+        self.stdout.write(f"{'cache':<16}" + ''.join(f'{name:>11}' for name in STAT_NAMES) + f"{'hit rate':>10}")
+        for name, data in report.items():
+            shared = data['shared']
+            lookups = shared['l1_hits'] + shared['l2_hits'] + shared['misses']
+            hit_rate = (shared['l1_hits'] + shared['l2_hits']) / lookups * 100 if lookups else 0
+            self.stdout.write(
+                f'{name:<16}' + ''.join(f'{shared[stat]:>11}' for stat in STAT_NAMES) + f'{hit_rate:>9.1f}%'
+            )
@@ -0,0 +1,41 @@
+"""
+Management command to start the Celery worker pool for one queue.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Start the Celery worker for a queue as laid out in CELERY_WORKER_POOLS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('queue', nargs='?', help='Queue whose worker pool to start')
+        parser.add_argument('--print', action='store_true', help='Print the worker command for every pool and exit')
+        parser.add_argument('--loglevel', default='info')
+
+    def worker_argv(self, queue, loglevel='info'):
+        pool = settings.CELERY_WORKER_POOLS[queue]
+        return [
+            'worker',
+            '-Q', ','.join(pool.get('queues', [queue])),
+            '-c', str(pool['concurrency']),
+            '-P', pool.get('pool', 'prefork'),
+            '--prefetch-multiplier', str(pool.get('prefetch_multiplier', 1)),
+            '-n', f'{queue}@%h',
+            '--loglevel', loglevel,
+        ]
+
+    def handle(self, *args, **options):
+        pools = settings.CELERY_WORKER_POOLS
+        if options.get('print'):
+            for queue in pools:
+                self.stdout.write('celery -A mifumo ' + ' '.join(self.worker_argv(queue, options['loglevel'])))
+            return
+
+        queue = options.get('queue')
+        if queue not in pools:
+            raise CommandError(f"Unknown queue '{queue}'. Choose one of: {', '.join(pools)}")
+
+        from mifumo.celery import app
+
+        app.worker_main(argv=self.worker_argv(queue, options['loglevel']))
@@ -0,0 +1,211 @@
+"""
+Management command to load test the task queue layout: transactional send
+latency while a large campaign is queued.
+
+Real Celery workers are started in this process, one per queue, with the
+concurrency and prefetch multiplier of their CELERY_WORKER_POOLS entry,
+and the campaign and single sends are published through the configured
+routes (CELERY_TASK_ROUTES plus the queue="bulk" override campaigns use).
+The tasks themselves are stubs registered under the real task names that
+only wait ``--service-ms`` in place of the provider call, so the database
+and providers are never touched. Latency is measured from publish to the
+moment a worker starts the task.
+
+Workers run in-process, so they use the threads pool whatever pool the
+layout names. The default in-memory broker leaves out network round trips;
+pass ``--broker`` (e.g. a scratch Redis database) to include them.
+"""
+import logging
+import threading
+import time
+from celery import Celery
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from kombu.transport import memory
+
+# (task, publish options) as the application publishes them
+CAMPAIGN_SEND = ('messaging.tasks.send_message_task', {'queue': 'bulk'})
+SINGLE_SEND = ('messaging.tasks_sms.send_sms_task', {})
+
+# Celery's default when a worker sets no prefetch multiplier
+DEFAULT_PREFETCH_MULTIPLIER = 4
+
+
+class MemoryTransport(memory.Transport):
+    """
+    The in-memory transport, returning to the worker loop between polls.
+
+    Workers on transports without an event loop (memory among them) ack
+    finished tasks from their consumer loop, which otherwise blocks for two
+    seconds whenever the prefetch window is full, capping a worker at one
+    window per two seconds; brokers such as Redis have no such wait.
+    """
+
+    def drain_events(self, connection, timeout=None):
+        return super().drain_events(connection, timeout=min(timeout or self.polling_interval, self.polling_interval))
+
+
+class Command(BaseCommand):
+    help = (
+        'Publish a campaign backlog plus a steady stream of single sends to in-process Celery '
+        'workers, once on one shared queue and once with CELERY_TASK_ROUTES and CELERY_WORKER_POOLS, '
+        'and compare how long single sends wait to start'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bulk', type=int, default=5000, help='Campaign sends queued at the start')
+        parser.add_argument('--transactional', type=int, default=200, help='Single sends arriving during the run')
+        parser.add_argument('--interval-ms', type=float, default=5.0, help='Time between single sends')
+        parser.add_argument('--service-ms', type=float, default=2.0, help='Time each task spends on the provider call')
+        parser.add_argument('--broker', default='memory://', help='Broker to run the test on (never a production one)')
+
+    def _percentile(self, values, pct):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+
+    def _app(self, broker, routes):
+        app = Celery('loadtest', broker=broker, set_as_current=False)
+        if broker.startswith('memory://'):
+            app.conf.broker_transport = MemoryTransport
+        app.conf.update(
+            task_routes=routes,
+            task_default_queue=settings.CELERY_TASK_DEFAULT_QUEUE,
+            task_serializer='json',
+            accept_content=['json'],
+            task_ignore_result=True,
+            # Poll the in-memory broker often enough not to dominate latency
+            broker_transport_options={'polling_interval': 0.005},
+            worker_hijack_root_logger=False,
+        )
+        return app
+
+    def _register(self, app, service, started, finished):
+        lock = threading.Lock()
+
+        def stub(kind, published_at):
+            begun = time.time()
+            with lock:
+                started[kind].append(begun - published_at)
+            time.sleep(service)
+            with lock:
+                finished[kind].append(time.time())
+
+        # Finalizing adds the project's shared tasks; replace the real ones with the stub
+        app.finalize(auto=True)
+        tasks = {}
+        for name, _ in (CAMPAIGN_SEND, SINGLE_SEND):
+            app.tasks.pop(name, None)
+            tasks[name] = app.task(name=name, shared=False)(stub)
+        return tasks
+
+    def _start_workers(self, app, pools):
+        # Threaded workers trace tasks on the current (or, off the main
+        # thread, the default) app, which must be this one, not the project's
+        app.set_current()
+        app.set_default()
+        workers = []
+        for name, pool in pools.items():
+            worker = app.WorkController(
+                hostname=f'{name}@loadtest',
+                queues=pool.get('queues', [name]),
+                concurrency=pool['concurrency'],
+                pool_cls='threads',
+                prefetch_multiplier=pool.get('prefetch_multiplier', DEFAULT_PREFETCH_MULTIPLIER),
+                without_heartbeat=True,
+                without_mingle=True,
+                without_gossip=True,
+                loglevel='WARNING',
+            )
+            threading.Thread(target=worker.start, name=f'loadtest-{name}', daemon=True).start()
+            workers.append(worker)
+        # Workers are consuming once their pools have started
+        deadline = time.monotonic() + 30
+        while not all(worker.pool is not None and worker.pool.active for worker in workers):
+            if time.monotonic() > deadline:
+                raise CommandError('Workers did not start')
+            time.sleep(0.05)
+        return workers
+
+    def run_layout(self, routes, pools, options, queue_options=True):
+        """
+        Publish the load with ``routes`` to workers laid out as ``pools``
+        ({queue: CELERY_WORKER_POOLS entry}); ``queue_options=False`` drops
+        the explicit queue campaigns are published with.
+
+        Returns:
+            tuple: (single send start latencies, seconds until the campaign drained)
+        """
+        app = self._app(options['broker'], routes)
+        started = {'bulk': [], 'transactional': []}
+        finished = {'bulk': [], 'transactional': []}
+        tasks = self._register(app, options['service_ms'] / 1000, started, finished)
+
+        # The campaign is queued before any worker is up, as after a campaign launch
+        campaign_task, campaign_options = CAMPAIGN_SEND
+        if not queue_options:
+            campaign_options = {k: v for k, v in campaign_options.items() if k != 'queue'}
+        begun = time.time()
+        for _ in range(options['bulk']):
+            tasks[campaign_task].apply_async(('bulk', time.time()), **campaign_options)
+
+        workers = self._start_workers(app, pools)
+        try:
+            single_task, single_options = SINGLE_SEND
+            for _ in range(options['transactional']):
+                tasks[single_task].apply_async(('transactional', time.time()), **single_options)
+                time.sleep(options['interval_ms'] / 1000)
+
+            expected = options['transactional'] + options['bulk']
+            done, progressed = 0, time.monotonic()
+            while done < expected:
+                time.sleep(0.01)
+                now_done = len(finished['transactional']) + len(finished['bulk'])
+                if now_done > done:
+                    done, progressed = now_done, time.monotonic()
+                elif time.monotonic() - progressed > 30:
+                    raise CommandError(f'Workers stalled after {done} of {expected} tasks')
+        finally:
+            for worker in workers:
+                worker.stop(in_sighandler=False, exitcode=0)
+        return started['transactional'], max(finished['bulk'], default=begun) - begun
+
+    def handle(self, *args, **options):
+        if options['broker'] == settings.CELERY_BROKER_URL:
+            # Real workers there would run the real tasks on the stub arguments
+            raise CommandError('Refusing to load test on the broker the application uses')
+        # A log line per task received and finished would dominate the timings
+        logging.getLogger('celery').setLevel(logging.WARNING)
+        logging.getLogger('kombu').setLevel(logging.ERROR)
+        worker_pools = settings.CELERY_WORKER_POOLS
+        routed = self._app(options['broker'], settings.CELERY_TASK_ROUTES)
+        transactional_queue = routed.amqp.router.route(dict(SINGLE_SEND[1]), SINGLE_SEND[0], (), {})['queue'].name
+        bulk_queue = routed.amqp.router.route(dict(CAMPAIGN_SEND[1]), CAMPAIGN_SEND[0], (), {})['queue'].name
+        routed_pools = {queue: worker_pools[queue] for queue in (transactional_queue, bulk_queue)}
+        # The same number of workers, all reading the default queue
+        shared_queue = settings.CELERY_TASK_DEFAULT_QUEUE
+        shared_pools = {shared_queue: {'concurrency': sum(pool['concurrency'] for pool in routed_pools.values())}}
+
+        self.stdout.write(
+            f"{options['bulk']} campaign sends queued, {options['transactional']} single sends every "
+            f"{options['interval_ms']:g}ms, {options['service_ms']:g}ms per task, broker {options['broker']}"
+        )
+        self.stdout.write(f"Routes: single send -> {transactional_queue}, campaign send -> {bulk_queue}")
+        self.stdout.write(
+            f"{'layout':<8} {'workers (concurrency/prefetch)':<32} "
+            f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'drain s':>9}"
+        )
+
+        for layout, routes, pools, queue_options in [
+            ('shared', {}, shared_pools, False),
+            ('routed', settings.CELERY_TASK_ROUTES, routed_pools, True),
+        ]:
+            latencies, drain = self.run_layout(routes, pools, options, queue_options)
+            workers = ', '.join(
+                f"{name}={pool['concurrency']}/{pool.get('prefetch_multiplier', DEFAULT_PREFETCH_MULTIPLIER)}"
+                for name, pool in pools.items()
+            )
+            self.stdout.write(
+                f'{layout:<8} {workers:<32} '
+                f'{self._percentile(latencies, 50):>9.1f} {self._percentile(latencies, 95):>9.1f} '
+                f'{self._percentile(latencies, 99):>9.1f} {max(latencies) * 1000:>9.1f} {drain:>9.2f}'
+            )
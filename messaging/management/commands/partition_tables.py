@@ -0,0 +1,44 @@
+"""
+Management command to manage monthly partitions of the message tables.
+"""
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core import partitioning
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming monthly partitions (and optionally convert tables) on PostgreSQL'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--convert',
+            action='store_true',
+            help='Convert tables that are not partitioned yet (locks and copies each table)',
+        )
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            help='Number of future months to create partitions for',
+        )
+
+    def handle(self, *args, **options):
+        if not partitioning.enabled():
+            self.stdout.write(
+                self.style.WARNING(
+                    f'Partitioning is disabled (DB_PARTITIONING_ENABLED) or unsupported on {connection.vendor}'
+                )
+            )
+            return
+
+        months_ahead = options.get('months_ahead')
+        if options.get('convert'):
+            for table in partitioning.convert_all(months_ahead=months_ahead):
+                self.stdout.write(self.style.SUCCESS(f'Converted {table}'))
+
+        checked = partitioning.ensure_partitions(months_ahead=months_ahead)
+        self.stdout.write(self.style.SUCCESS(f'Ensured {checked} partitions'))
+
+        for table in partitioning.PARTITIONED_TABLES:
+            status = 'partitioned' if partitioning.is_partitioned(table) else 'not partitioned'
+            self.stdout.write(f'{table}: {status}')
@@ -0,0 +1,31 @@
+"""
+Management command that runs the outbox relay as a long-lived process.
+"""
+import time
+from django.core.management.base import BaseCommand
+
+from messaging.services.outbox import outbox
+
+
+class Command(BaseCommand):
+    help = 'Publish pending outbox entries to Celery in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Entries per broker batch')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit')
+
+    def handle(self, *args, **options):
+        batch_size = options.get('batch_size')
+        if options.get('once'):
+            published = outbox.drain(batch_size=batch_size)
+            self.stdout.write(self.style.SUCCESS(f'Published {published} tasks'))
+            return
+
+        self.stdout.write(f'Relaying outbox every {options["interval"]}s (Ctrl+C to stop)')
+        try:
+            while True:
+                if not outbox.drain(batch_size=batch_size):
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped')
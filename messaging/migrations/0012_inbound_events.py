@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 23:05
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0011_alter_senderidrequest_status'),
+        ('tenants', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboundEvent',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('provider', models.CharField(choices=[('whatsapp', 'WhatsApp'), ('zenopay', 'ZenoPay'), ('stripe', 'Stripe'), ('beem', 'Beem Africa')], max_length=20)),
+                ('event_id', models.CharField(max_length=255)),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('tenant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='inbound_events', to='tenants.tenant')),
+            ],
+            options={
+                'db_table': 'inbound_events',
+                'ordering': ['-received_at'],
+                'indexes': [models.Index(fields=['received_at'], name='inbound_eve_receive_888587_idx')],
+                'constraints': [models.UniqueConstraint(fields=('provider', 'event_id'), name='uniq_inbound_event_provider_event')],
+            },
+        ),
+    ]
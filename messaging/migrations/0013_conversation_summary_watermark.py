@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 23:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0012_inbound_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='ai_summary_through_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='ai_summary_through_id',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+    ]
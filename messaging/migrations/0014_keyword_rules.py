@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 23:13
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0013_conversation_summary_watermark'),
+        ('tenants', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeywordRule',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('language', 'Language'), ('auto_reply', 'Auto Reply')], max_length=20)),
+                ('label', models.CharField(help_text='Language code or reply category', max_length=50)),
+                ('keywords', models.JSONField(default=list)),
+                ('reply_text', models.TextField(blank=True, help_text='Auto-reply text; {tenant_name} is substituted')),
+                ('priority', models.PositiveIntegerField(default=100, help_text='Lower values win when several rules match')),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='keyword_rules', to='tenants.tenant')),
+            ],
+            options={
+                'db_table': 'keyword_rules',
+                'ordering': ['kind', 'priority', 'label'],
+                'indexes': [models.Index(fields=['tenant', 'kind', 'is_active'], name='keyword_rul_tenant__1cf385_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 23:16
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0014_keyword_rules'),
+        ('tenants', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RetentionPolicy',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('message_retention_days', models.PositiveIntegerField(blank=True, help_text='Days to keep messages', null=True)),
+                ('sms_data_retention_days', models.PositiveIntegerField(blank=True, help_text='Days to keep delivery reports and bulk uploads', null=True)),
+                ('archive_before_delete', models.BooleanField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('tenant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='retention_policy', to='tenants.tenant')),
+            ],
+            options={
+                'verbose_name_plural': 'Retention policies',
+                'db_table': 'retention_policies',
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 23:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def partition_tables(apps, schema_editor):
+    # Opt-in: only runs on PostgreSQL with DB_PARTITIONING_ENABLED set.
+    # Tables can also be converted later with `manage.py partition_tables --convert`.
+    from core import partitioning
+
+    partitioning.convert_all(connection=schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0013_usage_record_tenant_created_index'),
+        ('messaging', '0015_retention_policies'),
+        ('tenants', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['tenant', 'created_at'], name='messages_tenant__a683c0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='smsdeliveryreport',
+            index=models.Index(fields=['tenant', 'received_at'], name='sms_deliver_tenant__324cfd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='smsmessage',
+            index=models.Index(fields=['tenant', 'created_at'], name='sms_message_tenant__3670ac_idx'),
+        ),
+        migrations.RunPython(partition_tables, migrations.RunPython.noop),
+    ]
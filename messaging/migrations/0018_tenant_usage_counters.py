@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 23:30
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0017_export_jobs'),
+        ('tenants', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TenantUsageCounter',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('period', models.DateField(help_text='First day of the month')),
+                ('messages_count', models.PositiveIntegerField(default=0)),
+                ('cost_micro', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage_counters', to='tenants.tenant')),
+            ],
+            options={
+                'db_table': 'tenant_usage_counters',
+                'unique_together': {('tenant', 'period')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 23:37
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0018_tenant_usage_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderMetadata',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('key', models.CharField(help_text='e.g. sender_ids:<tenant id>, balance', max_length=100, unique=True)),
+                ('data', models.JSONField(blank=True, null=True)),
+                ('refreshed_at', models.DateTimeField(blank=True, help_text='When data was last fetched successfully', null=True)),
+                ('last_attempt_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Provider metadata',
+                'db_table': 'provider_metadata',
+            },
+        ),
+    ]
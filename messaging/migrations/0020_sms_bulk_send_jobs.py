@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-18 23:40
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0019_provider_metadata'),
+        ('tenants', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SMSBulkSendJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('payload', models.JSONField(blank=True, default=list)),
+                ('schedule_time', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('sending', 'Sending'), ('completed', 'Completed'), ('partial', 'Partial Success'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('total_messages', models.PositiveIntegerField(default=0)),
+                ('total_recipients', models.PositiveIntegerField(default=0)),
+                ('sent_messages', models.PositiveIntegerField(default=0)),
+                ('failed_messages', models.PositiveIntegerField(default=0)),
+                ('total_cost', models.DecimalField(decimal_places=4, default=0, max_digits=12)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sms_bulk_send_jobs', to='tenants.tenant')),
+            ],
+            options={
+                'db_table': 'sms_bulk_send_jobs',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
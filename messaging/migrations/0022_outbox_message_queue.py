@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 23:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0021_outbox_messages'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxmessage',
+            name='queue',
+            field=models.CharField(blank=True, help_text="Overrides the task's routed queue", max_length=50),
+        ),
+    ]
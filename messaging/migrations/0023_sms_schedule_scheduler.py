@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-18 23:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0022_outbox_message_queue'),
+        ('tenants', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='smsschedule',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='smsschedule',
+            name='recurrence',
+            field=models.TextField(blank=True, help_text='RRULE for custom schedules, e.g. FREQ=WEEKLY;BYDAY=MO,TH (times are local to time_zone)'),
+        ),
+        migrations.AddField(
+            model_name='smsschedule',
+            name='run_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='smsschedule',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['next_run'], name='sms_schedules_due_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:02
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0023_sms_schedule_scheduler'),
+        ('tenants', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='status',
+            field=models.CharField(choices=[('staged', 'Staged'), ('queued', 'Queued'), ('sent', 'Sent'), ('delivered', 'Delivered'), ('read', 'Read'), ('failed', 'Failed')], default='queued', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='CampaignStage',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('run_at', models.DateTimeField()),
+                ('status', models.CharField(choices=[('staging', 'Staging'), ('staged', 'Staged'), ('dispatched', 'Dispatched')], default='staging', max_length=20)),
+                ('content_key', models.CharField(blank=True, max_length=64)),
+                ('total_recipients', models.PositiveIntegerField(default=0)),
+                ('dispatched_count', models.PositiveIntegerField(default=0)),
+                ('suppressed_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('staged_at', models.DateTimeField(blank=True, null=True)),
+                ('dispatched_at', models.DateTimeField(blank=True, null=True)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stages', to='messaging.campaign')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='campaign_stages', to='tenants.tenant')),
+            ],
+            options={
+                'db_table': 'campaign_stages',
+                'ordering': ['-run_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StagedCampaignMessage',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('contact', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='messaging.contact')),
+                ('message', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='staged_recipient', to='messaging.message')),
+                ('stage', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipients', to='messaging.campaignstage')),
+            ],
+            options={
+                'db_table': 'staged_campaign_messages',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='campaignstage',
+            constraint=models.UniqueConstraint(fields=('campaign', 'run_at'), name='campaign_stages_unique_run'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0024_campaign_staging'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaignstage',
+            name='total_segments',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
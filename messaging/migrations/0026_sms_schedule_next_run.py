@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-19 03:40
+
+from django.db import migrations
+
+
+def compute_next_run(apps, schema_editor):
+    # The scheduler only finds schedules through next_run, which active
+    # schedules saved before it never got. Like the serializers, start from
+    # the first occurrence (or the one after the last run); if that is in
+    # the past the scheduler fires it once and skips the rest it missed.
+    from messaging.services.scheduler import ScheduleError, upcoming_run
+
+    SMSSchedule = apps.get_model('messaging', 'SMSSchedule')
+    schedules = SMSSchedule.objects.filter(is_active=True, next_run__isnull=True).select_related('tenant')
+    for schedule in schedules.iterator():
+        try:
+            if schedule.last_run and schedule.last_run >= schedule.start_date:
+                next_run = upcoming_run(schedule, schedule.last_run, inclusive=False)
+            else:
+                next_run = upcoming_run(schedule, schedule.start_date)
+        except ScheduleError:
+            next_run = None
+        SMSSchedule.objects.filter(id=schedule.id).update(next_run=next_run, is_active=next_run is not None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0025_campaign_stage_segments'),
+    ]
+
+    operations = [
+        migrations.RunPython(compute_next_run, migrations.RunPython.noop),
+    ]
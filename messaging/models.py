@@ -11,6 +11,8 @@ User = get_user_model()
 
 # Import SMS models
 from .models_sms import *
+from .models_events import *
+from .models_exports import *
 
 
 class Contact(models.Model):
@@ -206,6 +208,9 @@ class Conversation(models.Model):
     # AI assistance
     ai_summary = models.TextField(blank=True)
     ai_suggestions = models.JSONField(default=list, blank=True)
+    # High-water mark of the last message folded into ai_summary
+    ai_summary_through_at = models.DateTimeField(null=True, blank=True)
+    ai_summary_through_id = models.UUIDField(null=True, blank=True)
 
     # Statistics
     message_count = models.PositiveIntegerField(default=0)
@@ -253,6 +258,7 @@ class Message(models.Model):
     ]
 
     STATUS_CHOICES = [
+        ('staged', 'Staged'),  # pre-rendered for a scheduled campaign, not yet queued
         ('queued', 'Queued'),
         ('sent', 'Sent'),
         ('delivered', 'Delivered'),
@@ -301,6 +307,9 @@ class Message(models.Model):
     class Meta:
         db_table = 'messages'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['tenant', 'created_at']),
+        ]
 
     def __str__(self):
         if self.conversation and self.conversation.contact:
@@ -557,6 +566,61 @@ class Campaign(models.Model):
         self.save()
 
 
+class CampaignStage(models.Model):
+    """
+    One run of a scheduled campaign, prepared ahead of its fire time: the
+    audience resolved and every message rendered and stored as 'staged'.
+    """
+    STATUS_CHOICES = [
+        ('staging', 'Staging'),
+        ('staged', 'Staged'),
+        ('dispatched', 'Dispatched'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='stages')
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='campaign_stages')
+    run_at = models.DateTimeField()
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='staging')
+    # Fingerprint of the campaign content the messages were rendered from
+    content_key = models.CharField(max_length=64, blank=True)
+    total_recipients = models.PositiveIntegerField(default=0)
+    # SMS parts across all rendered messages, for credit estimates
+    total_segments = models.PositiveIntegerField(default=0)
+    dispatched_count = models.PositiveIntegerField(default=0)
+    suppressed_count = models.PositiveIntegerField(default=0)
+
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    staged_at = models.DateTimeField(null=True, blank=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'campaign_stages'
+        ordering = ['-run_at']
+        constraints = [
+            models.UniqueConstraint(fields=['campaign', 'run_at'], name='campaign_stages_unique_run'),
+        ]
+
+    def __str__(self):
+        return f"{self.campaign_id} run at {self.run_at} - {self.status}"
+
+
+class StagedCampaignMessage(models.Model):
+    """
+    A staged message and the contact it is for, so opt-outs can be
+    re-checked with one join at dispatch.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    stage = models.ForeignKey(CampaignStage, on_delete=models.CASCADE, related_name='recipients')
+    message = models.OneToOneField('Message', on_delete=models.CASCADE, related_name='staged_recipient')
+    contact = models.ForeignKey(Contact, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        db_table = 'staged_campaign_messages'
+
+
 class Flow(models.Model):
     """
     Represents an automated flow for handling conversations.
@@ -594,3 +658,116 @@ class Flow(models.Model):
         """Deactivate the flow."""
         self.active = False
         self.save()
+
+
+class KeywordRule(models.Model):
+    """
+    Tenant-specific keywords for language routing and canned auto-replies.
+    """
+    KIND_CHOICES = [
+        ('language', 'Language'),
+        ('auto_reply', 'Auto Reply'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='keyword_rules')
+
+    # Rule details
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    label = models.CharField(max_length=50, help_text="Language code or reply category")
+    keywords = models.JSONField(default=list)
+    reply_text = models.TextField(blank=True, help_text="Auto-reply text; {tenant_name} is substituted")
+    priority = models.PositiveIntegerField(default=100, help_text="Lower values win when several rules match")
+    is_active = models.BooleanField(default=True)
+
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'keyword_rules'
+        ordering = ['kind', 'priority', 'label']
+        indexes = [
+            models.Index(fields=['tenant', 'kind', 'is_active']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.label}"
+
+
+class RetentionPolicy(models.Model):
+    """
+    Per-tenant data retention overrides; empty fields use platform defaults.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tenant = models.OneToOneField(Tenant, on_delete=models.CASCADE, related_name='retention_policy')
+
+    # Retention periods
+    message_retention_days = models.PositiveIntegerField(null=True, blank=True, help_text="Days to keep messages")
+    sms_data_retention_days = models.PositiveIntegerField(null=True, blank=True, help_text="Days to keep delivery reports and bulk uploads")
+
+    # Archive rows to cold storage before deleting them
+    archive_before_delete = models.BooleanField(null=True, blank=True)
+
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'retention_policies'
+        verbose_name_plural = 'Retention policies'
+
+    def __str__(self):
+        return f"Retention policy for {self.tenant.name}"
+
+
+class TenantUsageCounter(models.Model):
+    """
+    Running message count and cost for a tenant in one calendar month.
+
+    Incremented as messages are created so usage checks read one row
+    instead of aggregating the month's messages.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='usage_counters')
+    period = models.DateField(help_text="First day of the month")
+
+    # Totals
+    messages_count = models.PositiveIntegerField(default=0)
+    cost_micro = models.BigIntegerField(default=0)
+
+    # Timestamps
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'tenant_usage_counters'
+        unique_together = ['tenant', 'period']
+
+    def __str__(self):
+        return f"{self.tenant.name} usage for {self.period:%Y-%m}"
+
+
+class ProviderMetadata(models.Model):
+    """
+    Last known answer from a provider API (sender names, balance,
+    connection check), refreshed in the background.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    key = models.CharField(max_length=100, unique=True, help_text="e.g. sender_ids:<tenant id>, balance")
+    data = models.JSONField(null=True, blank=True)
+
+    # Refresh bookkeeping
+    refreshed_at = models.DateTimeField(null=True, blank=True, help_text="When data was last fetched successfully")
+    last_attempt_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'provider_metadata'
+        verbose_name_plural = 'Provider metadata'
+
+    def __str__(self):
+        return self.key
@@ -0,0 +1,73 @@
+"""
+Event bookkeeping models for provider webhooks.
+"""
+from django.db import models
+from django.utils import timezone
+import uuid
+
+
+class InboundEvent(models.Model):
+    """
+    Records provider webhook events that have already been accepted.
+
+    The unique (provider, event_id) index is the source of truth for
+    deduplication; rows only need to live as long as providers keep
+    retrying, after which the compactor removes them.
+    """
+    PROVIDER_CHOICES = [
+        ('whatsapp', 'WhatsApp'),
+        ('zenopay', 'ZenoPay'),
+        ('stripe', 'Stripe'),
+        ('beem', 'Beem Africa'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    provider = models.CharField(max_length=20, choices=PROVIDER_CHOICES)
+    event_id = models.CharField(max_length=255)
+    tenant = models.ForeignKey('tenants.Tenant', on_delete=models.CASCADE, related_name='inbound_events', null=True, blank=True)
+    received_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'inbound_events'
+        ordering = ['-received_at']
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'event_id'], name='uniq_inbound_event_provider_event'),
+        ]
+        indexes = [
+            models.Index(fields=['received_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.provider}:{self.event_id}"
+
+
+class OutboxMessage(models.Model):
+    """
+    A Celery task to publish, written in the same transaction as the rows
+    it refers to.
+
+    Nothing reaches the broker for a transaction that rolls back, and a
+    task whose publish fails stays here until the relay gets it out
+    (at-least-once). Published rows are purged after a retention window.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    task_name = models.CharField(max_length=255)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    queue = models.CharField(max_length=50, blank=True, help_text="Overrides the task's routed queue")
+    tenant = models.ForeignKey('tenants.Tenant', on_delete=models.CASCADE, related_name='outbox_messages', null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    published_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'outbox_messages'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['published_at', 'available_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.task_name} ({'published' if self.published_at else 'pending'})"
@@ -0,0 +1,54 @@
+"""
+Background data export jobs.
+"""
+from django.db import models
+from django.conf import settings
+import uuid
+
+
+class ExportJob(models.Model):
+    """
+    A CSV/XLSX export written to file storage by a Celery worker.
+    """
+    DATASET_CHOICES = [
+        ('messages', 'Messages'),
+        ('delivery_reports', 'SMS Delivery Reports'),
+        ('contacts', 'Contacts'),
+        ('transactions', 'Billing Transactions'),
+    ]
+
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('xlsx', 'Excel (XLSX)'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tenant = models.ForeignKey('tenants.Tenant', on_delete=models.CASCADE, related_name='export_jobs')
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='export_jobs')
+
+    dataset = models.CharField(max_length=30, choices=DATASET_CHOICES)
+    file_format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='csv')
+    filters = models.JSONField(default=dict, blank=True)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    file_path = models.CharField(max_length=500, blank=True)
+    row_count = models.PositiveIntegerField(default=0)
+    error_message = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'export_jobs'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.dataset} export ({self.file_format}) - {self.status}"
@@ -197,6 +197,9 @@ class SMSMessage(models.Model):
     class Meta:
         db_table = 'sms_messages'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['tenant', 'created_at']),
+        ]
 
     def __str__(self):
         return f"SMS {self.id} - {self.status}"
@@ -237,6 +240,9 @@ class SMSDeliveryReport(models.Model):
     class Meta:
         db_table = 'sms_delivery_reports'
         ordering = ['-received_at']
+        indexes = [
+            models.Index(fields=['tenant', 'received_at']),
+        ]
 
     def __str__(self):
         return f"Delivery Report {self.id} - {self.status}"
@@ -287,6 +293,50 @@ class SMSBulkUpload(models.Model):
         return f"Bulk Upload {self.file_name} - {self.status}"
 
 
+class SMSBulkSendJob(models.Model):
+    """
+    A bulk send request: its messages are stored first, then a worker calls
+    the provider and writes the results back.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('completed', 'Completed'),
+        ('partial', 'Partial Success'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='sms_bulk_send_jobs')
+
+    # What to send: one entry per message block
+    # [{"sms_message_id", "recipients", "encoding"}]
+    payload = models.JSONField(default=list, blank=True)
+    schedule_time = models.DateTimeField(null=True, blank=True)
+
+    # Progress
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    total_messages = models.PositiveIntegerField(default=0)
+    total_recipients = models.PositiveIntegerField(default=0)
+    sent_messages = models.PositiveIntegerField(default=0)
+    failed_messages = models.PositiveIntegerField(default=0)
+    total_cost = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+    errors = models.JSONField(default=list, blank=True)
+
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        db_table = 'sms_bulk_send_jobs'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Bulk send {self.id} - {self.status}"
+
+
 class SMSSchedule(models.Model):
     """
     Advanced scheduling for SMS campaigns.
@@ -314,6 +364,10 @@ class SMSSchedule(models.Model):
 
     # Custom schedule (for complex patterns)
     custom_schedule = models.JSONField(default=dict, blank=True)
+    recurrence = models.TextField(
+        blank=True,
+        help_text="RRULE for custom schedules, e.g. FREQ=WEEKLY;BYDAY=MO,TH (times are local to time_zone)"
+    )
 
     # Campaign reference
     campaign = models.ForeignKey('messaging.Campaign', on_delete=models.CASCADE, related_name='sms_schedules')
@@ -322,6 +376,9 @@ class SMSSchedule(models.Model):
     is_active = models.BooleanField(default=True)
     last_run = models.DateTimeField(null=True, blank=True)
     next_run = models.DateTimeField(null=True, blank=True)
+    run_count = models.PositiveIntegerField(default=0)
+    # Lease held by the scheduler node that claimed this schedule
+    locked_until = models.DateTimeField(null=True, blank=True)
 
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -331,6 +388,10 @@ class SMSSchedule(models.Model):
     class Meta:
         db_table = 'sms_schedules'
         ordering = ['-created_at']
+        indexes = [
+            # Due-time index the scheduler claims from
+            models.Index(fields=['next_run'], name='sms_schedules_due_idx', condition=models.Q(is_active=True)),
+        ]
 
     def __str__(self):
         return f"Schedule {self.name} - {self.frequency}"
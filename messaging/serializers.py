@@ -9,6 +9,8 @@ from .models import (
 )
 from django.utils import timezone
 
+from core.phone import PhoneNumberError, normalize
+
 User = get_user_model()
 
 
@@ -41,23 +43,19 @@ class ContactCreateSerializer(serializers.ModelSerializer):
 
     def validate_phone_e164(self, value):
         """Validate phone number format and uniqueness per tenant."""
-        import phonenumbers
         try:
-            parsed = phonenumbers.parse(value, None)
-            if not phonenumbers.is_valid_number(parsed):
-                raise serializers.ValidationError("Invalid phone number format.")
-            formatted_phone = phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
-
-            # Check for duplicate phone number within the same tenant
-            user = self.context['request'].user
-            tenant = getattr(user, 'tenant', None)
-            if tenant and Contact.objects.filter(tenant=tenant, phone_e164=formatted_phone).exists():
-                raise serializers.ValidationError("A contact with this phone number already exists in your contact list.")
-
-            return formatted_phone
-        except phonenumbers.NumberParseException:
+            formatted_phone = normalize(value)
+        except PhoneNumberError:
             raise serializers.ValidationError("Invalid phone number format.")
 
+        # Check for duplicate phone number within the same tenant
+        user = self.context['request'].user
+        tenant = getattr(user, 'tenant', None)
+        if tenant and Contact.objects.filter(tenant=tenant, phone_e164=formatted_phone).exists():
+            raise serializers.ValidationError("A contact with this phone number already exists in your contact list.")
+
+        return formatted_phone
+
 
 class ContactBulkImportSerializer(serializers.Serializer):
     """Serializer for bulk importing contacts from CSV."""
@@ -159,7 +157,7 @@ class ConversationSerializer(serializers.ModelSerializer):
 
     def get_last_message_text(self, obj):
         """Get the text of the last message."""
-        last_message = obj.messages.first()
+        last_message = obj.messages.exclude(status='staged').first()
         return last_message.text if last_message else ''
 
 
@@ -447,6 +445,10 @@ class CampaignCreateSerializer(serializers.ModelSerializer):
         target_contact_ids = validated_data.pop('target_contact_ids', [])
         target_segment_ids = validated_data.pop('target_segment_ids', [])
 
+        # A start time makes it a scheduled campaign; it is staged ahead of that time
+        if validated_data.get('scheduled_at'):
+            validated_data.setdefault('status', 'scheduled')
+
         # Create campaign
         campaign = Campaign.objects.create(**validated_data)
 
@@ -1,8 +1,11 @@
 """
 SMS-specific serializers for Mifumo WMS.
 """
+import copy
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+
+from core.phone import is_valid
 from .models_sms import (
     SMSProvider, SMSSenderID, SMSTemplate, SMSMessage,
     SMSDeliveryReport, SMSBulkUpload, SMSSchedule, SenderNameRequest
@@ -172,20 +175,25 @@ class SMSScheduleSerializer(serializers.ModelSerializer):
     created_by_name = serializers.CharField(source='created_by.get_full_name', read_only=True)
     campaign_name = serializers.CharField(source='campaign.name', read_only=True)
 
+    # Changing any of these moves next_run
+    TIMING_FIELDS = {'frequency', 'start_date', 'end_date', 'time_zone', 'recurrence', 'is_active'}
+
     class Meta:
         model = SMSSchedule
         fields = [
             'id', 'name', 'description', 'frequency', 'start_date',
-            'end_date', 'time_zone', 'custom_schedule', 'campaign',
-            'campaign_name', 'is_active', 'last_run', 'next_run',
+            'end_date', 'time_zone', 'recurrence', 'custom_schedule', 'campaign',
+            'campaign_name', 'is_active', 'last_run', 'next_run', 'run_count',
             'created_at', 'updated_at', 'created_by_name'
         ]
         read_only_fields = [
-            'id', 'last_run', 'next_run', 'created_at', 'updated_at'
+            'id', 'last_run', 'next_run', 'run_count', 'created_at', 'updated_at'
         ]
 
     def validate(self, data):
         """Validate schedule data."""
+        from .services.scheduler import ScheduleError, upcoming_run
+
         start_date = data.get('start_date')
         end_date = data.get('end_date')
 
@@ -194,8 +202,43 @@ class SMSScheduleSerializer(serializers.ModelSerializer):
                 "End date must be after start date"
             )
 
+        # Check the recurrence and time zone against the schedule as it will be saved
+        schedule = copy.copy(self.instance) if self.instance else SMSSchedule()
+        if not schedule.tenant_id:
+            tenant = getattr(self.context.get('request'), 'tenant', None)
+            schedule.tenant_id = getattr(tenant, 'id', None)
+        for field, value in data.items():
+            setattr(schedule, field, value)
+        if schedule.start_date:
+            try:
+                upcoming_run(schedule, schedule.start_date)
+            except ScheduleError as e:
+                raise serializers.ValidationError({'recurrence': str(e)})
+
         return data
 
+    def create(self, validated_data):
+        from .services.scheduler import upcoming_run
+
+        schedule = SMSSchedule(**validated_data)
+        schedule.next_run = upcoming_run(schedule, schedule.start_date)
+        schedule.save()
+        return schedule
+
+    def update(self, instance, validated_data):
+        from django.utils import timezone
+        from .services.scheduler import upcoming_run
+
+        instance = super().update(instance, validated_data)
+        if self.TIMING_FIELDS & set(validated_data) and instance.is_active:
+            if instance.frequency == 'once' and instance.last_run:
+                instance.next_run = None
+            else:
+                instance.next_run = upcoming_run(instance, max(instance.start_date, timezone.now()))
+            instance.is_active = instance.next_run is not None
+            instance.save(update_fields=['next_run', 'is_active', 'updated_at'])
+        return instance
+
 
 class SMSBulkSendSerializer(serializers.Serializer):
     """Serializer for bulk SMS sending."""
@@ -223,11 +266,7 @@ class SMSBulkSendSerializer(serializers.Serializer):
                 raise serializers.ValidationError(f"Contact {i+1} missing phone number")
 
             # Validate phone number format
-            phone = str(contact['phone']).strip()
-            if phone.startswith('+'):
-                phone = phone[1:]
-
-            if not phone.isdigit() or len(phone) < 10:
+            if not is_valid(contact['phone']):
                 raise serializers.ValidationError(f"Invalid phone number for contact {i+1}")
 
         return value
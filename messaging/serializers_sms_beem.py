@@ -10,6 +10,8 @@ from django.utils import timezone
 from datetime import datetime
 import re
 
+from core.phone import is_valid
+
 from .models_sms import SMSProvider, SMSSenderID, SMSTemplate, SMSMessage, SMSDeliveryReport
 
 
@@ -286,19 +288,9 @@ class PhoneValidationSerializer(serializers.Serializer):
         if not value:
             raise serializers.ValidationError("Phone number is required")
         
-        # Remove spaces, dashes, and parentheses
-        cleaned = re.sub(r'[\s\-\(\)]', '', value)
-        
-        # Check if it starts with + or country code
-        if not (cleaned.startswith('+') or cleaned.startswith('255')):
-            raise serializers.ValidationError(
-                "Phone number must include country code (e.g., +255 or 255)"
-            )
-        
-        # Basic length validation
-        if len(cleaned) < 10 or len(cleaned) > 15:
+        if not is_valid(value):
             raise serializers.ValidationError(
-                "Phone number must be between 10 and 15 digits"
+                "Invalid phone number (e.g., +255712345678 or 0712345678)"
             )
         
         return value
@@ -3,33 +3,91 @@ AI service for generating suggestions and summaries using Hugging Face.
 """
 import requests
 import logging
+import hashlib
 from django.conf import settings
-from typing import List, Dict, Any
-import json
+from typing import List, Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 
 
+class LocalAIModel:
+    """
+    Deterministic stand-in for the hosted model.
+
+    Produces the same JSON shapes as the prompts request, derived only from
+    the prompt text, so tests and benchmarks run without network access.
+    """
+    
+    REPLIES = [
+        "Thank you for your message. How can I help you today?",
+        "I understand your concern. Let me assist you with that.",
+        "Thanks for reaching out. I'll get back to you shortly.",
+        "Could you share a few more details so we can help?",
+        "We have received your request and are working on it.",
+    ]
+    
+    def generate(self, prompt: str) -> Dict[str, Any]:
+        """
+        Generate a response for a prompt.
+        
+        Args:
+            prompt: Input prompt
+        
+        Returns:
+            Parsed response in the same shape as the hosted model
+        """
+        digest = int(hashlib.sha256(prompt.encode('utf-8')).hexdigest(), 16)
+        
+        if '"replies"' in prompt:
+            start = digest % len(self.REPLIES)
+            return {"replies": [self.REPLIES[(start + i) % len(self.REPLIES)] for i in range(3)]}
+        
+        if '"summary"' in prompt:
+            lines = [
+                line.strip().lstrip('-').strip()
+                for line in prompt.split('\n')
+                if line.startswith(('Customer:', 'Agent:', '- '))
+            ]
+            return {"summary": [line[:120] for line in lines[-5:]] or ["No messages yet"]}
+        
+        return {}
+
+
 class AIService:
     """
     Service for AI-powered features using Hugging Face Inference API.
     """
     
-    def __init__(self):
+    FALLBACK_REPLIES = [
+        "Thank you for your message. How can I help you today?",
+        "I understand your concern. Let me assist you with that.",
+        "Thanks for reaching out. I'll get back to you shortly."
+    ]
+    
+    FALLBACK_SUMMARY = [
+        "Customer inquiry received",
+        "Support provided",
+        "Issue resolved"
+    ]
+    
+    def __init__(self, backend: Optional[str] = None):
         self.api_url = settings.HF_API_URL
         self.api_key = settings.HF_API_KEY
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        self.backend = backend or getattr(settings, 'AI_MODEL_BACKEND', 'huggingface')
+        self.local_model = LocalAIModel() if self.backend == 'local' else None
     
-    def suggest_reply(self, tenant_name: str, context: List[Dict[str, Any]]) -> List[str]:
+    def suggest_reply(self, tenant_name: str, context: List[Dict[str, Any]], tenant_id: Optional[str] = None) -> List[str]:
         """
         Generate AI suggestions for replying to a conversation.
         
         Args:
             tenant_name: Name of the tenant/business
             context: List of recent messages in the conversation
+            tenant_id: Optional tenant ID for per-tenant inference limits
         
         Returns:
             List of suggested replies
@@ -47,33 +105,26 @@ Keep each under 25 words, simple English (or detect and match language).
 CONTEXT:
 {context_text}"""
             
-            # Call Hugging Face API
-            response = self._call_huggingface_api(prompt)
+            # Call the configured model
+            response = self._call_model(prompt, tenant_id=tenant_id)
             
             if response and "replies" in response:
                 return response["replies"]
             else:
                 # Fallback suggestions
-                return [
-                    "Thank you for your message. How can I help you today?",
-                    "I understand your concern. Let me assist you with that.",
-                    "Thanks for reaching out. I'll get back to you shortly."
-                ]
+                return list(self.FALLBACK_REPLIES)
         
         except Exception as e:
             logger.error(f"Error generating AI suggestions: {str(e)}")
-            return [
-                "Thank you for your message. How can I help you today?",
-                "I understand your concern. Let me assist you with that.",
-                "Thanks for reaching out. I'll get back to you shortly."
-            ]
+            return list(self.FALLBACK_REPLIES)
     
-    def summarize_conversation(self, context: List[Dict[str, Any]]) -> List[str]:
+    def summarize_conversation(self, context: List[Dict[str, Any]], tenant_id: Optional[str] = None) -> List[str]:
         """
         Generate AI summary for a conversation.
         
         Args:
             context: List of all messages in the conversation
+            tenant_id: Optional tenant ID for per-tenant inference limits
         
         Returns:
             List of summary bullet points
@@ -89,26 +140,58 @@ CONTEXT:
 CONVERSATION:
 {context_text}"""
             
-            # Call Hugging Face API
-            response = self._call_huggingface_api(prompt)
+            # Call the configured model
+            response = self._call_model(prompt, tenant_id=tenant_id)
             
             if response and "summary" in response:
                 return response["summary"]
             else:
                 # Fallback summary
-                return [
-                    "Customer inquiry received",
-                    "Support provided",
-                    "Issue resolved"
-                ]
+                return list(self.FALLBACK_SUMMARY)
         
         except Exception as e:
             logger.error(f"Error generating AI summary: {str(e)}")
-            return [
-                "Customer inquiry received",
-                "Support provided", 
-                "Issue resolved"
-            ]
+            return list(self.FALLBACK_SUMMARY)
+    
+    def update_summary(self, previous_summary: List[str], context: List[Dict[str, Any]], tenant_id: Optional[str] = None) -> List[str]:
+        """
+        Fold new messages into an existing conversation summary.
+        
+        Args:
+            previous_summary: Current summary bullet points (may be empty)
+            context: Messages received since the summary was last updated
+            tenant_id: Optional tenant ID for per-tenant inference limits
+        
+        Returns:
+            List of summary bullet points, or None if the model did not
+            produce one
+        """
+        if not previous_summary:
+            summary = self.summarize_conversation(context, tenant_id=tenant_id)
+            return None if summary == self.FALLBACK_SUMMARY else summary
+        
+        try:
+            context_text = self._format_context_for_ai(context)
+            summary_text = "\n".join(f"- {bullet}" for bullet in previous_summary)
+            
+            prompt = f"""Update this WhatsApp conversation summary with the new messages. Keep 3-5 bullets (JSON):
+{{"summary":["...","...","..."]}}
+
+SUMMARY SO FAR:
+{summary_text}
+
+NEW MESSAGES:
+{context_text}"""
+            
+            response = self._call_model(prompt, tenant_id=tenant_id)
+            
+            if response and "summary" in response:
+                return response["summary"]
+            return None
+        
+        except Exception as e:
+            logger.error(f"Error updating AI summary: {str(e)}")
+            return None
     
     def _format_context_for_ai(self, context: List[Dict[str, Any]]) -> str:
         """
@@ -129,59 +212,41 @@ CONVERSATION:
         
         return "\n".join(formatted_messages)
     
-    def _call_huggingface_api(self, prompt: str) -> Dict[str, Any]:
+    def _call_model(self, prompt: str, tenant_id: Optional[str] = None) -> Dict[str, Any]:
         """
-        Call Hugging Face Inference API.
+        Call the configured model backend.
         
         Args:
             prompt: Input prompt for the AI
+            tenant_id: Tenant the prompt belongs to, for per-tenant limits
+        
+        Returns:
+            Parsed response from the model
+        """
+        if self.local_model:
+            return self.local_model.generate(prompt)
+        return self._call_huggingface_api(prompt, tenant_id=tenant_id)
+    
+    def _call_huggingface_api(self, prompt: str, tenant_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Call Hugging Face Inference API through the shared inference client.
+        
+        Args:
+            prompt: Input prompt for the AI
+            tenant_id: Tenant the prompt belongs to, for per-tenant limits
         
         Returns:
             Parsed response from the API
         """
+        from .inference import inference_client
+        from core.circuit_breaker import CircuitOpenError
+        
         try:
-            payload = {
-                "inputs": prompt,
-                "parameters": {
-                    "max_new_tokens": 200,
-                    "temperature": 0.7,
-                    "return_full_text": False
-                }
-            }
-            
-            response = requests.post(
-                self.api_url,
-                headers=self.headers,
-                json=payload,
-                timeout=30
-            )
-            response.raise_for_status()
-            
-            result = response.json()
-            
-            # Extract generated text
-            if isinstance(result, list) and len(result) > 0:
-                generated_text = result[0].get("generated_text", "")
-            else:
-                generated_text = str(result)
-            
-            # Try to parse as JSON
-            try:
-                # Clean up the response to extract JSON
-                start_idx = generated_text.find("{")
-                end_idx = generated_text.rfind("}") + 1
-                
-                if start_idx != -1 and end_idx > start_idx:
-                    json_str = generated_text[start_idx:end_idx]
-                    return json.loads(json_str)
-                else:
-                    logger.warning("No valid JSON found in AI response")
-                    return {}
-            
-            except json.JSONDecodeError as e:
-                logger.warning(f"Failed to parse AI response as JSON: {str(e)}")
-                return {}
+            return inference_client.submit(prompt, tenant_id=tenant_id)
         
+        except CircuitOpenError as e:
+            logger.warning(f"Skipping Hugging Face call: {str(e)}")
+            return {}
         except requests.exceptions.RequestException as e:
             logger.error(f"Error calling Hugging Face API: {str(e)}")
             return {}
@@ -189,74 +254,40 @@ CONVERSATION:
             logger.error(f"Unexpected error calling Hugging Face API: {str(e)}")
             return {}
     
-    def detect_language(self, text: str) -> str:
+    def detect_language(self, text: str, tenant_id: Optional[str] = None) -> str:
         """
         Detect the language of the input text.
         
         Args:
             text: Input text
+            tenant_id: Optional tenant whose keyword tables should be used
         
         Returns:
             Language code (e.g., 'en', 'sw', 'fr')
         """
         try:
-            # Simple language detection based on common words
-            text_lower = text.lower()
-            
-            # Swahili indicators
-            swahili_words = ['hujambo', 'sawa', 'asante', 'karibu', 'pole', 'hapana', 'ndiyo']
-            if any(word in text_lower for word in swahili_words):
-                return 'sw'
-            
-            # French indicators
-            french_words = ['bonjour', 'merci', 'oui', 'non', 'comment', 'pourquoi']
-            if any(word in text_lower for word in french_words):
-                return 'fr'
-            
-            # Arabic indicators
-            arabic_chars = ['ا', 'ب', 'ت', 'ث', 'ج', 'ح', 'خ', 'د', 'ذ', 'ر', 'ز', 'س', 'ش', 'ص', 'ض', 'ط', 'ظ', 'ع', 'غ', 'ف', 'ق', 'ك', 'ل', 'م', 'ن', 'ه', 'و', 'ي']
-            if any(char in text for char in arabic_chars):
-                return 'ar'
-            
-            # Default to English
-            return 'en'
+            from .keywords import keyword_classifier
+            return keyword_classifier.detect_language(text, tenant_id=tenant_id)
         
         except Exception as e:
             logger.error(f"Error detecting language: {str(e)}")
             return 'en'
     
-    def generate_auto_reply(self, message_text: str, tenant_name: str) -> str:
+    def generate_auto_reply(self, message_text: str, tenant_name: str, tenant_id: Optional[str] = None) -> str:
         """
         Generate an automatic reply for common inquiries.
         
         Args:
             message_text: Incoming message text
             tenant_name: Name of the tenant/business
+            tenant_id: Optional tenant whose keyword tables should be used
         
         Returns:
             Generated auto-reply text
         """
         try:
-            text_lower = message_text.lower()
-            
-            # Common greeting patterns
-            if any(word in text_lower for word in ['hello', 'hi', 'hey', 'hujambo', 'bonjour']):
-                return f"Hello! Welcome to {tenant_name}. How can I help you today?"
-            
-            # Help requests
-            if any(word in text_lower for word in ['help', 'support', 'assistance', 'msaada']):
-                return f"Hi! I'm here to help you with {tenant_name}. What do you need assistance with?"
-            
-            # Pricing inquiries
-            if any(word in text_lower for word in ['price', 'cost', 'fee', 'charge', 'bei']):
-                return f"Thanks for your interest in {tenant_name}! Let me connect you with our pricing information."
-            
-            # Hours of operation
-            if any(word in text_lower for word in ['hours', 'time', 'open', 'closed', 'muda']):
-                return f"Thanks for asking about our hours! Let me get you the current schedule for {tenant_name}."
-            
-            # Default response
-            return f"Thank you for contacting {tenant_name}! I'll get back to you as soon as possible."
+            from .keywords import keyword_classifier
+            return keyword_classifier.auto_reply(message_text, tenant_name, tenant_id=tenant_id)
         
         except Exception as e:
             logger.error(f"Error generating auto-reply: {str(e)}")
@@ -0,0 +1,102 @@
+"""
+Debounced, cached AI reply suggestions for conversations.
+"""
+import hashlib
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .ai import AIService
+
+logger = logging.getLogger(__name__)
+
+
+class ReplySuggestionService:
+    """
+    Generates reply suggestions once per quiet period per conversation.
+
+    Each inbound message schedules a run after ``quiet_period`` seconds; a
+    run that finds a newer inbound message steps aside for the run that
+    message scheduled, so a burst of messages costs one model call.
+    Results are cached by a hash of the context window, so re-running on
+    an unchanged conversation never reaches the model.
+    """
+    cache_prefix = 'ai:suggestions'
+
+    def __init__(self, ai_service=None, quiet_period=None, context_size=None, cache_ttl=None):
+        self.ai_service = ai_service or AIService()
+        self.quiet_period = quiet_period if quiet_period is not None else getattr(settings, 'AI_SUGGEST_QUIET_PERIOD', 5)
+        self.context_size = context_size or getattr(settings, 'AI_SUGGEST_CONTEXT_SIZE', 15)
+        self.cache_ttl = cache_ttl or getattr(settings, 'AI_SUGGEST_CACHE_TTL', 60 * 60 * 24)
+
+    def schedule(self, conversation_id, requested_at=None):
+        """
+        Queue a debounced suggestion run for a conversation.
+        """
+        from messaging.tasks import ai_suggest_reply_task
+
+        requested_at = requested_at or timezone.now()
+        ai_suggest_reply_task.apply_async(
+            args=[str(conversation_id)],
+            kwargs={'requested_at': requested_at.isoformat()},
+            countdown=self.quiet_period
+        )
+
+    def is_superseded(self, conversation, requested_at):
+        """
+        Whether a newer inbound message arrived after this run was requested.
+        """
+        if not requested_at:
+            return False
+        if isinstance(requested_at, str):
+            requested_at = parse_datetime(requested_at)
+        return conversation.messages.filter(direction='in', created_at__gt=requested_at).exists()
+
+    def get_context(self, conversation):
+        recent_messages = conversation.messages.order_by('-created_at').values(
+            'direction', 'text', 'created_at'
+        )[:self.context_size]
+        return [
+            {
+                'direction': msg['direction'],
+                'text': msg['text'],
+                'timestamp': msg['created_at'].isoformat()
+            }
+            for msg in reversed(list(recent_messages))
+        ]
+
+    def context_key(self, tenant_name, context):
+        # Timestamps are left out so identical wording shares an entry
+        material = tenant_name + '\n' + self.ai_service._format_context_for_ai(context)
+        digest = hashlib.sha256(material.encode('utf-8')).hexdigest()
+        return f'{self.cache_prefix}:{digest}'
+
+    def suggest(self, conversation):
+        """
+        Return suggestions for the current context window.
+
+        Returns:
+            tuple: (suggestions, cache_hit)
+        """
+        tenant_name = conversation.tenant.name
+        context = self.get_context(conversation)
+        key = self.context_key(tenant_name, context)
+
+        suggestions = cache.get(key)
+        if suggestions is not None:
+            return suggestions, True
+
+        suggestions = self.ai_service.suggest_reply(
+            tenant_name=tenant_name,
+            context=context,
+            tenant_id=str(conversation.tenant_id)
+        )
+        # Canned fallbacks mean the model was unavailable; try again next time
+        if suggestions != self.ai_service.FALLBACK_REPLIES:
+            cache.set(key, suggestions, self.cache_ttl)
+        return suggestions, False
+
+
+reply_suggestions = ReplySuggestionService()
@@ -0,0 +1,111 @@
+"""
+Incremental rolling summaries for conversations.
+"""
+import logging
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .ai import AIService
+
+logger = logging.getLogger(__name__)
+
+
+class RollingSummaryService:
+    """
+    Keeps ``Conversation.ai_summary`` up to date by folding in only the
+    messages after the stored high-water mark.
+
+    Messages are streamed in (created_at, id) order and summarized chunk by
+    chunk together with the running summary, so memory and prompt size stay
+    bounded no matter how long the thread is.
+    """
+
+    def __init__(self, ai_service=None, chunk_size=None):
+        self.ai_service = ai_service or AIService()
+        self.chunk_size = chunk_size or getattr(settings, 'AI_SUMMARY_CHUNK_SIZE', 50)
+
+    @staticmethod
+    def parse_summary(text):
+        return [line[2:] if line.startswith('- ') else line for line in (text or '').splitlines() if line.strip()]
+
+    @staticmethod
+    def format_summary(bullets):
+        return '\n'.join(f'- {bullet}' for bullet in bullets)
+
+    def pending_messages(self, conversation):
+        """
+        Messages not yet folded into the summary, oldest first.
+        """
+        qs = conversation.messages.order_by('created_at', 'id')
+        if conversation.ai_summary_through_at:
+            qs = qs.filter(
+                Q(created_at__gt=conversation.ai_summary_through_at) |
+                Q(created_at=conversation.ai_summary_through_at, id__gt=conversation.ai_summary_through_id)
+            )
+        return qs.values('id', 'direction', 'text', 'created_at')
+
+    def _chunks(self, rows):
+        chunk = []
+        for row in rows.iterator(chunk_size=self.chunk_size):
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def refresh(self, conversation):
+        """
+        Bring the conversation summary up to date.
+
+        Returns:
+            int: Number of messages folded into the summary
+        """
+        from messaging.models import Conversation
+
+        summary = self.parse_summary(conversation.ai_summary)
+        through_at = conversation.ai_summary_through_at
+        through_id = conversation.ai_summary_through_id
+        folded = 0
+
+        for chunk in self._chunks(self.pending_messages(conversation)):
+            context = [
+                {
+                    'direction': row['direction'],
+                    'text': row['text'],
+                    'timestamp': row['created_at'].isoformat()
+                }
+                for row in chunk
+            ]
+            updated = self.ai_service.update_summary(summary, context, tenant_id=str(conversation.tenant_id))
+            if updated is None:
+                # Keep what was folded so far; this chunk is retried on the next refresh
+                logger.warning(f"Summary update failed for conversation {conversation.id}")
+                break
+            summary = updated
+            through_at, through_id = chunk[-1]['created_at'], chunk[-1]['id']
+            folded += len(chunk)
+
+        if not folded:
+            return 0
+
+        # Only advance from the mark we started at; a concurrent run that
+        # got there first has already stored an equivalent summary
+        updated = Conversation.objects.filter(
+            id=conversation.id,
+            ai_summary_through_at=conversation.ai_summary_through_at,
+            ai_summary_through_id=conversation.ai_summary_through_id
+        ).update(
+            ai_summary=self.format_summary(summary),
+            ai_summary_through_at=through_at,
+            ai_summary_through_id=through_id,
+            updated_at=timezone.now()
+        )
+        if not updated:
+            logger.info(f"Summary for conversation {conversation.id} was advanced concurrently")
+            return 0
+        return folded
+
+
+rolling_summaries = RollingSummaryService()
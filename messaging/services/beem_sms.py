@@ -11,18 +11,28 @@ API Endpoint: https://apisms.beem.africa/v1/send
 
 import requests
 import logging
+from collections import Counter
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 from django.conf import settings
 from requests.auth import HTTPBasicAuth
 from requests.exceptions import RequestException, Timeout, ConnectionError
 
+from core.circuit_breaker import CircuitOpenError
+from core.operators import operator_directory
+from core.phone import PhoneNumberError, is_valid, to_msisdn
+from .provider_health import BEEM_SEND, TRANSIENT, classify, provider_health
+
 logger = logging.getLogger(__name__)
 
 
 class BeemSMSError(Exception):
     """Custom exception for Beem SMS API errors"""
-    pass
+
+    def __init__(self, message, status_code=None, code=None):
+        self.status_code = status_code
+        self.code = code
+        super().__init__(message)
 
 
 class BeemSMSService:
@@ -48,7 +58,8 @@ class BeemSMSService:
         if not self.api_key or not self.secret_key:
             raise BeemSMSError(
                 "Beem API credentials not configured. "
-                "Please set BEEM_API_KEY and BEEM_SECRET_KEY in your environment variables."
+                "Please set BEEM_API_KEY and BEEM_SECRET_KEY in your environment variables.",
+                code='NOT_CONFIGURED'
             )
         
         self.auth = HTTPBasicAuth(self.api_key, self.secret_key)
@@ -128,6 +139,11 @@ class BeemSMSService:
         Raises:
             BeemSMSError: If API call fails or returns error
         """
+        try:
+            provider_health.check(BEEM_SEND)
+        except CircuitOpenError as e:
+            raise BeemSMSError(str(e), code='CIRCUIT_OPEN')
+        
         try:
             # Auto-detect encoding if not specified
             if encoding is None:
@@ -174,28 +190,45 @@ class BeemSMSService:
             # Handle response
             if response.status_code == 200:
                 response_data = response.json()
+                provider_health.record(BEEM_SEND)
                 logger.info(f"SMS sent successfully via Beem. Response: {response_data}")
                 return {
                     'success': True,
                     'provider': 'beem',
                     'response': response_data,
                     'message_count': len(recipients),
-                    'cost_estimate': self._calculate_cost(len(recipients), len(message))
+                    'cost_estimate': self._calculate_cost(len(recipients), len(message), recipients)
                 }
             else:
+                code = self._error_code(response)
+                provider_health.record(BEEM_SEND, classify(code, response.status_code))
                 error_msg = f"Beem API error: {response.status_code} - {response.text}"
                 logger.error(error_msg)
-                raise BeemSMSError(error_msg)
+                raise BeemSMSError(error_msg, status_code=response.status_code, code=code)
                 
+        except BeemSMSError:
+            raise
         except (RequestException, Timeout, ConnectionError) as e:
+            provider_health.record(BEEM_SEND, TRANSIENT)
             error_msg = f"Network error while sending SMS via Beem: {str(e)}"
             logger.error(error_msg)
-            raise BeemSMSError(error_msg)
+            raise BeemSMSError(error_msg, code='NETWORK_ERROR')
         except Exception as e:
             error_msg = f"Unexpected error while sending SMS via Beem: {str(e)}"
             logger.error(error_msg)
             raise BeemSMSError(error_msg)
     
+    def _error_code(self, response) -> Optional[int]:
+        """Beem's error code from an error response, if it has one."""
+        try:
+            data = response.json()
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        nested = data.get('data')
+        return data.get('code') or (nested.get('code') if isinstance(nested, dict) else None)
+    
     def send_bulk_sms(
         self,
         messages: List[Dict],
@@ -280,12 +313,7 @@ class BeemSMSService:
         Returns:
             bool: True if valid, False otherwise
         """
-        try:
-            formatted = self._format_phone_number(phone_number)
-            # Basic validation - should be 10-15 digits
-            return len(formatted) >= 10 and len(formatted) <= 15 and formatted.isdigit()
-        except:
-            return False
+        return is_valid(phone_number)
     
     def _format_phone_number(self, phone_number: str) -> str:
         """
@@ -297,40 +325,53 @@ class BeemSMSService:
         Returns:
             str: Formatted phone number
         """
-        # Remove all non-digit characters except +
-        cleaned = ''.join(c for c in phone_number if c.isdigit() or c == '+')
-        
-        # Remove leading +
-        if cleaned.startswith('+'):
-            cleaned = cleaned[1:]
-        
-        # Add country code if missing (assume Tanzania +255)
-        if len(cleaned) == 9 and cleaned.startswith('7'):
-            cleaned = '255' + cleaned
-        elif len(cleaned) == 10 and cleaned.startswith('07'):
-            cleaned = '255' + cleaned[1:]
-        
-        return cleaned
+        try:
+            return to_msisdn(phone_number)
+        except PhoneNumberError:
+            # Passed through as digits for Beem to reject with its own error
+            return ''.join(c for c in str(phone_number) if c.isdigit())
     
-    def _calculate_cost(self, recipient_count: int, message_length: int) -> float:
+    def _price_per_sms(self, operator) -> float:
+        """
+        Price of one SMS part to an operator's network (SMS_PRICES, by
+        '<country>:<operator>', then country, then 'default')
+        """
+        prices = getattr(settings, 'SMS_PRICES', {})
+        if operator is not None:
+            for key in (f'{operator.country}:{operator.operator}', operator.country):
+                if key in prices:
+                    return prices[key]
+        return prices.get('default', 0.05)
+    
+    def _calculate_cost(self, recipient_count: int, message_length: int,
+                        recipients: Optional[List[str]] = None) -> float:
         """
         Calculate estimated cost for SMS
         
         Args:
             recipient_count (int): Number of recipients
             message_length (int): Message length in characters
+            recipients (List[str], optional): The numbers, priced by their operator
             
         Returns:
             float: Estimated cost in USD
         """
         # Beem pricing (approximate - check current rates)
-        base_cost_per_sms = 0.05  # $0.05 per SMS
         cost_per_160_chars = 0.01  # Additional cost per 160 characters
         
         sms_parts = (message_length // 160) + 1
-        cost_per_recipient = base_cost_per_sms + (sms_parts - 1) * cost_per_160_chars
+        extra_parts_cost = (sms_parts - 1) * cost_per_160_chars
+        
+        if recipients is None:
+            return round(recipient_count * (self._price_per_sms(None) + extra_parts_cost), 4)
         
-        return round(recipient_count * cost_per_recipient, 4)
+        # One trie walk per distinct number, then one price per operator
+        operators = Counter(operator_directory.lookup_many(recipients))
+        cost = sum(
+            count * (self._price_per_sms(operator) + extra_parts_cost)
+            for operator, count in operators.items()
+        )
+        return round(cost, 4)
     
     def get_account_balance(self) -> Dict:
         """
@@ -0,0 +1,281 @@
+"""
+Two-phase bulk SMS sending.
+
+The request only stores queued records and reserves a credit per
+recipient, in one short transaction. A worker then calls the provider
+outside any transaction, several blocks at a time. Each message is
+claimed before its call and every batch's results are written back with
+bulk updates, giving back the credits of messages that failed.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class BulkSendPipeline:
+    """
+    Queues and dispatches ``SMSBulkSendJob``s.
+    """
+
+    def __init__(self, concurrency=None, batch_size=None):
+        self.concurrency = concurrency or getattr(settings, 'BULK_SMS_CONCURRENCY', 8)
+        self.batch_size = batch_size or getattr(settings, 'BULK_SMS_BATCH_SIZE', 50)
+
+    def enqueue(self, tenant, user, provider, blocks, schedule_time=None):
+        """
+        Store a job and its queued messages, reserve one credit per
+        recipient, and hand it to a worker.
+
+        Args:
+            blocks: [{'message', 'recipients', 'sender', 'encoding'}] with
+                ``sender`` an already validated SMSSenderID
+
+        Returns:
+            SMSBulkSendJob
+
+        Raises:
+            SMSValidationError: if the tenant does not have the credits
+        """
+        from messaging.models import Message
+        from messaging.models_sms import SMSBulkSendJob, SMSMessage
+        from messaging.tasks_sms import send_bulk_sms_job_task
+        from .costmeter import cost_meter
+        from .outbox import outbox
+        from .sms_validation import SMSValidationError, reserve_credits
+
+        total_recipients = sum(len(block['recipients']) for block in blocks)
+        with transaction.atomic():
+            if not reserve_credits(tenant.id, total_recipients):
+                raise SMSValidationError(
+                    f"Insufficient SMS credits. Required: {total_recipients}. "
+                    "Please purchase more credits to send SMS."
+                )
+            messages = Message.objects.bulk_create([
+                Message(
+                    tenant=tenant,
+                    conversation=None,
+                    direction='out',
+                    provider='sms',
+                    text=block['message'],
+                    created_by=user
+                )
+                for block in blocks
+            ])
+            sms_messages = SMSMessage.objects.bulk_create([
+                SMSMessage(
+                    tenant=tenant,
+                    base_message=message,
+                    provider=provider,
+                    sender_id=block['sender'],
+                    status='queued'
+                )
+                for message, block in zip(messages, blocks)
+            ])
+            job = SMSBulkSendJob.objects.create(
+                tenant=tenant,
+                created_by=user,
+                schedule_time=schedule_time,
+                total_messages=len(blocks),
+                total_recipients=total_recipients,
+                payload=[
+                    {
+                        'sms_message_id': str(sms_message.id),
+                        'recipients': list(block['recipients']),
+                        'encoding': block.get('encoding'),
+                    }
+                    for sms_message, block in zip(sms_messages, blocks)
+                ],
+            )
+            # bulk_create skips the post_save signal that feeds the usage counter
+            cost_meter.record_messages(tenant, messages)
+            outbox.enqueue(send_bulk_sms_job_task, str(job.id), tenant=tenant)
+
+        return job
+
+    def dispatch(self, job):
+        """
+        Send every queued message of ``job`` and record the results.
+
+        Each message is claimed ('queued' -> 'pending') with a conditional
+        UPDATE before its provider call, as send_sms_task does, and results
+        are written back after every batch, so a crash or a retry never
+        sends a message twice. Messages that fail transiently go back to
+        queued and TransientProviderError is raised, so the task retries
+        just those; an open circuit raises CircuitOpenError before anything
+        is sent.
+        """
+        from messaging.models_sms import SMSMessage
+        from .beem_sms import BeemSMSService
+        from .provider_health import BEEM_SEND, TransientProviderError, provider_health
+
+        # Raises BeemSMSError before anything changes if Beem is not configured
+        service = BeemSMSService()
+        provider_health.check(BEEM_SEND)
+
+        job.status = 'sending'
+        job.started_at = job.started_at or timezone.now()
+        job.save(update_fields=['status', 'started_at'])
+
+        entries = {entry['sms_message_id']: entry for entry in job.payload}
+        queued = list(
+            SMSMessage.objects.filter(id__in=list(entries), status='queued').order_by('created_at')
+            .values_list('id', flat=True)
+        )
+        deferred = 0
+        for offset in range(0, len(queued), self.batch_size):
+            deferred += self._send_batch(job, service, entries, queued[offset:offset + self.batch_size])
+
+        if deferred:
+            self._count(job)
+            job.status = 'queued'
+            job.save(update_fields=['sent_messages', 'failed_messages', 'status'])
+            raise TransientProviderError(f"{deferred} messages of bulk send {job.id} deferred")
+
+        return self._finish(job)
+
+    def _send_batch(self, job, service, entries, ids):
+        """
+        Claim, send and record one batch of the job's messages.
+
+        Returns:
+            int: messages deferred for a retry
+        """
+        from messaging.models import Message
+        from messaging.models_sms import SMSMessage
+        from .sms_validation import release_credits
+        from .provider_health import TRANSIENT, classify_exception
+
+        # Claim each message; one another worker already claimed is skipped
+        now = timezone.now()
+        claimed = [
+            sms_message_id for sms_message_id in ids
+            if SMSMessage.objects.filter(id=sms_message_id, status='queued').update(status='pending', updated_at=now)
+        ]
+        sms_messages = list(
+            SMSMessage.objects.filter(id__in=claimed).select_related('base_message', 'sender_id')
+        )
+        requests = [
+            {
+                'message': sms_message.base_message.text,
+                'recipients': entries[str(sms_message.id)]['recipients'],
+                'source_addr': sms_message.sender_id.sender_id,
+                'schedule_time': job.schedule_time,
+                'encoding': entries[str(sms_message.id)].get('encoding'),
+            }
+            for sms_message in sms_messages
+        ]
+
+        # Provider calls run outside any transaction, several at a time
+        def send(request):
+            try:
+                return service.send_sms(**request)
+            except Exception as e:
+                return {'success': False, 'error': str(e), 'transient': classify_exception(e) == TRANSIENT}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.concurrency, len(requests) or 1))) as pool:
+            results = list(pool.map(send, requests))
+
+        now = timezone.now()
+        done = []
+        deferred = []
+        errors = []
+        refund = 0
+        total_cost = Decimal('0')
+        for sms_message, result in zip(sms_messages, results):
+            if not result.get('success') and result.get('transient'):
+                deferred.append(sms_message.id)
+                continue
+
+            base = sms_message.base_message
+            if result.get('success'):
+                cost = Decimal(str(result.get('cost_estimate', 0.0)))
+                sms_message.status = 'sent'
+                sms_message.provider_response = result.get('response', {})
+                sms_message.sent_at = now
+                sms_message.cost_amount = cost
+                base.status = 'sent'
+                base.sent_at = now
+                total_cost += cost
+            else:
+                sms_message.status = 'failed'
+                sms_message.error_message = result.get('error') or ''
+                sms_message.failed_at = now
+                base.status = 'failed'
+                base.error_message = sms_message.error_message
+                errors.append({'message_id': str(sms_message.id), 'error': sms_message.error_message})
+                refund += len(entries[str(sms_message.id)]['recipients'])
+            sms_message.updated_at = now
+            base.updated_at = now
+            done.append(sms_message)
+
+        with transaction.atomic():
+            SMSMessage.objects.bulk_update(
+                done,
+                ['status', 'provider_response', 'sent_at', 'failed_at', 'cost_amount', 'error_message', 'updated_at'],
+                batch_size=500
+            )
+            Message.objects.bulk_update(
+                [sms_message.base_message for sms_message in done],
+                ['status', 'sent_at', 'error_message', 'updated_at'],
+                batch_size=500
+            )
+            # Nothing reached Beem for these (or it failed transiently); the retry claims them again
+            SMSMessage.objects.filter(id__in=deferred, status='pending').update(status='queued', updated_at=now)
+            if refund:
+                release_credits(job.tenant_id, refund)
+            job.total_cost += total_cost
+            job.errors = job.errors + errors
+            job.save(update_fields=['total_cost', 'errors'])
+        return len(deferred)
+
+    def abandon(self, job, error):
+        """
+        Fail whatever ``job`` still has queued, once it will not be retried.
+        """
+        from messaging.models import Message
+        from messaging.models_sms import SMSMessage
+        from .sms_validation import release_credits
+
+        now = timezone.now()
+        entries = {entry['sms_message_id']: entry for entry in job.payload}
+        pending = SMSMessage.objects.filter(id__in=list(entries), status='queued')
+        refund = sum(len(entries[str(sms_message_id)]['recipients']) for sms_message_id in pending.values_list('id', flat=True))
+        Message.objects.filter(id__in=pending.values('base_message_id')).update(
+            status='failed', error_message=error, updated_at=now
+        )
+        pending.update(status='failed', error_message=error, failed_at=now, updated_at=now)
+        if refund:
+            release_credits(job.tenant_id, refund)
+        job.errors = job.errors + [{'error': error}]
+        return self._finish(job)
+
+    def _count(self, job):
+        from messaging.models_sms import SMSMessage
+
+        # Count from the table so a retried job still reports every message
+        totals = dict(
+            SMSMessage.objects.filter(id__in=[entry['sms_message_id'] for entry in job.payload]).order_by()
+            .values_list('status').annotate(count=Count('id'))
+        )
+        job.sent_messages = totals.get('sent', 0)
+        job.failed_messages = totals.get('failed', 0)
+
+    def _finish(self, job):
+        self._count(job)
+        sent = job.sent_messages
+        job.status = 'completed' if not job.failed_messages else ('failed' if not sent else 'partial')
+        job.completed_at = timezone.now()
+        job.save(update_fields=[
+            'sent_messages', 'failed_messages', 'total_cost', 'errors', 'status', 'completed_at'
+        ])
+        logger.info(f"Bulk send {job.id}: {sent} sent, {job.failed_messages} failed")
+        return job
+
+
+bulk_send_pipeline = BulkSendPipeline()
@@ -0,0 +1,310 @@
+"""
+Pre-staging of scheduled campaigns.
+
+Ahead of a campaign's fire time (CAMPAIGN_STAGING_LEAD_MINUTES) the
+audience is resolved and every message rendered and bulk inserted with
+status 'staged', so at fire time only the dispatch remains: one join
+drops recipients who opted out in the meantime, one UPDATE queues the
+rest and their send tasks go into the outbox in bulk. Usage is counted
+at dispatch, for the messages that are actually queued.
+"""
+import hashlib
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+SUPPRESSED_ERROR = 'Contact opted out before the campaign was sent'
+
+
+class CampaignStager:
+    """
+    Stages campaign runs ahead of time and dispatches them when due.
+    """
+
+    def __init__(self, lead_minutes=None, batch_size=None):
+        self.lead_minutes = lead_minutes or getattr(settings, 'CAMPAIGN_STAGING_LEAD_MINUTES', 30)
+        self.batch_size = batch_size or getattr(settings, 'CAMPAIGN_STAGING_BATCH_SIZE', 2000)
+
+    def tenant_for(self, campaign):
+        """Campaigns belong to their creator's tenant."""
+        schedule = campaign.sms_schedules.select_related('tenant').first()
+        if schedule:
+            return schedule.tenant
+        return campaign.created_by.tenant
+
+    def body(self, campaign):
+        return campaign.template.body_text if campaign.template_id else campaign.message_text
+
+    def content_key(self, campaign):
+        return hashlib.sha256(f'{campaign.template_id}:{self.body(campaign)}'.encode()).hexdigest()
+
+    def audience(self, campaign, tenant):
+        """
+        Contacts the campaign goes to: its chosen contacts, else its
+        segments' contacts, else every contact of the tenant. Only contacts
+        that opted in and have not opted out receive campaigns.
+        """
+        from messaging.models import Contact
+
+        contacts = Contact.objects.filter(
+            tenant=tenant, is_active=True, opt_in_at__isnull=False, opt_out_at__isnull=True
+        )
+        if campaign.target_contacts.exists():
+            return contacts.filter(id__in=campaign.target_contacts.values('id'))
+
+        segments = list(campaign.target_segments.all())
+        if segments:
+            q = Q()
+            for segment in segments:
+                q |= self._segment_filter(segment.filter_json or {})
+            contacts = contacts.filter(q)
+        return contacts
+
+    def _segment_filter(self, filter_json):
+        q = Q()
+        if filter_json.get('tags'):
+            q &= Q(tags__contains=filter_json['tags'])
+        for key, value in filter_json.get('attributes', {}).items():
+            q &= Q(attributes__contains={key: value})
+        return q
+
+    def stage(self, campaign, run_at):
+        """
+        Stage ``campaign`` for the run at ``run_at``; a run that is
+        already staged is left as it is.
+
+        Returns:
+            CampaignStage
+        """
+        from messaging.models import CampaignStage, Message, StagedCampaignMessage
+        from .templating import compile_template, contact_context
+
+        tenant = self.tenant_for(campaign)
+        try:
+            with transaction.atomic():
+                stage = CampaignStage.objects.create(
+                    campaign=campaign, tenant=tenant, run_at=run_at, content_key=self.content_key(campaign)
+                )
+        except IntegrityError:
+            return CampaignStage.objects.get(campaign=campaign, run_at=run_at)
+
+        provider = 'sms' if campaign.campaign_type == 'sms' else 'whatsapp'
+        template = compile_template(self.body(campaign))
+        total = 0
+        total_segments = 0
+        contacts = self.audience(campaign, tenant).order_by('id')
+        last_id = None
+        while True:
+            batch = contacts.filter(id__gt=last_id) if last_id else contacts
+            batch = list(batch[:self.batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            contexts = [contact_context(contact) for contact in batch]
+            rendered = template.render_many(contexts)
+            with transaction.atomic():
+                conversations = self._conversations(tenant, batch)
+                messages = Message.objects.bulk_create([
+                    Message(
+                        tenant=tenant,
+                        conversation=conversations[contact.id],
+                        direction='out',
+                        provider=provider,
+                        text=message.text,
+                        recipient_number=contact.phone_e164,
+                        template=campaign.template,
+                        template_variables={name: context.get(name) for name in template.variables},
+                        status='staged',
+                        created_by=campaign.created_by,
+                    )
+                    for contact, context, message in zip(batch, contexts, rendered)
+                ])
+                StagedCampaignMessage.objects.bulk_create([
+                    StagedCampaignMessage(stage=stage, message=message, contact=contact)
+                    for message, contact in zip(messages, batch)
+                ])
+            total += len(batch)
+            total_segments += sum(message.segments for message in rendered)
+
+        CampaignStage.objects.filter(id=stage.id).update(
+            status='staged', total_recipients=total, total_segments=total_segments, staged_at=timezone.now()
+        )
+        stage.refresh_from_db()
+        logger.info(f"Campaign {campaign.id} staged {total} messages for {run_at}")
+        return stage
+
+    def _conversations(self, tenant, contacts):
+        from messaging.models import Conversation
+
+        existing = {
+            conversation.contact_id: conversation
+            for conversation in Conversation.objects.filter(tenant=tenant, contact__in=contacts)
+        }
+        missing = [contact for contact in contacts if contact.id not in existing]
+        if missing:
+            Conversation.objects.bulk_create(
+                [Conversation(tenant=tenant, contact=contact) for contact in missing], ignore_conflicts=True
+            )
+            existing.update(
+                (conversation.contact_id, conversation)
+                for conversation in Conversation.objects.filter(tenant=tenant, contact__in=missing)
+            )
+        return existing
+
+    def discard(self, stage, reason=''):
+        """
+        Delete a run that has not been dispatched, with its staged
+        messages, so it can be staged again.
+        """
+        from messaging.models import CampaignStage, Message
+
+        with transaction.atomic():
+            stage = CampaignStage.objects.select_for_update().filter(
+                id=stage.id, status__in=['staging', 'staged']
+            ).first()
+            if stage is None:
+                return
+            Message.objects.filter(staged_recipient__stage=stage, status='staged').delete()
+            stage.delete()
+        logger.info(f"Campaign stage {stage.id} discarded{': ' + reason if reason else ''}")
+
+    def sender_id(self, campaign, tenant):
+        """
+        The sender ID an SMS campaign goes out under: the one named in the
+        campaign's settings, else the tenant's first active sender ID.
+        """
+        from messaging.models_sms import SMSSenderID
+
+        sender_id = (campaign.settings or {}).get('sender_id')
+        if sender_id:
+            return sender_id
+        return SMSSenderID.objects.filter(
+            tenant=tenant, status='active'
+        ).order_by('created_at').values_list('sender_id', flat=True).first()
+
+    def dispatch(self, campaign, run_at):
+        """
+        Queue the messages staged for ``run_at``, staging them first if
+        the lead-time stage did not run or the campaign changed since.
+        SMS campaigns go through send_sms_task, the others through
+        send_message_task.
+
+        Returns:
+            CampaignStage, or None if this run was already dispatched
+        """
+        from messaging.models import CampaignStage, Message
+        from messaging.tasks import send_message_task
+        from messaging.tasks_sms import send_sms_task
+        from .costmeter import cost_meter
+        from .outbox import outbox
+
+        stage = CampaignStage.objects.filter(campaign=campaign, run_at=run_at).first()
+        if stage and stage.status == 'staging':
+            # Staging died part way (or is still running at fire time)
+            self.discard(stage, 'staging did not finish')
+            stage = None
+        elif stage and stage.status == 'staged' and stage.content_key != self.content_key(campaign):
+            self.discard(stage, 'campaign changed after staging')
+            stage = None
+        if stage is None:
+            stage = self.stage(campaign, run_at)
+
+        now = timezone.now()
+        with transaction.atomic():
+            stage = CampaignStage.objects.select_for_update().get(id=stage.id)
+            if stage.status != 'staged':
+                logger.info(f"Campaign stage {stage.id} is {stage.status}; not dispatching")
+                return None
+
+            staged = Message.objects.filter(staged_recipient__stage=stage, status='staged')
+            # Last-minute opt-outs, in one join against contacts
+            suppressed = staged.filter(
+                Q(staged_recipient__contact__opt_out_at__isnull=False)
+                | Q(staged_recipient__contact__is_active=False)
+            ).update(status='failed', error_message=SUPPRESSED_ERROR, updated_at=now)
+
+            messages = list(staged.only('id', 'provider', 'media_url'))
+            message_ids = [message.id for message in messages]
+            staged.update(status='queued', updated_at=now)
+            if campaign.campaign_type == 'sms':
+                sender_id = self.sender_id(campaign, stage.tenant)
+                outbox.enqueue_many(
+                    send_sms_task, [[str(message_id), sender_id] for message_id in message_ids],
+                    tenant=stage.tenant, queue='bulk'
+                )
+            else:
+                outbox.enqueue_many(
+                    send_message_task, [[str(message_id)] for message_id in message_ids],
+                    tenant=stage.tenant, queue='bulk'
+                )
+            # Staged messages were created with bulk_create, which skips the usage signal
+            cost_meter.record_messages(stage.tenant, messages)
+
+            stage.status = 'dispatched'
+            stage.dispatched_count = len(message_ids)
+            stage.suppressed_count = suppressed
+            stage.dispatched_at = now
+            stage.save(update_fields=['status', 'dispatched_count', 'suppressed_count', 'dispatched_at'])
+
+        logger.info(
+            f"Campaign {campaign.id} dispatched {len(message_ids)} staged messages ({suppressed} suppressed)"
+        )
+        return stage
+
+    def upcoming_runs(self, now=None):
+        """
+        (campaign, run_at) pairs firing within the lead time that have
+        not been staged yet.
+        """
+        from messaging.models import Campaign, CampaignStage
+        from messaging.models_sms import SMSSchedule
+
+        now = now or timezone.now()
+        horizon = now + timedelta(minutes=self.lead_minutes)
+
+        runs = [
+            (campaign, campaign.scheduled_at)
+            for campaign in Campaign.objects.filter(
+                status='scheduled', scheduled_at__gt=now, scheduled_at__lte=horizon
+            ).select_related('template', 'created_by')
+        ]
+        runs.extend(
+            (schedule.campaign, schedule.next_run)
+            for schedule in SMSSchedule.objects.filter(
+                is_active=True, next_run__gt=now, next_run__lte=horizon
+            ).select_related('campaign__template', 'campaign__created_by')
+            if schedule.campaign.status in ('draft', 'scheduled', 'completed')
+        )
+
+        staged = set(
+            CampaignStage.objects.filter(
+                campaign_id__in={campaign.id for campaign, _ in runs}, run_at__gt=now
+            ).values_list('campaign_id', 'run_at')
+        )
+        return [(campaign, run_at) for campaign, run_at in runs if (campaign.id, run_at) not in staged]
+
+    def stage_upcoming(self, now=None):
+        """
+        Stage every run firing within the lead time.
+
+        Returns:
+            int: runs staged
+        """
+        staged = 0
+        for campaign, run_at in self.upcoming_runs(now):
+            try:
+                self.stage(campaign, run_at)
+                staged += 1
+            except Exception as e:
+                # It is staged at fire time instead
+                logger.error(f"Staging campaign {campaign.id} for {run_at} failed: {str(e)}")
+        return staged
+
+
+campaign_stager = CampaignStager()
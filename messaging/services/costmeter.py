@@ -2,8 +2,11 @@
 Cost calculation service for message billing.
 """
 import logging
+from datetime import date, datetime
 from typing import Dict, Any
 from django.conf import settings
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When
+from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
@@ -55,6 +58,48 @@ class CostMeterService:
             logger.error(f"Error calculating message cost: {str(e)}")
             return 0
     
+    def cost_expression(self):
+        """
+        SQL expression for a message's cost, mirroring calculate_message_cost.
+        """
+        whens = []
+        for provider, prices in self.costs.items():
+            whens.append(When(Q(provider=provider) & (Q(media_url='') | Q(media_url__isnull=True)),
+                              then=Value(prices.get('text', 0))))
+            whens.append(When(provider=provider, then=Value(prices.get('media', 0))))
+        return Case(*whens, default=Value(0), output_field=IntegerField())
+
+    def aggregate(self, messages) -> Dict[str, int]:
+        """
+        Count and total cost of a message queryset, computed in the database.
+        """
+        totals = messages.order_by().aggregate(count=Count('id'), cost=Sum(self.cost_expression()))
+        return {'messages_count': totals['count'] or 0, 'cost_micro': totals['cost'] or 0}
+
+    def month_range(self, year=None, month=None):
+        """
+        (start, end) datetimes of a month in the current time zone.
+        """
+        now = timezone.localtime()
+        year = year or now.year
+        month = month or now.month
+        start = timezone.make_aware(datetime(year, month, 1))
+        if month == 12:
+            end = timezone.make_aware(datetime(year + 1, 1, 1))
+        else:
+            end = timezone.make_aware(datetime(year, month + 1, 1))
+        return start, end
+
+    def month_messages(self, tenant, year=None, month=None):
+        from messaging.models import Message
+
+        # A plain range (not __year/__month) so the (tenant, created_at) index applies
+        start, end = self.month_range(year, month)
+        # Staged campaign messages are counted when their run is dispatched
+        return Message.objects.filter(
+            tenant=tenant, created_at__gte=start, created_at__lt=end
+        ).exclude(status='staged')
+
     def calculate_campaign_cost(self, campaign) -> int:
         """
         Calculate the total cost of a campaign.
@@ -66,14 +111,11 @@ class CostMeterService:
             Total cost in micro-units
         """
         try:
-            # Get all messages for the campaign
-            messages = campaign.messages.all()
-            total_cost = 0
-            
-            for message in messages:
-                total_cost += self.calculate_message_cost(message)
-            
-            return total_cost
+            # Messages are not linked to campaigns in every deployment
+            messages = getattr(campaign, 'messages', None)
+            if messages is None:
+                return 0
+            return self.aggregate(messages.all())['cost_micro']
         
         except Exception as e:
             logger.error(f"Error calculating campaign cost: {str(e)}")
@@ -91,36 +133,28 @@ class CostMeterService:
         Returns:
             Dict with cost breakdown
         """
+        now = timezone.localtime()
+        if year is None:
+            year = now.year
+        if month is None:
+            month = now.month
+        
         try:
-            from django.utils import timezone
-            from django.db.models import Sum, Count
-            from .models import Message
-            
-            if year is None:
-                year = timezone.now().year
-            if month is None:
-                month = timezone.now().month
-            
-            # Get messages for the month
-            messages = Message.objects.filter(
-                tenant=tenant,
-                created_at__year=year,
-                created_at__month=month
+            # One grouped query instead of loading every message
+            rows = self.month_messages(tenant, year, month).order_by().values('provider').annotate(
+                count=Count('id'), cost=Sum(self.cost_expression())
             )
+            totals = {row['provider']: row for row in rows}
             
-            # Calculate costs by provider
             costs_by_provider = {}
             total_cost = 0
             
             for provider in self.costs.keys():
-                provider_messages = messages.filter(provider=provider)
-                provider_cost = 0
-                
-                for message in provider_messages:
-                    provider_cost += self.calculate_message_cost(message)
+                row = totals.get(provider, {})
+                provider_cost = row.get('cost') or 0
                 
                 costs_by_provider[provider] = {
-                    'count': provider_messages.count(),
+                    'count': row.get('count', 0),
                     'cost_micro': provider_cost,
                     'cost_dollars': provider_cost / 1000000
                 }
@@ -143,17 +177,21 @@ class CostMeterService:
                 'period': f"{year}-{month:02d}"
             }
     
-    def get_usage_limits(self, tenant) -> Dict[str, int]:
+    def get_usage_limits(self, tenant, current_usage=None) -> Dict[str, int]:
         """
         Get usage limits for a tenant based on their subscription.
         
         Args:
             tenant: Tenant instance
+            current_usage: Already-read usage, to avoid reading it twice
         
         Returns:
             Dict with usage limits
         """
         try:
+            if current_usage is None:
+                current_usage = self.get_current_month_usage(tenant)
+            
             # TODO: Integrate with billing system to get actual limits
             # For now, return default limits
             
@@ -163,14 +201,14 @@ class CostMeterService:
                 return {
                     'messages_per_month': plan.messages_limit,
                     'cost_limit_dollars': plan.cost_limit,
-                    'current_usage': self.get_current_month_usage(tenant)
+                    'current_usage': current_usage
                 }
             else:
                 # Free tier limits
                 return {
                     'messages_per_month': 1000,
                     'cost_limit_dollars': 10.0,
-                    'current_usage': self.get_current_month_usage(tenant)
+                    'current_usage': current_usage
                 }
         
         except Exception as e:
@@ -185,6 +223,9 @@ class CostMeterService:
         """
         Get current month usage for a tenant.
         
+        Reads the tenant's usage counter; the month is only aggregated from
+        messages the first time it is read.
+        
         Args:
             tenant: Tenant instance
         
@@ -192,26 +233,17 @@ class CostMeterService:
             Dict with current usage
         """
         try:
-            from django.utils import timezone
-            from .models import Message
-            
-            now = timezone.now()
+            from messaging.models import TenantUsageCounter
             
-            # Get messages for current month
-            messages = Message.objects.filter(
-                tenant=tenant,
-                created_at__year=now.year,
-                created_at__month=now.month
-            )
-            
-            total_cost = 0
-            for message in messages:
-                total_cost += self.calculate_message_cost(message)
+            period = self.current_period()
+            counter = TenantUsageCounter.objects.filter(tenant=tenant, period=period).first()
+            if counter is None:
+                counter = self.reconcile(tenant, period)
             
             return {
-                'messages_count': messages.count(),
-                'cost_micro': total_cost,
-                'cost_dollars': total_cost / 1000000
+                'messages_count': counter.messages_count,
+                'cost_micro': counter.cost_micro,
+                'cost_dollars': counter.cost_micro / 1000000
             }
         
         except Exception as e:
@@ -222,6 +254,54 @@ class CostMeterService:
                 'cost_dollars': 0
             }
     
+    def current_period(self) -> date:
+        return timezone.localtime().date().replace(day=1)
+    
+    def record_message(self, message):
+        """
+        Add a newly created message to its tenant's counter for this month.
+        """
+        self.record_messages(message.tenant, [message])
+    
+    def record_messages(self, tenant, messages):
+        """
+        Add messages created together (e.g. with bulk_create, which sends
+        no signals) to the tenant's counter in one UPDATE.
+        """
+        from messaging.models import TenantUsageCounter
+        
+        try:
+            period = self.current_period()
+            cost = sum(self.calculate_message_cost(message) for message in messages)
+            updated = TenantUsageCounter.objects.filter(tenant=tenant, period=period).update(
+                messages_count=F('messages_count') + len(messages),
+                cost_micro=F('cost_micro') + cost,
+                updated_at=timezone.now(),
+            )
+            if not updated:
+                # First messages of the month: seed from the messages table,
+                # which already includes these
+                self.reconcile(tenant, period)
+        
+        except Exception as e:
+            # The nightly reconcile repairs a missed increment
+            logger.error(f"Error recording usage for tenant {getattr(tenant, 'id', tenant)}: {str(e)}")
+    
+    def reconcile(self, tenant, period=None):
+        """
+        Recompute a month's counter from the messages table.
+        
+        Catches up on rows written without signals (bulk_create, raw SQL).
+        """
+        from messaging.models import TenantUsageCounter
+        
+        period = period or self.current_period()
+        totals = self.aggregate(self.month_messages(tenant, period.year, period.month))
+        counter, _ = TenantUsageCounter.objects.update_or_create(
+            tenant=tenant, period=period, defaults=totals
+        )
+        return counter
+    
     def check_usage_limits(self, tenant) -> Dict[str, Any]:
         """
         Check if tenant has exceeded usage limits.
@@ -233,8 +313,8 @@ class CostMeterService:
             Dict with limit check results
         """
         try:
-            limits = self.get_usage_limits(tenant)
             current_usage = self.get_current_month_usage(tenant)
+            limits = self.get_usage_limits(tenant, current_usage)
             
             messages_exceeded = current_usage['messages_count'] >= limits['messages_per_month']
             cost_exceeded = current_usage['cost_dollars'] >= limits['cost_limit_dollars']
@@ -256,3 +336,6 @@ class CostMeterService:
                 'limits': {},
                 'current_usage': {}
             }
+
+
+cost_meter = CostMeterService()
@@ -0,0 +1,348 @@
+"""
+Streaming CSV/XLSX exports of messages, delivery reports, contacts and
+billing transactions.
+"""
+import csv
+import importlib.util
+import io
+import logging
+import os
+import tempfile
+import uuid
+from datetime import datetime
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class ExportError(Exception):
+    """Raised for unknown datasets, formats or filters."""
+    pass
+
+
+def _parse_date(value, name):
+    try:
+        return timezone.make_aware(datetime.strptime(value, '%Y-%m-%d'))
+    except (TypeError, ValueError):
+        raise ExportError(f"Invalid {name}, expected YYYY-MM-DD")
+
+
+def date_range(filters):
+    """
+    The (start, end) datetimes for the start_date/end_date filters, either
+    None; ``end`` is exclusive (midnight after end_date).
+
+    Raises:
+        ExportError: for a malformed date
+    """
+    start = _parse_date(filters['start_date'], 'start_date') if filters.get('start_date') else None
+    end = _parse_date(filters['end_date'], 'end_date') + timezone.timedelta(days=1) if filters.get('end_date') else None
+    return start, end
+
+
+class ExportDataset:
+    """
+    A tenant-scoped queryset projected onto a fixed list of columns.
+
+    Rows come from ``values_list(...).iterator()``, which uses a
+    server-side cursor on PostgreSQL, so only one chunk is held in memory.
+    """
+    model_path = None
+    date_field = 'created_at'
+    columns = []           # (header, field lookup)
+    filter_fields = []     # exact-match query params
+
+    def model(self):
+        from django.apps import apps
+
+        return apps.get_model(self.model_path)
+
+    def headers(self):
+        return [header for header, _ in self.columns]
+
+    def validate(self, tenant, filters):
+        """
+        Raises:
+            ExportError: for malformed filters, before any work is queued
+        """
+        self.queryset(tenant, filters)
+
+    def queryset(self, tenant, filters):
+        queryset = self.model().objects.filter(tenant=tenant)
+        start, end = date_range(filters)
+        if start:
+            queryset = queryset.filter(**{f'{self.date_field}__gte': start})
+        if end:
+            queryset = queryset.filter(**{f'{self.date_field}__lt': end})
+        for field in self.filter_fields:
+            if filters.get(field):
+                try:
+                    queryset = queryset.filter(**{field: filters[field]})
+                except (ValidationError, ValueError):
+                    raise ExportError(f"Invalid {field}: '{filters[field]}'")
+        return queryset.order_by(self.date_field, 'pk')
+
+    def rows(self, tenant, filters, chunk_size):
+        fields = [field for _, field in self.columns]
+        return self.queryset(tenant, filters).values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+class MessageDataset(ExportDataset):
+    model_path = 'messaging.Message'
+    filter_fields = ['direction', 'provider', 'status']
+    columns = [
+        ('id', 'id'),
+        ('created_at', 'created_at'),
+        ('direction', 'direction'),
+        ('provider', 'provider'),
+        ('status', 'status'),
+        ('contact_name', 'conversation__contact__name'),
+        ('contact_phone', 'conversation__contact__phone_e164'),
+        ('recipient_number', 'recipient_number'),
+        ('text', 'text'),
+        ('sent_at', 'sent_at'),
+        ('delivered_at', 'delivered_at'),
+        ('error_message', 'error_message'),
+    ]
+
+
+class DeliveryReportDataset(ExportDataset):
+    model_path = 'messaging.SMSDeliveryReport'
+    date_field = 'received_at'
+    filter_fields = ['status']
+    columns = [
+        ('id', 'id'),
+        ('received_at', 'received_at'),
+        ('sms_message_id', 'sms_message_id'),
+        ('provider_message_id', 'provider_message_id'),
+        ('dest_addr', 'dest_addr'),
+        ('status', 'status'),
+        ('error_code', 'error_code'),
+        ('error_message', 'error_message'),
+        ('delivered_at', 'delivered_at'),
+    ]
+
+
+class ContactDataset(ExportDataset):
+    model_path = 'messaging.Contact'
+    filter_fields = ['is_active']
+    columns = [
+        ('id', 'id'),
+        ('name', 'name'),
+        ('phone_e164', 'phone_e164'),
+        ('email', 'email'),
+        ('tags', 'tags'),
+        ('is_active', 'is_active'),
+        ('opt_in_at', 'opt_in_at'),
+        ('opt_out_at', 'opt_out_at'),
+        ('last_contacted_at', 'last_contacted_at'),
+        ('created_at', 'created_at'),
+    ]
+
+
+class TransactionDataset(ExportDataset):
+    """Billing transactions from the merged purchase/payment timeline."""
+    columns = [
+        ('id', 'id'),
+        ('created_at', 'created_at'),
+        ('type', 'type'),
+        ('invoice_number', 'invoice_number'),
+        ('amount', 'amount'),
+        ('currency', 'currency'),
+        ('status', 'status'),
+        ('payment_method', 'payment_method'),
+        ('credits', 'credits'),
+        ('completed_at', 'completed_at'),
+    ]
+
+    def validate(self, tenant, filters):
+        date_range(filters)
+
+    def rows(self, tenant, filters, chunk_size):
+        from billing.services.timeline import TransactionTimeline
+
+        # Parsed here, not in the generator, so bad dates fail before any output
+        start, end = date_range(filters)
+        timeline = TransactionTimeline(
+            tenant, status=filters.get('status'), transaction_type=filters.get('transaction_type'),
+            start=start, end=end
+        )
+        fields = [field for _, field in self.columns]
+        return ([row.get(field) for field in fields] for row in timeline.iter_rows(chunk_size=chunk_size))
+
+
+DATASETS = {
+    'messages': MessageDataset(),
+    'delivery_reports': DeliveryReportDataset(),
+    'contacts': ContactDataset(),
+    'transactions': TransactionDataset(),
+}
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+
+# Spreadsheets run text starting with these as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _escape(text):
+    """Quote user-supplied text that a spreadsheet would evaluate."""
+    return "'" + text if text.startswith(FORMULA_PREFIXES) else text
+
+
+def _cell(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, list):
+        return _escape(', '.join(str(item) for item in value))
+    if isinstance(value, dict):
+        return _escape(str(value))
+    if isinstance(value, str):
+        return _escape(value)
+    return value
+
+
+def _xlsx_cell(value):
+    # Excel has no time zones; export aware datetimes in the current zone
+    if isinstance(value, datetime):
+        return timezone.make_naive(value) if timezone.is_aware(value) else value
+    if isinstance(value, (list, dict, str)):
+        return _cell(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+class _Echo:
+    """File-like object whose write() hands the line straight back."""
+
+    def write(self, value):
+        return value
+
+
+class ExportService:
+    """
+    Produces exports either as a streamed CSV response body or as a file
+    written to storage by a background job.
+    """
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+    def dataset(self, name):
+        if name not in DATASETS:
+            raise ExportError(f"Unknown dataset '{name}'")
+        return DATASETS[name]
+
+    def check_format(self, file_format):
+        """
+        Raises:
+            ExportError: for a format this process cannot write
+        """
+        if file_format not in FORMATS:
+            raise ExportError(f"Unknown format '{file_format}'")
+        if file_format == 'xlsx' and importlib.util.find_spec('openpyxl') is None:
+            raise ExportError("XLSX exports require the 'openpyxl' package")
+
+    def filename(self, dataset_name, file_format):
+        return f"{dataset_name}-{timezone.now():%Y%m%d-%H%M%S}.{FORMATS[file_format][1]}"
+
+    def stream_csv(self, dataset_name, tenant, filters):
+        """
+        Return an iterator of CSV lines for StreamingHttpResponse.
+
+        Raises:
+            ExportError: Before any output, for bad datasets or filters
+        """
+        dataset = self.dataset(dataset_name)
+        rows = dataset.rows(tenant, filters, self.chunk_size)
+        writer = csv.writer(_Echo())
+
+        def lines():
+            yield writer.writerow(dataset.headers())
+            for row in rows:
+                yield writer.writerow([_cell(value) for value in row])
+
+        return lines()
+
+    def write(self, dataset_name, tenant, filters, file_format, handle):
+        """
+        Write the export to an open binary file.
+
+        Returns:
+            int: Number of data rows written
+        """
+        dataset = self.dataset(dataset_name)
+        rows = dataset.rows(tenant, filters, self.chunk_size)
+        count = 0
+
+        if file_format == 'csv':
+            text = io.TextIOWrapper(handle, encoding='utf-8', newline='')
+            writer = csv.writer(text)
+            writer.writerow(dataset.headers())
+            for row in rows:
+                writer.writerow([_cell(value) for value in row])
+                count += 1
+            text.flush()
+            text.detach()
+            return count
+
+        if file_format == 'xlsx':
+            try:
+                from openpyxl import Workbook
+            except ImportError:
+                raise ExportError("XLSX exports require the 'openpyxl' package")
+
+            # Write-only workbooks stream rows to disk instead of keeping cells
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet(dataset_name)
+            sheet.append(dataset.headers())
+            for row in rows:
+                sheet.append([_xlsx_cell(value) for value in row])
+                count += 1
+            workbook.save(handle)
+            return count
+
+        raise ExportError(f"Unknown format '{file_format}'")
+
+    def run_job(self, job):
+        """
+        Write ``job``'s export to storage and record where it went.
+        """
+        job.status = 'running'
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'started_at'])
+
+        # Spool to local disk first; storage backends may not support appends
+        fd, temp_path = tempfile.mkstemp(suffix=f'.{job.file_format}')
+        try:
+            with os.fdopen(fd, 'w+b') as handle:
+                row_count = self.write(job.dataset, job.tenant, job.filters, job.file_format, handle)
+                handle.seek(0)
+                path = f"exports/{job.tenant_id}/{job.id}/{self.filename(job.dataset, job.file_format)}"
+                job.file_path = default_storage.save(path, File(handle))
+        except Exception as e:
+            job.status = 'failed'
+            job.error_message = str(e)
+            job.completed_at = timezone.now()
+            job.save(update_fields=['status', 'error_message', 'completed_at'])
+            raise
+        finally:
+            os.unlink(temp_path)
+
+        job.status = 'completed'
+        job.row_count = row_count
+        job.completed_at = timezone.now()
+        job.save(update_fields=['status', 'file_path', 'row_count', 'completed_at'])
+        logger.info(f"Export {job.id} wrote {row_count} {job.dataset} rows to {job.file_path}")
+        return job
+
+
+export_service = ExportService()
@@ -0,0 +1,255 @@
+"""
+Flow execution engine.
+
+``Flow.nodes`` is a list of node dicts, each with a unique ``id`` and a
+``type``:
+
+    trigger        {"keywords": [...]} or {"match": "any"}; "next"
+    send_message   {"text": "..."}; "next"        ({name} is the contact name)
+    add_tag        {"tag": "..."}; "next"
+    set_attribute  {"key": "...", "value": ...}; "next"
+    condition      {"keywords": [...]}; "then" / "else"
+    end
+
+Active flows are compiled into per-tenant graphs with every trigger
+keyword in a single matcher, so each inbound message costs one regex pass
+plus the nodes actually visited.
+"""
+import logging
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.cache import LocalObjectCache
+from .keywords import KeywordMatcher
+
+logger = logging.getLogger(__name__)
+
+NODE_TYPES = {'trigger', 'send_message', 'add_tag', 'set_attribute', 'condition', 'end'}
+MAX_STEPS = 50
+
+
+class FlowCompileError(Exception):
+    """Raised when a flow's nodes do not form a valid graph."""
+    pass
+
+
+def _keywords(node):
+    return [str(k).strip().lower() for k in node.get('keywords') or [] if str(k).strip()]
+
+
+class CompiledFlow:
+    """
+    A validated, indexed flow graph.
+    """
+
+    def __init__(self, flow_id, name, nodes):
+        self.flow_id = str(flow_id)
+        self.name = name
+        self.nodes = {}
+        self.triggers = []
+        self.conditions = {}
+
+        if not isinstance(nodes, list) or not nodes:
+            raise FlowCompileError("Flow has no nodes")
+
+        for node in nodes:
+            if not isinstance(node, dict) or not node.get('id'):
+                raise FlowCompileError("Every node needs an 'id'")
+            node_id = str(node['id'])
+            if node_id in self.nodes:
+                raise FlowCompileError(f"Duplicate node id '{node_id}'")
+            if node.get('type') not in NODE_TYPES:
+                raise FlowCompileError(f"Node '{node_id}' has unknown type '{node.get('type')}'")
+            self.nodes[node_id] = node
+
+        for node_id, node in self.nodes.items():
+            for edge in ('next', 'then', 'else'):
+                target = node.get(edge)
+                if target is not None and str(target) not in self.nodes:
+                    raise FlowCompileError(f"Node '{node_id}' points to missing node '{target}'")
+
+            if node['type'] == 'trigger':
+                if node.get('match') != 'any' and not _keywords(node):
+                    raise FlowCompileError(f"Trigger '{node_id}' needs keywords or match='any'")
+                self.triggers.append(node)
+            elif node['type'] == 'condition':
+                self.conditions[node_id] = KeywordMatcher([('match', _keywords(node), [])])
+            elif node['type'] == 'send_message' and not node.get('text'):
+                raise FlowCompileError(f"Node '{node_id}' needs text")
+            elif node['type'] == 'add_tag' and not node.get('tag'):
+                raise FlowCompileError(f"Node '{node_id}' needs a tag")
+            elif node['type'] == 'set_attribute' and not node.get('key'):
+                raise FlowCompileError(f"Node '{node_id}' needs a key")
+
+        if not self.triggers:
+            raise FlowCompileError("Flow has no trigger node")
+
+    def run(self, start_id, text):
+        """
+        Walk the graph from a trigger and return the actions to perform.
+        """
+        actions = []
+        node_id = str(start_id)
+        for _ in range(MAX_STEPS):
+            node = self.nodes[node_id]
+            node_type = node['type']
+
+            if node_type == 'condition':
+                branch = 'then' if self.conditions[node_id].match(text) else 'else'
+                next_id = node.get(branch)
+            else:
+                if node_type in ('send_message', 'add_tag', 'set_attribute'):
+                    actions.append(node)
+                next_id = node.get('next')
+
+            if node_type == 'end' or next_id is None:
+                return actions
+            node_id = str(next_id)
+
+        logger.warning(f"Flow {self.flow_id} stopped after {MAX_STEPS} steps; check for cycles")
+        return actions
+
+
+class TenantFlowGraph:
+    """
+    All active flows of one tenant with their triggers in one matcher.
+    """
+
+    def __init__(self, flows):
+        self.flows = {}
+        self.catch_all = []
+        self.by_keyword = {}
+
+        for flow in flows:
+            try:
+                compiled = CompiledFlow(flow.id, flow.name, flow.nodes)
+            except FlowCompileError as e:
+                logger.warning(f"Skipping invalid flow {flow.id}: {e}")
+                continue
+            self.flows[compiled.flow_id] = compiled
+            for trigger in compiled.triggers:
+                ref = (compiled.flow_id, str(trigger['id']))
+                if trigger.get('match') == 'any':
+                    self.catch_all.append(ref)
+                for keyword in _keywords(trigger):
+                    self.by_keyword.setdefault(keyword, []).append(ref)
+
+        self.matcher = KeywordMatcher([(keyword, [keyword], []) for keyword in self.by_keyword])
+
+    def evaluate(self, text):
+        """
+        Return (flow, actions) for every flow triggered by ``text``.
+
+        Each flow fires at most once per message, from its first matching
+        trigger.
+        """
+        fired = {}
+        refs = [ref for keyword in self.matcher.matches(text or '') for ref in self.by_keyword[keyword]]
+        for flow_id, trigger_id in refs + self.catch_all:
+            if flow_id not in fired:
+                fired[flow_id] = trigger_id
+
+        results = []
+        for flow_id, trigger_id in fired.items():
+            flow = self.flows[flow_id]
+            results.append((flow, flow.run(trigger_id, text)))
+        return results
+
+
+class FlowEngine:
+    """
+    Compiles, caches and executes flows for inbound messages.
+    """
+
+    def __init__(self, ttl=300):
+        self._graphs = LocalObjectCache('flows', ttl=ttl)
+
+    def compile(self, flow):
+        """Validate a single flow, raising FlowCompileError if it is invalid."""
+        return CompiledFlow(flow.id, flow.name, flow.nodes)
+
+    def _build(self, tenant_id):
+        from messaging.models import Flow
+
+        flows = Flow.objects.filter(tenant_id=tenant_id, active=True).only('id', 'name', 'nodes')
+        return TenantFlowGraph(flows)
+
+    def graph_for(self, tenant_id):
+        return self._graphs.get(str(tenant_id), lambda: self._build(tenant_id))
+
+    def invalidate(self, tenant_id):
+        self._graphs.invalidate(str(tenant_id))
+
+    def warm(self, tenant_id):
+        """Rebuild this process's graph now rather than on the next message."""
+        self.invalidate(tenant_id)
+        return self.graph_for(tenant_id)
+
+    def process_inbound(self, tenant_id, contact_id, conversation_id, text):
+        """
+        Evaluate an inbound message against the tenant's active flows and
+        perform the resulting actions.
+
+        Returns:
+            list: IDs of the flows that fired
+        """
+        graph = self.graph_for(tenant_id)
+        if not graph.flows:
+            return []
+
+        results = graph.evaluate(text)
+        for flow, actions in results:
+            self._execute(flow, actions, tenant_id, contact_id, conversation_id)
+        return [flow.flow_id for flow, _ in results]
+
+    def _execute(self, flow, actions, tenant_id, contact_id, conversation_id):
+        from messaging.models import Contact, Flow, Message
+        from messaging.tasks import send_message_task
+        from .outbox import outbox
+
+        contact = None
+        messages = []
+        with transaction.atomic():
+            if any(action['type'] in ('add_tag', 'set_attribute', 'send_message') for action in actions):
+                contact = Contact.objects.select_for_update().get(id=contact_id)
+
+            contact_changed = False
+            for action in actions:
+                if action['type'] == 'send_message':
+                    messages.append(Message.objects.create(
+                        tenant_id=tenant_id,
+                        conversation_id=conversation_id,
+                        direction='out',
+                        provider='whatsapp',
+                        text=str(action['text']).replace('{name}', contact.name),
+                        recipient_number=contact.phone_e164
+                    ))
+                elif action['type'] == 'add_tag':
+                    if action['tag'] not in contact.tags:
+                        contact.tags = contact.tags + [action['tag']]
+                        contact_changed = True
+                elif action['type'] == 'set_attribute':
+                    contact.attributes = {**contact.attributes, action['key']: action.get('value')}
+                    contact_changed = True
+
+            if contact_changed:
+                contact.save(update_fields=['tags', 'attributes', 'updated_at'])
+
+            Flow.objects.filter(id=flow.flow_id).update(trigger_count=F('trigger_count') + 1)
+
+            if messages:
+                # Published only if the flow's writes commit, and retried by the relay
+                outbox.enqueue_many(
+                    send_message_task, [[str(message.id)] for message in messages], tenant=contact.tenant
+                )
+
+        if messages:
+            from .inbound import conversation_counters
+            conversation_counters.add(conversation_id, messages=len(messages), unread=0,
+                                      last_message_at=timezone.now())
+
+        logger.info(f"Flow {flow.flow_id} fired with {len(actions)} actions")
+
+
+flow_engine = FlowEngine()
@@ -0,0 +1,187 @@
+"""
+Inbound message processing helpers: cached conversation lookups and
+coalesced, counter-safe conversation updates.
+"""
+import logging
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.phone import PhoneNumberError, normalize
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationLookupCache:
+    """
+    Caches the (contact, conversation) ids for a (tenant, phone) pair so a
+    chatty contact does not cost two get_or_create round trips per message.
+    """
+    key_prefix = 'inbound:conversation'
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout or getattr(settings, 'INBOUND_LOOKUP_CACHE_TTL', 3600)
+
+    def _key(self, tenant_id, phone):
+        return f'{self.key_prefix}:{tenant_id}:{phone}'
+
+    def resolve(self, tenant_id, phone, contact_name=''):
+        """
+        Return (contact_id, conversation_id), creating both if needed.
+        """
+        from messaging.models import Contact, Conversation
+
+        received = phone
+        try:
+            phone = normalize(phone)
+        except PhoneNumberError:
+            # Kept as received; the provider's format for numbers we have no plan for
+            pass
+        key = self._key(tenant_id, phone)
+        cached = cache.get(key)
+        if cached:
+            return cached
+
+        contact = Contact.objects.filter(tenant_id=tenant_id, phone_e164=phone).first()
+        if contact is None:
+            contact = self._legacy_contact(tenant_id, phone, received)
+        if contact is None:
+            contact, _ = Contact.objects.get_or_create(
+                tenant_id=tenant_id,
+                phone_e164=phone,
+                defaults={'name': contact_name or phone}
+            )
+        conversation, _ = Conversation.objects.get_or_create(
+            tenant_id=tenant_id,
+            contact=contact
+        )
+        ids = (str(contact.id), str(conversation.id))
+        cache.set(key, ids, self.timeout)
+        return ids
+
+    def _legacy_contact(self, tenant_id, phone, received):
+        """
+        A contact stored before numbers were normalized, under the digits
+        without '+' or the form the provider sent. It is moved to the E.164
+        form so later lookups find it directly.
+        """
+        from messaging.models import Contact
+
+        forms = {received, phone.lstrip('+')} - {phone}
+        contact = Contact.objects.filter(tenant_id=tenant_id, phone_e164__in=forms).order_by('created_at').first()
+        if contact is not None and phone.startswith('+'):
+            try:
+                with transaction.atomic():
+                    Contact.objects.filter(id=contact.id).update(phone_e164=phone)
+                contact.phone_e164 = phone
+            except IntegrityError:
+                # Another message created the E.164 contact meanwhile
+                return Contact.objects.get(tenant_id=tenant_id, phone_e164=phone)
+        return contact
+
+    def invalidate(self, tenant_id, phone):
+        cache.delete(self._key(tenant_id, phone))
+
+
+class ConversationCounterBuffer:
+    """
+    Applies conversation counter changes with atomic F() expressions.
+
+    With a shared cache (Redis/Memcached) deltas are accumulated with
+    atomic increments and flushed as a single UPDATE per conversation once
+    the coalescing window closes. Process-local caches cannot be shared
+    with the worker that runs the flush, so the update is applied
+    immediately instead.
+    """
+    key_prefix = 'inbound:counters'
+
+    def __init__(self, window=None):
+        self.window = window if window is not None else getattr(settings, 'INBOUND_COALESCE_WINDOW', 2)
+
+    @property
+    def coalescing(self):
+        return self.window > 0 and not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+    def _keys(self, conversation_id):
+        base = f'{self.key_prefix}:{conversation_id}'
+        return f'{base}:messages', f'{base}:unread', f'{base}:last', f'{base}:flush'
+
+    def add(self, conversation_id, messages=1, unread=1, last_message_at=None):
+        """
+        Record new messages on a conversation.
+
+        Returns:
+            bool: True if the update was buffered, False if applied directly.
+        """
+        last_message_at = last_message_at or timezone.now()
+        if not self.coalescing:
+            self.apply(conversation_id, messages, unread, last_message_at)
+            return False
+
+        messages_key, unread_key, last_key, flush_key = self._keys(conversation_id)
+        # Outlive any realistic queue backlog so deltas are never dropped
+        timeout = 60 * 60 * 24
+        for key, delta in ((messages_key, messages), (unread_key, unread)):
+            cache.add(key, 0, timeout)
+            cache.incr(key, delta)
+        cache.set(last_key, last_message_at.isoformat(), timeout)
+
+        if cache.add(flush_key, 1, self.window):
+            from messaging.tasks import flush_conversation_counters_task
+            flush_conversation_counters_task.apply_async(
+                args=[str(conversation_id)], countdown=self.window
+            )
+        return True
+
+    def flush(self, conversation_id):
+        """
+        Apply buffered deltas for a conversation in one UPDATE.
+        """
+        messages_key, unread_key, last_key, flush_key = self._keys(conversation_id)
+        # Let arrivals from now on schedule the next flush
+        cache.delete(flush_key)
+
+        messages = cache.get(messages_key) or 0
+        unread = cache.get(unread_key) or 0
+        last = cache.get(last_key)
+        if not messages and not unread:
+            return 0
+
+        # Subtract what we read rather than resetting, so increments that
+        # land between the read and the write are kept for the next flush.
+        # Taking the deltas before the UPDATE keeps a concurrent flush from
+        # applying them twice; if the UPDATE fails they are put back.
+        if messages:
+            cache.decr(messages_key, messages)
+        if unread:
+            cache.decr(unread_key, unread)
+
+        try:
+            self.apply(conversation_id, messages, unread, parse_datetime(last) if last else None)
+        except Exception:
+            if messages:
+                cache.incr(messages_key, messages)
+            if unread:
+                cache.incr(unread_key, unread)
+            raise
+        return messages
+
+    def apply(self, conversation_id, messages=0, unread=0, last_message_at=None):
+        from messaging.models import Conversation
+
+        now = timezone.now()
+        return Conversation.objects.filter(id=conversation_id).update(
+            message_count=F('message_count') + messages,
+            unread_count=F('unread_count') + unread,
+            last_message_at=last_message_at or now,
+            updated_at=now
+        )
+
+
+conversation_lookup = ConversationLookupCache()
+conversation_counters = ConversationCounterBuffer()
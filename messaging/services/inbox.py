@@ -0,0 +1,125 @@
+"""
+Idempotent inbox for inbound provider webhook events.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class InboundEventInbox:
+    """
+    Accepts each (provider, event_id) pair at most once.
+
+    Duplicates are rejected first by a short-TTL in-process seen-set, which
+    absorbs the tight retry bursts providers send, and otherwise by the
+    unique index on the ``inbound_events`` table.
+    """
+
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = ttl if ttl is not None else getattr(settings, 'INBOUND_EVENT_SEEN_TTL', 300)
+        self.max_entries = max_entries or getattr(settings, 'INBOUND_EVENT_SEEN_MAX_ENTRIES', 10000)
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key):
+        with self._lock:
+            self._seen[key] = time.monotonic() + self.ttl
+            self._seen.move_to_end(key)
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+
+    def _recently_seen(self, key):
+        with self._lock:
+            expires_at = self._seen.get(key)
+            if expires_at is None:
+                return False
+            if expires_at < time.monotonic():
+                del self._seen[key]
+                return False
+            return True
+
+    def _forget(self, key):
+        with self._lock:
+            self._seen.pop(key, None)
+
+    def claim(self, provider, event_id, tenant=None):
+        """
+        Claim an event for processing.
+
+        Returns:
+            bool: True the first time an event is seen, False for duplicates.
+        """
+        from messaging.models import InboundEvent
+
+        if not event_id:
+            # Nothing to deduplicate on; let the caller process it
+            return True
+
+        key = (provider, str(event_id))
+        if self._recently_seen(key):
+            logger.info(f"Duplicate {provider} event {event_id} dropped (seen-set)")
+            return False
+
+        try:
+            with transaction.atomic():
+                InboundEvent.objects.create(
+                    provider=provider,
+                    event_id=str(event_id),
+                    tenant=tenant,
+                    received_at=timezone.now()
+                )
+        except IntegrityError:
+            self._remember(key)
+            logger.info(f"Duplicate {provider} event {event_id} dropped (inbox)")
+            return False
+
+        self._remember(key)
+        return True
+
+    def release(self, provider, event_id):
+        """
+        Forget a claimed event so a provider retry can be processed again.
+
+        Used when processing fails after the event was claimed.
+        """
+        from messaging.models import InboundEvent
+
+        if not event_id:
+            return
+        self._forget((provider, str(event_id)))
+        InboundEvent.objects.filter(provider=provider, event_id=str(event_id)).delete()
+
+    def compact(self, retention_days=None, batch_size=1000):
+        """
+        Delete inbox rows older than the retention window in small batches.
+
+        Returns:
+            int: Number of rows deleted
+        """
+        from messaging.models import InboundEvent
+
+        if retention_days is None:
+            retention_days = getattr(settings, 'INBOUND_EVENT_RETENTION_DAYS', 7)
+        cutoff = timezone.now() - timezone.timedelta(days=retention_days)
+
+        deleted = 0
+        while True:
+            ids = list(
+                InboundEvent.objects.filter(received_at__lt=cutoff)
+                .order_by('received_at')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            count, _ = InboundEvent.objects.filter(id__in=ids).delete()
+            deleted += count
+        return deleted
+
+
+inbound_inbox = InboundEventInbox()
@@ -0,0 +1,270 @@
+"""
+Asyncio-based inference client for the hosted AI model.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from weakref import WeakValueDictionary
+from django.conf import settings
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+from core.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+
+def parse_model_output(generated_text: str) -> Dict[str, Any]:
+    """
+    Extract the JSON object from a model completion.
+
+    Returns:
+        Parsed JSON, or an empty dict when the completion holds none
+    """
+    start_idx = generated_text.find("{")
+    end_idx = generated_text.rfind("}") + 1
+
+    if start_idx == -1 or end_idx <= start_idx:
+        logger.warning("No valid JSON found in AI response")
+        return {}
+
+    try:
+        return json.loads(generated_text[start_idx:end_idx])
+    except json.JSONDecodeError as e:
+        logger.warning(f"Failed to parse AI response as JSON: {str(e)}")
+        return {}
+
+
+def _generated_text(output: Any) -> str:
+    if isinstance(output, list):
+        output = output[0] if output else {}
+    if isinstance(output, dict):
+        return output.get("generated_text", "")
+    return str(output)
+
+
+class InferenceClient:
+    """
+    Shares one event loop per process between all callers of the model.
+
+    Prompts are queued and grouped into batches of up to ``batch_size``
+    collected within ``batch_window`` seconds (batching is only useful when
+    the endpoint accepts a list of inputs). In-flight work is capped per
+    tenant and globally, a circuit breaker fails calls fast while the
+    endpoint is degraded, and queue depth and latency are tracked for
+    ``stats()``.
+
+    HTTP calls run on the loop's default executor, so at most
+    ``max_in_flight`` threads are ever blocked on the endpoint.
+    """
+
+    def __init__(self, api_url: Optional[str] = None, api_key: Optional[str] = None,
+                 max_in_flight: Optional[int] = None, max_in_flight_per_tenant: Optional[int] = None,
+                 batch_size: Optional[int] = None, batch_window: Optional[float] = None,
+                 timeout: Optional[int] = None, breaker: Optional[CircuitBreaker] = None,
+                 transport: Optional[Callable[[Dict[str, Any]], Any]] = None):
+        self.api_url = api_url if api_url is not None else settings.HF_API_URL
+        self.api_key = api_key if api_key is not None else settings.HF_API_KEY
+        self.max_in_flight = max_in_flight or getattr(settings, 'AI_MAX_IN_FLIGHT', 8)
+        self.max_in_flight_per_tenant = max_in_flight_per_tenant or getattr(settings, 'AI_MAX_IN_FLIGHT_PER_TENANT', 2)
+        self.batch_size = batch_size or getattr(settings, 'HF_BATCH_SIZE', 1)
+        self.batch_window = batch_window if batch_window is not None else getattr(settings, 'HF_BATCH_WINDOW_MS', 20) / 1000
+        self.timeout = timeout or getattr(settings, 'AI_REQUEST_TIMEOUT', 30)
+        self.breaker = breaker or CircuitBreaker(
+            'huggingface',
+            failure_threshold=getattr(settings, 'AI_CIRCUIT_FAILURE_THRESHOLD', 5),
+            recovery_timeout=getattr(settings, 'AI_CIRCUIT_RECOVERY_TIMEOUT', 30)
+        )
+        self.transport = transport or self._post
+
+        self._lock = threading.Lock()
+        self._loop = None
+        self._queue = None
+        self._global_slots = None
+        # Dropped once no call holds them, so idle tenants cost nothing
+        self._tenant_slots = WeakValueDictionary()
+
+        self._queued = 0
+        self._in_flight = 0
+        self._latencies = deque(maxlen=1000)
+        self._counters = {'requests': 0, 'batches': 0, 'errors': 0, 'rejected': 0}
+
+    # Event loop lifecycle
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._loop is not None and self._loop.is_running():
+                return self._loop
+
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            threading.Thread(target=run, name='ai-inference-loop', daemon=True).start()
+            ready.wait()
+            asyncio.run_coroutine_threadsafe(self._start(), loop).result()
+            self._loop = loop
+            return loop
+
+    async def _start(self):
+        self._queue = asyncio.Queue()
+        self._global_slots = asyncio.Semaphore(self.max_in_flight)
+        self._tenant_slots = WeakValueDictionary()
+        asyncio.get_running_loop().create_task(self._batcher())
+
+    def close(self):
+        """Stop the client's event loop thread."""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+
+        async def shutdown():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=5)
+        loop.call_soon_threadsafe(loop.stop)
+
+    # Public API
+
+    async def infer(self, prompt: str, tenant_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Run one prompt through the model. Must be awaited on the client loop.
+
+        Raises:
+            CircuitOpenError: If the endpoint is currently considered down
+        """
+        if not self.breaker.allow():
+            self._counters['rejected'] += 1
+            raise CircuitOpenError(self.breaker.name, self.breaker.retry_after())
+
+        key = str(tenant_id) if tenant_id else None
+        slots = self._tenant_slots.get(key)
+        if slots is None:
+            slots = self._tenant_slots[key] = asyncio.Semaphore(self.max_in_flight_per_tenant)
+        started = time.monotonic()
+        self._queued += 1
+        try:
+            async with slots:
+                future = asyncio.get_running_loop().create_future()
+                await self._queue.put((prompt, future))
+                return await future
+        finally:
+            self._queued -= 1
+            self._latencies.append(time.monotonic() - started)
+
+    def submit(self, prompt: str, tenant_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Blocking wrapper around ``infer`` for synchronous callers.
+        """
+        loop = self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(self.infer(prompt, tenant_id), loop)
+        return future.result(timeout=self.timeout * 2)
+
+    def submit_many(self, prompts: List[str], tenant_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Run several prompts concurrently; failed prompts yield an empty dict.
+        """
+        async def gather():
+            results = await asyncio.gather(
+                *(self.infer(prompt, tenant_id) for prompt in prompts),
+                return_exceptions=True
+            )
+            return [{} if isinstance(result, Exception) else result for result in results]
+
+        loop = self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(gather(), loop).result(timeout=self.timeout * 4)
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 4)
+
+        return {
+            'queue_depth': self._queued,
+            'in_flight': self._in_flight,
+            'latency_p50': percentile(0.50),
+            'latency_p95': percentile(0.95),
+            'circuit': self.breaker.stats(),
+            **self._counters,
+        }
+
+    # Internals
+
+    async def _batcher(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            asyncio.get_running_loop().create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        prompts = [prompt for prompt, _ in batch]
+        payload = {
+            "inputs": prompts[0] if len(prompts) == 1 else prompts,
+            "parameters": {
+                "max_new_tokens": 200,
+                "temperature": 0.7,
+                "return_full_text": False
+            }
+        }
+
+        async with self._global_slots:
+            self._in_flight += len(batch)
+            self._counters['requests'] += len(batch)
+            self._counters['batches'] += 1
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(None, self.transport, payload)
+                outputs = result if len(batch) > 1 else [result]
+                if len(outputs) != len(batch):
+                    raise ValueError(f"Expected {len(batch)} outputs, got {len(outputs)}")
+                self.breaker.record_success()
+                for (_, future), output in zip(batch, outputs):
+                    if not future.done():
+                        future.set_result(parse_model_output(_generated_text(output)))
+            except Exception as e:
+                self.breaker.record_failure()
+                self._counters['errors'] += 1
+                logger.error(f"Error calling Hugging Face API: {str(e)}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                self._in_flight -= len(batch)
+
+    def _post(self, payload: Dict[str, Any]) -> Any:
+        response = requests.post(
+            self.api_url,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            },
+            json=payload,
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+
+inference_client = InferenceClient()
@@ -0,0 +1,154 @@
+"""
+Compiled keyword matching for language detection and canned auto-replies.
+"""
+import logging
+import re
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from core.cache import LocalObjectCache
+
+logger = logging.getLogger(__name__)
+
+
+# (label, keywords, raw patterns); earlier entries take priority
+DEFAULT_LANGUAGE_RULES = [
+    ('sw', ['hujambo', 'sawa', 'asante', 'karibu', 'pole', 'hapana', 'ndiyo'], []),
+    ('fr', ['bonjour', 'merci', 'oui', 'non', 'comment', 'pourquoi'], []),
+    ('ar', [], [r'[\u0600-\u06FF]']),
+]
+
+DEFAULT_REPLY_RULES = [
+    ('greeting', ['hello', 'hi', 'hey', 'hujambo', 'bonjour'],
+     "Hello! Welcome to {tenant_name}. How can I help you today?"),
+    ('help', ['help', 'support', 'assistance', 'msaada'],
+     "Hi! I'm here to help you with {tenant_name}. What do you need assistance with?"),
+    ('pricing', ['price', 'cost', 'fee', 'charge', 'bei'],
+     "Thanks for your interest in {tenant_name}! Let me connect you with our pricing information."),
+    ('hours', ['hours', 'time', 'open', 'closed', 'muda'],
+     "Thanks for asking about our hours! Let me get you the current schedule for {tenant_name}."),
+]
+
+DEFAULT_REPLY = "Thank you for contacting {tenant_name}! I'll get back to you as soon as possible."
+
+
+class KeywordMatcher:
+    """
+    Matches text against many labelled keyword lists with one regex pass.
+
+    All keywords compile into a single alternation with one named group per
+    label, matched case-insensitively on word boundaries. When several
+    labels occur in a text the one listed first wins.
+    """
+
+    def __init__(self, rules: Sequence[Tuple[str, Iterable[str], Iterable[str]]]):
+        self.labels = []
+        branches = []
+        for label, keywords, patterns in rules:
+            if isinstance(keywords, str):
+                # A rule saved with one keyword instead of a list of them
+                keywords = [keywords]
+            words = sorted({w.strip().lower() for w in keywords if w and w.strip()}, key=len, reverse=True)
+            parts = []
+            if words:
+                parts.append(r'(?<!\w)(?:' + '|'.join(re.escape(w) for w in words) + r')(?!\w)')
+            parts.extend(patterns)
+            if not parts:
+                continue
+            branches.append(f'(?P<g{len(self.labels)}>' + '|'.join(parts) + ')')
+            self.labels.append(label)
+        self.pattern = re.compile('|'.join(branches), re.IGNORECASE) if branches else None
+
+    def match(self, text: str) -> Optional[str]:
+        """
+        Return the highest-priority label found in ``text``, or None.
+        """
+        if not text or self.pattern is None:
+            return None
+        best = None
+        for found in self.pattern.finditer(text):
+            index = int(found.lastgroup[1:])
+            if best is None or index < best:
+                best = index
+                if best == 0:
+                    break
+        return self.labels[best] if best is not None else None
+
+    def matches(self, text: str) -> List[str]:
+        """
+        Return every label found in ``text``, highest priority first.
+        """
+        if not text or self.pattern is None:
+            return []
+        found = {int(m.lastgroup[1:]) for m in self.pattern.finditer(text)}
+        return [self.labels[index] for index in sorted(found)]
+
+    def match_many(self, texts: Iterable[str]) -> List[Optional[str]]:
+        """Classify a batch of texts."""
+        match = self.match
+        return [match(text) for text in texts]
+
+
+class KeywordClassifier:
+    """
+    Builds and caches one language matcher and one reply matcher per tenant.
+
+    Tenant ``KeywordRule`` rows are ordered by priority ahead of the
+    built-in tables. Compiled matchers live in process memory and are
+    rebuilt after ``invalidate`` (called when rules change).
+    """
+
+    def __init__(self, ttl=300):
+        self._matchers = LocalObjectCache('keywords', ttl=ttl)
+
+    def _tenant_rules(self, tenant_id, kind):
+        from messaging.models import KeywordRule
+
+        if not tenant_id:
+            return []
+        return list(
+            KeywordRule.objects.filter(tenant_id=tenant_id, kind=kind, is_active=True)
+            .order_by('priority', 'label')
+            .values('label', 'keywords', 'reply_text')
+        )
+
+    def _build(self, tenant_id):
+        language_rules = [(r['label'], r['keywords'], []) for r in self._tenant_rules(tenant_id, 'language')]
+        language_rules += DEFAULT_LANGUAGE_RULES
+
+        replies = {}
+        reply_rules = []
+        for rule in self._tenant_rules(tenant_id, 'auto_reply'):
+            key = f"tenant:{rule['label']}"
+            replies[key] = rule['reply_text'] or DEFAULT_REPLY
+            reply_rules.append((key, rule['keywords'], []))
+        for label, keywords, reply_text in DEFAULT_REPLY_RULES:
+            replies[label] = reply_text
+            reply_rules.append((label, keywords, []))
+
+        return KeywordMatcher(language_rules), KeywordMatcher(reply_rules), replies
+
+    def _get(self, tenant_id):
+        return self._matchers.get(str(tenant_id or 'default'), lambda: self._build(tenant_id))
+
+    def invalidate(self, tenant_id):
+        self._matchers.invalidate(str(tenant_id))
+
+    def detect_languages(self, texts: Iterable[str], tenant_id=None) -> List[str]:
+        language_matcher, _, _ = self._get(tenant_id)
+        return [label or 'en' for label in language_matcher.match_many(texts)]
+
+    def detect_language(self, text: str, tenant_id=None) -> str:
+        return self.detect_languages([text], tenant_id)[0]
+
+    def auto_replies(self, texts: Iterable[str], tenant_name: str, tenant_id=None) -> List[str]:
+        _, reply_matcher, replies = self._get(tenant_id)
+        return [
+            (replies[label] if label else DEFAULT_REPLY).replace('{tenant_name}', tenant_name)
+            for label in reply_matcher.match_many(texts)
+        ]
+
+    def auto_reply(self, text: str, tenant_name: str, tenant_id=None) -> str:
+        return self.auto_replies([text], tenant_name, tenant_id)[0]
+
+
+keyword_classifier = KeywordClassifier()
@@ -0,0 +1,199 @@
+"""
+Transactional outbox for Celery tasks.
+
+Views write an ``OutboxMessage`` in the same transaction as the rows a
+task refers to, instead of calling ``.delay()`` directly. Once the
+transaction commits the row is published straight away; anything that
+could not be published is picked up by the relay
+(``relay_outbox_task`` / ``manage.py relay_outbox``), which drains the
+table in batches over a single broker connection.
+"""
+import logging
+from datetime import timedelta
+from celery import current_app
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class TransactionalOutbox:
+    """
+    Stores tasks with the data they belong to and publishes them after
+    commit, at least once.
+    """
+
+    def __init__(self, batch_size=None, max_backoff=None):
+        self.batch_size = batch_size or getattr(settings, 'OUTBOX_BATCH_SIZE', 500)
+        self.max_backoff = max_backoff or getattr(settings, 'OUTBOX_MAX_BACKOFF', 300)
+
+    def enqueue(self, task, *args, tenant=None, queue=None, **kwargs):
+        """
+        Record ``task(*args, **kwargs)`` in the current transaction.
+
+        Args:
+            task: a Celery task or a task name
+            queue: publish to this queue instead of the task's routed one
+
+        Returns:
+            OutboxMessage
+        """
+        from messaging.models import OutboxMessage
+
+        entry = OutboxMessage.objects.create(
+            task_name=getattr(task, 'name', task),
+            args=list(args),
+            kwargs=kwargs,
+            queue=queue or '',
+            tenant=tenant,
+        )
+        if getattr(settings, 'OUTBOX_PUBLISH_ON_COMMIT', True):
+            transaction.on_commit(lambda: self._publish_after_commit(entry.id))
+        return entry
+
+    def enqueue_many(self, task, arg_lists, tenant=None, queue=None):
+        """
+        Record ``task(*args)`` for each entry of ``arg_lists`` with one bulk
+        insert in the current transaction, e.g. a campaign's sends.
+
+        Returns:
+            list: the OutboxMessages
+        """
+        from messaging.models import OutboxMessage
+
+        entries = OutboxMessage.objects.bulk_create(
+            [
+                OutboxMessage(
+                    task_name=getattr(task, 'name', task),
+                    args=list(args),
+                    kwargs={},
+                    queue=queue or '',
+                    tenant=tenant,
+                )
+                for args in arg_lists
+            ],
+            batch_size=self.batch_size
+        )
+        if entries and getattr(settings, 'OUTBOX_PUBLISH_ON_COMMIT', True):
+            transaction.on_commit(self._drain_after_commit)
+        return entries
+
+    def _drain_after_commit(self):
+        try:
+            self.drain()
+        except Exception as e:
+            # The relay will pick them up
+            logger.error(f"Outbox drain after commit failed: {str(e)}")
+
+    def _publish_after_commit(self, entry_id):
+        try:
+            self.relay(ids=[entry_id])
+        except Exception as e:
+            # The relay will pick it up
+            logger.error(f"Outbox publish after commit failed for {entry_id}: {str(e)}")
+
+    def _publish(self, entries):
+        """
+        Publish ``entries`` over one producer.
+
+        Returns:
+            tuple: (published entries, [(entry, error)])
+        """
+        published, failed = [], []
+        try:
+            with current_app.producer_or_acquire() as producer:
+                for entry in entries:
+                    try:
+                        options = {'producer': producer}
+                        if entry.queue:
+                            options['queue'] = entry.queue
+                        task = current_app.tasks.get(entry.task_name)
+                        if task is not None:
+                            task.apply_async(args=entry.args, kwargs=entry.kwargs, **options)
+                        else:
+                            current_app.send_task(entry.task_name, args=entry.args, kwargs=entry.kwargs, **options)
+                        published.append(entry)
+                    except Exception as e:
+                        failed.append((entry, str(e)))
+        except Exception as e:
+            # No broker connection; nothing after the last success went out
+            done = {entry.id for entry in published}
+            done.update(entry.id for entry, _ in failed)
+            failed.extend((entry, str(e)) for entry in entries if entry.id not in done)
+        return published, failed
+
+    def relay(self, batch_size=None, ids=None):
+        """
+        Publish one batch of pending entries.
+
+        Rows are claimed with SKIP LOCKED, so several relays (and the
+        after-commit publish) never send the same row concurrently.
+
+        Returns:
+            int: entries published
+        """
+        from messaging.models import OutboxMessage
+
+        now = timezone.now()
+        with transaction.atomic():
+            pending = OutboxMessage.objects.filter(published_at__isnull=True, available_at__lte=now)
+            if ids is not None:
+                pending = pending.filter(id__in=ids)
+            entries = list(
+                pending.select_for_update(skip_locked=True).order_by('created_at')[:batch_size or self.batch_size]
+            )
+            if not entries:
+                return 0
+
+            published, failed = self._publish(entries)
+
+            if published:
+                OutboxMessage.objects.filter(id__in=[entry.id for entry in published]).update(
+                    published_at=now, attempts=F('attempts') + 1, last_error=''
+                )
+            for entry, error in failed:
+                entry.attempts += 1
+                entry.last_error = error
+                entry.available_at = now + timedelta(seconds=min(5 * 2 ** entry.attempts, self.max_backoff))
+            if failed:
+                OutboxMessage.objects.bulk_update(
+                    [entry for entry, _ in failed], ['attempts', 'last_error', 'available_at']
+                )
+                logger.warning(f"Outbox: {len(failed)} of {len(entries)} tasks could not be published")
+
+        return len(published)
+
+    def drain(self, batch_size=None, max_batches=100):
+        """
+        Relay batches until the outbox is empty or ``max_batches`` is hit.
+
+        Returns:
+            int: entries published
+        """
+        batch_size = batch_size or self.batch_size
+        total = 0
+        for _ in range(max_batches):
+            published = self.relay(batch_size=batch_size)
+            total += published
+            if published < batch_size:
+                break
+        return total
+
+    def purge(self, hours=None):
+        """
+        Delete entries published more than ``hours`` ago.
+
+        Returns:
+            int: entries deleted
+        """
+        from messaging.models import OutboxMessage
+
+        hours = hours if hours is not None else getattr(settings, 'OUTBOX_RETENTION_HOURS', 24)
+        cutoff = timezone.now() - timedelta(hours=hours)
+        deleted, _ = OutboxMessage.objects.filter(published_at__lt=cutoff).delete()
+        return deleted
+
+
+outbox = TransactionalOutbox()
@@ -0,0 +1,220 @@
+"""
+Provider health: circuit breakers per provider endpoint and the retry
+policy for tasks that call providers.
+
+Failures are classified as permanent (retrying cannot help: a bad
+number, an unapproved sender) or transient (timeouts, 5xx, rate limits,
+account problems an operator will fix). Only transient failures count
+against an endpoint's breaker and only they are retried. While a breaker
+is open, tasks are deferred until it will take a probe instead of
+calling the provider, so an outage costs a cache read per task.
+"""
+import logging
+import random
+import time
+from django.conf import settings
+from django.core.cache import cache
+from requests.exceptions import RequestException
+
+from core.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+PERMANENT = 'permanent'
+TRANSIENT = 'transient'
+
+# Endpoints with their own breaker
+BEEM_SEND = 'beem:send'
+BEEM_DELIVERY = 'beem:delivery'
+WHATSAPP_SEND = 'whatsapp:send'
+
+# Beem response codes that mean something other than "rejected for this message"
+BEEM_ERROR_CODES = {
+    101: PERMANENT,  # invalid phone number
+    102: TRANSIENT,  # insufficient balance on the platform's Beem account
+    103: PERMANENT,  # network not allowed
+    104: PERMANENT,  # missing parameters
+    105: PERMANENT,  # invalid parameters
+    106: PERMANENT,  # invalid sender ID
+    107: PERMANENT,  # invalid schedule time
+    111: PERMANENT,  # sender ID not approved
+    120: TRANSIENT,  # invalid API credentials
+}
+
+# Our own codes for failures that never reached a provider answer
+TRANSIENT_CODES = {'NETWORK_ERROR', 'SERVICE_ERROR', 'CIRCUIT_OPEN', 'TIMEOUT'}
+
+
+class TransientProviderError(Exception):
+    """A provider failure that is worth retrying later."""
+
+    def __init__(self, message, code=None):
+        self.code = code
+        super().__init__(message)
+
+
+def classify(error_code=None, status_code=None):
+    """
+    Classify a failed provider call from its error code and HTTP status.
+
+    Returns:
+        str: PERMANENT or TRANSIENT
+    """
+    if error_code in TRANSIENT_CODES:
+        return TRANSIENT
+    try:
+        kind = BEEM_ERROR_CODES.get(int(error_code))
+    except (TypeError, ValueError):
+        kind = None
+    if kind:
+        return kind
+    if status_code is not None:
+        if status_code in (401, 403, 408, 429) or status_code >= 500:
+            return TRANSIENT
+        if status_code >= 400:
+            return PERMANENT
+    # The provider answered and said no
+    return PERMANENT
+
+
+def classify_exception(exc):
+    """Classify an exception raised while calling a provider (or around it)."""
+    if isinstance(exc, (CircuitOpenError, TransientProviderError, RequestException)):
+        return TRANSIENT
+    code = getattr(exc, 'code', None)
+    status_code = getattr(exc, 'status_code', None)
+    if code is not None or status_code is not None:
+        return classify(code, status_code)
+    # Database hiccups, worker restarts and the like
+    return TRANSIENT
+
+
+class ProviderHealth:
+    """
+    Circuit breakers per provider endpoint.
+
+    Each worker process has its own breakers; when one opens, the open
+    state is also written to the shared cache so the other workers stop
+    calling the endpoint without having to fail first.
+    """
+
+    def __init__(self, failure_threshold=None, recovery_timeout=None):
+        self.failure_threshold = failure_threshold or getattr(settings, 'PROVIDER_CIRCUIT_FAILURE_THRESHOLD', 5)
+        self.recovery_timeout = recovery_timeout or getattr(settings, 'PROVIDER_CIRCUIT_RECOVERY_TIMEOUT', 60)
+        self._breakers = {}
+
+    def breaker(self, name):
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = self._breakers.setdefault(
+                name, CircuitBreaker(name, self.failure_threshold, self.recovery_timeout)
+            )
+        return breaker
+
+    def _shared_key(self, name):
+        return f'provider-circuit:{name}'
+
+    def check(self, name):
+        """
+        Raise CircuitOpenError unless ``name`` may be called now.
+        """
+        breaker = self.breaker(name)
+        if breaker.state == CircuitBreaker.CLOSED:
+            reopen_at = cache.get(self._shared_key(name))
+            if reopen_at and reopen_at > time.time():
+                raise CircuitOpenError(name, reopen_at - time.time())
+        breaker.check()
+
+    def record(self, name, kind=None):
+        """
+        Record the outcome of a call: None for success, else its classification.
+
+        Permanent failures mean the endpoint is working, so they count as
+        successes for the breaker.
+        """
+        breaker = self.breaker(name)
+        if kind == TRANSIENT:
+            breaker.record_failure()
+            if breaker.state == CircuitBreaker.OPEN:
+                retry_after = breaker.retry_after()
+                cache.set(self._shared_key(name), time.time() + retry_after, int(retry_after) + 1)
+            return
+
+        if breaker.state != CircuitBreaker.CLOSED:
+            cache.delete(self._shared_key(name))
+        breaker.record_success()
+
+    def stats(self):
+        return {name: breaker.stats() for name, breaker in self._breakers.items()}
+
+
+def claim_call(key, ttl=300):
+    """
+    Claim a call that must happen once (e.g. sending one message) for
+    ``ttl`` seconds, so duplicate task deliveries do not repeat it.
+
+    Returns:
+        bool: False if another worker holds the claim
+    """
+    return cache.add(f'provider-claim:{key}', 1, ttl)
+
+
+def release_call(key):
+    """Give up a claim so a retry can make the call."""
+    cache.delete(f'provider-claim:{key}')
+
+
+class RetryPolicy:
+    """
+    How long a provider task should wait before its next attempt.
+
+    Transient failures back off exponentially with jitter, up to
+    ``max_retries`` times. An open circuit defers the task until the
+    breaker will take a probe, up to ``outage_deferrals`` times, so a long
+    outage delays messages rather than failing them. Deferrals are counted
+    per task in the cache and do not use up the transient retry budget.
+    """
+
+    def __init__(self, max_retries=3, base_delay=60, max_delay=3600, outage_deferrals=None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.outage_deferrals = outage_deferrals or getattr(settings, 'PROVIDER_OUTAGE_MAX_DEFERRALS', 30)
+
+    def countdown(self, exc, retries, deferrals=0):
+        """
+        Seconds to wait before retrying after ``exc``, or None to give up.
+        ``retries`` counts every earlier retry, ``deferrals`` the ones
+        caused by an open circuit.
+        """
+        if isinstance(exc, CircuitOpenError):
+            if deferrals >= self.outage_deferrals:
+                return None
+            return int(exc.retry_after) + 1 + random.randint(0, 15)
+
+        attempts = max(retries - deferrals, 0)
+        if classify_exception(exc) == PERMANENT or attempts >= self.max_retries:
+            return None
+        delay = min(self.base_delay * (2 ** attempts), self.max_delay)
+        return delay + random.randint(0, delay // 4)
+
+    def deferrals(self, task):
+        return cache.get(f'provider-deferrals:{task.request.id}', 0)
+
+    def retry(self, task, exc):
+        """
+        Raise ``task.retry`` per this policy; returns only when ``exc``
+        should not be retried.
+        """
+        deferrals = self.deferrals(task)
+        countdown = self.countdown(exc, task.request.retries, deferrals)
+        if countdown is None:
+            return
+        if isinstance(exc, CircuitOpenError):
+            cache.set(f'provider-deferrals:{task.request.id}', deferrals + 1, 86400)
+        logger.warning(f"{task.name} retrying in {countdown}s: {str(exc)}")
+        raise task.retry(exc=exc, countdown=countdown, max_retries=task.request.retries + 1)
+
+
+provider_health = ProviderHealth()
+provider_retry_policy = RetryPolicy()
@@ -0,0 +1,183 @@
+"""
+Background-refreshed cache of provider metadata (Beem sender names,
+account balance, connection check).
+
+Endpoints read the last stored answer and never call the provider
+themselves. An entry older than its freshness window is still served,
+marked ``stale``, and a background refresh is queued (stale-while-
+revalidate); ``refresh_provider_metadata_task`` also refreshes the
+periodic entries on a schedule.
+"""
+import logging
+from django.core.cache import cache
+from django.utils import timezone
+
+from core.cache import TieredCache, invalidate_tags
+
+logger = logging.getLogger(__name__)
+
+metadata_cache = TieredCache('provider_metadata', ttl=300)
+
+
+class ProviderMetadataError(Exception):
+    """Raised by fetchers when the provider returns an error."""
+    pass
+
+
+def fetch_sender_ids(scope):
+    """Active sender names from Beem for a tenant's provider (or the platform's)."""
+    from .sms_service import SMSService
+
+    result = SMSService(tenant_id=None if scope == 'platform' else scope).get_sender_ids(status='active')
+    if not result.get('success'):
+        raise ProviderMetadataError(result.get('error', 'Failed to get sender IDs'))
+    return [
+        {
+            'senderid': item.get('senderid'),
+            'status': item.get('status'),
+            'id': item.get('id')
+        }
+        for item in result.get('sender_ids', [])
+        if (item or {}).get('status') == 'active'
+    ]
+
+
+def fetch_balance(scope):
+    from .beem_sms import BeemSMSService
+
+    return BeemSMSService().get_account_balance()
+
+
+def fetch_connection(scope):
+    from .beem_sms import BeemSMSService
+
+    return BeemSMSService().test_connection()
+
+
+# kind -> (fetcher, seconds an entry counts as fresh, refreshed on the beat schedule)
+KINDS = {
+    'sender_ids': (fetch_sender_ids, 300, True),
+    'balance': (fetch_balance, 300, True),
+    # The connection check sends a test SMS, so it only runs when asked for
+    'connection': (fetch_connection, 900, False),
+}
+
+
+class ProviderMetadataService:
+    """
+    Reads and refreshes ``ProviderMetadata`` rows.
+
+    Keys are ``<kind>`` or ``<kind>:<scope>``, e.g. ``balance`` or
+    ``sender_ids:<tenant id>``.
+    """
+
+    refresh_lock_seconds = 60
+
+    def _kind(self, key):
+        kind, _, scope = key.partition(':')
+        if kind not in KINDS:
+            raise ValueError(f"Unknown provider metadata key '{key}'")
+        return kind, scope or None
+
+    def _load(self, key):
+        from messaging.models import ProviderMetadata
+
+        return ProviderMetadata.objects.filter(key=key).values(
+            'data', 'refreshed_at', 'last_attempt_at', 'last_error'
+        ).first()
+
+    def read(self, key, revalidate=True):
+        """
+        Return the stored entry for ``key`` without calling the provider.
+
+        Returns:
+            dict: data (None until the first refresh), refreshed_at,
+            last_error, stale and refreshing flags
+        """
+        kind, _ = self._kind(key)
+        row = metadata_cache.get_or_set(key, lambda: self._load(key), tags=[f'provider_metadata:{key}']) or {}
+
+        refreshed_at = row.get('refreshed_at')
+        fresh_for = KINDS[kind][1]
+        stale = refreshed_at is None or (timezone.now() - refreshed_at).total_seconds() > fresh_for
+
+        refreshing = False
+        if stale and revalidate:
+            refreshing = self.schedule_refresh(key)
+
+        return {
+            'data': row.get('data'),
+            'refreshed_at': refreshed_at,
+            'last_error': row.get('last_error') or None,
+            'stale': stale,
+            'refreshing': refreshing,
+        }
+
+    def schedule_refresh(self, key):
+        """
+        Queue a background refresh unless one was queued recently.
+
+        Returns:
+            bool: True if a refresh is pending
+        """
+        if not cache.add(f'provider_metadata:refreshing:{key}', 1, self.refresh_lock_seconds):
+            return True
+        try:
+            from messaging.tasks import refresh_provider_metadata_task
+
+            refresh_provider_metadata_task.delay(key)
+            return True
+        except Exception as e:
+            logger.error(f"Could not queue provider metadata refresh for {key}: {str(e)}")
+            cache.delete(f'provider_metadata:refreshing:{key}')
+            return False
+
+    def refresh(self, key):
+        """
+        Fetch ``key`` from the provider and store it.
+
+        Failures are recorded on the entry; the previous data is kept.
+
+        Returns:
+            bool: True if the fetch succeeded
+        """
+        from messaging.models import ProviderMetadata
+
+        kind, scope = self._kind(key)
+        now = timezone.now()
+        try:
+            data = KINDS[kind][0](scope)
+            ProviderMetadata.objects.update_or_create(
+                key=key,
+                defaults={'data': data, 'refreshed_at': now, 'last_attempt_at': now, 'last_error': ''}
+            )
+            ok = True
+        except Exception as e:
+            logger.warning(f"Provider metadata refresh failed for {key}: {str(e)}")
+            ProviderMetadata.objects.update_or_create(
+                key=key, defaults={'last_attempt_at': now, 'last_error': str(e)}
+            )
+            ok = False
+        finally:
+            cache.delete(f'provider_metadata:refreshing:{key}')
+
+        invalidate_tags(f'provider_metadata:{key}')
+        return ok
+
+    def due(self, key, refreshed_at):
+        """True once an entry is past half its freshness window."""
+        kind, _ = self._kind(key)
+        return (timezone.now() - refreshed_at).total_seconds() > KINDS[kind][1] / 2
+
+    def periodic_keys(self):
+        """Keys the refresher keeps warm: every stored periodic entry plus the platform ones."""
+        from messaging.models import ProviderMetadata
+
+        keys = {'balance', 'sender_ids:platform'}
+        for key in ProviderMetadata.objects.values_list('key', flat=True):
+            if KINDS.get(key.partition(':')[0], (None, None, False))[2]:
+                keys.add(key)
+        return sorted(keys)
+
+
+provider_metadata = ProviderMetadataService()
@@ -0,0 +1,249 @@
+"""
+Data retention: batched purges with optional cold-storage archiving.
+"""
+import gzip
+import io
+import json
+import logging
+import time
+import uuid
+from collections import defaultdict
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionArchiver:
+    """
+    Writes rows to compressed files partitioned by table, tenant and day:
+
+        <root>/<table>/tenant=<id>/date=<YYYY-MM-DD>/part-<uuid>.jsonl.gz
+
+    Parquet output is available when pyarrow is installed.
+    """
+
+    def __init__(self, root=None, file_format=None, storage=None):
+        self.root = (root or getattr(settings, 'RETENTION_ARCHIVE_ROOT', 'archive')).rstrip('/')
+        self.file_format = file_format or getattr(settings, 'RETENTION_ARCHIVE_FORMAT', 'jsonl')
+        self.storage = storage or default_storage
+        if self.file_format not in ('jsonl', 'parquet'):
+            raise ImproperlyConfigured(f"Unknown RETENTION_ARCHIVE_FORMAT '{self.file_format}'")
+
+    def write(self, table, tenant_id, rows, date_field='created_at'):
+        """
+        Archive rows, one file per day.
+
+        Returns:
+            list: Storage paths written
+        """
+        by_day = defaultdict(list)
+        for row in rows:
+            by_day[row[date_field].date().isoformat()].append(row)
+
+        paths = []
+        for day, day_rows in sorted(by_day.items()):
+            extension = 'jsonl.gz' if self.file_format == 'jsonl' else 'parquet'
+            path = f"{self.root}/{table}/tenant={tenant_id}/date={day}/part-{uuid.uuid4().hex}.{extension}"
+            content = self._jsonl(day_rows) if self.file_format == 'jsonl' else self._parquet(day_rows)
+            paths.append(self.storage.save(path, ContentFile(content)))
+        return paths
+
+    def _jsonl(self, rows):
+        buffer = io.BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode='wb') as handle:
+            for row in rows:
+                handle.write(json.dumps(row, cls=DjangoJSONEncoder).encode('utf-8'))
+                handle.write(b'\n')
+        return buffer.getvalue()
+
+    def _parquet(self, rows):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImproperlyConfigured("Parquet archives require the 'pyarrow' package")
+
+        # Normalise values pyarrow cannot infer (UUIDs, Decimals, dicts)
+        records = json.loads(json.dumps(rows, cls=DjangoJSONEncoder))
+        buffer = io.BytesIO()
+        pq.write_table(pa.Table.from_pylist(records), buffer, compression='snappy')
+        return buffer.getvalue()
+
+
+class RetentionPurger:
+    """
+    Deletes expired rows tenant by tenant in primary-key-ordered batches.
+
+    Each batch is a short statement on a bounded set of ids, followed by a
+    pause, so locks are held briefly and Django's cascade collector never
+    loads more than one batch. Dependent rows are removed child-first.
+    When the tables are partitioned, fully expired months are dropped
+    before batching.
+    """
+
+    def __init__(self, batch_size=None, pause=None, archiver=None):
+        self.batch_size = batch_size or getattr(settings, 'RETENTION_BATCH_SIZE', 500)
+        self.pause = pause if pause is not None else getattr(settings, 'RETENTION_BATCH_PAUSE', 0.2)
+        self._archiver = archiver
+
+    @property
+    def archiver(self):
+        if self._archiver is None:
+            self._archiver = RetentionArchiver()
+        return self._archiver
+
+    def policies(self):
+        """Map tenant id to its RetentionPolicy."""
+        from messaging.models import RetentionPolicy
+
+        return {policy.tenant_id: policy for policy in RetentionPolicy.objects.all()}
+
+    def _settings_for(self, policy, field, default_days):
+        days = getattr(policy, field, None) if policy else None
+        archive = policy.archive_before_delete if policy and policy.archive_before_delete is not None else None
+        if archive is None:
+            archive = getattr(settings, 'RETENTION_ARCHIVE_ENABLED', False)
+        return days if days is not None else default_days, archive
+
+    def _batches(self, queryset):
+        """Yield lists of primary keys, walking the key range once."""
+        last_pk = None
+        while True:
+            page = queryset.order_by('pk')
+            if last_pk is not None:
+                page = page.filter(pk__gt=last_pk)
+            ids = list(page.values_list('pk', flat=True)[:self.batch_size])
+            if not ids:
+                return
+            yield ids
+            last_pk = ids[-1]
+            if len(ids) < self.batch_size:
+                return
+            if self.pause:
+                time.sleep(self.pause)
+
+    def _drop_partitions(self, tables, policies, field, default_days):
+        """
+        Drop whole monthly partitions that every tenant's retention has
+        passed. Skipped while any tenant archives, since archiving reads
+        the rows first.
+        """
+        from core import partitioning
+
+        if not partitioning.enabled():
+            return []
+        if getattr(settings, 'RETENTION_ARCHIVE_ENABLED', False) or any(
+            policy.archive_before_delete for policy in policies.values()
+        ):
+            return []
+
+        days = max([default_days] + [
+            getattr(policy, field) for policy in policies.values() if getattr(policy, field) is not None
+        ])
+        cutoff = timezone.now() - timezone.timedelta(days=days)
+        dropped = []
+        for table in tables:
+            dropped += partitioning.drop_partitions_before(table, cutoff)
+        return dropped
+
+    def _tenant_ids(self, model):
+        return model.objects.order_by().values_list('tenant_id', flat=True).distinct()
+
+    def purge_messages(self, default_days=None):
+        """
+        Purge messages (and their SMS records) past each tenant's retention.
+
+        Returns:
+            int: Number of messages deleted
+        """
+        from messaging.models import Message, Attachment
+        from messaging.models_sms import SMSMessage, SMSDeliveryReport
+        from billing.models import UsageRecord
+
+        default_days = default_days or getattr(settings, 'MESSAGE_RETENTION_DAYS', 30)
+        policies = self.policies()
+        deleted = 0
+
+        # Cheap path first; batches below only see rows in partial months
+        self._drop_partitions(
+            ['sms_delivery_reports', 'sms_usage_records', 'sms_messages', 'messages'],
+            policies, 'message_retention_days', default_days
+        )
+
+        for tenant_id in self._tenant_ids(Message):
+            days, archive = self._settings_for(policies.get(tenant_id), 'message_retention_days', default_days)
+            cutoff = timezone.now() - timezone.timedelta(days=days)
+            expired = Message.objects.filter(tenant_id=tenant_id, created_at__lt=cutoff)
+
+            for ids in self._batches(expired):
+                sms = SMSMessage.objects.filter(base_message_id__in=ids)
+                reports = SMSDeliveryReport.objects.filter(sms_message__base_message_id__in=ids)
+                usage = UsageRecord.objects.filter(message__base_message_id__in=ids)
+                attachments = Attachment.objects.filter(message_id__in=ids)
+                if archive:
+                    # Every row the batch deletes is archived, not just the messages
+                    self.archiver.write('messages', tenant_id, list(Message.objects.filter(pk__in=ids).values()))
+                    self.archiver.write('sms_messages', tenant_id, list(sms.values()))
+                    self.archiver.write('sms_delivery_reports', tenant_id, list(reports.values()), date_field='received_at')
+                    self.archiver.write('sms_usage_records', tenant_id, list(usage.values()))
+                    self.archiver.write('attachments', tenant_id, list(attachments.values()))
+
+                reports.delete()
+                usage.delete()
+                sms.delete()
+                attachments.delete()
+                count, _ = Message.objects.filter(pk__in=ids).delete()
+                deleted += count
+
+        logger.info(f"Retention purge removed {deleted} messages")
+        return deleted
+
+    def purge_sms_data(self, default_days=None):
+        """
+        Purge delivery reports and finished bulk uploads past retention.
+
+        Returns:
+            dict: Number of reports and uploads deleted
+        """
+        from messaging.models_sms import SMSDeliveryReport, SMSBulkUpload
+
+        default_days = default_days or getattr(settings, 'SMS_DATA_RETENTION_DAYS', 30)
+        policies = self.policies()
+        deleted = {'reports': 0, 'uploads': 0}
+
+        self._drop_partitions(['sms_delivery_reports'], policies, 'sms_data_retention_days', default_days)
+
+        for tenant_id in self._tenant_ids(SMSDeliveryReport):
+            days, archive = self._settings_for(policies.get(tenant_id), 'sms_data_retention_days', default_days)
+            cutoff = timezone.now() - timezone.timedelta(days=days)
+            expired = SMSDeliveryReport.objects.filter(tenant_id=tenant_id, received_at__lt=cutoff)
+            for ids in self._batches(expired):
+                batch = SMSDeliveryReport.objects.filter(pk__in=ids)
+                if archive:
+                    self.archiver.write('sms_delivery_reports', tenant_id, list(batch.values()), date_field='received_at')
+                count, _ = batch.delete()
+                deleted['reports'] += count
+
+        for tenant_id in self._tenant_ids(SMSBulkUpload):
+            days, archive = self._settings_for(policies.get(tenant_id), 'sms_data_retention_days', default_days)
+            cutoff = timezone.now() - timezone.timedelta(days=days)
+            expired = SMSBulkUpload.objects.filter(
+                tenant_id=tenant_id, created_at__lt=cutoff, status__in=['completed', 'failed']
+            )
+            for ids in self._batches(expired):
+                batch = SMSBulkUpload.objects.filter(pk__in=ids)
+                if archive:
+                    self.archiver.write('sms_bulk_uploads', tenant_id, list(batch.values()))
+                count, _ = batch.delete()
+                deleted['uploads'] += count
+
+        logger.info(f"Retention purge removed {deleted['reports']} reports, {deleted['uploads']} uploads")
+        return deleted
+
+
+retention_purger = RetentionPurger()
@@ -0,0 +1,240 @@
+"""
+Scheduler for SMS campaign schedules.
+
+Due schedules are found through a partial index on ``next_run`` and
+claimed in batches with SELECT ... FOR UPDATE SKIP LOCKED plus a short
+lease. Firing advances ``next_run`` with a compare-and-set in the same
+transaction that queues the campaign, so any number of beat or worker
+nodes can run the scheduler without a schedule firing twice.
+
+Occurrences are computed with dateutil's rrule on wall-clock time in the
+schedule's time zone: 09:00 stays 09:00 across DST changes, and a monthly
+schedule starting on the 31st runs on the last day of shorter months.
+"""
+import logging
+from datetime import timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from dateutil import rrule
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+FREQUENCIES = {
+    'daily': rrule.DAILY,
+    'weekly': rrule.WEEKLY,
+    'monthly': rrule.MONTHLY,
+}
+
+
+class ScheduleError(ValueError):
+    """Raised for a schedule whose recurrence cannot be computed."""
+    pass
+
+
+def schedule_timezone(schedule):
+    """
+    The schedule's own time zone if one was chosen, else its tenant's.
+    """
+    name = schedule.time_zone
+    if not name or name == 'UTC':
+        tenant = schedule.tenant if schedule.tenant_id else None
+        name = getattr(tenant, 'timezone', None) or 'UTC'
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ScheduleError(f"Unknown time zone '{name}'")
+
+
+def recurrence_rule(schedule, tz):
+    """
+    The rrule for a recurring schedule, in naive local time.
+    """
+    start = timezone.localtime(schedule.start_date, tz).replace(tzinfo=None)
+
+    if schedule.frequency == 'custom':
+        if not schedule.recurrence:
+            raise ScheduleError('Custom schedules need a recurrence rule')
+        try:
+            return rrule.rrulestr(schedule.recurrence, dtstart=start, ignoretz=True)
+        except (ValueError, TypeError) as e:
+            raise ScheduleError(f"Invalid recurrence rule: {str(e)}")
+
+    if schedule.frequency not in FREQUENCIES:
+        raise ScheduleError(f"Unknown frequency '{schedule.frequency}'")
+
+    options = {}
+    if schedule.frequency == 'monthly' and start.day > 28:
+        # The last of e.g. the 28th-31st that exists, rather than skipping short months
+        options = {'bymonthday': tuple(range(28, start.day + 1)), 'bysetpos': -1}
+    return rrule.rrule(FREQUENCIES[schedule.frequency], dtstart=start, **options)
+
+
+def upcoming_run(schedule, after, inclusive=True):
+    """
+    The first occurrence of ``schedule`` at or after ``after`` (strictly
+    after when ``inclusive`` is False), or None once it has ended.
+
+    Raises:
+        ScheduleError: for an invalid time zone or recurrence rule
+    """
+    tz = schedule_timezone(schedule)
+
+    if schedule.frequency == 'once':
+        start = schedule.start_date
+        return start if start > after or (inclusive and start == after) else None
+
+    rule = recurrence_rule(schedule, tz)
+    local_after = timezone.localtime(after, tz).replace(tzinfo=None)
+    occurrence = rule.after(local_after, inc=inclusive)
+    if occurrence is None:
+        return None
+
+    occurrence = occurrence.replace(tzinfo=tz)
+    if schedule.end_date and occurrence > schedule.end_date:
+        return None
+    return occurrence
+
+
+class CampaignScheduler:
+    """
+    Claims due ``SMSSchedule``s and starts their campaigns.
+    """
+
+    def __init__(self, batch_size=None, lease_seconds=None):
+        self.batch_size = batch_size or getattr(settings, 'SCHEDULER_BATCH_SIZE', 500)
+        self.lease_seconds = lease_seconds or getattr(settings, 'SCHEDULER_LEASE_SECONDS', 120)
+
+    def claim_due(self, now=None, batch_size=None, ids=None):
+        """
+        Lease up to ``batch_size`` due schedules (of ``ids``, if given)
+        to this node.
+
+        Returns:
+            list: the claimed SMSSchedules (with tenant and campaign)
+        """
+        from messaging.models_sms import SMSSchedule
+
+        now = now or timezone.now()
+        with transaction.atomic():
+            due = (
+                SMSSchedule.objects
+                .filter(is_active=True, next_run__lte=now)
+                .filter(Q(locked_until__isnull=True) | Q(locked_until__lte=now))
+            )
+            if ids is not None:
+                due = due.filter(id__in=ids)
+            due = due.order_by('next_run').select_for_update(skip_locked=True).only('id')
+            claimed = [schedule.id for schedule in due[:batch_size or self.batch_size]]
+            if not claimed:
+                return []
+            SMSSchedule.objects.filter(id__in=claimed).update(locked_until=now + timedelta(seconds=self.lease_seconds))
+
+        return list(SMSSchedule.objects.filter(id__in=claimed).select_related('tenant', 'campaign').order_by('next_run'))
+
+    def fire(self, schedule, now=None):
+        """
+        Start the campaign for one claimed schedule and move it to its
+        next occurrence. Missed occurrences collapse into this run.
+
+        Returns:
+            bool: False if another node fired it first
+        """
+        from messaging.models_sms import SMSSchedule
+
+        now = now or timezone.now()
+        due_at = schedule.next_run
+        try:
+            next_run = upcoming_run(schedule, max(due_at, now), inclusive=False)
+        except ScheduleError as e:
+            logger.error(f"Deactivating SMS schedule {schedule.id}: {str(e)}")
+            SMSSchedule.objects.filter(id=schedule.id).update(is_active=False, locked_until=None)
+            return False
+
+        with transaction.atomic():
+            advanced = SMSSchedule.objects.filter(id=schedule.id, next_run=due_at, is_active=True).update(
+                next_run=next_run,
+                last_run=now,
+                run_count=F('run_count') + 1,
+                is_active=next_run is not None,
+                locked_until=None,
+                updated_at=now,
+            )
+            if not advanced:
+                return False
+            self._start_campaign(schedule, due_at, now)
+
+        logger.info(f"SMS schedule {schedule.id} fired; next run {next_run}")
+        return True
+
+    def _start_campaign(self, schedule, run_at, now):
+        from messaging.models import Campaign
+        from messaging.tasks import send_campaign_messages_task
+        from .outbox import outbox
+
+        campaign = schedule.campaign
+        if campaign.status not in ('draft', 'scheduled', 'completed'):
+            logger.info(f"Campaign {campaign.id} is {campaign.status}; skipping this run of schedule {schedule.id}")
+            return
+
+        Campaign.objects.filter(id=campaign.id).update(status='running', started_at=now, updated_at=now)
+        # The run time picks up the messages staged ahead of it
+        outbox.enqueue(
+            send_campaign_messages_task, str(campaign.id), run_at.isoformat(), tenant=schedule.tenant
+        )
+
+    def fire_scheduled_campaigns(self, now=None):
+        """
+        Start campaigns whose one-off ``scheduled_at`` has come. Each is
+        moved from 'scheduled' to 'running' with a compare-and-set, so it
+        starts once however many nodes run this.
+
+        Returns:
+            int: campaigns started
+        """
+        from messaging.models import Campaign
+        from messaging.tasks import send_campaign_messages_task
+        from .campaign_staging import campaign_stager
+        from .outbox import outbox
+
+        now = now or timezone.now()
+        started = 0
+        due = Campaign.objects.filter(
+            status='scheduled', scheduled_at__lte=now, sms_schedules__isnull=True
+        ).select_related('created_by').only('id', 'scheduled_at', 'created_by')
+        for campaign in due[:self.batch_size]:
+            with transaction.atomic():
+                if not Campaign.objects.filter(id=campaign.id, status='scheduled').update(
+                    status='running', started_at=now, updated_at=now
+                ):
+                    continue
+                outbox.enqueue(
+                    send_campaign_messages_task, str(campaign.id), campaign.scheduled_at.isoformat(),
+                    tenant=campaign_stager.tenant_for(campaign)
+                )
+            started += 1
+        return started
+
+    def run(self, now=None, max_batches=100):
+        """
+        Fire every due schedule, a batch at a time, and start due
+        one-off campaigns.
+
+        Returns:
+            int: schedules fired and campaigns started
+        """
+        fired = self.fire_scheduled_campaigns(now)
+        for _ in range(max_batches):
+            schedules = self.claim_due(now)
+            if not schedules:
+                break
+            for schedule in schedules:
+                fired += self.fire(schedule, now)
+            if len(schedules) < self.batch_size:
+                break
+        return fired
+
+
+campaign_scheduler = CampaignScheduler()
@@ -0,0 +1,76 @@
+"""
+Per-tenant send context for SMS send tasks.
+"""
+import logging
+
+from core.cache import LocalObjectCache
+
+logger = logging.getLogger(__name__)
+
+
+class SendContext:
+    """
+    What a worker needs to send SMS for one tenant: the provider and its
+    API client, the active sender IDs and the user usage is billed to.
+
+    Built once per tenant per worker and reused until it expires or
+    ``invalidate_send_context`` is called, so sending a message only
+    reads the message and writes its status.
+    """
+
+    def __init__(self, tenant_id, provider, client, sender_ids, billing_user_id):
+        self.tenant_id = tenant_id
+        self.provider = provider
+        self.client = client
+        self.sender_ids = sender_ids
+        self.billing_user_id = billing_user_id
+
+    @property
+    def cost_amount(self):
+        return self.provider.cost_per_sms
+
+    @property
+    def cost_currency(self):
+        return self.provider.currency
+
+    def sender(self, sender_id):
+        """The active SMSSenderID named ``sender_id``, or None."""
+        return self.sender_ids.get(sender_id)
+
+
+def build_send_context(tenant_id):
+    from messaging.models_sms import SMSProvider, SMSSenderID
+    from tenants.models import Membership
+    from .sms_service import BeemSMSService
+
+    providers = SMSProvider.objects.filter(tenant_id=tenant_id, is_active=True).order_by('-is_default', 'created_at')
+    provider = providers.first()
+
+    client = None
+    if provider and provider.provider_type == 'beem':
+        client = BeemSMSService(provider)
+
+    sender_ids = {
+        sender.sender_id: sender
+        for sender in SMSSenderID.objects.filter(tenant_id=tenant_id, status='active').order_by('created_at')
+    }
+
+    # Usage is recorded against the first active member, else any member
+    memberships = Membership.objects.filter(tenant_id=tenant_id)
+    billing_user_id = (
+        memberships.filter(status='active').values_list('user_id', flat=True).first()
+        or memberships.values_list('user_id', flat=True).first()
+    )
+
+    return SendContext(tenant_id, provider, client, sender_ids, billing_user_id)
+
+
+send_contexts = LocalObjectCache('sms_send_context', ttl=60)
+
+
+def get_send_context(tenant_id):
+    return send_contexts.get(str(tenant_id), lambda: build_send_context(tenant_id))
+
+
+def invalidate_send_context(tenant_id):
+    send_contexts.invalidate(str(tenant_id))
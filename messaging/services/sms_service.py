@@ -11,7 +11,9 @@ from typing import Dict, Any, Optional, List, Tuple
 from django.conf import settings
 from django.utils import timezone as django_timezone
 
+from core.circuit_breaker import CircuitOpenError
 from ..models_sms import SMSProvider, SMSSenderID, SMSTemplate, SMSMessage, SMSDeliveryReport
+from .provider_health import BEEM_DELIVERY, BEEM_SEND, TRANSIENT, classify, provider_health
 
 logger = logging.getLogger(__name__)
 
@@ -64,6 +66,8 @@ class BeemSMSService(BaseSMSProvider):
     
     def __init__(self, provider: SMSProvider):
         super().__init__(provider)
+        # Reuse connections across calls; send contexts keep one client per worker
+        self.session = requests.Session()
         # Use environment variables for API URLs
         self.send_url = getattr(settings, 'BEEM_SEND_URL', 'https://apisms.beem.africa/v1/send')
         self.balance_url = getattr(settings, 'BEEM_BALANCE_URL', 'https://apisms.beem.africa/public/v1/vendors/balance')
@@ -130,6 +134,15 @@ class BeemSMSService(BaseSMSProvider):
         Returns:
             Dict with success status and message ID or error
         """
+        try:
+            provider_health.check(BEEM_SEND)
+        except CircuitOpenError as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'error_code': 'CIRCUIT_OPEN'
+            }
+        
         try:
             # Prepare recipients array
             recipients = [{
@@ -137,8 +150,10 @@ class BeemSMSService(BaseSMSProvider):
                 "dest_addr": to
             }]
             
-            # Auto-detect encoding based on message content
-            encoding = self._detect_encoding(message)
+            # Callers that rendered the message already know its encoding
+            encoding = kwargs.get('encoding')
+            if encoding is None:
+                encoding = self._detect_encoding(message)
             
             # Prepare request data
             data = {
@@ -153,7 +168,7 @@ class BeemSMSService(BaseSMSProvider):
                 data["schedule_time"] = kwargs['schedule_time']
             
             # Make API request
-            response = requests.post(
+            response = self.session.post(
                 self.send_url,
                 json=data,
                 headers=self._get_headers(),
@@ -163,6 +178,7 @@ class BeemSMSService(BaseSMSProvider):
             response_data = response.json()
             
             if response.status_code == 200 and response_data.get('successful'):
+                provider_health.record(BEEM_SEND)
                 return {
                     'success': True,
                     'request_id': response_data.get('request_id'),
@@ -173,14 +189,17 @@ class BeemSMSService(BaseSMSProvider):
                     'response': response_data
                 }
             else:
+                provider_health.record(BEEM_SEND, classify(response_data.get('code'), response.status_code))
                 return {
                     'success': False,
                     'error': response_data.get('message', 'Unknown error'),
                     'error_code': response_data.get('code'),
+                    'status_code': response.status_code,
                     'response': response_data
                 }
                 
         except requests.exceptions.RequestException as e:
+            provider_health.record(BEEM_SEND, TRANSIENT)
             logger.error(f"Beem SMS API request failed: {str(e)}")
             return {
                 'success': False,
@@ -188,6 +207,8 @@ class BeemSMSService(BaseSMSProvider):
                 'error_code': 'NETWORK_ERROR'
             }
         except Exception as e:
+            # e.g. an HTML error page from a gateway in front of Beem
+            provider_health.record(BEEM_SEND, TRANSIENT)
             logger.error(f"Beem SMS service error: {str(e)}")
             return {
                 'success': False,
@@ -198,7 +219,7 @@ class BeemSMSService(BaseSMSProvider):
     def check_balance(self) -> Dict[str, Any]:
         """Check account balance."""
         try:
-            response = requests.get(
+            response = self.session.get(
                 self.balance_url,
                 headers=self._get_headers(),
                 timeout=30
@@ -228,13 +249,22 @@ class BeemSMSService(BaseSMSProvider):
     
     def get_delivery_report(self, request_id: str, dest_addr: str) -> Dict[str, Any]:
         """Get delivery report for a message."""
+        try:
+            provider_health.check(BEEM_DELIVERY)
+        except CircuitOpenError as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'error_code': 'CIRCUIT_OPEN'
+            }
+        
         try:
             params = {
                 'dest_addr': dest_addr,
                 'request_id': request_id
             }
             
-            response = requests.get(
+            response = self.session.get(
                 self.delivery_url,
                 params=params,
                 headers=self._get_headers(),
@@ -244,23 +274,29 @@ class BeemSMSService(BaseSMSProvider):
             response_data = response.json()
             
             if response.status_code == 200:
+                provider_health.record(BEEM_DELIVERY)
                 return {
                     'success': True,
                     'reports': response_data if isinstance(response_data, list) else [response_data],
                     'response': response_data
                 }
             else:
+                provider_health.record(BEEM_DELIVERY, classify(None, response.status_code))
                 return {
                     'success': False,
                     'error': response_data.get('error', 'Failed to get delivery report'),
+                    'status_code': response.status_code,
                     'response': response_data
                 }
                 
         except Exception as e:
+            if isinstance(e, requests.exceptions.RequestException):
+                provider_health.record(BEEM_DELIVERY, TRANSIENT)
             logger.error(f"Beem delivery report failed: {str(e)}")
             return {
                 'success': False,
-                'error': f"Delivery report failed: {str(e)}"
+                'error': f"Delivery report failed: {str(e)}",
+                'error_code': 'NETWORK_ERROR' if isinstance(e, requests.exceptions.RequestException) else None
             }
     
     def create_sender_id(self, sender_id: str, sample_content: str) -> Dict[str, Any]:
@@ -271,7 +307,7 @@ class BeemSMSService(BaseSMSProvider):
                 "sample_content": sample_content
             }
             
-            response = requests.post(
+            response = self.session.post(
                 self.sender_url,
                 json=data,
                 headers=self._get_headers(),
@@ -311,7 +347,7 @@ class BeemSMSService(BaseSMSProvider):
             if status:
                 params['status'] = status
             
-            response = requests.get(
+            response = self.session.get(
                 self.sender_url,
                 params=params,
                 headers=self._get_headers(),
@@ -349,7 +385,7 @@ class BeemSMSService(BaseSMSProvider):
                 "message": message
             }
             
-            response = requests.post(
+            response = self.session.post(
                 self.template_url,
                 json=data,
                 headers=self._get_headers(),
@@ -383,7 +419,7 @@ class BeemSMSService(BaseSMSProvider):
     def get_templates(self) -> Dict[str, Any]:
         """Get list of templates."""
         try:
-            response = requests.get(
+            response = self.session.get(
                 self.template_url,
                 headers=self._get_headers(),
                 timeout=30
@@ -521,19 +557,26 @@ class SMSBulkProcessor:
                     'error': 'Phone number column is required'
                 }
             
+            from core.phone import normalize_many
+            from .templating import compile_template
+            
+            # Normalize the whole phone column in one pass
+            phone_col = 'phone' if 'phone' in df.columns else 'Phone'
+            phones = normalize_many(df[phone_col].tolist())
+            
             # Process each row
             results = []
             errors = []
             
             for index, row in df.iterrows():
                 try:
-                    # Extract phone number
-                    phone_col = 'phone' if 'phone' in df.columns else 'Phone'
-                    phone = str(row[phone_col]).strip()
-                    
-                    # Clean phone number (remove + if present)
-                    if phone.startswith('+'):
-                        phone = phone[1:]
+                    if phones[index] is None:
+                        errors.append({
+                            'row': index + 1,
+                            'error': f"Invalid phone number: {row[phone_col]}"
+                        })
+                        continue
+                    phone = phones[index][1:]
                     
                     # Extract other data
                     name = row.get('name', row.get('Name', phone))
@@ -545,20 +588,25 @@ class SMSBulkProcessor:
                     for col in df.columns:
                         if col.lower() not in ['phone', 'name', 'message', 'sender_id']:
                             variables[col.lower()] = str(row[col]) if pd.notna(row[col]) else ''
+                    variables['name'] = name
+                    
+                    # Fill the row's variables into the message
+                    rendered = compile_template(str(message) if pd.notna(message) else '').render(variables)
                     
                     # Send SMS
                     result = self.sms_service.send_sms(
                         to=phone,
-                        message=message,
+                        message=rendered.text,
                         sender_id=sender_id,
                         recipient_id=index + 1,
-                        **variables
+                        encoding=rendered.encoding
                     )
                     
                     results.append({
                         'row': index + 1,
                         'phone': phone,
                         'name': name,
+                        'segments': rendered.segments,
                         'success': result['success'],
                         'message_id': result.get('message_id'),
                         'error': result.get('error')
@@ -3,11 +3,56 @@ SMS validation service for credit and sender ID checks.
 """
 import logging
 from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
 from billing.models import SMSBalance, UsageRecord
+from core.cache import TieredCache
 
 logger = logging.getLogger(__name__)
 
+# Active sender IDs per tenant; invalidated by messaging.signals
+sender_cache = TieredCache('sender_ids', ttl=600)
+
+
+def active_sender_ids(tenant_id):
+    """
+    Names of the tenant's active sender IDs, served from the tiered cache.
+    """
+    from messaging.models_sms import SMSSenderID
+    
+    return sender_cache.get_or_set(
+        str(tenant_id),
+        lambda: list(SMSSenderID.objects.filter(
+            tenant_id=tenant_id, status='active'
+        ).values_list('sender_id', flat=True)),
+        tags=[f'sender_ids:{tenant_id}'],
+    )
+
+
+def reserve_credits(tenant_id, amount=1):
+    """
+    Take ``amount`` credits from the tenant's balance if it has them.
+
+    A single conditional UPDATE, so concurrent senders cannot overdraw.
+
+    Returns:
+        bool: True if the credits were taken
+    """
+    return bool(SMSBalance.objects.filter(tenant_id=tenant_id, credits__gte=amount).update(
+        credits=F('credits') - amount,
+        total_used=F('total_used') + amount,
+        last_updated=timezone.now(),
+    ))
+
+
+def release_credits(tenant_id, amount=1):
+    """Give back credits taken by ``reserve_credits`` for a send that failed."""
+    SMSBalance.objects.filter(tenant_id=tenant_id).update(
+        credits=F('credits') + amount,
+        total_used=F('total_used') - amount,
+        last_updated=timezone.now(),
+    )
+
 
 class SMSValidationError(Exception):
     """Exception raised when SMS validation fails."""
@@ -100,16 +145,8 @@ class SMSValidationService:
         Raises:
             SMSValidationError: If validation fails
         """
-        from messaging.models_sms import SMSSenderID
-        
         try:
-            sms_sender = SMSSenderID.objects.filter(
-                tenant=self.tenant,
-                sender_id=sender_id,
-                status='active'
-            ).first()
-            
-            if not sms_sender:
+            if sender_id not in active_sender_ids(self.tenant.id):
                 raise SMSValidationError(
                     f"Sender ID '{sender_id}' is not registered or not active. "
                     "Please register and activate your sender ID before sending SMS."
@@ -315,14 +352,7 @@ class SMSValidationService:
             list: List of active sender IDs
         """
         try:
-            from messaging.models_sms import SMSSenderID
-            
-            sender_ids = SMSSenderID.objects.filter(
-                tenant=self.tenant,
-                status='active'
-            ).values_list('sender_id', flat=True)
-            
-            return list(sender_ids)
+            return list(active_sender_ids(self.tenant.id))
             
         except Exception as e:
             logger.error(f"Error getting active sender IDs: {e}")
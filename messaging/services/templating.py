@@ -0,0 +1,151 @@
+"""
+Compiled message templates for per-recipient personalization.
+
+A template body (``Template.body_text``, ``SMSTemplate.message`` or a
+campaign's text) is parsed once into a printf-style format string and
+its placeholders. Rendering a batch is then one ``%`` per recipient, and
+the SMS encoding and segment count come from the lengths of the literal
+parts (measured at compile time) plus each value (memoized, since names
+and attributes repeat across an audience).
+
+Placeholders are ``{{ name }}`` or ``{name}``, with an optional default:
+``{{ first_name|Customer }}``.
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+# Beem's encoding parameter
+GSM7 = 0
+UCS2 = 1
+
+# GSM 03.38 default alphabet, and the extension table (two septets each)
+GSM7_BASIC = frozenset(
+    '@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !"#¤%&\'()*+,-./0123456789:;<=>?'
+    '¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà'
+)
+GSM7_EXTENSION = frozenset('^{}\\[~]|€\f')
+GSM7_ALL = GSM7_BASIC | GSM7_EXTENSION
+
+PLACEHOLDER = re.compile(r'\{\{\s*(\w+)\s*(?:\|([^}]*))?\}\}|\{(\w+)(?:\|([^}]*))?\}')
+
+RenderedMessage = namedtuple('RenderedMessage', ['text', 'encoding', 'segments'])
+
+
+@lru_cache(maxsize=65536)
+def _measure(text):
+    """
+    Returns:
+        tuple: (fits GSM-7, length in septets, length in UTF-16 units)
+    """
+    units = len(text) if text.isascii() else len(text.encode('utf-16-le')) // 2
+    chars = set(text)
+    if chars <= GSM7_BASIC:
+        return True, len(text), units
+    if chars <= GSM7_ALL:
+        return True, len(text) + sum(text.count(char) for char in chars & GSM7_EXTENSION), units
+    return False, 0, units
+
+
+def segment_count(encoding, length):
+    """SMS parts needed for ``length`` septets (GSM-7) or UTF-16 units (UCS-2)."""
+    if length == 0:
+        return 0
+    single, part = (160, 153) if encoding == GSM7 else (70, 67)
+    return 1 if length <= single else -(-length // part)
+
+
+def measure(text):
+    """
+    Returns:
+        tuple: (encoding, segments) for sending ``text`` as one SMS
+    """
+    gsm, septets, units = _measure(text)
+    return (GSM7, segment_count(GSM7, septets)) if gsm else (UCS2, segment_count(UCS2, units))
+
+
+def _value(value, default):
+    if value is None or value == '':
+        return default
+    return value if isinstance(value, str) else str(value)
+
+
+class CompiledTemplate:
+    """
+    A template body parsed into literal parts and placeholders.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        literals, fields = [], []
+        position = 0
+        for match in PLACEHOLDER.finditer(source):
+            literals.append(source[position:match.start()])
+            if match.group(1):
+                fields.append((match.group(1), (match.group(2) or '').strip()))
+            else:
+                fields.append((match.group(3), (match.group(4) or '').strip()))
+            position = match.end()
+        literals.append(source[position:])
+
+        self.fields = tuple(fields)
+        self.variables = tuple(dict.fromkeys(name for name, _ in fields))
+        self._format = '%s'.join(literal.replace('%', '%%') for literal in literals)
+        self._literal = _measure(''.join(literals))
+
+    def render(self, context):
+        return self.render_many([context])[0]
+
+    def render_many(self, contexts):
+        """
+        Render the template for each context (a dict of variable values).
+
+        Returns:
+            list: RenderedMessage(text, encoding, segments) per context
+        """
+        fields = self.fields
+        if not fields:
+            return [RenderedMessage(self.source, *measure(self.source))] * len(contexts)
+
+        # Hot loop: locals only, one dict lookup and one memoized measure per value
+        template = self._format
+        literal_gsm, literal_septets, literal_units = self._literal
+        measure_value = _measure
+        rendered = []
+        append = rendered.append
+        for context in contexts:
+            get = context.get
+            values = []
+            gsm, septets, units = literal_gsm, literal_septets, literal_units
+            for name, default in fields:
+                value = get(name)
+                if value.__class__ is not str or not value:
+                    value = _value(value, default)
+                value_gsm, value_septets, value_units = measure_value(value)
+                gsm = gsm and value_gsm
+                septets += value_septets
+                units += value_units
+                values.append(value)
+            if gsm:
+                append(RenderedMessage(template % tuple(values), GSM7, segment_count(GSM7, septets)))
+            else:
+                append(RenderedMessage(template % tuple(values), UCS2, segment_count(UCS2, units)))
+        return rendered
+
+
+@lru_cache(maxsize=1024)
+def compile_template(source):
+    """The CompiledTemplate for ``source``, compiled once per process."""
+    return CompiledTemplate(source)
+
+
+def contact_context(contact):
+    """Template variables for a contact: its attributes plus its own fields."""
+    context = dict(contact.attributes) if isinstance(contact.attributes, dict) else {}
+    context.update(
+        name=contact.name,
+        first_name=contact.name.split()[0] if contact.name else '',
+        phone=contact.phone_e164,
+        email=contact.email,
+    )
+    return context
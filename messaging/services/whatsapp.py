@@ -71,9 +71,12 @@ class WhatsAppService:
         
         except requests.exceptions.RequestException as e:
             logger.error(f"Error sending WhatsApp message: {str(e)}")
+            response = getattr(e, 'response', None)
             return {
                 "success": False,
-                "error": str(e)
+                "error": str(e),
+                "error_code": None if response is not None else "NETWORK_ERROR",
+                "status_code": getattr(response, 'status_code', None)
             }
         except Exception as e:
             logger.error(f"Unexpected error sending WhatsApp message: {str(e)}")
@@ -0,0 +1,58 @@
+"""
+Signals for messaging app.
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from core.cache import invalidate_tags
+from .models import Flow, KeywordRule, Message
+from .models_sms import SMSProvider, SMSSenderID
+from tenants.models import Membership
+
+
+@receiver(post_save, sender=KeywordRule)
+@receiver(post_delete, sender=KeywordRule)
+def invalidate_keyword_matchers(sender, instance, **kwargs):
+    """Rebuild the tenant's compiled keyword matchers after a rule changes."""
+    from .services.keywords import keyword_classifier
+
+    keyword_classifier.invalidate(instance.tenant_id)
+
+
+@receiver(post_save, sender=Flow)
+@receiver(post_delete, sender=Flow)
+def invalidate_flow_graphs(sender, instance, **kwargs):
+    """Recompile the tenant's flow graph after a flow is edited or toggled."""
+    from .services.flows import flow_engine
+
+    flow_engine.invalidate(instance.tenant_id)
+
+
+@receiver(post_save, sender=Message)
+def record_message_usage(sender, instance, created, **kwargs):
+    """Add new messages to the tenant's monthly usage counter."""
+    if not created:
+        return
+    from .services.costmeter import cost_meter
+
+    cost_meter.record_message(instance)
+
+
+@receiver(post_save, sender=SMSSenderID)
+@receiver(post_delete, sender=SMSSenderID)
+def invalidate_sender_ids(sender, instance, **kwargs):
+    """Drop the tenant's cached active sender IDs after one changes."""
+    invalidate_tags(f'sender_ids:{instance.tenant_id}')
+
+
+@receiver(post_save, sender=SMSSenderID)
+@receiver(post_delete, sender=SMSSenderID)
+@receiver(post_save, sender=SMSProvider)
+@receiver(post_delete, sender=SMSProvider)
+@receiver(post_save, sender=Membership)
+@receiver(post_delete, sender=Membership)
+def invalidate_send_contexts(sender, instance, **kwargs):
+    """Rebuild the tenant's SMS send context after its providers, senders or members change."""
+    from .services.send_context import invalidate_send_context
+
+    invalidate_send_context(instance.tenant_id)
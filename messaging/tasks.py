@@ -4,10 +4,14 @@ Celery tasks for messaging functionality.
 from celery import shared_task
 from django.utils import timezone
 from django.db import transaction
-from .models import Message, Conversation, Contact, Campaign, Flow
+from .models import Message, Conversation, Contact, Campaign, Flow, ExportJob
 from .services.whatsapp import WhatsAppService
 from .services.ai import AIService
-from .services.costmeter import CostMeterService
+from .services.costmeter import cost_meter
+from .services.provider_health import (
+    TRANSIENT, WHATSAPP_SEND, TransientProviderError, claim_call, classify, provider_health,
+    provider_retry_policy, release_call
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -26,8 +30,19 @@ def send_message_task(self, message_id):
             message.mark_failed("Contact has not opted in")
             return
         
+        # Resend guard: a retry or duplicate delivery of an already sent message
+        if message.status != 'queued':
+            logger.info(f"Message {message_id} already {message.status}; not sending again")
+            return
+        
         # Send via WhatsApp
         if message.provider == 'whatsapp':
+            # Defer without calling WhatsApp while it is known to be down
+            provider_health.check(WHATSAPP_SEND)
+            if not claim_call(f'message:{message_id}'):
+                logger.info(f"Message {message_id} is being sent by another worker")
+                return
+            
             whatsapp_service = WhatsAppService()
             result = whatsapp_service.send_message(
                 to=message.conversation.contact.phone_e164,
@@ -35,13 +50,18 @@ def send_message_task(self, message_id):
                 media_url=message.media_url if message.media_url else None
             )
             
+            kind = None if result['success'] else classify(result.get('error_code'), result.get('status_code'))
+            provider_health.record(WHATSAPP_SEND, kind)
+            if kind == TRANSIENT:
+                release_call(f'message:{message_id}')
+                raise TransientProviderError(result['error'], code=result.get('error_code'))
+            
             if result['success']:
                 message.provider_message_id = result['message_id']
                 message.mark_sent()
                 
                 # Calculate cost
-                cost_service = CostMeterService()
-                message.cost_micro = cost_service.calculate_message_cost(message)
+                message.cost_micro = cost_meter.calculate_message_cost(message)
                 message.save()
                 
                 logger.info(f"Message {message_id} sent successfully")
@@ -65,8 +85,11 @@ def send_message_task(self, message_id):
     except Message.DoesNotExist:
         logger.error(f"Message {message_id} not found")
     except Exception as exc:
+        provider_retry_policy.retry(self, exc)
         logger.error(f"Error sending message {message_id}: {str(exc)}")
-        raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
+        Message.objects.filter(id=message_id, status='queued').update(
+            status='failed', error_message=str(exc), updated_at=timezone.now()
+        )
 
 
 @shared_task(bind=True, max_retries=3)
@@ -98,77 +121,40 @@ def sync_delivery_status_task(self, provider_message_id, provider='whatsapp'):
 
 
 @shared_task(bind=True, max_retries=3)
-def send_campaign_messages_task(self, campaign_id):
+def send_campaign_messages_task(self, campaign_id, run_at=None):
     """
     Send messages for a campaign.
+    
+    Dispatches the messages staged for this run, staging them now if that
+    did not happen ahead of time.
+    
+    Args:
+        run_at: ISO time of the scheduled run; defaults to when the
+            campaign was started
     """
     try:
-        campaign = Campaign.objects.get(id=campaign_id)
+        from django.utils.dateparse import parse_datetime
+        from .services.campaign_staging import campaign_stager
+        
+        campaign = Campaign.objects.select_related('template', 'created_by').get(id=campaign_id)
         
         if campaign.status != 'running':
             logger.warning(f"Campaign {campaign_id} is not running")
             return
         
-        # Get contacts from segment
-        contacts = Contact.objects.filter(
-            tenant=campaign.tenant,
-            is_active=True
-        )
-        
-        # Apply segment filters
-        if campaign.segment.filter_json:
-            from django.db.models import Q
-            q = Q()
-            
-            if 'tags' in campaign.segment.filter_json:
-                tags = campaign.segment.filter_json['tags']
-                if tags:
-                    q &= Q(tags__contains=tags)
-            
-            if 'attributes' in campaign.segment.filter_json:
-                for key, value in campaign.segment.filter_json['attributes'].items():
-                    q &= Q(attributes__contains={key: value})
-            
-            if 'opt_in_status' in campaign.segment.filter_json:
-                if campaign.segment.filter_json['opt_in_status'] == 'opted_in':
-                    q &= Q(opt_in_at__isnull=False, opt_out_at__isnull=True)
-                elif campaign.segment.filter_json['opt_in_status'] == 'opted_out':
-                    q &= Q(opt_out_at__isnull=False)
-            
-            contacts = contacts.filter(q)
-        
-        # Create messages for each contact
-        messages_created = 0
-        for contact in contacts:
-            # Get or create conversation
-            conversation, created = Conversation.objects.get_or_create(
-                tenant=campaign.tenant,
-                contact=contact
-            )
-            
-            # Create message
-            message = Message.objects.create(
-                tenant=campaign.tenant,
-                conversation=conversation,
-                direction='out',
-                provider='whatsapp',
-                text=campaign.template.body_text,
-                template=campaign.template,
-                template_variables={}  # TODO: Parse variables from contact attributes
-            )
-            
-            # Queue message for sending
-            send_message_task.delay(str(message.id))
-            messages_created += 1
+        run_at = parse_datetime(run_at) if run_at else (campaign.started_at or campaign.created_at)
+        stage = campaign_stager.dispatch(campaign, run_at)
+        if stage is None:
+            return
         
         # Update campaign statistics
-        campaign.sent_count = messages_created
-        campaign.save()
+        campaign.total_recipients = stage.total_recipients
+        campaign.sent_count = stage.dispatched_count
         
         # Mark campaign as completed if all messages are queued
         campaign.complete()
         
-        logger.info(f"Campaign {campaign_id} processed {messages_created} messages")
+        logger.info(f"Campaign {campaign_id} processed {stage.dispatched_count} messages")
     
     except Campaign.DoesNotExist:
         logger.error(f"Campaign {campaign_id} not found")
@@ -178,36 +164,52 @@ def send_campaign_messages_task(self, campaign_id):
 
 
 @shared_task(bind=True, max_retries=3)
-def ai_suggest_reply_task(self, conversation_id):
+def stage_upcoming_campaigns_task(self):
+    """
+    Stage the campaign runs due within CAMPAIGN_STAGING_LEAD_MINUTES.
+    """
+    try:
+        from .services.campaign_staging import campaign_stager
+        
+        staged = campaign_stager.stage_upcoming()
+        if staged:
+            logger.info(f"Campaign runs staged: {staged}")
+        return staged
+    
+    except Exception as exc:
+        logger.error(f"Error staging campaigns: {str(exc)}")
+        raise self.retry(exc=exc, countdown=60)
+
+
+@shared_task(bind=True, max_retries=3)
+def ai_suggest_reply_task(self, conversation_id, requested_at=None):
     """
     Generate AI suggestions for a conversation.
+    
+    Runs scheduled from inbound messages pass ``requested_at`` and are
+    skipped when a newer inbound message has already scheduled its own run.
     """
     try:
-        conversation = Conversation.objects.get(id=conversation_id)
+        from .services.ai_suggestions import reply_suggestions
         
-        # Get recent messages for context
-        recent_messages = conversation.messages.order_by('-created_at')[:15]
-        context = []
-        
-        for msg in recent_messages:
-            context.append({
-                'direction': msg.direction,
-                'text': msg.text,
-                'timestamp': msg.created_at.isoformat()
-            })
-        
-        # Get AI suggestions
-        ai_service = AIService()
-        suggestions = ai_service.suggest_reply(
-            tenant_name=conversation.tenant.name,
-            context=context
-        )
+        conversation = Conversation.objects.select_related('tenant').get(id=conversation_id)
+        
+        if reply_suggestions.is_superseded(conversation, requested_at):
+            logger.info(f"AI suggestions for conversation {conversation_id} superseded by a newer message")
+            return
+        
+        suggestions, cache_hit = reply_suggestions.suggest(conversation)
         
         # Update conversation with suggestions
-        conversation.ai_suggestions = suggestions
-        conversation.save()
+        Conversation.objects.filter(id=conversation.id).update(
+            ai_suggestions=suggestions,
+            updated_at=timezone.now()
+        )
         
-        logger.info(f"AI suggestions generated for conversation {conversation_id}")
+        logger.info(
+            f"AI suggestions generated for conversation {conversation_id}"
+            f"{' (cached)' if cache_hit else ''}"
+        )
     
     except Conversation.DoesNotExist:
         logger.error(f"Conversation {conversation_id} not found")
@@ -219,31 +221,16 @@ def ai_suggest_reply_task(self, conversation_id):
 @shared_task(bind=True, max_retries=3)
 def ai_summarize_conversation_task(self, conversation_id):
     """
-    Generate AI summary for a conversation.
+    Fold messages received since the last run into the conversation summary.
     """
     try:
-        conversation = Conversation.objects.get(id=conversation_id)
-        
-        # Get all messages for context
-        messages = conversation.messages.order_by('created_at')
-        context = []
-        
-        for msg in messages:
-            context.append({
-                'direction': msg.direction,
-                'text': msg.text,
-                'timestamp': msg.created_at.isoformat()
-            })
+        from .services.ai_summaries import rolling_summaries
         
-        # Get AI summary
-        ai_service = AIService()
-        summary = ai_service.summarize_conversation(context)
+        conversation = Conversation.objects.get(id=conversation_id)
         
-        # Update conversation with summary
-        conversation.ai_summary = summary
-        conversation.save()
+        folded = rolling_summaries.refresh(conversation)
         
-        logger.info(f"AI summary generated for conversation {conversation_id}")
+        logger.info(f"AI summary updated for conversation {conversation_id} ({folded} new messages)")
     
     except Conversation.DoesNotExist:
         logger.error(f"Conversation {conversation_id} not found")
@@ -257,74 +244,80 @@ def process_inbound_message_task(self, message_data):
     """
     Process an inbound message from webhook.
     """
+    from .services.inbound import conversation_lookup, conversation_counters
+    from .services.ai_suggestions import reply_suggestions
+    from .services.flows import flow_engine
+    
+    tenant_id = message_data.get('tenant_id')
+    contact_phone = message_data.get('contact_phone')
     try:
-        tenant_id = message_data.get('tenant_id')
-        contact_phone = message_data.get('contact_phone')
         text = message_data.get('text', '')
         media_url = message_data.get('media_url')
         
-        # Get tenant
-        from tenants.models import Tenant
-        tenant = Tenant.objects.get(id=tenant_id)
-        
-        # Get or create contact
-        contact, created = Contact.objects.get_or_create(
-            tenant=tenant,
-            phone_e164=contact_phone,
-            defaults={'name': contact_phone}  # Use phone as name if not provided
-        )
-        
-        # Get or create conversation
-        conversation, created = Conversation.objects.get_or_create(
-            tenant=tenant,
-            contact=contact
+        # Resolve contact and conversation (cached per tenant and phone)
+        contact_id, conversation_id = conversation_lookup.resolve(
+            tenant_id,
+            contact_phone,
+            contact_name=message_data.get('contact_name', '')
         )
         
         # Create inbound message
         message = Message.objects.create(
-            tenant=tenant,
-            conversation=conversation,
+            tenant_id=tenant_id,
+            conversation_id=conversation_id,
             direction='in',
             provider='whatsapp',
+            provider_message_id=message_data.get('message_id') or '',
             text=text,
-            media_url=media_url,
+            media_url=media_url or '',
             status='delivered'  # Inbound messages are considered delivered
         )
         
-        # Update conversation
-        conversation.last_message_at = timezone.now()
-        conversation.message_count += 1
-        conversation.unread_count += 1
-        conversation.save()
+        # Update conversation counters atomically, coalescing bursts
+        conversation_counters.add(conversation_id, last_message_at=message.created_at)
         
-        # Trigger AI suggestions if flow is active
-        active_flows = Flow.objects.filter(tenant=tenant, active=True)
-        for flow in active_flows:
-            # TODO: Implement flow processing logic
-            pass
+        # Run the tenant's active flows against the message
+        flow_engine.process_inbound(tenant_id, contact_id, conversation_id, text)
         
-        # Generate AI suggestions
-        ai_suggest_reply_task.delay(str(conversation.id))
+        # Generate AI suggestions once the conversation goes quiet
+        reply_suggestions.schedule(conversation_id, requested_at=message.created_at)
         
-        logger.info(f"Inbound message processed for conversation {conversation.id}")
+        logger.info(f"Inbound message processed for conversation {conversation_id}")
     
     except Exception as exc:
         logger.error(f"Error processing inbound message: {str(exc)}")
+        # The cached conversation may have been deleted; resolve afresh on retry
+        conversation_lookup.invalidate(tenant_id, contact_phone)
         raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
 
 
 @shared_task(bind=True, max_retries=3)
-def cleanup_old_messages_task(self, days=30):
+def flush_conversation_counters_task(self, conversation_id):
+    """
+    Apply coalesced conversation counter updates.
+    """
+    try:
+        from .services.inbound import conversation_counters
+        
+        conversation_counters.flush(conversation_id)
+    
+    except Exception as exc:
+        logger.error(f"Error flushing counters for conversation {conversation_id}: {str(exc)}")
+        raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
+
+
+@shared_task(bind=True, max_retries=3)
+def cleanup_old_messages_task(self, days=None):
     """
     Clean up old messages to save storage.
+    
+    Tenants without a RetentionPolicy keep messages for ``days`` (or
+    MESSAGE_RETENTION_DAYS); rows are archived first when enabled.
     """
     try:
-        cutoff_date = timezone.now() - timezone.timedelta(days=days)
+        from .services.retention import retention_purger
         
-        # Delete old messages (keep recent ones)
-        old_messages = Message.objects.filter(created_at__lt=cutoff_date)
-        count = old_messages.count()
-        old_messages.delete()
+        count = retention_purger.purge_messages(default_days=days)
         
         logger.info(f"Cleaned up {count} old messages")
     
@@ -333,5 +326,138 @@ def cleanup_old_messages_task(self, days=30):
         raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
 
 
+@shared_task(bind=True, max_retries=3)
+def compact_inbound_events_task(self, days=None):
+    """
+    Remove webhook inbox rows that are past the provider retry window.
+    """
+    try:
+        from .services.inbox import inbound_inbox
+        
+        count = inbound_inbox.compact(retention_days=days)
+        
+        logger.info(f"Compacted {count} inbound webhook events")
+    
+    except Exception as exc:
+        logger.error(f"Error compacting inbound events: {str(exc)}")
+        raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
+
+
+@shared_task(bind=True, max_retries=3)
+def ensure_future_partitions_task(self, months_ahead=None):
+    """
+    Create upcoming monthly partitions before rows arrive for them.
+    """
+    try:
+        from core import partitioning
+        
+        count = partitioning.ensure_partitions(months_ahead=months_ahead)
+        
+        logger.info(f"Ensured {count} table partitions")
+    
+    except Exception as exc:
+        logger.error(f"Error creating table partitions: {str(exc)}")
+        raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
+
+
+@shared_task(bind=True, max_retries=3)
+def reconcile_usage_counters_task(self):
+    """
+    Recompute this month's usage counters from the messages table.
+    
+    Counters are incremented by a post_save signal, which bulk inserts
+    skip; this brings them back in line. On the first of the month the
+    previous month is settled too.
+    """
+    try:
+        from tenants.models import Tenant
+        
+        today = timezone.localdate()
+        periods = [today.replace(day=1)]
+        if today.day == 1:
+            periods.append((today - timezone.timedelta(days=1)).replace(day=1))
+        
+        for period in periods:
+            start, end = cost_meter.month_range(period.year, period.month)
+            tenant_ids = Message.objects.filter(
+                created_at__gte=start, created_at__lt=end
+            ).order_by().values_list('tenant_id', flat=True).distinct()
+            for tenant in Tenant.objects.filter(id__in=list(tenant_ids)):
+                cost_meter.reconcile(tenant, period)
+        
+        logger.info(f"Reconciled usage counters for {', '.join(f'{p:%Y-%m}' for p in periods)}")
+    
+    except Exception as exc:
+        logger.error(f"Error reconciling usage counters: {str(exc)}")
+        raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
+
+
+@shared_task(bind=True, max_retries=3)
+def refresh_provider_metadata_task(self, key=None):
+    """
+    Refresh cached provider metadata: one key, or every periodic key that
+    is past half its freshness window.
+    """
+    from .services.provider_metadata import provider_metadata
+    
+    try:
+        if key:
+            provider_metadata.refresh(key)
+            return
+        
+        refreshed = 0
+        for periodic_key in provider_metadata.periodic_keys():
+            entry = provider_metadata.read(periodic_key, revalidate=False)
+            if entry['refreshed_at'] and not provider_metadata.due(periodic_key, entry['refreshed_at']):
+                continue
+            provider_metadata.refresh(periodic_key)
+            refreshed += 1
+        
+        logger.info(f"Refreshed {refreshed} provider metadata entries")
+    
+    except Exception as exc:
+        logger.error(f"Error refreshing provider metadata: {str(exc)}")
+        raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
+
+
+@shared_task(bind=True, max_retries=3)
+def run_export_job_task(self, job_id):
+    """
+    Write a background export to file storage.
+    """
+    from .services.exports import export_service, ExportError
+    
+    try:
+        job = ExportJob.objects.select_related('tenant').get(id=job_id)
+        export_service.run_job(job)
+    
+    except ExportJob.DoesNotExist:
+        logger.error(f"Export job {job_id} not found")
+    except ExportError as exc:
+        logger.error(f"Export job {job_id} failed: {str(exc)}")
+    except Exception as exc:
+        logger.error(f"Error running export job {job_id}: {str(exc)}")
+        raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
+
+
+@shared_task(bind=True, max_retries=3)
+def relay_outbox_task(self):
+    """
+    Publish outbox entries that were not sent after commit, and purge old
+    published ones.
+    """
+    from .services.outbox import outbox
+    
+    try:
+        published = outbox.drain()
+        purged = outbox.purge()
+        if published or purged:
+            logger.info(f"Outbox relay published {published} tasks, purged {purged}")
+    
+    except Exception as exc:
+        logger.error(f"Error relaying outbox: {str(exc)}")
+        raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
+
+
 # Import SMS tasks
 from .tasks_sms import *
@@ -4,9 +4,14 @@ SMS-specific Celery tasks for Mifumo WMS.
 import logging
 from celery import shared_task
 from django.utils import timezone
-from django.db import transaction
+from django.db import IntegrityError, transaction
+
+from core.phone import to_msisdn
 
 from .models_sms import SMSMessage, SMSDeliveryReport, SMSBulkUpload
+from .services.provider_health import (
+    BEEM_SEND, TRANSIENT, TransientProviderError, classify, provider_health, provider_retry_policy
+)
 from .services.sms_service import SMSService, SMSBulkProcessor
 
 logger = logging.getLogger(__name__)
@@ -17,79 +22,102 @@ def send_sms_task(self, message_id, sender_id, provider_id=None):
     """
     Send SMS message asynchronously.
     
+    The message's SMSMessage row doubles as the resend guard: it is
+    claimed ('pending') before Beem is called, and a task that finds it
+    claimed or sent does nothing, so retries and duplicate deliveries
+    never send the same SMS twice. Transient failures put it back to
+    'queued' and retry; permanent ones fail it at once.
+    
     Args:
         message_id: ID of the base message
         sender_id: Sender ID to use
         provider_id: Optional provider ID
     """
+    from .models import Message
+    from .services.sms_validation import reserve_credits, release_credits
+    
+    reserved = False
+    claimed = None
     try:
-        from .models import Message
-        from .services.sms_validation import SMSValidationService, SMSValidationError
+        from billing.models import UsageRecord
+        from .services.send_context import get_send_context
+        
+        # Get base message (with the contact, for the phone number, and any earlier attempt)
+        base_message = Message.objects.select_related('conversation__contact', 'sms_message').get(id=message_id)
+        tenant_id = base_message.tenant_id
+        
+        try:
+            sms_message = base_message.sms_message
+        except SMSMessage.DoesNotExist:
+            sms_message = None
+        
+        # Resend guard: never send again once Beem has accepted it or another worker is on it
+        if base_message.status in ('sent', 'delivered', 'read') or (
+            sms_message and sms_message.status not in ('queued', 'failed')
+        ):
+            logger.info(f"SMS for message {message_id} already handled; not sending again")
+            return
         
-        # Get base message
-        base_message = Message.objects.get(id=message_id)
+        # Provider, client and sender IDs are cached per tenant in this worker
+        context = get_send_context(tenant_id)
         
-        # Initialize SMS validation service
-        validation_service = SMSValidationService(base_message.tenant)
+        if context.client:
+            # Defer without touching credits while Beem is known to be down
+            provider_health.check(BEEM_SEND)
         
-        # Validate SMS sending capability
-        validation_result = validation_service.validate_sms_sending(sender_id, required_credits=1)
+        sms_sender_id = context.sender(sender_id)
+        if not sms_sender_id:
+            error = (
+                f"Sender ID '{sender_id}' is not registered or not active. "
+                "Please register and activate your sender ID before sending SMS."
+            )
+        elif not reserve_credits(tenant_id, 1):
+            error = "Insufficient SMS credits. Please purchase more credits to send SMS."
+        else:
+            error = None
+            reserved = True
         
-        if not validation_result['valid']:
+        if error:
             # Mark message as failed with validation error
             base_message.status = 'failed'
-            base_message.error_message = validation_result['error']
-            base_message.save()
+            base_message.error_message = error
+            base_message.save(update_fields=['status', 'error_message', 'updated_at'])
             
-            logger.error(f"SMS validation failed for message {message_id}: {validation_result['error']}")
+            logger.error(f"SMS validation failed for message {message_id}: {error}")
             return
         
-        # Get SMS provider and sender ID
-        from .models_sms import SMSProvider, SMSSenderID
-        
-        provider = SMSProvider.objects.filter(
-            tenant=base_message.tenant,
-            is_active=True,
-            is_default=True
-        ).first()
-        
-        if not provider:
-            provider = SMSProvider.objects.filter(
-                tenant=base_message.tenant,
-                is_active=True
-            ).first()
-        
-        if not provider:
+        if not context.provider or not context.client:
             raise Exception("No active SMS provider found")
         
-        sms_sender_id = SMSSenderID.objects.filter(
-            tenant=base_message.tenant,
-            sender_id=sender_id,
-            status='active'
-        ).first()
-        
-        if not sms_sender_id:
-            raise Exception(f"Sender ID '{sender_id}' not found or not active")
-        
-        # Create SMS message record
-        sms_message = SMSMessage.objects.create(
-            tenant=base_message.tenant,
-            base_message=base_message,
-            provider=provider,
-            sender_id=sms_sender_id,
-            cost_amount=provider.cost_per_sms,
-            cost_currency=provider.currency
-        )
-        
-        # Send SMS
-        sms_service = SMSService(str(base_message.tenant.id))
+        # Claim the send; the one-to-one row means only one worker can
+        if sms_message is None:
+            try:
+                with transaction.atomic():
+                    sms_message = SMSMessage.objects.create(
+                        tenant_id=tenant_id,
+                        base_message=base_message,
+                        provider=context.provider,
+                        sender_id=sms_sender_id,
+                        status='pending',
+                        cost_amount=context.cost_amount,
+                        cost_currency=context.cost_currency
+                    )
+            except IntegrityError:
+                sms_message = None
+        elif not SMSMessage.objects.filter(id=sms_message.id, status__in=['queued', 'failed']).update(status='pending'):
+            sms_message = None
+        
+        if sms_message is None:
+            release_credits(tenant_id, 1)
+            reserved = False
+            logger.info(f"SMS for message {message_id} is being sent by another worker")
+            return
+        claimed = sms_message.id
         
         # Get phone number from contact
-        phone = base_message.conversation.contact.phone_e164
-        if phone.startswith('+'):
-            phone = phone[1:]
+        phone = to_msisdn(base_message.conversation.contact.phone_e164)
         
-        result = sms_service.send_sms(
+        result = context.client.send_sms(
             to=phone,
             message=base_message.text,
             sender_id=sender_id,
@@ -97,18 +125,9 @@ def send_sms_task(self, message_id, sender_id, provider_id=None):
         )
         
         if result['success']:
-            # Deduct SMS credits after successful send
-            try:
-                validation_service.deduct_credits(
-                    amount=1,
-                    sender_id=sender_id,
-                    message_id=str(base_message.id),
-                    description=f"SMS sent to {phone}"
-                )
-                logger.info(f"Deducted 1 SMS credit for message {message_id}")
-            except SMSValidationError as e:
-                logger.error(f"Failed to deduct credits for message {message_id}: {e}")
-                # Don't fail the message if credit deduction fails, just log it
+            # The reserved credit is now spent; the claim stays with the sent row
+            reserved = False
+            claimed = None
             
             # Update SMS message
             sms_message.status = 'sent'
@@ -116,13 +135,23 @@ def send_sms_task(self, message_id, sender_id, provider_id=None):
             sms_message.provider_request_id = result.get('request_id')
             sms_message.provider_response = result.get('response', {})
             sms_message.sent_at = timezone.now()
-            sms_message.save()
+            sms_message.save(update_fields=[
+                'status', 'provider_message_id', 'provider_request_id', 'provider_response', 'sent_at', 'updated_at'
+            ])
             
             # Update base message
             base_message.status = 'sent'
             base_message.provider_message_id = result.get('message_id')
             base_message.sent_at = timezone.now()
-            base_message.save()
+            base_message.save(update_fields=['status', 'provider_message_id', 'sent_at', 'updated_at'])
+            
+            if context.billing_user_id:
+                UsageRecord.objects.create(
+                    tenant_id=tenant_id,
+                    user_id=context.billing_user_id,
+                    credits_used=1,
+                    cost=0.0  # Cost is handled in purchase
+                )
             
             # Schedule delivery report check
             check_sms_delivery_task.apply_async(
@@ -131,35 +160,77 @@ def send_sms_task(self, message_id, sender_id, provider_id=None):
             )
             
             logger.info(f"SMS sent successfully: {message_id}")
-            
+        
+        elif classify(result.get('error_code'), result.get('status_code')) == TRANSIENT:
+            # Released below and retried
+            raise TransientProviderError(result.get('error') or 'Provider unavailable', code=result.get('error_code'))
+        
         else:
+            release_credits(tenant_id, 1)
+            reserved = False
+            claimed = None
+            
             # Update with error
             sms_message.status = 'failed'
-            sms_message.error_code = result.get('error_code')
-            sms_message.error_message = result.get('error')
+            sms_message.error_code = result.get('error_code') or ''
+            sms_message.error_message = result.get('error') or ''
             sms_message.failed_at = timezone.now()
-            sms_message.save()
+            sms_message.save(update_fields=['status', 'error_code', 'error_message', 'failed_at', 'updated_at'])
             
             base_message.status = 'failed'
             base_message.error_message = result.get('error')
-            base_message.save()
+            base_message.save(update_fields=['status', 'error_message', 'updated_at'])
             
             logger.error(f"SMS send failed: {message_id} - {result.get('error')}")
-            
+    
+    except Message.DoesNotExist:
+        logger.error(f"Message {message_id} not found")
     except Exception as exc:
+        if reserved:
+            release_credits(base_message.tenant_id, 1)
+        if claimed:
+            # Nothing reached Beem (or it failed transiently); let a retry claim it again
+            SMSMessage.objects.filter(id=claimed, status='pending').update(
+                status='queued', error_message=str(exc), updated_at=timezone.now()
+            )
+        
+        provider_retry_policy.retry(self, exc)
+        
         logger.error(f"SMS send task failed: {str(exc)}")
+        now = timezone.now()
+        SMSMessage.objects.filter(base_message_id=message_id, status='queued').update(
+            status='failed', error_message=str(exc), failed_at=now, updated_at=now
+        )
+        Message.objects.filter(id=message_id, status='queued').update(
+            status='failed', error_message=str(exc), updated_at=now
+        )
+
+
+@shared_task(bind=True, max_retries=3)
+def send_bulk_sms_job_task(self, job_id):
+    """
+    Send the queued messages of a bulk SMS job and record the results.
+    
+    Args:
+        job_id: ID of the SMSBulkSendJob
+    """
+    from .models_sms import SMSBulkSendJob
+    from .services.bulk_send import bulk_send_pipeline
+    
+    try:
+        job = SMSBulkSendJob.objects.get(id=job_id)
+        if job.status in ('completed', 'partial', 'failed'):
+            return
         
-        # Update message status
-        try:
-            from .models import Message
-            base_message = Message.objects.get(id=message_id)
-            base_message.status = 'failed'
-            base_message.error_message = str(exc)
-            base_message.save()
-        except:
-            pass
+        bulk_send_pipeline.dispatch(job)
         
-        raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
+    except SMSBulkSendJob.DoesNotExist:
+        logger.error(f"Bulk send job {job_id} not found")
+    except Exception as exc:
+        provider_retry_policy.retry(self, exc)
+        
+        logger.error(f"Bulk send job {job_id} failed: {str(exc)}")
+        bulk_send_pipeline.abandon(SMSBulkSendJob.objects.get(id=job_id), str(exc))
 
 
 @shared_task(bind=True, max_retries=3)
@@ -178,9 +249,7 @@ def check_sms_delivery_task(self, sms_message_id):
             return
         
         # Get phone number
-        phone = sms_message.base_message.conversation.contact.phone_e164
-        if phone.startswith('+'):
-            phone = phone[1:]
+        phone = to_msisdn(sms_message.base_message.conversation.contact.phone_e164)
         
         # Check delivery status
         sms_service = SMSService(str(sms_message.tenant.id))
@@ -234,12 +303,15 @@ def check_sms_delivery_task(self, sms_message_id):
             
             logger.info(f"Delivery report checked for SMS: {sms_message_id}")
             
+        elif classify(result.get('error_code'), result.get('status_code')) == TRANSIENT:
+            raise TransientProviderError(result.get('error') or 'Delivery report unavailable', code=result.get('error_code'))
+            
         else:
             logger.error(f"Delivery report check failed: {result.get('error')}")
             
     except Exception as exc:
+        provider_retry_policy.retry(self, exc)
         logger.error(f"Delivery check task failed: {str(exc)}")
-        raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
 
 
 @shared_task(bind=True, max_retries=3)
@@ -349,61 +421,48 @@ def sync_sms_provider_data_task(self, provider_id):
         raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
 
 
+@shared_task(bind=True, max_retries=3)
+def dispatch_due_schedules_task(self):
+    """
+    Start the campaigns of every due SMS schedule.
+    
+    Safe to run on several nodes at once: schedules are leased with SKIP
+    LOCKED and advanced with a compare-and-set, so each occurrence fires once.
+    """
+    try:
+        from .services.scheduler import campaign_scheduler
+        
+        fired = campaign_scheduler.run()
+        if fired:
+            logger.info(f"SMS schedules fired: {fired}")
+        return fired
+        
+    except Exception as exc:
+        logger.error(f"Schedule dispatch failed: {str(exc)}")
+        raise self.retry(exc=exc, countdown=30)
+
+
 @shared_task(bind=True, max_retries=3)
 def process_sms_schedule_task(self, schedule_id):
     """
     Process scheduled SMS campaign.
     
+    Fires the schedule only if it is due and not leased by another node;
+    ``dispatch_due_schedules_task`` normally does this for every schedule.
+    
     Args:
         schedule_id: ID of the SMS schedule
     """
     try:
-        from .models_sms import SMSSchedule
-        from .models import Campaign
-        
-        schedule = SMSSchedule.objects.get(id=schedule_id)
-        
-        if not schedule.is_active:
-            logger.info(f"SMS schedule is inactive: {schedule_id}")
-            return
-        
-        if schedule.next_run and schedule.next_run > timezone.now():
-            logger.info(f"SMS schedule not ready: {schedule_id}")
-            return
+        from .services.scheduler import campaign_scheduler
         
-        # Get campaign
-        campaign = schedule.campaign
-        
-        if campaign.status not in ['draft', 'scheduled']:
-            logger.info(f"Campaign not ready for sending: {campaign.id}")
+        schedules = campaign_scheduler.claim_due(ids=[schedule_id])
+        if not schedules:
+            logger.info(f"SMS schedule not due: {schedule_id}")
             return
         
-        # Start campaign if it's a draft
-        if campaign.status == 'draft':
-            campaign.status = 'running'
-            campaign.started_at = timezone.now()
-            campaign.save()
-        
-        # Process campaign messages
-        from .tasks import send_campaign_messages_task
-        send_campaign_messages_task.delay(str(campaign.id))
-        
-        # Update schedule
-        schedule.last_run = timezone.now()
-        
-        # Calculate next run
-        if schedule.frequency == 'once':
-            schedule.is_active = False
-        elif schedule.frequency == 'daily':
-            schedule.next_run = timezone.now() + timezone.timedelta(days=1)
-        elif schedule.frequency == 'weekly':
-            schedule.next_run = timezone.now() + timezone.timedelta(weeks=1)
-        elif schedule.frequency == 'monthly':
-            schedule.next_run = timezone.now() + timezone.timedelta(days=30)
-        
-        schedule.save()
-        
-        logger.info(f"SMS schedule processed: {schedule_id}")
+        if campaign_scheduler.fire(schedules[0]):
+            logger.info(f"SMS schedule processed: {schedule_id}")
         
     except Exception as exc:
         logger.error(f"Schedule task failed: {str(exc)}")
@@ -411,35 +470,20 @@ def process_sms_schedule_task(self, schedule_id):
 
 
 @shared_task(bind=True, max_retries=3)
-def cleanup_old_sms_data_task(self, days=30):
+def cleanup_old_sms_data_task(self, days=None):
     """
     Clean up old SMS data to maintain performance.
     
     Args:
-        days: Number of days to keep data
+        days: Default number of days to keep data; tenant RetentionPolicy
+            overrides win
     """
     try:
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        cutoff_date = timezone.now() - timedelta(days=days)
+        from .services.retention import retention_purger
         
-        # Clean up old delivery reports
-        old_reports = SMSDeliveryReport.objects.filter(
-            received_at__lt=cutoff_date
-        )
-        deleted_reports = old_reports.count()
-        old_reports.delete()
-        
-        # Clean up old bulk uploads
-        old_uploads = SMSBulkUpload.objects.filter(
-            created_at__lt=cutoff_date,
-            status__in=['completed', 'failed']
-        )
-        deleted_uploads = old_uploads.count()
-        old_uploads.delete()
+        deleted = retention_purger.purge_sms_data(default_days=days)
         
-        logger.info(f"SMS cleanup completed: {deleted_reports} reports, {deleted_uploads} uploads")
+        logger.info(f"SMS cleanup completed: {deleted['reports']} reports, {deleted['uploads']} uploads")
         
     except Exception as exc:
         logger.error(f"Cleanup task failed: {str(exc)}")
@@ -0,0 +1,1759 @@
+"""
+Tests for messaging services.
+"""
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from datetime import timedelta
+from unittest.mock import patch
+
+from .models import InboundEvent
+from .services.inbox import InboundEventInbox
+
+
+class InboundEventInboxTests(TestCase):
+    """Webhook events are accepted exactly once."""
+
+    def setUp(self):
+        self.inbox = InboundEventInbox(ttl=60, max_entries=100)
+
+    def test_duplicate_event_is_rejected(self):
+        self.assertTrue(self.inbox.claim('whatsapp', 'wamid.1'))
+        self.assertFalse(self.inbox.claim('whatsapp', 'wamid.1'))
+        self.assertTrue(self.inbox.claim('stripe', 'wamid.1'))
+        self.assertEqual(InboundEvent.objects.count(), 2)
+
+    def test_duplicate_rejected_by_index_across_processes(self):
+        self.assertTrue(self.inbox.claim('zenopay', 'order-1:COMPLETED'))
+        other_worker = InboundEventInbox(ttl=60)
+        self.assertFalse(other_worker.claim('zenopay', 'order-1:COMPLETED'))
+
+    def test_release_allows_retry(self):
+        self.inbox.claim('zenopay', 'order-2:COMPLETED')
+        self.inbox.release('zenopay', 'order-2:COMPLETED')
+        self.assertTrue(self.inbox.claim('zenopay', 'order-2:COMPLETED'))
+
+    def test_compact_removes_expired_rows(self):
+        self.inbox.claim('whatsapp', 'old')
+        self.inbox.claim('whatsapp', 'new')
+        InboundEvent.objects.filter(event_id='old').update(
+            received_at=timezone.now() - timedelta(days=30)
+        )
+        deleted = self.inbox.compact(retention_days=7, batch_size=1)
+        self.assertEqual(deleted, 1)
+        self.assertEqual(list(InboundEvent.objects.values_list('event_id', flat=True)), ['new'])
+
+
+class InboundProcessingTests(TestCase):
+    """Inbound messages update conversation counters atomically."""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from tenants.models import Tenant
+
+        cache.clear()
+        self.tenant = Tenant.objects.create(name='Inbound Co', subdomain='inbound-co')
+
+    def test_inbound_messages_increment_counters(self):
+        from .models import Conversation, Message
+        from .tasks import process_inbound_message_task
+
+        with patch('messaging.services.ai_suggestions.ReplySuggestionService.schedule'):
+            for i in range(3):
+                process_inbound_message_task.apply(args=[{
+                    'tenant_id': str(self.tenant.id),
+                    'contact_phone': '+255700000001',
+                    'text': f'hello {i}',
+                    'message_id': f'wamid.{i}',
+                }])
+
+        conversation = Conversation.objects.get(tenant=self.tenant)
+        self.assertEqual(conversation.message_count, 3)
+        self.assertEqual(conversation.unread_count, 3)
+        self.assertIsNotNone(conversation.last_message_at)
+        self.assertEqual(Message.objects.filter(conversation=conversation).count(), 3)
+
+    @patch('messaging.tasks.flush_conversation_counters_task.apply_async')
+    def test_burst_is_flushed_once_and_survives_failed_flush(self, apply_async):
+        from unittest.mock import PropertyMock
+        from .models import Contact, Conversation
+        from .services.inbound import ConversationCounterBuffer
+
+        contact = Contact.objects.create(tenant=self.tenant, name='Burst', phone_e164='+255700000005')
+        conversation = Conversation.objects.create(tenant=self.tenant, contact=contact)
+        buffer = ConversationCounterBuffer(window=2)
+
+        with patch.object(ConversationCounterBuffer, 'coalescing', new_callable=PropertyMock, return_value=True):
+            for _ in range(5):
+                self.assertTrue(buffer.add(conversation.id))
+        # One flush is scheduled for the whole burst
+        apply_async.assert_called_once()
+
+        with patch.object(buffer, 'apply', side_effect=Exception('database unavailable')):
+            with self.assertRaises(Exception):
+                buffer.flush(conversation.id)
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.message_count, 0)
+
+        # The retried flush applies the whole burst, once
+        self.assertEqual(buffer.flush(conversation.id), 5)
+        self.assertEqual(buffer.flush(conversation.id), 0)
+        conversation.refresh_from_db()
+        self.assertEqual((conversation.message_count, conversation.unread_count), (5, 5))
+
+    def test_contact_stored_without_plus_is_reused(self):
+        from .models import Contact
+        from .services.inbound import conversation_lookup
+
+        contact = Contact.objects.create(tenant=self.tenant, name='Legacy', phone_e164='255700000004')
+
+        contact_id, _ = conversation_lookup.resolve(self.tenant.id, '+255700000004')
+
+        self.assertEqual(contact_id, str(contact.id))
+        self.assertEqual(Contact.objects.filter(tenant=self.tenant).count(), 1)
+        self.assertEqual(Contact.objects.get(id=contact.id).phone_e164, '+255700000004')
+
+
+class ReplySuggestionTests(TestCase):
+    """Suggestions are debounced per conversation and cached by context."""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from tenants.models import Tenant
+        from .models import Contact, Conversation
+
+        cache.clear()
+        self.tenant = Tenant.objects.create(name='Suggest Co', subdomain='suggest-co')
+        contact = Contact.objects.create(tenant=self.tenant, name='Asha', phone_e164='+255700000002')
+        self.conversation = Conversation.objects.create(tenant=self.tenant, contact=contact)
+
+    def _service(self):
+        from .services.ai import AIService
+        from .services.ai_suggestions import ReplySuggestionService
+
+        return ReplySuggestionService(ai_service=AIService(backend='local'), quiet_period=0)
+
+    def test_suggestions_cached_by_context(self):
+        from .models import Message
+
+        Message.objects.create(tenant=self.tenant, conversation=self.conversation, direction='in', text='Bei gani?')
+        service = self._service()
+
+        first, first_hit = service.suggest(self.conversation)
+        with patch.object(service.ai_service, 'suggest_reply') as model:
+            second, second_hit = service.suggest(self.conversation)
+            model.assert_not_called()
+
+        self.assertFalse(first_hit)
+        self.assertTrue(second_hit)
+        self.assertEqual(first, second)
+        self.assertEqual(len(first), 3)
+
+    def test_fallback_replies_not_cached(self):
+        from .models import Message
+
+        Message.objects.create(tenant=self.tenant, conversation=self.conversation, direction='in', text='Habari?')
+        service = self._service()
+
+        with patch.object(service.ai_service, '_call_model', side_effect=Exception('model down')):
+            fallback, _ = service.suggest(self.conversation)
+        _, hit = service.suggest(self.conversation)
+
+        self.assertEqual(fallback, service.ai_service.FALLBACK_REPLIES)
+        self.assertFalse(hit)
+
+    def test_older_run_is_superseded(self):
+        from .models import Message
+
+        first = Message.objects.create(tenant=self.tenant, conversation=self.conversation, direction='in', text='Hi')
+        second = Message.objects.create(tenant=self.tenant, conversation=self.conversation, direction='in', text='Are you there?')
+        service = self._service()
+
+        self.assertTrue(service.is_superseded(self.conversation, first.created_at.isoformat()))
+        self.assertFalse(service.is_superseded(self.conversation, second.created_at.isoformat()))
+
+
+class RollingSummaryTests(TestCase):
+    """Summaries only fold in messages after the high-water mark."""
+
+    def setUp(self):
+        from tenants.models import Tenant
+        from .models import Contact, Conversation
+
+        self.tenant = Tenant.objects.create(name='Summary Co', subdomain='summary-co')
+        contact = Contact.objects.create(tenant=self.tenant, name='Juma', phone_e164='+255700000003')
+        self.conversation = Conversation.objects.create(tenant=self.tenant, contact=contact)
+
+    def test_incremental_refresh(self):
+        from .models import Conversation, Message
+        from .services.ai import AIService
+        from .services.ai_summaries import RollingSummaryService
+
+        service = RollingSummaryService(ai_service=AIService(backend='local'), chunk_size=4)
+        for i in range(10):
+            Message.objects.create(tenant=self.tenant, conversation=self.conversation, direction='in', text=f'message {i}')
+
+        with patch.object(service.ai_service, 'update_summary', wraps=service.ai_service.update_summary) as update:
+            self.assertEqual(service.refresh(self.conversation), 10)
+            self.assertEqual(update.call_count, 3)
+
+        self.conversation = Conversation.objects.get(id=self.conversation.id)
+        self.assertIn('message 9', self.conversation.ai_summary)
+        self.assertEqual(service.refresh(self.conversation), 0)
+
+        Message.objects.create(tenant=self.tenant, conversation=self.conversation, direction='out', text='reply')
+        with patch.object(service.ai_service, 'update_summary', wraps=service.ai_service.update_summary) as update:
+            self.assertEqual(service.refresh(self.conversation), 1)
+            self.assertEqual(len(update.call_args[0][1]), 1)
+
+    def test_failed_update_does_not_advance_watermark(self):
+        from .models import Conversation, Message
+        from .services.ai import AIService
+        from .services.ai_summaries import RollingSummaryService
+
+        service = RollingSummaryService(ai_service=AIService(backend='local'), chunk_size=4)
+        for i in range(10):
+            Message.objects.create(tenant=self.tenant, conversation=self.conversation, direction='in', text=f'message {i}')
+
+        real_call = service.ai_service._call_model
+        calls = []
+
+        def flaky_model(prompt, **kwargs):
+            calls.append(prompt)
+            if len(calls) == 2:
+                raise Exception('model down')
+            return real_call(prompt, **kwargs)
+
+        with patch.object(service.ai_service, '_call_model', side_effect=flaky_model):
+            # The first chunk is kept; the failed one stops the run
+            self.assertEqual(service.refresh(self.conversation), 4)
+        self.assertEqual(len(calls), 2)
+
+        self.conversation = Conversation.objects.get(id=self.conversation.id)
+        self.assertEqual(self.conversation.ai_summary_through_id, Message.objects.get(text='message 3').id)
+        self.assertNotIn('message 4', self.conversation.ai_summary)
+
+        # Nothing is folded while the model keeps failing
+        with patch.object(service.ai_service, '_call_model', side_effect=Exception('model down')):
+            self.assertEqual(service.refresh(self.conversation), 0)
+        self.assertEqual(service.refresh(Conversation.objects.get(id=self.conversation.id)), 6)
+
+
+class InferenceClientTests(TestCase):
+    """The shared inference client batches prompts and fails fast when degraded."""
+
+    def test_batches_prompts(self):
+        from .services.inference import InferenceClient
+
+        payloads = []
+
+        def transport(payload):
+            payloads.append(payload)
+            if not isinstance(payload['inputs'], list):
+                return [{'generated_text': '{"replies": ["%s"]}' % payload['inputs']}]
+            return [[{'generated_text': '{"replies": ["%s"]}' % prompt}] for prompt in payload['inputs']]
+
+        client = InferenceClient(api_url='', api_key='', batch_size=8, batch_window=0.05, transport=transport)
+        self.addCleanup(client.close)
+        results = client.submit_many([f'p{i}' for i in range(5)], tenant_id='t1')
+
+        self.assertEqual([r['replies'][0] for r in results], [f'p{i}' for i in range(5)])
+        self.assertLess(len(payloads), 5)
+        self.assertEqual(client.stats()['requests'], 5)
+
+    def test_idle_tenant_slots_are_released(self):
+        import gc
+        from .services.inference import InferenceClient
+
+        def transport(payload):
+            return [{'generated_text': '{"replies": ["ok"]}'}]
+
+        client = InferenceClient(api_url='', api_key='', transport=transport)
+        self.addCleanup(client.close)
+        for i in range(20):
+            client.submit('hello', tenant_id=f'tenant-{i}')
+        gc.collect()
+        self.assertEqual(len(client._tenant_slots), 0)
+
+    def test_circuit_opens_after_failures(self):
+        from core.circuit_breaker import CircuitBreaker, CircuitOpenError
+        from .services.inference import InferenceClient
+
+        def transport(payload):
+            raise ConnectionError('endpoint down')
+
+        breaker = CircuitBreaker('test', failure_threshold=2, recovery_timeout=60)
+        client = InferenceClient(api_url='', api_key='', breaker=breaker, transport=transport)
+        self.addCleanup(client.close)
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                client.submit('hello')
+        with self.assertRaises(CircuitOpenError):
+            client.submit('hello')
+        self.assertEqual(client.stats()['rejected'], 1)
+
+
+class KeywordClassifierTests(TestCase):
+    """Language routing and canned replies use compiled per-tenant matchers."""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from tenants.models import Tenant
+        from .services.keywords import KeywordClassifier
+
+        cache.clear()
+        self.tenant = Tenant.objects.create(name='Keyword Co', subdomain='keyword-co')
+        self.classifier = KeywordClassifier()
+
+    def test_default_tables(self):
+        texts = ['Asante sana', 'Merci beaucoup', 'مرحبا', 'Thanks a lot', 'this is fine']
+        self.assertEqual(self.classifier.detect_languages(texts), ['sw', 'fr', 'ar', 'en', 'en'])
+        self.assertIn('pricing', self.classifier.auto_reply('What is the PRICE?', 'Acme'))
+        # Whole words only: "this" must not trigger the "hi" greeting
+        self.assertNotIn('Welcome', self.classifier.auto_reply('this is fine', 'Acme'))
+
+    def test_tenant_rules_take_priority_and_invalidate(self):
+        from .models import KeywordRule
+
+        self.assertEqual(self.classifier.detect_language('habari yako', self.tenant.id), 'en')
+        KeywordRule.objects.create(tenant=self.tenant, kind='language', label='sw', keywords=['habari'])
+        rule = KeywordRule.objects.create(
+            tenant=self.tenant, kind='auto_reply', label='delivery',
+            keywords=['delivery', 'usafirishaji'], reply_text='{tenant_name} delivers daily.', priority=1
+        )
+        self.classifier.invalidate(self.tenant.id)
+
+        self.assertEqual(self.classifier.detect_language('habari yako', self.tenant.id), 'sw')
+        self.assertEqual(
+            self.classifier.auto_reply('hi, delivery time?', 'Acme', self.tenant.id),
+            'Acme delivers daily.'
+        )
+        rule.delete()
+        self.classifier.invalidate(self.tenant.id)
+        self.assertIn('Welcome', self.classifier.auto_reply('hi, delivery time?', 'Acme', self.tenant.id))
+
+    def test_single_keyword_string_is_one_keyword(self):
+        from .models import KeywordRule
+
+        KeywordRule.objects.create(tenant=self.tenant, kind='language', label='sw', keywords='habari')
+        self.classifier.invalidate(self.tenant.id)
+
+        self.assertEqual(self.classifier.detect_language('habari yako', self.tenant.id), 'sw')
+        # Not one keyword per character
+        self.assertEqual(self.classifier.detect_language('a b c', self.tenant.id), 'en')
+
+
+class FlowEngineTests(TestCase):
+    """Active flows compile into per-tenant graphs evaluated on inbound messages."""
+
+    NODES = [
+        {'id': 'start', 'type': 'trigger', 'keywords': ['order', 'agiza'], 'next': 'tag'},
+        {'id': 'tag', 'type': 'add_tag', 'tag': 'buyer', 'next': 'check'},
+        {'id': 'check', 'type': 'condition', 'keywords': ['urgent'], 'then': 'fast', 'else': 'reply'},
+        {'id': 'fast', 'type': 'send_message', 'text': 'On it, {name}!', 'next': 'done'},
+        {'id': 'reply', 'type': 'send_message', 'text': 'Thanks {name}, we will call you.', 'next': 'done'},
+        {'id': 'done', 'type': 'end'},
+    ]
+
+    def setUp(self):
+        from django.core.cache import cache
+        from tenants.models import Tenant
+        from .models import Contact, Conversation, Flow
+        from .services.flows import FlowEngine
+
+        cache.clear()
+        self.tenant = Tenant.objects.create(name='Flow Co', subdomain='flow-co')
+        self.contact = Contact.objects.create(tenant=self.tenant, name='Neema', phone_e164='+255700000004')
+        self.conversation = Conversation.objects.create(tenant=self.tenant, contact=self.contact)
+        self.flow = Flow.objects.create(tenant=self.tenant, name='Orders', nodes=self.NODES, active=True)
+        self.engine = FlowEngine()
+
+    def test_compile_rejects_invalid_graph(self):
+        from .services.flows import FlowCompileError
+
+        self.flow.nodes = [{'id': 'start', 'type': 'trigger', 'keywords': ['x'], 'next': 'missing'}]
+        with self.assertRaises(FlowCompileError):
+            self.engine.compile(self.flow)
+
+    def test_inbound_message_runs_flow(self):
+        from .models import Flow, Message, OutboxMessage
+        from .tasks import send_message_task
+
+        fired = self.engine.process_inbound(self.tenant.id, self.contact.id, self.conversation.id, 'URGENT order please')
+        self.assertEqual(fired, [str(self.flow.id)])
+        self.assertEqual(self.engine.process_inbound(self.tenant.id, self.contact.id, self.conversation.id, 'hello'), [])
+
+        self.contact.refresh_from_db()
+        self.assertEqual(self.contact.tags, ['buyer'])
+        reply = Message.objects.get(conversation=self.conversation, direction='out')
+        self.assertEqual(reply.text, 'On it, Neema!')
+        # The send is recorded in the outbox with the reply
+        entry = OutboxMessage.objects.get(task_name=send_message_task.name)
+        self.assertEqual((entry.args, entry.tenant_id), ([str(reply.id)], self.tenant.id))
+        self.assertEqual(Flow.objects.get(id=self.flow.id).trigger_count, 1)
+
+    def test_edit_invalidates_graph(self):
+        self.assertEqual(len(self.engine.graph_for(self.tenant.id).flows), 1)
+        self.flow.deactivate()
+        self.engine.invalidate(self.tenant.id)
+        self.assertEqual(len(self.engine.graph_for(self.tenant.id).flows), 0)
+
+
+class MessagePaginationTests(TestCase):
+    """Message listings page by number by default and by cursor on request."""
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        from rest_framework.test import APIClient
+        from .models import Contact, Conversation, Message
+
+        user = get_user_model().objects.create_user(email='pages@example.com', password='pass12345')
+        contact = Contact.objects.create(
+            tenant=user.tenant, name='Pages', phone_e164='+255700000006', created_by=user
+        )
+        conversation = Conversation.objects.create(tenant=user.tenant, contact=contact)
+        for i in range(25):
+            Message.objects.create(tenant=user.tenant, conversation=conversation, direction='in', text=f'message {i}')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def test_page_size_only_applies_in_cursor_mode(self):
+        from django.conf import settings
+        from django.urls import reverse
+
+        url = reverse('message-list-create')
+        pages = self.client.get(url, {'page_size': 5}).data
+        self.assertEqual(len(pages['results']), min(25, settings.REST_FRAMEWORK['PAGE_SIZE']))
+
+        cursor = self.client.get(url, {'pagination': 'cursor', 'page_size': 5}).data
+        self.assertEqual(len(cursor['results']), 5)
+        self.assertIsNotNone(cursor['next'])
+
+    def test_invalid_cursor_is_a_bad_request(self):
+        from django.urls import reverse
+
+        response = self.client.get(reverse('message-list-create'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class RetentionPurgerTests(TestCase):
+    """Expired rows are purged in batches, honouring tenant policies."""
+
+    def setUp(self):
+        from tenants.models import Tenant
+        from .models import Message, RetentionPolicy
+
+        self.default_tenant = Tenant.objects.create(name='Default Co', subdomain='default-co')
+        self.long_tenant = Tenant.objects.create(name='Archive Co', subdomain='archive-co')
+        RetentionPolicy.objects.create(tenant=self.long_tenant, message_retention_days=90)
+
+        for tenant in (self.default_tenant, self.long_tenant):
+            for i in range(5):
+                Message.objects.create(tenant=tenant, direction='in', text=f'old {i}')
+            Message.objects.create(tenant=tenant, direction='in', text='new')
+        Message.objects.filter(text__startswith='old').update(created_at=timezone.now() - timedelta(days=60))
+
+    def test_purge_respects_tenant_policy_and_archives(self):
+        import gzip
+        import json
+        from django.core.files.storage import InMemoryStorage
+        from .models import Message
+        from .services.retention import RetentionArchiver, RetentionPurger
+
+        storage = InMemoryStorage()
+        archiver = RetentionArchiver(root='archive', storage=storage)
+        purger = RetentionPurger(batch_size=2, pause=0, archiver=archiver)
+
+        with self.settings(RETENTION_ARCHIVE_ENABLED=True):
+            self.assertEqual(purger.purge_messages(default_days=30), 5)
+
+        self.assertEqual(Message.objects.filter(tenant=self.default_tenant).count(), 1)
+        self.assertEqual(Message.objects.filter(tenant=self.long_tenant).count(), 6)
+
+        days, _ = storage.listdir(f'archive/messages/tenant={self.default_tenant.id}')
+        _, files = storage.listdir(f'archive/messages/tenant={self.default_tenant.id}/{days[0]}')
+        self.assertEqual(len(files), 3)
+        rows = []
+        for name in files:
+            with storage.open(f'archive/messages/tenant={self.default_tenant.id}/{days[0]}/{name}') as handle:
+                rows += [json.loads(line) for line in gzip.decompress(handle.read()).splitlines()]
+        self.assertEqual(sorted(row['text'] for row in rows), [f'old {i}' for i in range(5)])
+
+    def test_attachments_are_archived_before_delete(self):
+        import gzip
+        import json
+        from django.core.files.storage import InMemoryStorage
+        from .models import Attachment, Message
+        from .services.retention import RetentionArchiver, RetentionPurger
+
+        message = Message.objects.filter(tenant=self.default_tenant, text='old 0').get()
+        Attachment.objects.create(
+            message=message, file_name='invoice.pdf', file_size=1024, file_type='application/pdf',
+            file_url='https://files.example.com/invoice.pdf'
+        )
+        storage = InMemoryStorage()
+        purger = RetentionPurger(pause=0, archiver=RetentionArchiver(root='archive', storage=storage))
+
+        with self.settings(RETENTION_ARCHIVE_ENABLED=True):
+            purger.purge_messages(default_days=30)
+
+        self.assertFalse(Attachment.objects.exists())
+        root = f'archive/attachments/tenant={self.default_tenant.id}'
+        days, _ = storage.listdir(root)
+        _, files = storage.listdir(f'{root}/{days[0]}')
+        with storage.open(f'{root}/{days[0]}/{files[0]}') as handle:
+            rows = [json.loads(line) for line in gzip.decompress(handle.read()).splitlines()]
+        self.assertEqual([row['file_name'] for row in rows], ['invoice.pdf'])
+
+    def test_purges_are_not_scheduled_by_default(self):
+        from django.conf import settings
+
+        tasks = {entry['task'] for entry in settings.CELERY_BEAT_SCHEDULE.values()}
+        self.assertNotIn('messaging.tasks.cleanup_old_messages_task', tasks)
+        self.assertNotIn('messaging.tasks_sms.cleanup_old_sms_data_task', tasks)
+
+
+class PartitioningTests(TestCase):
+    """Partition helpers are inert on SQLite and name months consistently."""
+
+    def test_month_arithmetic(self):
+        from datetime import datetime, timezone as dt_timezone
+        from core import partitioning
+
+        december = partitioning.month_start(datetime(2025, 12, 17, 9, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual(partitioning.add_months(december, 1), datetime(2026, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(partitioning.add_months(december, 14), datetime(2027, 2, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(partitioning.partition_name('messages', december), 'messages_p202512')
+
+    def test_sqlite_fallback_is_noop(self):
+        from core import partitioning
+
+        with self.settings(DB_PARTITIONING_ENABLED=True):
+            self.assertFalse(partitioning.enabled())
+            self.assertEqual(partitioning.convert_all(), [])
+            self.assertEqual(partitioning.ensure_partitions(), 0)
+            self.assertEqual(partitioning.drop_partitions_before('messages', timezone.now()), [])
+
+
+class ExportServiceTests(TestCase):
+    """Exports stream rows and write background files to storage."""
+
+    def setUp(self):
+        from tenants.models import Tenant
+        from .models import Contact
+
+        self.tenant = Tenant.objects.create(name='Export Co', subdomain='export-co')
+        other = Tenant.objects.create(name='Other Co', subdomain='other-co')
+        for i in range(5):
+            Contact.objects.create(tenant=self.tenant, name=f'Contact {i}', phone_e164=f'+25570000010{i}', tags=['vip'])
+        Contact.objects.create(tenant=other, name='Hidden', phone_e164='+255700000199')
+
+    def test_stream_csv(self):
+        import csv
+        from .services.exports import ExportService
+
+        lines = list(ExportService(chunk_size=2).stream_csv('contacts', self.tenant, {}))
+        rows = list(csv.reader(lines))
+
+        self.assertEqual(rows[0][:3], ['id', 'name', 'phone_e164'])
+        self.assertEqual([row[1] for row in rows[1:]], [f'Contact {i}' for i in range(5)])
+        self.assertEqual(rows[1][4], 'vip')
+
+    def test_invalid_filter_fails_before_streaming(self):
+        from .services.exports import ExportError, ExportService
+
+        with self.assertRaises(ExportError):
+            ExportService().stream_csv('contacts', self.tenant, {'start_date': 'yesterday'})
+
+    def test_malformed_filter_value_is_rejected(self):
+        from django.contrib.auth import get_user_model
+        from django.urls import reverse
+        from rest_framework.test import APIClient
+        from .models import ExportJob
+        from .services.exports import ExportError, ExportService
+
+        with self.assertRaises(ExportError):
+            ExportService().stream_csv('contacts', self.tenant, {'is_active': 'foo'})
+
+        user = get_user_model().objects.create_user(email='filters@example.com', password='pass12345')
+        client = APIClient()
+        client.force_authenticate(user)
+        url = reverse('export-dataset', args=['contacts'])
+        self.assertEqual(client.get(url, {'is_active': 'foo'}).status_code, 400)
+        self.assertEqual(client.get(url, {'is_active': 'foo', 'background': 'true'}).status_code, 400)
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_formulas_are_escaped(self):
+        import csv
+        from .models import Contact
+        from .services.exports import ExportService, _xlsx_cell
+
+        Contact.objects.filter(tenant=self.tenant, name='Contact 0').update(
+            name='=HYPERLINK("http://evil.example","x")', tags=['@SUM(A1)']
+        )
+
+        rows = list(csv.reader(ExportService().stream_csv('contacts', self.tenant, {})))
+
+        self.assertEqual(rows[1][1], '\'=HYPERLINK("http://evil.example","x")')
+        self.assertEqual(rows[1][4], "'@SUM(A1)")
+        self.assertEqual(rows[2][1], 'Contact 1')
+        self.assertEqual(_xlsx_cell('-1+2'), "'-1+2")
+        self.assertEqual(_xlsx_cell(-12), -12)
+
+    def test_transactions_honour_date_range(self):
+        from decimal import Decimal
+        from billing.models import PaymentTransaction
+        from .services.exports import ExportService
+
+        for day, order_id in ((1, 'ORDER-MAY-01'), (15, 'ORDER-MAY-15')):
+            payment = PaymentTransaction.objects.create(
+                tenant=self.tenant, order_id=order_id, invoice_number=f'INV-{order_id}', zenopay_order_id=order_id,
+                amount=Decimal('1000.00'), currency='TZS', status='completed'
+            )
+            PaymentTransaction.objects.filter(id=payment.id).update(
+                created_at=timezone.make_aware(timezone.datetime(2026, 5, day, 12))
+            )
+
+        lines = ExportService().stream_csv(
+            'transactions', self.tenant, {'start_date': '2026-05-10', 'end_date': '2026-05-15'}
+        )
+
+        rows = list(lines)[1:]
+        self.assertEqual(len(rows), 1)
+        self.assertIn('2026-05-15', rows[0])
+
+    def test_invalid_transaction_dates_are_rejected(self):
+        from django.contrib.auth import get_user_model
+        from django.urls import reverse
+        from rest_framework.test import APIClient
+        from .models import ExportJob
+
+        user = get_user_model().objects.create_user(email='exports@example.com', password='pass12345')
+        client = APIClient()
+        client.force_authenticate(user)
+
+        response = client.get(
+            reverse('export-dataset', args=['transactions']), {'file_format': 'xlsx', 'start_date': '2026-13-01'}
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_background_job_writes_to_storage(self):
+        from django.core.files.storage import InMemoryStorage
+        from .models import ExportJob
+        from .services.exports import ExportService
+
+        storage = InMemoryStorage()
+        job = ExportJob.objects.create(tenant=self.tenant, dataset='contacts', file_format='csv')
+        with patch('messaging.services.exports.default_storage', storage):
+            ExportService(chunk_size=2).run_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.row_count, 5)
+        with storage.open(job.file_path) as handle:
+            self.assertEqual(len(handle.read().decode('utf-8').splitlines()), 6)
+
+    def test_xlsx_job_completes(self):
+        from django.core.files.storage import InMemoryStorage
+        from openpyxl import load_workbook
+        from .models import ExportJob
+        from .services.exports import ExportService
+
+        storage = InMemoryStorage()
+        job = ExportJob.objects.create(tenant=self.tenant, dataset='contacts', file_format='xlsx')
+        with patch('messaging.services.exports.default_storage', storage):
+            ExportService(chunk_size=2).run_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.row_count, 5)
+        with storage.open(job.file_path) as handle:
+            rows = list(load_workbook(handle, read_only=True).active.values)
+        self.assertEqual(rows[0][:3], ('id', 'name', 'phone_e164'))
+        self.assertEqual([row[1] for row in rows[1:]], [f'Contact {i}' for i in range(5)])
+
+    def test_xlsx_is_rejected_without_openpyxl(self):
+        import sys
+        from django.contrib.auth import get_user_model
+        from django.urls import reverse
+        from rest_framework.test import APIClient
+        from .models import ExportJob
+
+        user = get_user_model().objects.create_user(email='xlsx@example.com', password='pass12345')
+        client = APIClient()
+        client.force_authenticate(user)
+
+        with patch.dict(sys.modules, {'openpyxl': None}):
+            response = client.get(reverse('export-dataset', args=['contacts']), {'file_format': 'xlsx'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('openpyxl', response.data['message'])
+        self.assertFalse(ExportJob.objects.exists())
+
+
+class CostMeterTests(TestCase):
+    """Costs are aggregated in SQL and usage is read from a running counter."""
+
+    def setUp(self):
+        from tenants.models import Tenant
+        from .models import Message
+
+        self.tenant = Tenant.objects.create(name='Meter Co', subdomain='meter-co')
+        Message.objects.create(tenant=self.tenant, direction='out', provider='sms', text='a')
+        Message.objects.create(tenant=self.tenant, direction='out', provider='sms', text='b',
+                               media_url='https://example.com/a.png')
+        Message.objects.create(tenant=self.tenant, direction='out', provider='whatsapp', text='c')
+
+    def test_monthly_cost_by_provider(self):
+        from .services.costmeter import CostMeterService
+
+        with self.assertNumQueries(1):
+            report = CostMeterService().calculate_tenant_monthly_cost(self.tenant)
+
+        self.assertEqual(report['by_provider']['sms'], {'count': 2, 'cost_micro': 15000, 'cost_dollars': 0.015})
+        self.assertEqual(report['by_provider']['whatsapp']['cost_micro'], 1000)
+        self.assertEqual(report['by_provider']['telegram']['count'], 0)
+        self.assertEqual(report['total_cost_micro'], 16000)
+
+    def test_counter_tracks_new_messages(self):
+        from .models import Message
+        from .services.costmeter import CostMeterService
+
+        meter = CostMeterService()
+        self.assertEqual(meter.get_current_month_usage(self.tenant)['cost_micro'], 16000)
+
+        Message.objects.create(tenant=self.tenant, direction='out', provider='sms', text='d')
+        with self.assertNumQueries(1):
+            usage = meter.get_current_month_usage(self.tenant)
+        self.assertEqual(usage['messages_count'], 4)
+        self.assertEqual(usage['cost_micro'], 21000)
+
+    def test_reconcile_catches_bulk_inserts(self):
+        from .models import Message
+        from .services.costmeter import CostMeterService
+
+        meter = CostMeterService()
+        Message.objects.bulk_create([
+            Message(tenant=self.tenant, direction='out', provider='sms', text='bulk') for _ in range(3)
+        ])
+        self.assertEqual(meter.get_current_month_usage(self.tenant)['messages_count'], 3)
+
+        meter.reconcile(self.tenant)
+        self.assertEqual(meter.get_current_month_usage(self.tenant)['messages_count'], 6)
+        self.assertTrue(meter.check_usage_limits(self.tenant)['within_limits'])
+
+
+class TieredCacheTests(TestCase):
+    """The two-tier cache builds once, honours tags and counts lookups."""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+
+    def test_builds_once_and_serves_from_l1_then_l2(self):
+        from core.cache import TieredCache
+
+        tiered = TieredCache('test-tiers', ttl=60, l1_ttl=60)
+        calls = []
+
+        def build():
+            calls.append(1)
+            return {'value': len(calls)}
+
+        self.assertEqual(tiered.get_or_set('k', build), {'value': 1})
+        self.assertEqual(tiered.get_or_set('k', build), {'value': 1})
+        with tiered._lock:
+            tiered._l1.clear()
+        self.assertEqual(tiered.get_or_set('k', build), {'value': 1})
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((tiered.stats['misses'], tiered.stats['l1_hits'], tiered.stats['l2_hits']), (1, 1, 1))
+
+    def test_tag_invalidation_reaches_every_key(self):
+        from core.cache import TieredCache, invalidate_tags
+
+        tiered = TieredCache('test-tags', ttl=60)
+        tiered.get_or_set('a', lambda: 'old a', tags=['group'])
+        tiered.get_or_set('b', lambda: 'old b', tags=['group'])
+        tiered.get_or_set('c', lambda: 'old c', tags=['other'])
+
+        invalidate_tags('group')
+
+        self.assertEqual(tiered.get_or_set('a', lambda: 'new a', tags=['group']), 'new a')
+        self.assertEqual(tiered.get_or_set('b', lambda: 'new b', tags=['group']), 'new b')
+        self.assertEqual(tiered.get_or_set('c', lambda: 'new c', tags=['other']), 'old c')
+
+    def test_early_refresh_rebuilds_before_expiry(self):
+        from core.cache import TieredCache
+
+        tiered = TieredCache('test-refresh', ttl=60, l1_ttl=0, early_refresh=1)
+        tiered.get_or_set('k', lambda: 'first')
+        self.assertEqual(tiered.get_or_set('k', lambda: 'second'), 'second')
+        self.assertEqual(tiered.stats['refreshes'], 1)
+
+    def test_sender_ids_invalidate_on_save(self):
+        from tenants.models import Tenant
+        from .models_sms import SMSProvider, SMSSenderID
+        from .services.sms_validation import active_sender_ids
+
+        tenant = Tenant.objects.create(name='Cache Co', subdomain='cache-co')
+        provider = SMSProvider.objects.create(tenant=tenant, name='Beem', provider_type='beem')
+        self.assertEqual(active_sender_ids(tenant.id), [])
+
+        SMSSenderID.objects.create(tenant=tenant, provider=provider, sender_id='CACHECO', status='active')
+        self.assertEqual(active_sender_ids(tenant.id), ['CACHECO'])
+        with self.assertNumQueries(0):
+            active_sender_ids(tenant.id)
+
+    def test_tenant_middleware_caches_only_the_id(self):
+        from django.test import RequestFactory
+        from core.middleware import TenantMiddleware
+        from tenants.models import Tenant
+
+        tenant = Tenant.objects.create(name='Host Co', subdomain='host-co')
+        middleware = TenantMiddleware(lambda request: None)
+        request = RequestFactory().get('/api/messaging/messages/', HTTP_HOST='host-co.example.com')
+
+        middleware.process_request(request)
+        self.assertEqual(request.tenant, tenant)
+
+        # A change made elsewhere is seen on the next request, not a 10-minute-old copy
+        Tenant.objects.filter(id=tenant.id).update(name='Host Company')
+        with self.assertNumQueries(1):
+            middleware.process_request(request)
+        self.assertEqual(request.tenant.name, 'Host Company')
+
+
+class ProviderMetadataTests(TestCase):
+    """Provider data is served from storage and refreshed in the background."""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+
+    def test_read_serves_stale_and_queues_one_refresh(self):
+        from .services.provider_metadata import provider_metadata
+
+        with patch('messaging.tasks.refresh_provider_metadata_task.delay') as delay:
+            first = provider_metadata.read('balance')
+            provider_metadata.read('balance')
+
+        self.assertIsNone(first['data'])
+        self.assertTrue(first['stale'])
+        self.assertTrue(first['refreshing'])
+        delay.assert_called_once_with('balance')
+
+    def test_refresh_records_data_and_keeps_it_on_failure(self):
+        from .models import ProviderMetadata
+        from .services.provider_metadata import KINDS, provider_metadata
+
+        with patch.dict(KINDS, {'balance': (lambda scope: {'success': True, 'balance': 42}, 300, True)}):
+            self.assertTrue(provider_metadata.refresh('balance'))
+        entry = provider_metadata.read('balance', revalidate=False)
+        self.assertEqual(entry['data']['balance'], 42)
+        self.assertFalse(entry['stale'])
+
+        def fail(scope):
+            raise RuntimeError('Beem unavailable')
+
+        with patch.dict(KINDS, {'balance': (fail, 300, True)}):
+            self.assertFalse(provider_metadata.refresh('balance'))
+        row = ProviderMetadata.objects.get(key='balance')
+        self.assertEqual(row.data['balance'], 42)
+        self.assertEqual(row.last_error, 'Beem unavailable')
+
+
+class SendContextTests(TestCase):
+    """send_sms_task reuses the tenant's cached send context."""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from billing.models import SMSBalance
+        from tenants.models import Tenant
+        from .models import Contact, Conversation
+        from .models_sms import SMSProvider, SMSSenderID
+        from .services.send_context import send_contexts
+
+        cache.clear()
+        send_contexts.clear()
+        self.tenant = Tenant.objects.create(name='Send Co', subdomain='send-co')
+        self.provider = SMSProvider.objects.create(
+            tenant=self.tenant, name='Beem', provider_type='beem', is_default=True,
+            api_key='key', secret_key='secret', api_url='https://apisms.beem.africa/v1/send'
+        )
+        SMSSenderID.objects.create(tenant=self.tenant, provider=self.provider, sender_id='SENDCO', status='active')
+        SMSBalance.objects.create(tenant=self.tenant, credits=2)
+        contact = Contact.objects.create(tenant=self.tenant, name='Asha', phone_e164='+255700000001')
+        self.conversation = Conversation.objects.create(tenant=self.tenant, contact=contact)
+
+    def _message(self):
+        from .models import Message
+
+        return Message.objects.create(
+            tenant=self.tenant, conversation=self.conversation, direction='out', provider='sms', text='Hello'
+        )
+
+    @patch('messaging.tasks_sms.check_sms_delivery_task.apply_async')
+    @patch('messaging.services.sms_service.BeemSMSService.send_sms')
+    def test_cached_context_and_credit_reservation(self, send_sms, apply_async):
+        from billing.models import SMSBalance
+        from .models import Message
+        from .tasks_sms import send_sms_task
+
+        send_sms.return_value = {'success': True, 'message_id': 'beem-1', 'request_id': 'req-1'}
+        first, second, third = self._message(), self._message(), self._message()
+
+        send_sms_task.run(str(first.id), 'SENDCO')
+        # Message read, credit reservation, SMS claim insert (and its
+        # savepoint) and two status updates (no members, so no usage record)
+        with self.assertNumQueries(7):
+            send_sms_task.run(str(second.id), 'SENDCO')
+        send_sms_task.run(str(third.id), 'SENDCO')
+
+        self.assertEqual(Message.objects.get(id=second.id).status, 'sent')
+        self.assertEqual(Message.objects.get(id=third.id).status, 'failed')
+        self.assertEqual(SMSBalance.objects.get(tenant=self.tenant).credits, 0)
+        self.assertEqual(send_sms.call_count, 2)
+
+    @patch('messaging.services.sms_service.BeemSMSService.send_sms')
+    def test_sender_change_invalidates_context(self, send_sms):
+        from .models import Message
+        from .models_sms import SMSSenderID
+        from .tasks_sms import send_sms_task
+
+        send_sms.return_value = {'success': False, 'error': 'Rejected'}
+        message = self._message()
+        send_sms_task.run(str(message.id), 'NEWSENDER')
+        self.assertIn('not registered', Message.objects.get(id=message.id).error_message)
+
+        SMSSenderID.objects.create(tenant=self.tenant, provider=self.provider, sender_id='NEWSENDER', status='active')
+        send_sms_task.run(str(message.id), 'NEWSENDER')
+        self.assertEqual(Message.objects.get(id=message.id).error_message, 'Rejected')
+
+
+@override_settings(BEEM_API_KEY='key', BEEM_SECRET_KEY='secret')
+class BulkSendPipelineTests(TestCase):
+    """Bulk sends are stored in one transaction and sent by a worker."""
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        from billing.models import SMSBalance
+        from tenants.models import Tenant
+        from .models_sms import SMSProvider, SMSSenderID
+
+        self.tenant = Tenant.objects.create(name='Bulk Co', subdomain='bulk-co')
+        SMSBalance.objects.create(tenant=self.tenant, credits=10)
+        self.user = get_user_model().objects.create_user(email='bulk@example.com', password='pass12345')
+        self.provider = SMSProvider.objects.create(
+            tenant=self.tenant, name='Beem', provider_type='beem', is_default=True,
+            api_key='key', secret_key='secret', api_url='https://apisms.beem.africa/v1/send'
+        )
+        self.sender = SMSSenderID.objects.create(
+            tenant=self.tenant, provider=self.provider, sender_id='BULKCO', status='active'
+        )
+
+    def _enqueue(self):
+        from .services.bulk_send import bulk_send_pipeline
+
+        blocks = [
+            {'message': 'Hello', 'recipients': ['255700000001', '255700000002'], 'sender': self.sender, 'encoding': 0},
+            {'message': 'Habari', 'recipients': ['255700000003'], 'sender': self.sender, 'encoding': 0},
+        ]
+        return bulk_send_pipeline.enqueue(self.tenant, self.user, self.provider, blocks)
+
+    def test_enqueue_stores_queued_messages(self):
+        from billing.models import SMSBalance
+        from .models import OutboxMessage
+        from .models_sms import SMSMessage
+
+        with patch('messaging.services.beem_sms.BeemSMSService.send_sms') as send_sms:
+            job = self._enqueue()
+        send_sms.assert_not_called()
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(job.total_recipients, 3)
+        self.assertEqual(SMSMessage.objects.filter(tenant=self.tenant, status='queued').count(), 2)
+        # The worker's task is recorded in the same transaction
+        self.assertEqual(OutboxMessage.objects.get().args, [str(job.id)])
+        # A credit per recipient is reserved up front
+        self.assertEqual(SMSBalance.objects.get(tenant=self.tenant).credits, 7)
+
+    def test_send_bulk_view_requires_credits(self):
+        from django.core.cache import cache
+        from django.urls import reverse
+        from rest_framework.test import APIClient
+        from billing.models import SMSBalance
+        from .models_sms import SMSMessage, SMSProvider, SMSSenderID
+
+        cache.clear()
+        tenant = self.user.tenant
+        SMSBalance.objects.update_or_create(tenant=tenant, defaults={'credits': 0})
+        provider = SMSProvider.objects.create(
+            tenant=tenant, name='Beem', provider_type='beem', is_default=True,
+            api_key='key', secret_key='secret', api_url='https://apisms.beem.africa/v1/send'
+        )
+        SMSSenderID.objects.create(tenant=tenant, provider=provider, sender_id='BULKCO', status='active')
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.post(reverse('sms-send-bulk'), {
+            'messages': [{'message': 'Hello', 'recipients': ['255712000001', '255712000002'], 'sender_id': 'BULKCO'}]
+        }, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error_code'], 'INSUFFICIENT_CREDITS')
+        self.assertFalse(SMSMessage.objects.filter(tenant=tenant).exists())
+
+    @patch('messaging.services.beem_sms.BeemSMSService.send_sms')
+    def test_dispatch_records_results(self, send_sms):
+        from billing.models import SMSBalance
+        from .models import Message
+        from .models_sms import SMSMessage
+        from .services.bulk_send import bulk_send_pipeline
+
+        def fake_send(message, **kwargs):
+            if message == 'Habari':
+                return {'success': False, 'error': 'Rejected'}
+            return {'success': True, 'response': {'request_id': 1}, 'cost_estimate': 0.05}
+
+        send_sms.side_effect = fake_send
+        job = bulk_send_pipeline.dispatch(self._enqueue())
+
+        self.assertEqual(job.status, 'partial')
+        self.assertEqual((job.sent_messages, job.failed_messages), (1, 1))
+        self.assertEqual(job.errors[0]['error'], 'Rejected')
+        self.assertEqual(SMSMessage.objects.filter(status='sent').count(), 1)
+        self.assertEqual(Message.objects.filter(tenant=self.tenant, status='failed').count(), 1)
+        # The failed message's credit is given back
+        self.assertEqual(SMSBalance.objects.get(tenant=self.tenant).credits, 8)
+
+        # A second run finds nothing left to send
+        bulk_send_pipeline.dispatch(job)
+        self.assertEqual(send_sms.call_count, 2)
+
+    @patch('messaging.services.beem_sms.BeemSMSService.send_sms')
+    def test_dispatch_claims_messages_and_saves_each_batch(self, send_sms):
+        from requests.exceptions import ConnectionError
+        from .models_sms import SMSMessage
+        from .services.bulk_send import BulkSendPipeline
+        from .services.provider_health import TransientProviderError
+
+        def fake_send(message, **kwargs):
+            if message == 'Habari':
+                raise ConnectionError('Connection reset')
+            return {'success': True, 'response': {'request_id': 1}, 'cost_estimate': 0.05}
+
+        send_sms.side_effect = fake_send
+        job = self._enqueue()
+        pipeline = BulkSendPipeline(batch_size=1)
+        with self.assertRaises(TransientProviderError):
+            pipeline.dispatch(job)
+
+        # The first batch is saved even though the second is deferred
+        self.assertEqual(SMSMessage.objects.get(base_message__text='Hello').status, 'sent')
+        self.assertEqual(SMSMessage.objects.get(base_message__text='Habari').status, 'queued')
+
+        # A message another worker has claimed is not sent again
+        SMSMessage.objects.filter(base_message__text='Habari').update(status='pending')
+        send_sms.reset_mock()
+        pipeline.dispatch(job)
+        send_sms.assert_not_called()
+
+
+class TransactionalOutboxTests(TestCase):
+    """Tasks are published from the outbox only after commit."""
+
+    def setUp(self):
+        from tenants.models import Tenant
+
+        self.tenant = Tenant.objects.create(name='Outbox Co', subdomain='outbox-co')
+
+    def _producer(self):
+        from contextlib import nullcontext
+
+        return patch('celery.app.base.Celery.producer_or_acquire', return_value=nullcontext(None))
+
+    @patch('messaging.tasks.send_message_task.apply_async')
+    def test_published_after_commit(self, apply_async):
+        from django.db import transaction
+        from .models import OutboxMessage
+        from .services.outbox import outbox
+        from .tasks import send_message_task
+
+        with self._producer(), self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                outbox.enqueue(send_message_task, 'message-1', tenant=self.tenant)
+                apply_async.assert_not_called()
+
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args.kwargs['args'], ['message-1'])
+        self.assertIsNotNone(OutboxMessage.objects.get().published_at)
+
+    def test_rolled_back_entries_are_never_published(self):
+        from django.db import transaction
+        from .models import OutboxMessage
+        from .services.outbox import outbox
+        from .tasks import send_message_task
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    outbox.enqueue(send_message_task, 'message-1', tenant=self.tenant)
+                    raise RuntimeError('rollback')
+
+        self.assertEqual(callbacks, [])
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    @patch('messaging.tasks.send_message_task.apply_async')
+    def test_relay_retries_failed_publishes(self, apply_async):
+        from .models import OutboxMessage
+        from .services.outbox import TransactionalOutbox
+        from .tasks import send_message_task
+
+        relay = TransactionalOutbox(batch_size=2)
+        for i in range(3):
+            relay.enqueue(send_message_task, f'message-{i}', tenant=self.tenant)
+
+        apply_async.side_effect = ConnectionError('broker down')
+        with self._producer():
+            self.assertEqual(relay.drain(), 0)
+        self.assertEqual(OutboxMessage.objects.filter(attempts=1, published_at__isnull=True).count(), 2)
+
+        apply_async.side_effect = None
+        OutboxMessage.objects.update(available_at=timezone.now())
+        with self._producer():
+            self.assertEqual(relay.drain(), 3)
+        self.assertFalse(OutboxMessage.objects.filter(published_at__isnull=True).exists())
+
+
+class ProviderHealthTests(TestCase):
+    """Provider failures are classified, trip breakers and are retried only when worth it."""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from billing.models import SMSBalance
+        from tenants.models import Tenant
+        from .models import Contact, Conversation
+        from .models_sms import SMSProvider, SMSSenderID
+        from .services.provider_health import provider_health
+        from .services.send_context import send_contexts
+
+        cache.clear()
+        send_contexts.clear()
+        provider_health._breakers.clear()
+        self.tenant = Tenant.objects.create(name='Health Co', subdomain='health-co')
+        provider = SMSProvider.objects.create(
+            tenant=self.tenant, name='Beem', provider_type='beem', is_default=True,
+            api_key='key', secret_key='secret', api_url='https://apisms.beem.africa/v1/send'
+        )
+        SMSSenderID.objects.create(tenant=self.tenant, provider=provider, sender_id='HEALTH', status='active')
+        SMSBalance.objects.create(tenant=self.tenant, credits=5)
+        contact = Contact.objects.create(tenant=self.tenant, name='Juma', phone_e164='+255700000009')
+        self.conversation = Conversation.objects.create(tenant=self.tenant, contact=contact)
+
+    def tearDown(self):
+        from .services.provider_health import provider_health
+
+        provider_health._breakers.clear()
+
+    def _message(self):
+        from .models import Message
+
+        return Message.objects.create(
+            tenant=self.tenant, conversation=self.conversation, direction='out', provider='sms', text='Hello'
+        )
+
+    def test_classification(self):
+        from .services.provider_health import PERMANENT, TRANSIENT, classify
+
+        self.assertEqual(classify(101), PERMANENT)
+        self.assertEqual(classify('102'), TRANSIENT)
+        self.assertEqual(classify(None, 503), TRANSIENT)
+        self.assertEqual(classify(None, 400), PERMANENT)
+        self.assertEqual(classify('NETWORK_ERROR'), TRANSIENT)
+
+    def test_open_circuit_is_shared_between_workers(self):
+        from core.circuit_breaker import CircuitOpenError
+        from .services.provider_health import BEEM_SEND, PERMANENT, TRANSIENT, ProviderHealth
+
+        worker, other_worker = ProviderHealth(failure_threshold=2), ProviderHealth(failure_threshold=2)
+        worker.record(BEEM_SEND, PERMANENT)
+        worker.record(BEEM_SEND, TRANSIENT)
+        worker.check(BEEM_SEND)
+        worker.record(BEEM_SEND, TRANSIENT)
+
+        with self.assertRaises(CircuitOpenError):
+            other_worker.check(BEEM_SEND)
+
+    @patch('messaging.services.sms_service.BeemSMSService.send_sms')
+    def test_open_circuit_defers_without_calling_beem(self, send_sms):
+        from core.circuit_breaker import CircuitOpenError
+        from billing.models import SMSBalance
+        from .models import Message
+        from .services.provider_health import BEEM_SEND, TRANSIENT, provider_health
+        from .tasks_sms import send_sms_task
+
+        for _ in range(provider_health.failure_threshold):
+            provider_health.record(BEEM_SEND, TRANSIENT)
+        message = self._message()
+
+        with self.assertRaises(CircuitOpenError):
+            send_sms_task.run(str(message.id), 'HEALTH')
+
+        send_sms.assert_not_called()
+        self.assertEqual(Message.objects.get(id=message.id).status, 'queued')
+        self.assertEqual(SMSBalance.objects.get(tenant=self.tenant).credits, 5)
+
+    @patch('messaging.tasks_sms.check_sms_delivery_task.apply_async')
+    @patch('messaging.services.sms_service.BeemSMSService.send_sms')
+    def test_transient_failure_is_retried_once_sent(self, send_sms, apply_async):
+        from billing.models import SMSBalance
+        from .models_sms import SMSMessage
+        from .services.provider_health import TransientProviderError
+        from .tasks_sms import send_sms_task
+
+        message = self._message()
+        send_sms.return_value = {'success': False, 'error': 'Timed out', 'error_code': 'NETWORK_ERROR'}
+        with self.assertRaises(TransientProviderError):
+            send_sms_task.run(str(message.id), 'HEALTH')
+        self.assertEqual(SMSMessage.objects.get(base_message=message).status, 'queued')
+        self.assertEqual(SMSBalance.objects.get(tenant=self.tenant).credits, 5)
+
+        send_sms.return_value = {'success': True, 'message_id': 'beem-1', 'request_id': 'req-1'}
+        send_sms_task.run(str(message.id), 'HEALTH')
+        # A duplicate delivery of the task does not send again
+        send_sms_task.run(str(message.id), 'HEALTH')
+
+        self.assertEqual(send_sms.call_count, 2)
+        self.assertEqual(SMSMessage.objects.get(base_message=message).status, 'sent')
+        self.assertEqual(SMSBalance.objects.get(tenant=self.tenant).credits, 4)
+
+    def test_outage_deferrals_do_not_use_up_retries(self):
+        from types import SimpleNamespace
+        from celery.exceptions import Retry
+        from core.circuit_breaker import CircuitOpenError
+        from .services.provider_health import RetryPolicy, TransientProviderError
+
+        policy = RetryPolicy(max_retries=3, outage_deferrals=5)
+        task = SimpleNamespace(name='send', request=SimpleNamespace(id='task-1', retries=0))
+        task.retry = lambda **options: Retry()
+
+        for _ in range(5):
+            with self.assertRaises(Retry):
+                policy.retry(task, CircuitOpenError('beem:send', 30))
+            task.request.retries += 1
+        # The outage is over; transient failures still get all their retries
+        for _ in range(3):
+            with self.assertRaises(Retry):
+                policy.retry(task, TransientProviderError('Timed out'))
+            task.request.retries += 1
+        self.assertIsNone(policy.retry(task, TransientProviderError('Timed out')))
+
+        # Deferrals have their own limit
+        task.request.id, task.request.retries = 'task-2', 0
+        for _ in range(5):
+            with self.assertRaises(Retry):
+                policy.retry(task, CircuitOpenError('beem:send', 30))
+            task.request.retries += 1
+        self.assertIsNone(policy.retry(task, CircuitOpenError('beem:send', 30)))
+
+
+class TaskRoutingTests(TestCase):
+    """Tasks land on the queue for their priority."""
+
+    def _queue(self, task_name, **options):
+        from mifumo.celery import app
+
+        return app.amqp.router.route(options, task_name, (), {})['queue'].name
+
+    def test_routes(self):
+        self.assertEqual(self._queue('messaging.tasks_sms.send_sms_task'), 'transactional')
+        self.assertEqual(self._queue('messaging.tasks_sms.send_sms_task', queue='bulk'), 'bulk')
+        self.assertEqual(self._queue('messaging.tasks.send_campaign_messages_task'), 'bulk')
+        self.assertEqual(self._queue('messaging.tasks_sms.check_sms_delivery_task'), 'dlr')
+        self.assertEqual(self._queue('messaging.tasks.ai_suggest_reply_task'), 'ai')
+        self.assertEqual(self._queue('messaging.tasks.cleanup_old_messages_task'), 'maintenance')
+
+    @patch('messaging.tasks_sms.send_sms_task.apply_async')
+    def test_outbox_keeps_queue_override(self, apply_async):
+        from contextlib import nullcontext
+        from .services.outbox import TransactionalOutbox
+        from .tasks_sms import send_sms_task
+
+        relay = TransactionalOutbox()
+        relay.enqueue(send_sms_task, 'message-1', 'SENDER', queue='bulk')
+        with patch('celery.app.base.Celery.producer_or_acquire', return_value=nullcontext(None)):
+            relay.drain()
+
+        self.assertEqual(apply_async.call_args.kwargs['queue'], 'bulk')
+
+
+class SchedulerTests(TestCase):
+    """Schedules fire once per occurrence, on the tenant's wall clock."""
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        from tenants.models import Tenant
+        from .models import Campaign
+
+        self.tenant = Tenant.objects.create(name='Schedule Co', subdomain='schedule-co', timezone='Europe/London')
+        self.user = get_user_model().objects.create_user(email='schedule@example.com', password='pass12345')
+        self.campaign = Campaign.objects.create(
+            created_by=self.user, name='Weekly promo', message_text='Hello', status='scheduled'
+        )
+
+    def _schedule(self, start, frequency='daily', **fields):
+        from .models_sms import SMSSchedule
+        from .services.scheduler import upcoming_run
+
+        schedule = SMSSchedule(
+            tenant=self.tenant, campaign=self.campaign, name='Promo', frequency=frequency, start_date=start, **fields
+        )
+        schedule.next_run = upcoming_run(schedule, start)
+        schedule.save()
+        return schedule
+
+    def _utc(self, *args):
+        from datetime import datetime, timezone as dt_timezone
+
+        return datetime(*args, tzinfo=dt_timezone.utc)
+
+    def test_monthly_on_the_31st_clamps_to_month_end(self):
+        from .services.scheduler import upcoming_run
+
+        schedule = self._schedule(self._utc(2027, 1, 31, 9), frequency='monthly', time_zone='Africa/Dar_es_Salaam')
+        runs = [schedule.next_run]
+        for _ in range(3):
+            runs.append(upcoming_run(schedule, runs[-1], inclusive=False))
+
+        self.assertEqual([run.date().isoformat() for run in runs], ['2027-01-31', '2027-02-28', '2027-03-31', '2027-04-30'])
+
+    def test_wall_clock_time_is_kept_across_dst(self):
+        from .services.scheduler import upcoming_run
+
+        # 09:00 GMT the day before the clocks go forward
+        schedule = self._schedule(self._utc(2026, 3, 28, 9))
+        after_change = upcoming_run(schedule, schedule.next_run, inclusive=False)
+
+        self.assertEqual(after_change, self._utc(2026, 3, 29, 8))
+
+    def test_custom_recurrence_rule(self):
+        from .services.scheduler import ScheduleError, upcoming_run
+
+        # Monday 2026-10-19, 10:00 London
+        schedule = self._schedule(self._utc(2026, 10, 19, 9), frequency='custom', recurrence='FREQ=WEEKLY;BYDAY=MO,TH')
+        self.assertEqual(upcoming_run(schedule, schedule.next_run, inclusive=False), self._utc(2026, 10, 22, 9))
+
+        schedule.recurrence = 'FREQ=FORTNIGHTLY'
+        with self.assertRaises(ScheduleError):
+            upcoming_run(schedule, schedule.start_date)
+
+    def test_due_schedule_fires_once(self):
+        from .models import OutboxMessage
+        from .models_sms import SMSSchedule
+        from .services.scheduler import CampaignScheduler
+
+        now = timezone.now()
+        schedule = self._schedule(now - timedelta(days=3, minutes=5))
+        node_a, node_b = CampaignScheduler(), CampaignScheduler()
+
+        claimed = node_a.claim_due(now)
+        # Leased to node A
+        self.assertEqual(node_b.claim_due(now), [])
+        self.assertTrue(node_a.fire(claimed[0], now))
+        # A stale copy of the schedule cannot fire it again
+        self.assertFalse(node_b.fire(claimed[0], now))
+        self.assertEqual(node_b.run(now), 0)
+
+        schedule = SMSSchedule.objects.get(id=schedule.id)
+        self.assertEqual(schedule.run_count, 1)
+        self.assertIsNone(schedule.locked_until)
+        # Missed occurrences are skipped, not replayed
+        self.assertGreater(schedule.next_run, now)
+        self.assertEqual(OutboxMessage.objects.filter(task_name='messaging.tasks.send_campaign_messages_task').count(), 1)
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.status, 'running')
+
+    def test_once_schedule_deactivates(self):
+        from .models_sms import SMSSchedule
+        from .services.scheduler import campaign_scheduler
+
+        now = timezone.now()
+        schedule = self._schedule(now - timedelta(minutes=1), frequency='once')
+        self.assertEqual(campaign_scheduler.run(now), 1)
+
+        schedule = SMSSchedule.objects.get(id=schedule.id)
+        self.assertFalse(schedule.is_active)
+        self.assertIsNone(schedule.next_run)
+
+    def test_migration_sets_next_run_for_existing_schedules(self):
+        from importlib import import_module
+        from django.apps import apps
+        from .models_sms import SMSSchedule
+
+        migration = import_module('messaging.migrations.0026_sms_schedule_next_run')
+        start = self._utc(2030, 1, 7, 9)
+        daily = SMSSchedule.objects.create(
+            tenant=self.tenant, campaign=self.campaign, name='Daily', frequency='daily', start_date=start
+        )
+        ran = SMSSchedule.objects.create(
+            tenant=self.tenant, campaign=self.campaign, name='Weekly', frequency='weekly',
+            start_date=start - timedelta(days=14), last_run=start - timedelta(days=7)
+        )
+        broken = SMSSchedule.objects.create(
+            tenant=self.tenant, campaign=self.campaign, name='Broken', frequency='custom', start_date=start
+        )
+
+        migration.compute_next_run(apps, None)
+
+        self.assertEqual(SMSSchedule.objects.get(id=daily.id).next_run, start)
+        self.assertEqual(SMSSchedule.objects.get(id=ran.id).next_run, start)
+        broken = SMSSchedule.objects.get(id=broken.id)
+        self.assertFalse(broken.is_active)
+        self.assertIsNone(broken.next_run)
+
+
+class CampaignStagingTests(TestCase):
+    """Scheduled campaigns are rendered ahead of time and only dispatched when due."""
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        from .models import Campaign, Contact
+
+        self.user = get_user_model().objects.create_user(email='staging@example.com', password='pass12345')
+        self.tenant = self.user.tenant
+        now = timezone.now()
+        self.contacts = [
+            Contact.objects.create(
+                tenant=self.tenant, name=f'Contact {i}', phone_e164=f'+25571100000{i}', opt_in_at=now
+            )
+            for i in range(3)
+        ]
+        # Never opted in
+        Contact.objects.create(tenant=self.tenant, name='Cold', phone_e164='+255711000009')
+        self.run_at = now + timedelta(minutes=10)
+        self.campaign = Campaign.objects.create(
+            created_by=self.user, name='Launch', message_text='Hi {name}, we are live', status='scheduled',
+            scheduled_at=self.run_at
+        )
+
+    def test_dispatch_rechecks_opt_outs(self):
+        from .models import Message, OutboxMessage
+        from .services.campaign_staging import campaign_stager
+
+        stage = campaign_stager.stage(self.campaign, self.run_at)
+        self.assertEqual(stage.total_recipients, 3)
+        self.assertEqual(
+            sorted(Message.objects.filter(status='staged').values_list('text', flat=True)),
+            [f'Hi Contact {i}, we are live' for i in range(3)]
+        )
+        self.assertFalse(OutboxMessage.objects.exists())
+
+        self.contacts[0].opt_out('STOP')
+        stage = campaign_stager.dispatch(self.campaign, self.run_at)
+
+        self.assertEqual((stage.dispatched_count, stage.suppressed_count), (2, 1))
+        self.assertEqual(Message.objects.filter(status='queued').count(), 2)
+        self.assertEqual(Message.objects.get(conversation__contact=self.contacts[0]).status, 'failed')
+        self.assertEqual(set(OutboxMessage.objects.values_list('queue', flat=True)), {'bulk'})
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+        # A duplicate fire does not send again
+        self.assertIsNone(campaign_stager.dispatch(self.campaign, self.run_at))
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+
+    @patch('messaging.tasks_sms.check_sms_delivery_task.apply_async')
+    @patch('messaging.services.sms_service.BeemSMSService.send_sms')
+    def test_sms_campaign_is_sent_through_sms_path(self, send_sms, check_delivery):
+        from billing.models import SMSBalance
+        from .models import Message, OutboxMessage
+        from .models_sms import SMSMessage, SMSProvider, SMSSenderID
+        from .services.campaign_staging import campaign_stager
+        from .services.send_context import invalidate_send_context
+        from .tasks_sms import send_sms_task
+
+        SMSBalance.objects.filter(tenant=self.tenant).update(credits=10)
+        provider = SMSProvider.objects.create(
+            tenant=self.tenant, name='Beem', provider_type='beem', is_default=True,
+            api_key='key', secret_key='secret', api_url='https://apisms.beem.africa/v1/send'
+        )
+        SMSSenderID.objects.create(tenant=self.tenant, provider=provider, sender_id='LAUNCH', status='active')
+        invalidate_send_context(self.tenant.id)
+        send_sms.return_value = {'success': True, 'message_id': 'beem-1', 'request_id': 'req-1', 'response': {}}
+
+        campaign_stager.dispatch(self.campaign, self.run_at)
+        entries = OutboxMessage.objects.all()
+        self.assertEqual({entry.task_name for entry in entries}, {send_sms_task.name})
+        for entry in entries:
+            self.assertEqual(entry.args[1], 'LAUNCH')
+            send_sms_task.run(*entry.args)
+
+        self.assertEqual(send_sms.call_count, 3)
+        self.assertEqual(set(Message.objects.values_list('status', flat=True)), {'sent'})
+        self.assertEqual(SMSMessage.objects.filter(status='sent').count(), 3)
+
+    def test_usage_is_counted_at_dispatch(self):
+        from .models import Message, TenantUsageCounter
+        from .services.campaign_staging import campaign_stager
+        from .services.costmeter import cost_meter
+
+        def counted():
+            counter = TenantUsageCounter.objects.filter(tenant=self.tenant, period=cost_meter.current_period()).first()
+            return counter.messages_count if counter else 0
+
+        stage = campaign_stager.stage(self.campaign, self.run_at)
+        self.assertEqual(counted(), 0)
+        # Staged messages stay out of listings
+        self.assertEqual(cost_meter.month_messages(self.tenant).count(), 0)
+
+        campaign_stager.discard(stage)
+        self.assertEqual(counted(), 0)
+
+        self.contacts[0].opt_out('STOP')
+        campaign_stager.dispatch(self.campaign, self.run_at)
+        self.assertEqual(counted(), Message.objects.exclude(status='staged').count())
+        self.assertEqual(Message.objects.filter(status='queued').count(), 2)
+
+    def test_staged_messages_are_hidden_from_listings(self):
+        from django.urls import reverse
+        from rest_framework.test import APIClient
+        from .services.campaign_staging import campaign_stager
+
+        self.contacts[0].created_by = self.user
+        self.contacts[0].save()
+        campaign_stager.stage(self.campaign, self.run_at)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        def listed():
+            response = client.get(reverse('message-list-create'))
+            self.assertEqual(response.status_code, 200)
+            return len(response.data['results'])
+
+        self.assertEqual(listed(), 0)
+        campaign_stager.dispatch(self.campaign, self.run_at)
+        self.assertEqual(listed(), 1)
+
+    def test_edited_campaign_is_restaged(self):
+        from .models import Message
+        from .services.campaign_staging import campaign_stager
+
+        campaign_stager.stage(self.campaign, self.run_at)
+        self.campaign.message_text = 'Hi {name}, new date'
+        self.campaign.save()
+        campaign_stager.dispatch(self.campaign, self.run_at)
+
+        self.assertEqual(Message.objects.count(), 3)
+        self.assertTrue(all(text.endswith('new date') for text in Message.objects.values_list('text', flat=True)))
+
+    def test_upcoming_runs_within_lead_time(self):
+        from .models import Campaign
+        from .services.campaign_staging import CampaignStager
+
+        Campaign.objects.create(
+            created_by=self.user, name='Later', message_text='Later on', status='scheduled',
+            scheduled_at=timezone.now() + timedelta(hours=3)
+        )
+        stager = CampaignStager(lead_minutes=30)
+
+        self.assertEqual([campaign for campaign, _ in stager.upcoming_runs()], [self.campaign])
+        self.assertEqual(stager.stage_upcoming(), 1)
+        self.assertEqual(stager.upcoming_runs(), [])
+
+    @patch('messaging.tasks.send_message_task.apply_async')
+    def test_scheduled_campaign_fires_once(self, apply_async):
+        from .models import Campaign, OutboxMessage
+        from .services.scheduler import CampaignScheduler
+        from .tasks import send_campaign_messages_task
+
+        scheduler = CampaignScheduler()
+        fire_time = self.run_at + timedelta(seconds=5)
+        self.assertEqual(scheduler.fire_scheduled_campaigns(fire_time), 1)
+        self.assertEqual(scheduler.fire_scheduled_campaigns(fire_time), 0)
+
+        entry = OutboxMessage.objects.get(task_name=send_campaign_messages_task.name)
+        self.assertEqual(entry.tenant, self.tenant)
+        send_campaign_messages_task.run(*entry.args)
+
+        campaign = Campaign.objects.get(id=self.campaign.id)
+        self.assertEqual(campaign.status, 'completed')
+        self.assertEqual(campaign.sent_count, 3)
+
+
+class TemplatingTests(TestCase):
+    """Templates compile once and report each message's encoding and length."""
+
+    def test_placeholders_and_defaults(self):
+        from .services.templating import compile_template
+
+        template = compile_template('Hi {{ first_name|there }}, {city} office: {{ city }}. 100% free')
+        self.assertEqual(template.variables, ('first_name', 'city'))
+
+        rendered = template.render_many([{'first_name': 'Amina', 'city': 'Arusha'}, {'city': 'Mwanza'}])
+        self.assertEqual(
+            [message.text for message in rendered],
+            ['Hi Amina, Arusha office: Arusha. 100% free', 'Hi there, Mwanza office: Mwanza. 100% free']
+        )
+
+    def test_encoding_and_segments(self):
+        from .services.templating import GSM7, UCS2, compile_template
+
+        template = compile_template('{body}')
+        rendered = template.render_many([
+            {'body': 'a' * 160},
+            {'body': 'a' * 161},
+            # Extension characters take two septets
+            {'body': '€' * 80},
+            {'body': '€' * 81},
+            {'body': 'Karibu 🎉' + 'a' * 61},
+            {'body': 'Karibu 🎉' + 'a' * 62},
+        ])
+
+        self.assertEqual(
+            [(message.encoding, message.segments) for message in rendered],
+            [(GSM7, 1), (GSM7, 2), (GSM7, 1), (GSM7, 2), (UCS2, 1), (UCS2, 2)]
+        )
+
+    def test_staged_messages_use_contact_attributes(self):
+        from django.contrib.auth import get_user_model
+        from .models import Campaign, Contact, Message
+        from .services.campaign_staging import campaign_stager
+
+        user = get_user_model().objects.create_user(email='templates@example.com', password='pass12345')
+        Contact.objects.create(
+            tenant=user.tenant, name='Neema Mushi', phone_e164='+255712000001', opt_in_at=timezone.now(),
+            attributes={'plan': 'Pro'}
+        )
+        campaign = Campaign.objects.create(
+            created_by=user, name='Renewal', message_text='Hi {{ first_name }}, your {{ plan|plan }} renews soon'
+        )
+
+        stage = campaign_stager.stage(campaign, timezone.now())
+
+        message = Message.objects.get()
+        self.assertEqual(message.text, 'Hi Neema, your Pro renews soon')
+        self.assertEqual(message.template_variables, {'first_name': 'Neema', 'plan': 'Pro'})
+        self.assertEqual(stage.total_segments, 1)
+
+    @patch('messaging.services.beem_sms.BeemSMSService.send_sms')
+    def test_sms_templates_are_rendered_before_sending(self, send_sms):
+        from django.contrib.auth import get_user_model
+        from django.core.cache import cache
+        from django.urls import reverse
+        from rest_framework.test import APIClient
+        from billing.models import SMSBalance
+        from .models import Contact
+        from .models_sms import SMSProvider, SMSSenderID, SMSTemplate
+
+        cache.clear()
+        user = get_user_model().objects.create_user(email='smstemplates@example.com', password='pass12345')
+        tenant = user.tenant
+        SMSBalance.objects.update_or_create(tenant=tenant, defaults={'credits': 10})
+        provider = SMSProvider.objects.create(
+            tenant=tenant, name='Beem', provider_type='beem', is_default=True,
+            api_key='key', secret_key='secret', api_url='https://apisms.beem.africa/v1/send'
+        )
+        SMSSenderID.objects.create(tenant=tenant, provider=provider, sender_id='TEMPLCO', status='active')
+        Contact.objects.create(tenant=tenant, name='Neema Mushi', phone_e164='+255712000001')
+        template = SMSTemplate.objects.create(
+            tenant=tenant, name='Greeting', category='NOTIFICATION', message='Hi {{ first_name|there }}, welcome!'
+        )
+        send_sms.return_value = {'success': True, 'response': {'request_id': 1}, 'cost_estimate': 0.05}
+        client = APIClient()
+        client.force_authenticate(user)
+
+        for recipients in (['255712000001'], ['255712000001', '255712000002']):
+            response = client.post(reverse('sms-send'), {
+                'message': 'unused', 'recipients': recipients, 'sender_id': 'TEMPLCO', 'template_id': str(template.id)
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(
+            [(call.kwargs['message'], call.kwargs['encoding']) for call in send_sms.call_args_list],
+            [('Hi Neema, welcome!', 0), ('Hi there, welcome!', 0)]
+        )
+
+
+class PhoneNormalizationTests(TestCase):
+    def test_formats_normalize_to_e164(self):
+        from core.phone import normalize
+
+        for number in ['+255712345678', '255712345678', '0712345678', '712345678', '+255 712 345 678',
+                       '00255-712-345-678', '(0712) 345678', '+2550712345678', 255712345678.0]:
+            self.assertEqual(normalize(number), '+255712345678', number)
+        self.assertEqual(normalize('0722 000 111', region='KE'), '+254722000111')
+        self.assertEqual(normalize('+257 79 123 456'), '+25779123456')
+        # Outside the East African plans, any plausible international number
+        self.assertEqual(normalize('+44 20 7946 0958'), '+442079460958')
+
+    def test_invalid_numbers(self):
+        from core.phone import PhoneNumberError, is_valid, normalize
+
+        for number in ['', 'abc', '12345', '0222123456', '+2557123456', '07123456789', None]:
+            self.assertFalse(is_valid(number), number)
+        with self.assertRaises(PhoneNumberError):
+            normalize('0222123456')
+
+    def test_provider_forms(self):
+        from core.phone import PhoneNumberError, region_of, to_msisdn, to_national
+
+        self.assertEqual(to_msisdn('0712 345 678'), '255712345678')
+        self.assertEqual(to_national('+255 655 123 456'), '0655123456')
+        self.assertEqual(region_of('+256712345678'), 'UG')
+        with self.assertRaises(PhoneNumberError):
+            to_national('+254712345678', 'TZ')
+
+    def test_normalize_many(self):
+        from core.phone import normalize_many
+
+        self.assertEqual(
+            normalize_many(['0712345678', 'bad', '+254 712 345 678', '0712345678']),
+            ['+255712345678', None, '+254712345678', '+255712345678']
+        )
+
+    def test_call_sites_agree(self):
+        from billing.zenopay_service import ZenoPayService
+        from .services.beem_sms import BeemSMSService
+
+        self.assertEqual(BeemSMSService()._format_phone_number('+255 712-345-678'), '255712345678')
+        self.assertTrue(BeemSMSService().validate_phone_number('0712345678'))
+        self.assertEqual(ZenoPayService()._validate_phone_number('255712345678'), '0712345678')
+
+
+class OperatorDetectionTests(TestCase):
+    def test_longest_prefix_wins(self):
+        from core.operators import PrefixTrie
+
+        trie = PrefixTrie()
+        trie.insert('25475', 'airtel')
+        trie.insert('254757', 'safaricom')
+        self.assertEqual(trie.longest_match('254750000000'), 'airtel')
+        self.assertEqual(trie.longest_match('254757000000'), 'safaricom')
+        self.assertIsNone(trie.longest_match('255712345678'))
+        self.assertEqual(len(trie), 2)
+
+    def test_lookup(self):
+        from core.operators import operator_directory
+
+        operator = operator_directory.lookup('0754 123 456')
+        self.assertEqual((operator.country, operator.operator, operator.network_type), ('TZ', 'vodacom', 'mobile'))
+        self.assertEqual(operator_directory.mobile_money_provider('0655123456'), 'tigo')
+        self.assertIsNone(operator_directory.mobile_money_provider('+254712345678'))
+        self.assertIsNone(operator_directory.lookup('not a number'))
+
+        operators = operator_directory.lookup_many(['+256772000111', 'bad', '0754123456'])
+        self.assertEqual(operators[0].operator, 'mtn')
+        self.assertIsNone(operators[1])
+        self.assertEqual(operators[2].operator, 'vodacom')
+
+    @override_settings(SMS_PRICES={'default': 0.05, 'KE': 0.08, 'KE:safaricom': 0.07})
+    def test_cost_per_operator(self):
+        from .services.beem_sms import BeemSMSService
+
+        service = BeemSMSService()
+        recipients = ['+255754123456', '+254712345678', '+254733123456']
+        self.assertEqual(service._calculate_cost(3, 100, recipients), 0.2)
+        # Two parts cost 0.01 more per recipient
+        self.assertEqual(service._calculate_cost(3, 200, recipients), 0.23)
+        self.assertEqual(service._calculate_cost(3, 100), 0.15)
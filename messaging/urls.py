@@ -3,7 +3,7 @@ URL patterns for messaging functionality.
 Optimized for frontend integration.
 """
 from django.urls import path, include
-from . import views, views_dashboard, views_campaign
+from . import views, views_dashboard, views_campaign, views_exports
 
 urlpatterns = [
     # Core messaging endpoints (used by frontend)
@@ -48,6 +48,12 @@ urlpatterns = [
     # Purchase History - moved to billing/history/ for better organization
     # Use /api/billing/history/purchases/ instead
 
+    # Exports
+    path('exports/jobs/', views_exports.export_jobs, name='export-job-list-create'),
+    path('exports/jobs/<uuid:job_id>/', views_exports.export_job_detail, name='export-job-detail'),
+    path('exports/jobs/<uuid:job_id>/download/', views_exports.export_job_download, name='export-job-download'),
+    path('exports/<str:dataset>/', views_exports.export_dataset, name='export-dataset'),
+
     # Dashboard
     path('dashboard/overview/', views_dashboard.dashboard_overview, name='dashboard-overview'),
     path('dashboard/metrics/', views_dashboard.dashboard_metrics, name='dashboard-metrics'),
@@ -8,6 +8,8 @@ from . import views_sms_beem, views_sms
 urlpatterns = [
     # Core SMS Operations (used by frontend)
     path('send/', views_sms_beem.send_sms, name='sms-send'),
+    path('send-bulk/', views_sms_beem.send_bulk_sms, name='sms-send-bulk'),
+    path('bulk-jobs/<uuid:job_id>/', views_sms_beem.get_bulk_sms_job, name='sms-bulk-job'),
     path('balance/', views_sms_beem.get_beem_balance, name='sms-balance'),
     path('stats/', views_sms_beem.get_sms_stats, name='sms-stats'),
     path('capability/', views_sms.check_sms_capability, name='sms-capability'),
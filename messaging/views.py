@@ -9,7 +9,7 @@ from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from django.shortcuts import get_object_or_404
 from django.db.models import Q, Count, Sum
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from django_filters import FilterSet, CharFilter
@@ -29,10 +29,13 @@ from .serializers import (
     ConversationSummarySerializer, AISuggestionsSerializer,
     PurchaseHistorySerializer, PurchaseHistorySummarySerializer
 )
+from core.pagination import KeysetOrPageNumberPagination
 from core.permissions import IsTenantMember, IsTenantAdmin
 from core.rate_limits import check_rate_limit, MESSAGE_RATE_LIMITER
 from .tasks import send_message_task, ai_suggest_reply_task, ai_summarize_conversation_task
 from .models_sms import SMSSenderID
+from .services.flows import flow_engine, FlowCompileError
+from .services.outbox import outbox
 
 
 def validate_user_tenant(user):
@@ -92,6 +95,7 @@ class ContactListCreateView(generics.ListCreateAPIView):
     search_fields = ['name', 'phone_e164', 'email']
     ordering_fields = ['name', 'created_at', 'last_contacted_at']
     ordering = ['-created_at']
+    pagination_class = KeysetOrPageNumberPagination
 
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -369,6 +373,7 @@ class MessageListCreateView(generics.ListCreateAPIView):
     search_fields = ['text']
     ordering_fields = ['created_at', 'sent_at']
     ordering = ['-created_at']
+    pagination_class = KeysetOrPageNumberPagination
 
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -383,21 +388,21 @@ class MessageListCreateView(generics.ListCreateAPIView):
         if not hasattr(self.request.user, 'tenant') or not self.request.user.tenant:
             return Message.objects.none()
 
+        # Staged campaign messages are not shown until their run is dispatched
         return Message.objects.filter(
             conversation__contact__created_by=self.request.user,
             tenant=self.request.user.tenant
-        ).select_related('conversation__contact')
+        ).exclude(status='staged').select_related('conversation__contact')
 
     def perform_create(self, serializer):
         """Create message and trigger sending."""
         # Check rate limits BEFORE creating the message
         check_rate_limit(self.request, MESSAGE_RATE_LIMITER)
 
-        # Create message
-        message = serializer.save(tenant=self.request.user.tenant)
-
-        # Queue message for sending
-        send_message_task.delay(str(message.id))
+        # Create the message and its send task together
+        with transaction.atomic():
+            message = serializer.save(tenant=self.request.user.tenant)
+            outbox.enqueue(send_message_task, str(message.id), tenant=message.tenant)
 
 
 class MessageDetailView(generics.RetrieveUpdateDestroyAPIView):
@@ -417,7 +422,7 @@ class MessageDetailView(generics.RetrieveUpdateDestroyAPIView):
         return Message.objects.filter(
             conversation__contact__created_by=self.request.user,
             tenant=self.request.user.tenant
-        )
+        ).exclude(status='staged')
 
 
 class CampaignListCreateView(generics.ListCreateAPIView):
@@ -474,11 +479,11 @@ def campaign_start(request, campaign_id):
     if campaign.status != 'draft':
         return Response({'error': 'Campaign can only be started from draft status'}, status=status.HTTP_400_BAD_REQUEST)
 
-    campaign.start()
-
-    # Queue campaign messages for sending
     from .tasks import send_campaign_messages_task
-    send_campaign_messages_task.delay(str(campaign.id))
+    with transaction.atomic():
+        campaign.start()
+        # Queue campaign messages for sending
+        outbox.enqueue(send_campaign_messages_task, str(campaign.id), tenant=campaign.tenant)
 
     return Response({'message': 'Campaign started successfully'})
 
@@ -554,7 +559,14 @@ def flow_activate(request, flow_id):
         created_by=request.user,
         tenant=request.user.tenant
     )
+
+    try:
+        flow_engine.compile(flow)
+    except FlowCompileError as e:
+        return Response({'error': f'Invalid flow: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+
     flow.activate()
+    flow_engine.warm(flow.tenant_id)
 
     return Response({'message': 'Flow activated successfully'})
 
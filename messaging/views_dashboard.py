@@ -9,8 +9,10 @@ from rest_framework.response import Response
 from django.db.models import Count, Sum, Q, Avg
 from django.utils import timezone
 from datetime import datetime, timedelta
+import functools
 import logging
 
+from core.cache import TieredCache
 from .models import Contact, Message, Campaign, Conversation
 from .models_sms import SMSMessage, SMSDeliveryReport
 from tenants.models import Tenant
@@ -18,9 +20,43 @@ from billing.models import SMSBalance, SMSPackage
 
 logger = logging.getLogger(__name__)
 
+# Dashboards aggregate whole tables; a minute of staleness is acceptable
+dashboard_cache = TieredCache('dashboard', ttl=60)
+
+
+class _Uncacheable(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+def cached_dashboard(view):
+    """
+    Serve successful responses from the tiered cache per tenant and user.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        tenant = getattr(request.user, 'tenant', None)
+        if not tenant:
+            return view(request, *args, **kwargs)
+
+        def build():
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                raise _Uncacheable(response)
+            return response.data
+
+        key = f"{view.__name__}:{tenant.id}:{request.user.pk}:{request.GET.urlencode()}"
+        try:
+            data = dashboard_cache.get_or_set(key, build, tags=[f'dashboard:{tenant.id}'])
+        except _Uncacheable as e:
+            return e.response
+        return Response(data)
+    return wrapper
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_dashboard
 def dashboard_overview(request):
     """
     Get comprehensive dashboard overview data.
@@ -215,6 +251,7 @@ def dashboard_overview(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_dashboard
 def dashboard_metrics(request):
     """
     Get detailed metrics for dashboard cards.
@@ -457,6 +494,7 @@ def _calculate_percentage_change(current, previous):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_dashboard
 def dashboard_comprehensive(request):
     """
     Get comprehensive dashboard data with all metrics.
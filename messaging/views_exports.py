@@ -0,0 +1,200 @@
+"""
+Export views: streamed CSV downloads and background export jobs.
+"""
+import logging
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import FileResponse, StreamingHttpResponse
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .models import ExportJob
+from .services.exports import DATASETS, FORMATS, ExportError, export_service
+from .services.outbox import outbox
+from .tasks import run_export_job_task
+
+logger = logging.getLogger(__name__)
+
+FILTER_PARAMS = ['start_date', 'end_date', 'direction', 'provider', 'status', 'is_active', 'transaction_type']
+
+
+def _filters(params):
+    return {key: params[key] for key in FILTER_PARAMS if params.get(key) not in (None, '')}
+
+
+def _no_tenant():
+    return Response({
+        'success': False,
+        'message': 'User is not associated with any tenant.',
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _job_data(request, job):
+    data = {
+        'id': str(job.id),
+        'dataset': job.dataset,
+        'file_format': job.file_format,
+        'filters': job.filters,
+        'status': job.status,
+        'row_count': job.row_count,
+        'error_message': job.error_message,
+        'created_at': job.created_at,
+        'completed_at': job.completed_at,
+        'download_url': None,
+    }
+    if job.status == 'completed':
+        data['download_url'] = request.build_absolute_uri(reverse('export-job-download', args=[job.id]))
+    return data
+
+
+def _create_job(request, tenant, dataset, file_format, filters):
+    if dataset not in DATASETS:
+        raise ExportError(f"Unknown dataset '{dataset}'")
+    export_service.check_format(file_format)
+    # Fail fast on malformed filters instead of inside the worker
+    DATASETS[dataset].validate(tenant, filters)
+
+    with transaction.atomic():
+        job = ExportJob.objects.create(
+            tenant=tenant,
+            created_by=request.user,
+            dataset=dataset,
+            file_format=file_format,
+            filters=filters,
+        )
+        outbox.enqueue(run_export_job_task, str(job.id), tenant=tenant)
+    return job
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_dataset(request, dataset):
+    """
+    Export a dataset for the current tenant.
+
+    GET /api/messaging/exports/<dataset>/?file_format=csv&start_date=2025-01-01
+
+    CSV is streamed row by row. XLSX (and CSV with ``background=true``) is
+    written by a background job; the response is 202 with the job, whose
+    ``download_url`` is filled in when it completes.
+    """
+    tenant = getattr(request.user, 'tenant', None)
+    if not tenant:
+        return _no_tenant()
+
+    file_format = request.query_params.get('file_format', 'csv')
+    filters = _filters(request.query_params)
+
+    try:
+        if file_format == 'csv' and request.query_params.get('background') != 'true':
+            lines = export_service.stream_csv(dataset, tenant, filters)
+            response = StreamingHttpResponse(lines, content_type=FORMATS['csv'][0])
+            response['Content-Disposition'] = f'attachment; filename="{export_service.filename(dataset, "csv")}"'
+            return response
+
+        job = _create_job(request, tenant, dataset, file_format, filters)
+    except ExportError as e:
+        return Response({
+            'success': False,
+            'message': str(e),
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'success': True,
+        'message': 'Export started',
+        'data': _job_data(request, job),
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def export_jobs(request):
+    """
+    List recent export jobs or start a new one.
+
+    POST /api/messaging/exports/jobs/
+    {"dataset": "messages", "file_format": "xlsx", "filters": {"start_date": "2025-01-01"}}
+    """
+    tenant = getattr(request.user, 'tenant', None)
+    if not tenant:
+        return _no_tenant()
+
+    if request.method == 'GET':
+        jobs = ExportJob.objects.filter(tenant=tenant).order_by('-created_at')[:50]
+        return Response({
+            'success': True,
+            'data': [_job_data(request, job) for job in jobs],
+        })
+
+    try:
+        job = _create_job(
+            request,
+            tenant,
+            request.data.get('dataset'),
+            request.data.get('file_format', 'csv'),
+            _filters(request.data.get('filters') or {}),
+        )
+    except ExportError as e:
+        return Response({
+            'success': False,
+            'message': str(e),
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'success': True,
+        'message': 'Export started',
+        'data': _job_data(request, job),
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_job_detail(request, job_id):
+    """
+    Get the status of an export job.
+    """
+    tenant = getattr(request.user, 'tenant', None)
+    if not tenant:
+        return _no_tenant()
+
+    try:
+        job = ExportJob.objects.get(id=job_id, tenant=tenant)
+    except ExportJob.DoesNotExist:
+        return Response({
+            'success': False,
+            'message': 'Export job not found',
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    return Response({
+        'success': True,
+        'data': _job_data(request, job),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_job_download(request, job_id):
+    """
+    Download the file produced by a completed export job.
+    """
+    tenant = getattr(request.user, 'tenant', None)
+    if not tenant:
+        return _no_tenant()
+
+    try:
+        job = ExportJob.objects.get(id=job_id, tenant=tenant, status='completed')
+    except ExportJob.DoesNotExist:
+        return Response({
+            'success': False,
+            'message': 'Export file not available',
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    return FileResponse(
+        default_storage.open(job.file_path, 'rb'),
+        as_attachment=True,
+        filename=job.file_path.rsplit('/', 1)[-1],
+        content_type=FORMATS[job.file_format][0],
+    )
@@ -17,7 +17,7 @@ from .serializers_sender_requests import (
     SenderIDUsageCreateSerializer
 )
 from billing.models import SMSPackage
-from .services.sms_service import SMSService
+from .services.provider_metadata import provider_metadata
 
 
 class SenderIDRequestListCreateView(generics.ListCreateAPIView):
@@ -208,31 +208,16 @@ def available_sender_ids(request):
             unified.append({'requested_sender_id': sid, 'sample_content': item.get('sample_content', '')})
             seen.add(sid)
 
-    # Fetch active sender IDs from Beem for visibility
-    beem_ids = []
-    try:
-        service = SMSService(tenant_id=str(tenant.id))
-        provider_result = service.get_sender_ids(status='active')
-        if provider_result.get('success'):
-            # Normalize to a lean structure
-            beem_ids = [
-                {
-                    'senderid': item.get('senderid'),
-                    'status': item.get('status'),
-                    'id': item.get('id')
-                }
-                for item in provider_result.get('sender_ids', [])
-                if (item or {}).get('status') == 'active'
-            ]
-    except Exception as e:
-        # Non-fatal: just omit provider list on errors
-        beem_ids = []
+    # Active sender IDs at Beem, from the background-refreshed cache
+    provider_entry = provider_metadata.read(f'sender_ids:{tenant.id}')
 
     return Response({
     "available_sender_ids": unified,
         "provider": {
             "name": "Beem Africa",
-            "active_sender_ids": beem_ids
+            "active_sender_ids": provider_entry['data'] or [],
+            "refreshed_at": provider_entry['refreshed_at'],
+            "stale": provider_entry['stale']
         }
     })
 
@@ -14,6 +14,8 @@ from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 
+from core.pagination import KeysetOrPageNumberPagination
+from core.phone import PhoneNumberError, normalize
 from core.permissions import IsTenantMember
 from .models_sms import (
     SMSProvider, SMSSenderID, SMSTemplate, SMSMessage,
@@ -26,6 +28,7 @@ from .serializers_sms import (
     SMSBalanceSerializer, SMSStatsSerializer
 )
 from .services.sms_service import SMSService, SMSBulkProcessor
+from .services.outbox import outbox
 from .tasks import send_sms_task, process_sms_bulk_upload_task
 
 logger = logging.getLogger(__name__)
@@ -125,6 +128,7 @@ class SMSMessageListView(generics.ListAPIView):
     search_fields = ['provider_message_id', 'base_message__conversation__contact__name']
     ordering_fields = ['created_at', 'sent_at', 'delivered_at']
     ordering = ['-created_at']
+    pagination_class = KeysetOrPageNumberPagination
 
     def get_queryset(self):
         return SMSMessage.objects.filter(tenant=self.request.tenant).select_related(
@@ -142,6 +146,8 @@ class SMSDeliveryReportListView(generics.ListAPIView):
     search_fields = ['dest_addr', 'provider_message_id']
     ordering_fields = ['received_at', 'delivered_at']
     ordering = ['-received_at']
+    pagination_class = KeysetOrPageNumberPagination
+    keyset_field = 'received_at'
 
     def get_queryset(self):
         return SMSDeliveryReport.objects.filter(tenant=self.request.tenant)
@@ -206,6 +212,11 @@ def send_sms_view(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        try:
+            phone = normalize(phone)
+        except PhoneNumberError:
+            return Response({'error': 'Invalid phone number'}, status=status.HTTP_400_BAD_REQUEST)
+
         # Validate SMS sending capability before processing
         from .services.sms_validation import SMSValidationService, SMSValidationError
         
@@ -219,33 +230,33 @@ def send_sms_view(request):
                 'error_type': validation_result.get('error_type', 'validation_error')
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Get or create contact
-        from .models import Contact, Conversation
-        contact, created = Contact.objects.get_or_create(
-            tenant=request.tenant,
-            phone_e164=phone,
-            defaults={'name': phone}
-        )
+        from .models import Contact, Conversation, Message
+        with transaction.atomic():
+            # Get or create contact
+            contact, created = Contact.objects.get_or_create(
+                tenant=request.tenant,
+                phone_e164=phone,
+                defaults={'name': phone}
+            )
 
-        # Get or create conversation
-        conversation, created = Conversation.objects.get_or_create(
-            tenant=request.tenant,
-            contact=contact
-        )
+            # Get or create conversation
+            conversation, created = Conversation.objects.get_or_create(
+                tenant=request.tenant,
+                contact=contact
+            )
 
-        # Create base message
-        from .models import Message
-        message_obj = Message.objects.create(
-            tenant=request.tenant,
-            conversation=conversation,
-            direction='out',
-            provider='sms',
-            text=message,
-            recipient_number=phone
-        )
+            # Create base message
+            message_obj = Message.objects.create(
+                tenant=request.tenant,
+                conversation=conversation,
+                direction='out',
+                provider='sms',
+                text=message,
+                recipient_number=phone
+            )
 
-        # Send SMS asynchronously
-        send_sms_task.delay(str(message_obj.id), sender_id)
+            # Send SMS asynchronously once the message is committed
+            outbox.enqueue(send_sms_task, str(message_obj.id), sender_id, tenant=request.tenant)
 
         return Response({
             'success': True,
@@ -333,37 +344,36 @@ def send_bulk_sms_view(request):
         results = []
         for i, contact_data in enumerate(contacts):
             try:
-                phone = contact_data['phone']
-                if phone.startswith('+'):
-                    phone = phone[1:]
-
-                # Get or create contact
-                from .models import Contact, Conversation
-                contact, created = Contact.objects.get_or_create(
-                    tenant=request.tenant,
-                    phone_e164=phone,
-                    defaults={'name': contact_data.get('name', phone)}
-                )
-
-                # Get or create conversation
-                conversation, created = Conversation.objects.get_or_create(
-                    tenant=request.tenant,
-                    contact=contact
-                )
-
-                # Create base message
-                from .models import Message
-                message_obj = Message.objects.create(
-                    tenant=request.tenant,
-                    conversation=conversation,
-                    direction='out',
-                    provider='sms',
-                    text=message,
-                    recipient_number=phone
-                )
-
-                # Send SMS asynchronously
-                send_sms_task.delay(str(message_obj.id), sender_id)
+                phone = normalize(contact_data['phone'])
+
+                from .models import Contact, Conversation, Message
+                with transaction.atomic():
+                    # Get or create contact
+                    contact, created = Contact.objects.get_or_create(
+                        tenant=request.tenant,
+                        phone_e164=phone,
+                        defaults={'name': contact_data.get('name', phone)}
+                    )
+
+                    # Get or create conversation
+                    conversation, created = Conversation.objects.get_or_create(
+                        tenant=request.tenant,
+                        contact=contact
+                    )
+
+                    # Create base message
+                    message_obj = Message.objects.create(
+                        tenant=request.tenant,
+                        conversation=conversation,
+                        direction='out',
+                        provider='sms',
+                        text=message,
+                        recipient_number=phone
+                    )
+
+                    # Send SMS asynchronously once the message is committed, behind
+                    # single sends rather than in front of them
+                    outbox.enqueue(send_sms_task, str(message_obj.id), sender_id, tenant=request.tenant, queue='bulk')
 
                 results.append({
                     'phone': phone,
@@ -412,18 +422,19 @@ def upload_excel_sms_view(request):
         # Save file
         file_path = default_storage.save(f'sms_uploads/{file.name}', file)
 
-        # Create bulk upload record
-        bulk_upload = SMSBulkUpload.objects.create(
-            tenant=request.tenant,
-            file_name=file.name,
-            file_path=file_path,
-            file_size=file.size,
-            campaign_id=campaign_id,
-            created_by=request.user
-        )
+        with transaction.atomic():
+            # Create bulk upload record
+            bulk_upload = SMSBulkUpload.objects.create(
+                tenant=request.tenant,
+                file_name=file.name,
+                file_path=file_path,
+                file_size=file.size,
+                campaign_id=campaign_id,
+                created_by=request.user
+            )
 
-        # Process file asynchronously
-        process_sms_bulk_upload_task.delay(str(bulk_upload.id))
+            # Process file asynchronously
+            outbox.enqueue(process_sms_bulk_upload_task, str(bulk_upload.id), tenant=request.tenant)
 
         return Response({
             'success': True,
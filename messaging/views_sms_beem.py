@@ -25,9 +25,12 @@ from datetime import datetime, timedelta
 import logging
 
 from .models import Message, Conversation, Contact
-from .models_sms import SMSProvider, SMSSenderID, SMSTemplate, SMSMessage, SMSDeliveryReport
+from .models_sms import SMSProvider, SMSSenderID, SMSTemplate, SMSMessage, SMSDeliveryReport, SMSBulkSendJob
 from billing.models import SMSBalance
 from .services.beem_sms import BeemSMSService, BeemSMSError
+from .services.provider_metadata import provider_metadata
+from .services.bulk_send import bulk_send_pipeline
+from .services.templating import compile_template, contact_context
 from .serializers_sms_beem import (
     SMSSendSerializer,
     SMSBulkSendSerializer,
@@ -86,6 +89,57 @@ def _parse_provider_error(detail):
     return None, None
 
 
+def _template_context(tenant, recipients):
+    """
+    Template variables for a send: the contact's when there is a single
+    recipient we know, else none, so placeholders take their defaults
+    (every recipient gets the same text).
+    """
+    from core.phone import PhoneNumberError, normalize
+
+    if len(recipients) != 1:
+        return {}
+    try:
+        phone = normalize(recipients[0])
+    except PhoneNumberError:
+        return {}
+    contact = Contact.objects.filter(tenant=tenant, phone_e164=phone).first()
+    return contact_context(contact) if contact else {}
+
+
+def _validation_error_response(validation_result):
+    """Error response for a failed SMSValidationService.validate_sms_sending."""
+    lack_credits = 'Insufficient SMS credits' in validation_result['error'] or validation_result.get('reason') == 'no_credits'
+    message_too_long = validation_result.get('reason') == 'message_too_long'
+    
+    if message_too_long:
+        return _error_response(
+            validation_result['error'],
+            status.HTTP_400_BAD_REQUEST,
+            error_code='MESSAGE_TOO_LONG',
+            detail=validation_result.get('error_type'),
+            user_hint='Please reduce your message length to 200 SMS segments or less.',
+            actions={'max_segments': 200, 'current_segments': validation_result.get('segments', 0)}
+        )
+    elif lack_credits:
+        return _error_response(
+            validation_result['error'],
+            status.HTTP_400_BAD_REQUEST,
+            error_code='INSUFFICIENT_CREDITS',
+            detail=validation_result.get('error_type'),
+            user_hint='Buy SMS credits and try again.',
+            actions={'purchase_url': '/api/billing/sms/purchase/'}
+        )
+    else:
+        return _error_response(
+            validation_result['error'],
+            status.HTTP_400_BAD_REQUEST,
+            error_code='VALIDATION_ERROR',
+            detail=validation_result.get('error_type'),
+            user_hint='Please review the details and try again.'
+        )
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def send_sms(request):
@@ -184,9 +238,13 @@ def send_sms(request):
         template = None
         if data.get('template_id'):
             template = get_object_or_404(SMSTemplate, id=data['template_id'], tenant=tenant)
-            message_content = template.message
+            rendered = compile_template(template.message).render(_template_context(tenant, data['recipients']))
+            message_content = rendered.text
+            # An explicit UCS2 request stands; otherwise send the encoding the text needs
+            encoding = max(data.get('encoding') or 0, rendered.encoding)
         else:
             message_content = data['message']
+            encoding = data.get('encoding')
 
         # Initialize Beem service
         beem_service = BeemSMSService()
@@ -211,35 +269,7 @@ def send_sms(request):
         )
         
         if not validation_result['valid']:
-            lack_credits = 'Insufficient SMS credits' in validation_result['error'] or validation_result.get('reason') == 'no_credits'
-            message_too_long = validation_result.get('reason') == 'message_too_long'
-            
-            if message_too_long:
-                return _error_response(
-                    validation_result['error'],
-                    status.HTTP_400_BAD_REQUEST,
-                    error_code='MESSAGE_TOO_LONG',
-                    detail=validation_result.get('error_type'),
-                    user_hint='Please reduce your message length to 200 SMS segments or less.',
-                    actions={'max_segments': 200, 'current_segments': validation_result.get('segments', 0)}
-                )
-            elif lack_credits:
-                return _error_response(
-                    validation_result['error'],
-                    status.HTTP_400_BAD_REQUEST,
-                    error_code='INSUFFICIENT_CREDITS',
-                    detail=validation_result.get('error_type'),
-                    user_hint='Buy SMS credits and try again.',
-                    actions={'purchase_url': '/api/billing/sms/purchase/'}
-                )
-            else:
-                return _error_response(
-                    validation_result['error'],
-                    status.HTTP_400_BAD_REQUEST,
-                    error_code='VALIDATION_ERROR',
-                    detail=validation_result.get('error_type'),
-                    user_hint='Please review the details and try again.'
-                )
+            return _validation_error_response(validation_result)
 
         # Send SMS via Beem
         with transaction.atomic():
@@ -271,7 +301,7 @@ def send_sms(request):
                 recipients=data['recipients'],
                 source_addr=sender_id_obj.sender_id,
                 schedule_time=data.get('schedule_time'),
-                encoding=data.get('encoding')  # None will trigger auto-detection
+                encoding=encoding  # None will trigger auto-detection
             )
         except BeemSMSError as e:
             # Return Beem error payload to frontend with parsed provider reason
@@ -355,6 +385,26 @@ def send_sms(request):
         )
 
 
+def _bulk_job_data(job):
+    return {
+        'job_id': str(job.id),
+        'status': job.status,
+        'total_messages': job.total_messages,
+        'total_recipients': job.total_recipients,
+        'sent_messages': job.sent_messages,
+        'failed_messages': job.failed_messages,
+        'total_cost': float(job.total_cost),
+        'provider': 'beem',
+        'results': [
+            {'message_id': entry['sms_message_id'], 'recipient_count': len(entry['recipients'])}
+            for entry in job.payload
+        ],
+        'errors': job.errors,
+        'created_at': job.created_at,
+        'completed_at': job.completed_at,
+    }
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def send_bulk_sms(request):
@@ -379,6 +429,10 @@ def send_bulk_sms(request):
         ],
         "schedule_time": "2024-01-01T10:00:00Z" // optional
     }
+
+    The messages are stored as queued and sent by a background worker; the
+    202 response carries the job, whose progress is at
+    GET /api/messaging/sms/bulk-jobs/<job_id>/.
     """
     try:
         serializer = SMSBulkSendSerializer(data=request.data)
@@ -420,86 +474,74 @@ def send_bulk_sms(request):
         # Get Beem provider
         beem_provider = get_or_create_beem_provider(tenant)
 
-        # Initialize Beem service
-        beem_service = BeemSMSService()
-
-        results = []
-        total_recipients = 0
-        total_cost = 0.0
-
-        with transaction.atomic():
-            for message_data in data['messages']:
-                # Get and validate sender ID
-                sender_id = message_data.get('sender_id')
-                sender_id_obj = None
-                if sender_id:
-                    sender_id_obj = get_sender_id(tenant, sender_id)
-                if not sender_id_obj:
-                    if getattr(request.user, 'is_superuser', False) or getattr(request.user, 'is_staff', False):
+        # Fail fast if Beem is not configured; the worker does the sending
+        BeemSMSService()
+
+        # Resolve every sender first so nothing is stored for a bad request
+        blocks = []
+        for message_data in data['messages']:
+            # Get and validate sender ID
+            sender_id = message_data.get('sender_id')
+            sender_id_obj = None
+            if sender_id:
+                sender_id_obj = get_sender_id(tenant, sender_id)
+            if not sender_id_obj:
+                if getattr(request.user, 'is_superuser', False) or getattr(request.user, 'is_staff', False):
+                    sender_id_obj = get_or_create_default_sender(tenant, beem_provider)
+                else:
+                    if (sender_id or '').strip().lower() == 'taarifa-sms':
                         sender_id_obj = get_or_create_default_sender(tenant, beem_provider)
                     else:
-                        if (sender_id or '').strip().lower() == 'taarifa-sms':
-                            sender_id_obj = get_or_create_default_sender(tenant, beem_provider)
-                        else:
-                            return _error_response(
-                                'Sender name is missing or not available.',
-                                status.HTTP_400_BAD_REQUEST,
-                                error_code='SENDER_ID_INVALID',
-                                user_hint='Choose an approved sender name or request the default in Sender Names.',
-                                actions={'request_default_url': '/api/messaging/sender-requests/request-default/', 'available_url': '/api/messaging/sender-requests/available/'}
-                            )
-
-                # Send via Beem
-                beem_response = beem_service.send_sms(
-                    message=message_data['message'],
-                    recipients=message_data['recipients'],
-                    source_addr=sender_id_obj.sender_id,
-                    schedule_time=data.get('schedule_time'),
-                    encoding=message_data.get('encoding', 0)
-                )
+                        return _error_response(
+                            'Sender name is missing or not available.',
+                            status.HTTP_400_BAD_REQUEST,
+                            error_code='SENDER_ID_INVALID',
+                            user_hint='Choose an approved sender name or request the default in Sender Names.',
+                            actions={'request_default_url': '/api/messaging/sender-requests/request-default/', 'available_url': '/api/messaging/sender-requests/available/'}
+                        )
+
+            blocks.append({
+                'message': message_data['message'],
+                'recipients': message_data['recipients'],
+                'sender': sender_id_obj,
+                'encoding': message_data.get('encoding', 0),
+            })
 
-                # Create message records
-                base_message = Message.objects.create(
-                    tenant=tenant,
-                    conversation=None,
-                    direction='out',
-                    provider='sms',
-                    text=message_data['message'],
-                    created_by=request.user
-                )
-
-                sms_message = SMSMessage.objects.create(
-                    tenant=tenant,
-                    base_message=base_message,
-                    provider=beem_provider,
-                    sender_id=sender_id_obj,
-                    status='sent' if beem_response.get('success') else 'failed',
-                    provider_response=beem_response.get('response', {}),
-                    sent_at=timezone.now(),
-                    cost_amount=beem_response.get('cost_estimate', 0.0)
-                )
-
-                results.append({
-                    'message_id': str(sms_message.id),
-                    'recipient_count': len(message_data['recipients']),
-                    'status': sms_message.status,
-                    'cost': beem_response.get('cost_estimate', 0.0)
-                })
+        # Validate SMS sending capability before processing
+        from .services.sms_validation import SMSValidationService, SMSValidationError
+        
+        required_credits = sum(len(block['recipients']) for block in blocks)
+        
+        # Admin fallback: ensure sufficient credits
+        if getattr(request.user, 'is_superuser', False) or getattr(request.user, 'is_staff', False):
+            balance, _ = SMSBalance.objects.get_or_create(tenant=tenant)
+            if balance.credits < required_credits:
+                top_up_amount = max(1000, required_credits - balance.credits)
+                balance.add_credits(top_up_amount)
+        
+        validation_service = SMSValidationService(tenant)
+        for block in blocks:
+            validation_result = validation_service.validate_sms_sending(
+                block['sender'].sender_id,
+                required_credits=required_credits,
+                message=block['message']
+            )
+            if not validation_result['valid']:
+                return _validation_error_response(validation_result)
 
-                total_recipients += len(message_data['recipients'])
-                total_cost += beem_response.get('cost_estimate', 0.0)
+        # Store queued records and reserve a credit per recipient; provider calls happen in a worker
+        try:
+            job = bulk_send_pipeline.enqueue(
+                tenant, request.user, beem_provider, blocks, schedule_time=data.get('schedule_time')
+            )
+        except SMSValidationError as e:
+            return _validation_error_response({'valid': False, 'error': str(e), 'error_type': 'validation_error'})
 
         return Response({
             'success': True,
-            'message': f'Bulk SMS sent successfully via Beem',
-            'data': {
-                'total_messages': len(data['messages']),
-                'total_recipients': total_recipients,
-                'total_cost': round(total_cost, 4),
-                'provider': 'beem',
-                'results': results
-            }
-        }, status=status.HTTP_201_CREATED)
+            'message': 'Bulk SMS queued for sending via Beem',
+            'data': _bulk_job_data(job)
+        }, status=status.HTTP_202_ACCEPTED)
 
     except BeemSMSError as e:
         logger.error(f"Beem bulk SMS error: {str(e)}")
@@ -530,6 +572,60 @@ def send_bulk_sms(request):
         )
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_bulk_sms_job(request, job_id):
+    """
+    Progress of a bulk SMS job
+
+    GET /api/messaging/sms/bulk-jobs/<job_id>/
+    """
+    tenant = getattr(request.user, 'tenant', None)
+    if not tenant:
+        return _error_response(
+            'You are not linked to any organization.',
+            status.HTTP_400_BAD_REQUEST,
+            error_code='NO_TENANT',
+            user_hint='Please contact support to link your account to an organization.'
+        )
+
+    try:
+        job = SMSBulkSendJob.objects.get(id=job_id, tenant=tenant)
+    except SMSBulkSendJob.DoesNotExist:
+        return _error_response('Bulk SMS job not found.', status.HTTP_404_NOT_FOUND, error_code='NOT_FOUND')
+
+    return Response({
+        'success': True,
+        'data': _bulk_job_data(job)
+    })
+
+
+def _provider_metadata_response(key, pending_message):
+    """Serve a provider metadata entry without waiting on Beem."""
+    entry = provider_metadata.read(key)
+    if entry['data'] is None:
+        return Response({
+            'success': False,
+            'message': pending_message,
+            'data': {
+                'provider': 'beem',
+                'error': entry['last_error'],
+                'refreshing': entry['refreshing']
+            }
+        }, status=status.HTTP_202_ACCEPTED)
+
+    result = entry['data']
+    return Response({
+        'success': result.get('success', False),
+        'message': result.get('message', result.get('error', '')),
+        'data': {
+            **result,
+            'refreshed_at': entry['refreshed_at'],
+            'stale': entry['stale']
+        }
+    }, status=status.HTTP_200_OK)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def test_beem_connection(request):
@@ -538,6 +634,10 @@ def test_beem_connection(request):
 
     GET /api/messaging/sms/test-beem/
 
+    Serves the result of the last background connection check and queues
+    a new one when it is older than 15 minutes (or with ``?refresh=true``).
+    Until the first check finishes the response is 202.
+
     Response:
     {
         "success": true,
@@ -546,39 +646,14 @@ def test_beem_connection(request):
             "provider": "beem",
             "api_key_configured": true,
             "secret_key_configured": true,
-            "connection_status": "success"
+            "refreshed_at": "2025-01-01T10:00:00Z",
+            "stale": false
         }
     }
     """
-    try:
-        beem_service = BeemSMSService()
-        test_result = beem_service.test_connection()
-
-        return Response({
-            'success': test_result.get('success', False),
-            'message': test_result.get('message', 'Connection test completed'),
-            'data': test_result
-        }, status=status.HTTP_200_OK)
-
-    except BeemSMSError as e:
-        return Response({
-            'success': False,
-            'message': f'Beem connection test failed: {str(e)}',
-            'data': {
-                'provider': 'beem',
-                'error': str(e)
-            }
-        }, status=status.HTTP_400_BAD_REQUEST)
-
-    except Exception as e:
-        return Response({
-            'success': False,
-            'message': f'Connection test error: {str(e)}',
-            'data': {
-                'provider': 'beem',
-                'error': str(e)
-            }
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    if request.query_params.get('refresh') == 'true':
+        provider_metadata.schedule_refresh('connection')
+    return _provider_metadata_response('connection', 'Connection test is running, try again shortly')
 
 
 @api_view(['GET'])
@@ -589,6 +664,9 @@ def get_beem_balance(request):
 
     GET /api/messaging/sms/beem-balance/
 
+    Served from the provider metadata cache, which a periodic task keeps
+    up to date; ``stale`` is true while a refresh is pending.
+
     Response:
     {
         "success": true,
@@ -596,38 +674,13 @@ def get_beem_balance(request):
             "provider": "beem",
             "balance": "N/A",
             "currency": "USD",
-            "message": "Balance check not available via API"
+            "message": "Balance check not available via API",
+            "refreshed_at": "2025-01-01T10:00:00Z",
+            "stale": false
         }
     }
     """
-    try:
-        beem_service = BeemSMSService()
-        balance_info = beem_service.get_account_balance()
-
-        return Response({
-            'success': balance_info.get('success', False),
-            'data': balance_info
-        }, status=status.HTTP_200_OK)
-
-    except BeemSMSError as e:
-        return Response({
-            'success': False,
-            'message': f'Failed to get Beem balance: {str(e)}',
-            'data': {
-                'provider': 'beem',
-                'error': str(e)
-            }
-        }, status=status.HTTP_400_BAD_REQUEST)
-
-    except Exception as e:
-        return Response({
-            'success': False,
-            'message': f'Balance check error: {str(e)}',
-            'data': {
-                'provider': 'beem',
-                'error': str(e)
-            }
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return _provider_metadata_response('balance', 'Balance is being fetched from Beem, try again shortly')
 
 
 @api_view(['GET'])
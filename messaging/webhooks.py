@@ -10,6 +10,7 @@ from django.utils.decorators import method_decorator
 from django.views import View
 from django.conf import settings
 from .services.whatsapp import WhatsAppService
+from .services.inbox import inbound_inbox
 from .tasks import process_inbound_message_task, sync_delivery_status_task
 import hmac
 import hashlib
@@ -120,6 +121,7 @@ class WhatsAppWebhookView(View):
             # Extract message data
             message_data = {
                 'contact_phone': data['contact_phone'],
+                'contact_name': data.get('contact_name', ''),
                 'text': data['text'],
                 'media_url': data.get('media_url'),
                 'media_type': data.get('media_type'),
@@ -140,8 +142,16 @@ class WhatsAppWebhookView(View):
             if tenant:
                 message_data['tenant_id'] = str(tenant.id)
                 
+                # WhatsApp retries deliveries it considers unacknowledged
+                if not inbound_inbox.claim('whatsapp', data['message_id'], tenant=tenant):
+                    return
+                
                 # Queue message processing
-                process_inbound_message_task.delay(message_data)
+                try:
+                    process_inbound_message_task.delay(message_data)
+                except Exception:
+                    inbound_inbox.release('whatsapp', data['message_id'])
+                    raise
                 
                 logger.info(f"Inbound message queued for processing: {data['message_id']}")
             else:
@@ -155,11 +165,20 @@ class WhatsAppWebhookView(View):
         Process message status update from webhook.
         """
         try:
+            # The same message reports each status transition once
+            event_id = f"{data['message_id']}:{data.get('status')}"
+            if not inbound_inbox.claim('whatsapp', event_id):
+                return
+            
             # Queue status sync
-            sync_delivery_status_task.delay(
-                data['message_id'],
-                provider='whatsapp'
-            )
+            try:
+                sync_delivery_status_task.delay(
+                    data['message_id'],
+                    provider='whatsapp'
+                )
+            except Exception:
+                inbound_inbox.release('whatsapp', event_id)
+                raise
             
             logger.info(f"Status update queued for sync: {data['message_id']}")
         
@@ -196,19 +215,26 @@ def stripe_webhook(request):
             logger.error(f"Invalid signature: {str(e)}")
             return HttpResponse("Invalid signature", status=400)
         
-        # Handle the event
-        if event['type'] == 'customer.subscription.created':
-            handle_subscription_created(event['data']['object'])
-        elif event['type'] == 'customer.subscription.updated':
-            handle_subscription_updated(event['data']['object'])
-        elif event['type'] == 'customer.subscription.deleted':
-            handle_subscription_deleted(event['data']['object'])
-        elif event['type'] == 'invoice.payment_succeeded':
-            handle_payment_succeeded(event['data']['object'])
-        elif event['type'] == 'invoice.payment_failed':
-            handle_payment_failed(event['data']['object'])
-        else:
-            logger.info(f"Unhandled event type: {event['type']}")
+        if not inbound_inbox.claim('stripe', event['id']):
+            return HttpResponse("OK", status=200)
+        
+        # Handle the event; a failure releases the claim so Stripe's retry is processed
+        try:
+            if event['type'] == 'customer.subscription.created':
+                handle_subscription_created(event['data']['object'])
+            elif event['type'] == 'customer.subscription.updated':
+                handle_subscription_updated(event['data']['object'])
+            elif event['type'] == 'customer.subscription.deleted':
+                handle_subscription_deleted(event['data']['object'])
+            elif event['type'] == 'invoice.payment_succeeded':
+                handle_payment_succeeded(event['data']['object'])
+            elif event['type'] == 'invoice.payment_failed':
+                handle_payment_failed(event['data']['object'])
+            else:
+                logger.info(f"Unhandled event type: {event['type']}")
+        except Exception:
+            inbound_inbox.release('stripe', event['id'])
+            raise
         
         return HttpResponse("OK", status=200)
     
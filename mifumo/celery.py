@@ -1,5 +1,21 @@
 """
 Celery configuration for mifumo project.
+
+Worker layout: one pool per queue (CELERY_TASK_ROUTES), sized by
+CELERY_WORKER_POOLS and started with `python manage.py celery_worker
+<queue>`. With the default settings that is:
+
+    celery -A mifumo worker -Q transactional -c 8 --prefetch-multiplier 1
+    celery -A mifumo worker -Q bulk -c 4 --prefetch-multiplier 4
+    celery -A mifumo worker -Q dlr -P threads -c 16 --prefetch-multiplier 4
+    celery -A mifumo worker -Q ai -P threads -c 32 --prefetch-multiplier 1
+    celery -A mifumo worker -Q maintenance,celery -c 2 --prefetch-multiplier 1
+
+Transactional sends have workers no campaign can occupy, so their latency
+does not depend on how much bulk work is queued. AI tasks block on the
+model endpoint rather than the CPU, so a threaded worker lets them share
+the process-wide inference client (which enforces the real concurrency
+limits) without occupying the other workers.
 """
 import os
 from celery import Celery
@@ -7,6 +7,7 @@ from datetime import timedelta
 import os
 import sys
 
+from celery.schedules import crontab
 from decouple import config
 import dj_database_url
 
@@ -91,7 +92,7 @@ LOCAL_APPS = [
     "core",
     "tenants",
     "accounts.apps.AccountsConfig",
-    "messaging",
+    "messaging.apps.MessagingConfig",
     "billing.apps.BillingConfig",
     "api",
 ]
@@ -317,6 +318,98 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = TIME_ZONE
+# Tasks are routed by how long they may wait, and each queue has its own
+# worker pool (see mifumo/celery.py), so a large campaign never sits in
+# front of a single send or an OTP:
+#   transactional  single sends and inbound handling; latency matters
+#   bulk           campaigns, bulk sends and uploads, exports
+#   dlr            delivery reports
+#   ai             model calls; they wait on the endpoint, not the CPU
+#   maintenance    scheduled housekeeping
+# Campaign and bulk callers publish send_message_task / send_sms_task
+# with queue="bulk" explicitly; the routes below are the defaults.
+CELERY_TASK_DEFAULT_QUEUE = "celery"
+CELERY_TASK_ROUTES = {
+    "messaging.tasks.send_message_task": {"queue": "transactional"},
+    "messaging.tasks_sms.send_sms_task": {"queue": "transactional"},
+    "messaging.tasks.process_inbound_message_task": {"queue": "transactional"},
+    "messaging.tasks.relay_outbox_task": {"queue": "transactional"},
+    "messaging.tasks_sms.dispatch_due_schedules_task": {"queue": "transactional"},
+    "messaging.tasks.send_campaign_messages_task": {"queue": "bulk"},
+    "messaging.tasks.stage_upcoming_campaigns_task": {"queue": "bulk"},
+    "messaging.tasks_sms.send_bulk_sms_job_task": {"queue": "bulk"},
+    "messaging.tasks_sms.process_sms_bulk_upload_task": {"queue": "bulk"},
+    "messaging.tasks_sms.process_sms_schedule_task": {"queue": "bulk"},
+    "messaging.tasks.run_export_job_task": {"queue": "bulk"},
+    "messaging.tasks_sms.check_sms_delivery_task": {"queue": "dlr"},
+    "messaging.tasks.sync_delivery_status_task": {"queue": "dlr"},
+    "messaging.tasks.ai_suggest_reply_task": {"queue": "ai"},
+    "messaging.tasks.ai_summarize_conversation_task": {"queue": "ai"},
+    "messaging.tasks.*": {"queue": "maintenance"},
+    "messaging.tasks_sms.*": {"queue": "maintenance"},
+}
+
+# Worker pool per queue, used by `manage.py celery_worker <queue>`.
+# Transactional workers prefetch one task at a time so a slow send never
+# holds others back; bulk workers prefetch more for throughput.
+CELERY_WORKER_POOLS = {
+    "transactional": {
+        "concurrency": config("CELERY_TRANSACTIONAL_CONCURRENCY", default=8, cast=int),
+        "pool": "prefork",
+        "prefetch_multiplier": 1,
+    },
+    "bulk": {
+        "concurrency": config("CELERY_BULK_CONCURRENCY", default=4, cast=int),
+        "pool": "prefork",
+        "prefetch_multiplier": 4,
+    },
+    "dlr": {
+        "concurrency": config("CELERY_DLR_CONCURRENCY", default=16, cast=int),
+        "pool": "threads",
+        "prefetch_multiplier": 4,
+    },
+    "ai": {
+        "concurrency": config("CELERY_AI_CONCURRENCY", default=32, cast=int),
+        "pool": "threads",
+        "prefetch_multiplier": 1,
+    },
+    "maintenance": {
+        "concurrency": config("CELERY_MAINTENANCE_CONCURRENCY", default=2, cast=int),
+        "pool": "prefork",
+        "prefetch_multiplier": 1,
+        "queues": ["maintenance", "celery"],
+    },
+}
+CELERY_BEAT_SCHEDULE = {
+    "compact-inbound-events": {
+        "task": "messaging.tasks.compact_inbound_events_task",
+        "schedule": crontab(minute=15, hour="*/6"),
+    },
+    "ensure-future-partitions": {
+        "task": "messaging.tasks.ensure_future_partitions_task",
+        "schedule": crontab(minute=0, hour=1),
+    },
+    "refresh-provider-metadata": {
+        "task": "messaging.tasks.refresh_provider_metadata_task",
+        "schedule": crontab(minute="*/5"),
+    },
+    "reconcile-usage-counters": {
+        "task": "messaging.tasks.reconcile_usage_counters_task",
+        "schedule": crontab(minute=30, hour=0),
+    },
+    "relay-outbox": {
+        "task": "messaging.tasks.relay_outbox_task",
+        "schedule": crontab(minute="*"),
+    },
+    "dispatch-sms-schedules": {
+        "task": "messaging.tasks_sms.dispatch_due_schedules_task",
+        "schedule": crontab(minute="*"),
+    },
+    "stage-upcoming-campaigns": {
+        "task": "messaging.tasks.stage_upcoming_campaigns_task",
+        "schedule": crontab(minute="*"),
+    },
+}
 
 # =============================================================================
 # INTEGRATIONS / KEYS
@@ -330,6 +423,21 @@ WA_API_BASE = config("WA_API_BASE", default="https://graph.facebook.com/v20.0")
 # Hugging Face
 HF_API_URL = config("HF_API_URL", default="")
 HF_API_KEY = config("HF_API_KEY", default="")
+# "huggingface" calls HF_API_URL; "local" uses the deterministic stand-in model
+AI_MODEL_BACKEND = config("AI_MODEL_BACKEND", default="huggingface")
+AI_SUGGEST_QUIET_PERIOD = config("AI_SUGGEST_QUIET_PERIOD", default=5, cast=int)
+AI_SUGGEST_CONTEXT_SIZE = config("AI_SUGGEST_CONTEXT_SIZE", default=15, cast=int)
+AI_SUGGEST_CACHE_TTL = config("AI_SUGGEST_CACHE_TTL", default=86400, cast=int)
+AI_SUMMARY_CHUNK_SIZE = config("AI_SUMMARY_CHUNK_SIZE", default=50, cast=int)
+# Shared inference client: in-flight caps, batching and circuit breaking.
+# HF_BATCH_SIZE > 1 only helps endpoints that accept a list of inputs.
+AI_MAX_IN_FLIGHT = config("AI_MAX_IN_FLIGHT", default=8, cast=int)
+AI_MAX_IN_FLIGHT_PER_TENANT = config("AI_MAX_IN_FLIGHT_PER_TENANT", default=2, cast=int)
+AI_REQUEST_TIMEOUT = config("AI_REQUEST_TIMEOUT", default=30, cast=int)
+AI_CIRCUIT_FAILURE_THRESHOLD = config("AI_CIRCUIT_FAILURE_THRESHOLD", default=5, cast=int)
+AI_CIRCUIT_RECOVERY_TIMEOUT = config("AI_CIRCUIT_RECOVERY_TIMEOUT", default=30, cast=int)
+HF_BATCH_SIZE = config("HF_BATCH_SIZE", default=1, cast=int)
+HF_BATCH_WINDOW_MS = config("HF_BATCH_WINDOW_MS", default=20, cast=int)
 
 # Stripe
 STRIPE_SECRET_KEY = config("STRIPE_SECRET_KEY", default="")
@@ -405,6 +513,83 @@ WEBHOOK_SECRET_WHATSAPP = config("WEBHOOK_SECRET_WHATSAPP", default="")
 WEBHOOK_SECRET_STRIPE = config("WEBHOOK_SECRET_STRIPE", default="")
 WEBHOOK_SECRET_SMS = config("WEBHOOK_SECRET_SMS", default="")
 
+# Inbound webhook deduplication
+INBOUND_EVENT_RETENTION_DAYS = config("INBOUND_EVENT_RETENTION_DAYS", default=7, cast=int)
+INBOUND_EVENT_SEEN_TTL = config("INBOUND_EVENT_SEEN_TTL", default=300, cast=int)
+INBOUND_EVENT_SEEN_MAX_ENTRIES = config("INBOUND_EVENT_SEEN_MAX_ENTRIES", default=10000, cast=int)
+
+# Inbound message processing
+INBOUND_LOOKUP_CACHE_TTL = config("INBOUND_LOOKUP_CACHE_TTL", default=3600, cast=int)
+INBOUND_COALESCE_WINDOW = config("INBOUND_COALESCE_WINDOW", default=2, cast=int)
+
+# Data retention (tenants can override via RetentionPolicy)
+MESSAGE_RETENTION_DAYS = config("MESSAGE_RETENTION_DAYS", default=30, cast=int)
+SMS_DATA_RETENTION_DAYS = config("SMS_DATA_RETENTION_DAYS", default=30, cast=int)
+RETENTION_BATCH_SIZE = config("RETENTION_BATCH_SIZE", default=500, cast=int)
+RETENTION_BATCH_PAUSE = config("RETENTION_BATCH_PAUSE", default=0.2, cast=float)
+RETENTION_ARCHIVE_ENABLED = config("RETENTION_ARCHIVE_ENABLED", default=False, cast=bool)
+RETENTION_ARCHIVE_ROOT = config("RETENTION_ARCHIVE_ROOT", default="archive")
+RETENTION_ARCHIVE_FORMAT = config("RETENTION_ARCHIVE_FORMAT", default="jsonl")
+# The nightly purges delete data for good, so they only run when switched on
+RETENTION_PURGE_ENABLED = config("RETENTION_PURGE_ENABLED", default=False, cast=bool)
+if RETENTION_PURGE_ENABLED:
+    CELERY_BEAT_SCHEDULE.update({
+        "cleanup-old-messages": {
+            "task": "messaging.tasks.cleanup_old_messages_task",
+            "schedule": crontab(minute=0, hour=2),
+        },
+        "cleanup-old-sms-data": {
+            "task": "messaging.tasks_sms.cleanup_old_sms_data_task",
+            "schedule": crontab(minute=30, hour=2),
+        },
+    })
+
+# Monthly partitioning of message tables (PostgreSQL only, see core/partitioning.py)
+DB_PARTITIONING_ENABLED = config("DB_PARTITIONING_ENABLED", default=False, cast=bool)
+DB_PARTITION_MONTHS_AHEAD = config("DB_PARTITION_MONTHS_AHEAD", default=3, cast=int)
+
+# Data exports
+EXPORT_CHUNK_SIZE = config("EXPORT_CHUNK_SIZE", default=2000, cast=int)
+
+# Bulk SMS: provider calls made in parallel per job
+BULK_SMS_CONCURRENCY = config("BULK_SMS_CONCURRENCY", default=8, cast=int)
+BULK_SMS_BATCH_SIZE = config("BULK_SMS_BATCH_SIZE", default=50, cast=int)
+
+# Provider circuit breakers and retries (messaging/services/provider_health.py)
+PROVIDER_CIRCUIT_FAILURE_THRESHOLD = config("PROVIDER_CIRCUIT_FAILURE_THRESHOLD", default=5, cast=int)
+PROVIDER_CIRCUIT_RECOVERY_TIMEOUT = config("PROVIDER_CIRCUIT_RECOVERY_TIMEOUT", default=60, cast=int)
+PROVIDER_OUTAGE_MAX_DEFERRALS = config("PROVIDER_OUTAGE_MAX_DEFERRALS", default=30, cast=int)
+
+# Transactional outbox (messaging/services/outbox.py)
+OUTBOX_PUBLISH_ON_COMMIT = config("OUTBOX_PUBLISH_ON_COMMIT", default=True, cast=bool)
+OUTBOX_BATCH_SIZE = config("OUTBOX_BATCH_SIZE", default=500, cast=int)
+OUTBOX_MAX_BACKOFF = config("OUTBOX_MAX_BACKOFF", default=300, cast=int)
+OUTBOX_RETENTION_HOURS = config("OUTBOX_RETENTION_HOURS", default=24, cast=int)
+
+# Campaign scheduler (messaging/services/scheduler.py)
+SCHEDULER_BATCH_SIZE = config("SCHEDULER_BATCH_SIZE", default=500, cast=int)
+SCHEDULER_LEASE_SECONDS = config("SCHEDULER_LEASE_SECONDS", default=120, cast=int)
+
+# Campaign pre-staging (messaging/services/campaign_staging.py)
+CAMPAIGN_STAGING_LEAD_MINUTES = config("CAMPAIGN_STAGING_LEAD_MINUTES", default=30, cast=int)
+CAMPAIGN_STAGING_BATCH_SIZE = config("CAMPAIGN_STAGING_BATCH_SIZE", default=2000, cast=int)
+
+# Phone number normalization (core/phone.py); region national numbers are read in
+PHONE_DEFAULT_REGION = config("PHONE_DEFAULT_REGION", default="TZ")
+
+# Operator prefixes (core/operators.py) and per-destination SMS prices in USD
+# (messaging/services/beem_sms.py); keys are '<country>:<operator>' or a country
+MSISDN_PREFIX_FILE = config("MSISDN_PREFIX_FILE", default=str(BASE_DIR / "core" / "data" / "msisdn_prefixes.csv"))
+SMS_PRICES = {
+    'default': 0.05,
+    'KE': 0.08,
+    'UG': 0.08,
+    'RW': 0.08,
+    'BI': 0.10,
+    'SS': 0.10,
+    'CD': 0.10,
+}
+
 # Team comms
 SLACK_BOT_TOKEN = config("SLACK_BOT_TOKEN", default="")
 SLACK_WEBHOOK_URL = config("SLACK_WEBHOOK_URL", default="")
@@ -453,17 +638,35 @@ DEFAULT_LANGUAGE = config("DEFAULT_LANGUAGE", default="en")
 # =============================================================================
 # CACHE
 # =============================================================================
-CACHES = {
-    "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-        "LOCATION": "mifumo-locmem",
-        "TIMEOUT": config("CACHE_TTL", default=300, cast=int),
-        "OPTIONS": {
-            "MAX_ENTRIES": config("CACHE_MAX_ENTRIES", default=1000, cast=int),
-            "CULL_FREQUENCY": config("CACHE_CULL_FREQUENCY", default=3, cast=int),
-        },
+# Point CACHE_URL at Redis in production so every gunicorn and Celery
+# process shares one cache; the local-memory default is per-process.
+CACHE_URL = config("CACHE_URL", default="")
+if CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+            "TIMEOUT": config("CACHE_TTL", default=300, cast=int),
+            "KEY_PREFIX": "mifumo",
+        }
     }
-}
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "mifumo-locmem",
+            "TIMEOUT": config("CACHE_TTL", default=300, cast=int),
+            "OPTIONS": {
+                "MAX_ENTRIES": config("CACHE_MAX_ENTRIES", default=1000, cast=int),
+                "CULL_FREQUENCY": config("CACHE_CULL_FREQUENCY", default=3, cast=int),
+            },
+        }
+    }
+
+# In-process L1 in front of CACHES["default"] (core.cache.TieredCache)
+TIERED_CACHE_L1_SIZE = config("TIERED_CACHE_L1_SIZE", default=512, cast=int)
+TIERED_CACHE_L1_TTL = config("TIERED_CACHE_L1_TTL", default=5, cast=int)
+TIERED_CACHE_STATS_FLUSH_INTERVAL = config("TIERED_CACHE_STATS_FLUSH_INTERVAL", default=30, cast=int)
 
 # =============================================================================
 # LOGGING
@@ -0,0 +1,13 @@
+"""
+Tenants app configuration.
+"""
+from django.apps import AppConfig
+
+
+class TenantsConfig(AppConfig):
+    name = 'tenants'
+    verbose_name = 'Tenants'
+
+    def ready(self):
+        """Import signals when app is ready."""
+        import tenants.signals
@@ -0,0 +1,17 @@
+"""
+Signals for tenants app.
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from core.cache import invalidate_tags
+from .models import Tenant, Domain
+
+
+@receiver(post_save, sender=Tenant)
+@receiver(post_delete, sender=Tenant)
+@receiver(post_save, sender=Domain)
+@receiver(post_delete, sender=Domain)
+def invalidate_tenant_lookups(sender, instance, **kwargs):
+    """Drop cached host-to-tenant resolutions after a tenant or domain changes."""
+    invalidate_tags('tenants')